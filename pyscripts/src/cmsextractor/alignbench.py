@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. module:: alignbench
+    :platform: Unix
+    :synopsis: Benchmark of parser to tagger token alignment
+
+Compares :py:class:`tokenalign.TokenAligner` with the previous alignment of
+:py:meth:`cms.ConstructionMatchingSystem.incorporateDeps`, which scanned
+tagger words forward from the last match for each parser word, on generated
+web text: long sentences with URLs, hashtags, emoticons, contractions,
+bracket normalization and multiword tokens, where the parser tokenization
+differs from that of the tagger.  Reports the time taken and the share of
+parser tokens aligned to the right tagger token.  Example::
+
+    python alignbench.py -n 200 -l 50 -l 500 -l 2000
+
+"""
+import sys, time, random, argparse, logging
+from tokenalign import TokenAligner
+
+WORDS = [u'the', u'a', u'of', u'to', u'and', u'in', u'is', u'that', u'for', u'it', u'poverty',
+         u'crime', u'tax', u'taxes', u'government', u'people', u'said', u'we', u'this', u'on',
+         u'with', u'be', u'are', u'they', u'economy', u'grows', u'burden', u'war']
+CONTRACTIONS = [(u"don't", [u'do', u"n't"]), (u"can't", [u'ca', u"n't"]),
+                (u"it's", [u'it', u"'s"]), (u"we're", [u'we', u"'re"])]
+BRACKETS = {u'(': u'-LRB-', u')': u'-RRB-', u'[': u'-LSB-', u']': u'-RSB-'}
+EMOTICONS = [u':-)', u':)', u';-)', u':(', u'<3']
+MULTIWORDS = [[u'a', u'pesar', u'de'], [u'sin', u'embargo'], [u'in', u'spite', u'of']]
+
+def genSentence(rand, length):
+    """ Generate a sentence of about length tagger tokens.  Returns the text,
+    the tagger forms, the parser forms and, for each parser form, the set of
+    indexes of the tagger tokens it may be aligned to.
+    """
+    iforms = []
+    pforms = []
+    truth = []
+    parts = []
+    while len(iforms) < length:
+        r = rand.random()
+        if r < 0.05:
+            form, pieces = rand.choice(CONTRACTIONS)
+            iforms.append(form)
+            parts.append(form)
+            for piece in pieces:
+                pforms.append(piece)
+                truth.append(set([len(iforms) - 1]))
+        elif r < 0.08:
+            url = u'http://www.%s.com/%s/%s' % (rand.choice(WORDS), rand.choice(WORDS),
+                                               rand.choice(WORDS))
+            iforms.append(url)
+            parts.append(url)
+            # the parser splits URLs at slashes
+            pieces = url.split(u'/')
+            for i, piece in enumerate(pieces):
+                if piece:
+                    pforms.append(piece)
+                    truth.append(set([len(iforms) - 1]))
+        elif r < 0.10:
+            emoticon = rand.choice(EMOTICONS)
+            iforms.append(emoticon)
+            parts.append(emoticon)
+            # dropped by the parser
+        elif r < 0.13:
+            words = rand.choice(MULTIWORDS)
+            first = len(iforms)
+            iforms.extend(words)
+            parts.extend(words)
+            pforms.append(u'_'.join(words))
+            truth.append(set(range(first, len(iforms))))
+        elif r < 0.16:
+            opening = rand.choice([u'(', u'['])
+            closing = {u'(': u')', u'[': u']'}[opening]
+            word = rand.choice(WORDS)
+            first = len(iforms)
+            iforms.extend([opening, word, closing])
+            parts.append(opening + word + closing)
+            for i, form in enumerate([opening, word, closing]):
+                pforms.append(BRACKETS.get(form, form))
+                truth.append(set([first + i]))
+        elif r < 0.19:
+            tag = u'#' + rand.choice(WORDS) + rand.choice(WORDS)
+            iforms.append(tag)
+            parts.append(tag)
+            # the parser splits off the hash
+            pforms.extend([u'#', tag[1:]])
+            truth.extend([set([len(iforms) - 1]), set([len(iforms) - 1])])
+        else:
+            word = rand.choice(WORDS)
+            if rand.random() < 0.1:
+                word = word.capitalize()
+            iforms.append(word)
+            parts.append(word)
+            # the parser sometimes lowercases
+            pforms.append(word.lower() if rand.random() < 0.5 else word)
+            truth.append(set([len(iforms) - 1]))
+    return u' '.join(parts), iforms, pforms, truth
+
+def legacyAlign(iforms, pforms):
+    """ The previous alignment of incorporateDeps (on forms only).  Returns a
+    dict from parser token index to tagger token index.
+    """
+    pwlookup = dict((pidx, {'form': form, 'lem': form}) for pidx, form in enumerate(pforms))
+    iwords = [{'form': form, 'lem': form} for form in iforms]
+    p2imap = {}
+    current_iidx = 0
+    for pidx, pw in sorted(pwlookup.items()):
+        for iidx in range(current_iidx, len(iwords)):
+            iw = iwords[iidx]
+            if (pw['form']==iw['form']) or (pw['lem']==iw['lem']):
+                p2imap[pidx] = iidx
+                current_iidx = iidx+1
+                break
+            try:
+                npw = pwlookup[pidx + 1]
+                niw = iwords[iidx + 1]
+                if (npw['form']==niw['form']) or (npw['lem']==niw['lem']):
+                    p2imap[pidx] = iidx
+                    current_iidx = iidx+1
+                    break
+                if (npw['form']==iw['form']) or (npw['lem']==iw['lem']):
+                    break
+            except:
+                pass
+        if current_iidx >= len(iwords):
+            break
+    return p2imap
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark parser to tagger token alignment")
+    parser.add_argument('-n', '--sentences', type=int, default=100,
+                        help='Number of sentences per length')
+    parser.add_argument('-l', '--length', type=int, action='append',
+                        help='Sentence length in tagger tokens (may be repeated)')
+    parser.add_argument('--lookahead', type=int, default=None,
+                        help='Lookahead of the aligner, in characters')
+    cmdline = parser.parse_args()
+    logging.basicConfig(level=logging.WARN)
+    lengths = cmdline.length or [50, 200, 1000]
+    rand = random.Random(0)
+    print '%7s %-8s %9s %12s %9s' % ('length', 'method', 'seconds', 'tokens/sec', 'correct')
+    for length in lengths:
+        sents = [genSentence(rand, length) for i in xrange(cmdline.sentences)]
+        ntokens = sum(len(pforms) for text, iforms, pforms, truth in sents)
+        if cmdline.lookahead is None:
+            aligner = TokenAligner()
+        else:
+            aligner = TokenAligner(cmdline.lookahead)
+        for method in ['legacy', 'aligner']:
+            correct = 0
+            start = time.time()
+            for text, iforms, pforms, truth in sents:
+                if method == 'legacy':
+                    p2imap = legacyAlign(iforms, pforms)
+                    correct += sum(1 for k, iidx in p2imap.iteritems() if iidx in truth[k])
+                else:
+                    alignment = aligner.align(iforms, pforms, text)
+                    correct += sum(1 for k, a in enumerate(alignment)
+                                   if (a is not None) and (a[0] in truth[k]))
+            seconds = time.time() - start
+            print '%7d %-8s %9.3f %12.0f %8.1f%%' % (length, method, seconds, ntokens / seconds,
+                                                    100.0 * correct / ntokens)
+        print '        aligner counts: %s' % (' '.join('%s=%d' % item for item in sorted(aligner.stats().items())))
+    return 0
+
+if __name__ == "__main__":
+    status = main()
+    sys.exit(status)
@@ -22,11 +22,16 @@ with LM annotations added.
 """
 import sys, argparse, codecs, re, time, os, numpy, logging, pprint, traceback, hashlib
 from docquery import DocumentRepository
+from wordmatch import WordListMatcher
+from resources import ResourceRegistry
+from tokenalign import TokenAligner
 from mnrepository.metanetrdf import MetaNetRepository
 from mnrepository.cnmapping import ConceptualNetworkMapper
 from mnformats import mnjson
 from depparsing.dep2json import parse
+from depparsing.parsecache import parse_cache
 from mnpipeline.persiantagger import PersianPOSTagger
+from mnpipeline.metrics import METRICS
 from multiprocessing import Pool
 import cPickle as pickle
 
@@ -36,6 +41,19 @@ sys.setdefaultencoding('utf-8')
 sys.stdout = codecs.getwriter('utf8')(sys.stdout)
 sys.stderr = codecs.getwriter('utf8')(sys.stderr)
 
+def _loadPOSTagger(lang):
+    if lang == 'fa':
+        return PersianPOSTagger()
+    return mnjson.MNTreeTagger(lang)
+
+# POS taggers are loaded per language on first use, and shared by all
+# CMS instances of the process
+RESOURCES = ResourceRegistry()
+RESOURCES.register('tagger', _loadPOSTagger, forksafe=False)
+
+# aligns parser tokens to tagger tokens, and counts alignment failures
+ALIGNER = TokenAligner()
+
 class ConstructionMatchingSystem:
     """ CMS system class
     """
@@ -202,6 +220,17 @@ class ConstructionMatchingSystem:
     def _initTargetPatterns(self):
         self.search_lus = {}
         self.search_wl = {}
+        self.search_matchers = {}
+
+    def _compileSearchWords(self, searchtype):
+        """ Compile the word list structs for searchtype into a matcher that
+        searches each sentence in a single pass.
+        :param searchtype: either 'target' or 'source'
+        :type searchtype: str
+        """
+        self.search_matchers[searchtype] = WordListMatcher(self.search_wl[searchtype],
+                                                           self.mr.POSmap,
+                                                           self.mr.posre)
 
     def createWordListStructs(self, lutups):
         """ Retrieves a list of LU tuples (lempos, frame, framename, familyname,
@@ -289,6 +318,7 @@ class ConstructionMatchingSystem:
                 try:
                     (self.search_lus[searchtype], self.search_wl[searchtype]) = pickle.load(f)
                     f.close()
+                    self._compileSearchWords(searchtype)
                     return
                 except:
                     self.logger.warn(u'Malformed %s cache at %s. Bypassing cache.', 
@@ -339,6 +369,7 @@ class ConstructionMatchingSystem:
         # sort from longest to shortest so expressions like 'income tax' match before 'tax'
         self.search_wl[searchtype] = sorted(search_wl, key=lambda tw: tw['npieces'],
                                             reverse=True)
+        self._compileSearchWords(searchtype)
         
         # save target word/struct list cache
         if not self.noWCache:
@@ -549,6 +580,7 @@ class ConstructionMatchingSystem:
             self.logger.info("one or more sentence ids fixed")
         return targetsents
 
+    @METRICS.timed('searchForWords', items=lambda self, sentences: len(sentences))
     def searchForWords(self,sentences):
         """ Load JSON doc and create a filtered list of sentences that are known
         to contain the target or source expressions of interest.  The expressions
@@ -629,66 +661,59 @@ class ConstructionMatchingSystem:
                 searchmatched = False
                 search_idxset = searchtype + u'idxset'
                 search_list = searchtype + u'list'
-                for wstruct in self.search_wl[searchtype]:
-                    # this is in case the same string occurs multiple times in the same sentence
-                    self.logger.debug('Searching for pattern %s in sentence: %s',
-                                      wstruct['regexp'],sentence['mtext'])
-                    for matches in wstruct['re'].finditer(sentence['mtext']):
+                if searchtype not in self.search_matchers:
+                    self._compileSearchWords(searchtype)
+                # matches come longest first, and in sentence order for each lempos
+                wmatches = self.search_matchers[searchtype].match(sentence['word'],
+                                                                  self.lfield,
+                                                                  self.pfield,
+                                                                  sentence['mtext'])
+                for wstruct, idxlist in wmatches:
+                    formlist = []
+                    lemmalist = []
+                    startlist = []
+                    endlist = []
+                    for idx in idxlist:
+                        #self.logger.debug('idx=%d and form is %s'%(idx, sentence['word'][idx]['form']))
                         try:
-                            idxlist = [int(matches.group(n+1)) for n in range(wstruct['npieces'])]
+                            formlist.append(sentence['word'][idx]['form'])
+                            lemmalist.append(sentence['word'][idx][self.lfield])
+                            startlist.append(sentence['word'][idx]['start'])
+                            endlist.append(sentence['word'][idx]['end'])
                         except:
-                            print sentence['mtext']
-                            pprint.pprint(wstruct)
-                            pprint.pprint(wstruct['npieces'])
-                            pprint.pprint(matches.group(0))
-                            for n in range(wstruct['npieces']):
-                                print 'N=',n,'=',matches.group(n+1)
+                            print >> sys.stderr, "Idx is", idx
+                            print >> sys.stderr, "error in,", sentence['text']
+                            pprint.pprint(sentence['word'])
                             raise
-                        formlist = []
-                        lemmalist = []
-                        startlist = []
-                        endlist = []
-                        for idx in idxlist:
-                            #self.logger.debug('idx=%d and form is %s'%(idx, sentence['word'][idx]['form']))
-                            try:
-                                formlist.append(sentence['word'][idx]['form'])
-                                lemmalist.append(sentence['word'][idx][self.lfield])
-                                startlist.append(sentence['word'][idx]['start'])
-                                endlist.append(sentence['word'][idx]['end'])
-                            except:
-                                print >> sys.stderr, "Idx is", idx
-                                print >> sys.stderr, "error in,", sentence['text']
-                                pprint.pprint(sentence['word'])
-                                raise
-                        wmatch = {'form': u' '.join(formlist),
-                                  'lemma': u' '.join(lemmalist),
-                                  'start': min(startlist),
-                                  'end': max(endlist),
-                                  'mword': wstruct['lempos'],
-                                  'frameuri': wstruct['frameuri'],
-                                  'framename': wstruct['framename'],
-                                  'wdomain': wstruct['family'],
-                                  'framefamily': wstruct['family'],
-                                  'concept':wstruct['concept'],
-                                  'contype':wstruct['contype'],
-                                  'congroup':wstruct['congroup'],
-                                  'idxlist': idxlist}
-                        if len(idxlist)==1:
-                            wmatch['pos'] = sentence['word'][idxlist[0]][self.pfield]
-                            
-                        #print 'form=%s frame=%s wdomain=%s' % (tmatch['form'],tmatch['framename'],tmatch['wdomain'])
-                        if set(idxlist).issubset(sentence['CMS'][search_idxset]):
-                            # discard if this match is a subset of an earlier one:
-                            #   this is to prevent 'tax' from matching if 'income tax' matched
-                            self.logger.debug('Match %s discarded because or prior longer match.',
-                                              wmatch['form'])
-                            continue
-                        self.logger.debug(u'Adding match %s from target lempos %s (%s):\t%s',
-                                          wmatch['form'],wmatch['mword'],wstruct['regexp'],
-                                          sentence['mtext'])
-                        sentence['CMS'][search_idxset].update(idxlist)
-                        sentence['CMS'][search_list].append(wmatch)
-                        searchmatched = True
+                    wmatch = {'form': u' '.join(formlist),
+                              'lemma': u' '.join(lemmalist),
+                              'start': min(startlist),
+                              'end': max(endlist),
+                              'mword': wstruct['lempos'],
+                              'frameuri': wstruct['frameuri'],
+                              'framename': wstruct['framename'],
+                              'wdomain': wstruct['family'],
+                              'framefamily': wstruct['family'],
+                              'concept':wstruct['concept'],
+                              'contype':wstruct['contype'],
+                              'congroup':wstruct['congroup'],
+                              'idxlist': idxlist}
+                    if len(idxlist)==1:
+                        wmatch['pos'] = sentence['word'][idxlist[0]][self.pfield]
+                        
+                    #print 'form=%s frame=%s wdomain=%s' % (tmatch['form'],tmatch['framename'],tmatch['wdomain'])
+                    if set(idxlist).issubset(sentence['CMS'][search_idxset]):
+                        # discard if this match is a subset of an earlier one:
+                        #   this is to prevent 'tax' from matching if 'income tax' matched
+                        self.logger.debug('Match %s discarded because or prior longer match.',
+                                          wmatch['form'])
+                        continue
+                    self.logger.debug(u'Adding match %s from target lempos %s (%s):\t%s',
+                                      wmatch['form'],wmatch['mword'],wstruct['regexp'],
+                                      sentence['mtext'])
+                    sentence['CMS'][search_idxset].update(idxlist)
+                    sentence['CMS'][search_list].append(wmatch)
+                    searchmatched = True
                 if searchmatched:
                     searchcheck[searchtype] = True
                 else:
@@ -914,6 +939,7 @@ class ConstructionMatchingSystem:
             usents.append(s)
         return usents
     
+    @METRICS.timed('frameSearch')
     def frameSearch(self, lemma, pos, lpos):
         SCORE_BASELINES = {'wikilpos': 0.6,
                            'wikilem': 0.5,
@@ -1444,6 +1470,7 @@ class ConstructionMatchingSystem:
         else:
             self.runSearchPy(sentences, cxnlist, doallcxns)
 
+    @METRICS.timed('runSearchPy', items=lambda self, *args, **kwargs: len(self.match_sents))
     def runSearchPy(self, sentences, cxnlist=None, doallcxns=False):
         """ Python rdflib-based LM search method.
         In this case the search engine is not powerful enough to run over all the sentences.
@@ -1469,6 +1496,7 @@ class ConstructionMatchingSystem:
             sent['CMS']['idxset'] = list(sent['CMS']['idxset'])
         self.logger.info('end CMS search')
 
+    @METRICS.timed('runSearchSE', items=lambda self, *args, **kwargs: len(self.match_sents))
     def runSearchSE(self, sentences, cxnlist=None, doallcxns=False):
         """ SPARQL Endpoint based LM search method.
         In this case we run the cxn queries over all the sentences at once.
@@ -1603,12 +1631,14 @@ class ConstructionMatchingSystem:
             sent['lms'] = []
         sent['lms'].append(lm)
     
-    @staticmethod        
+    @staticmethod
+    @METRICS.timed('computePOS', items=lambda lang, sentences, *args, **kwargs: len(sentences))
     def computePOS(lang, sentences, logger=logging, pfield='pos',lfield='lem'):
         """ A statis method for computing POS tags and adding them under a 'word'
         node in each sentence. The 'word' node is a list of dicts, where each
         describes a word in the sentence.  Uses TreeTagger for EN, ES, and RU
-        and a custom HMM tagger for FA.
+        and a custom HMM tagger for FA.  Taggers are loaded once per process
+        (see RESOURCES).
         
         :param sentences: list of sentences
         :type sentences: str
@@ -1621,7 +1651,7 @@ class ConstructionMatchingSystem:
         """
         logger.info('start POS tagging')
         if lang == 'fa':
-            pt = PersianPOSTagger()
+            pt = RESOURCES.get(lang, 'tagger')
             for sent in sentences:
                 sent['ctext'] = pt.cleanText(sent['text'])
                 tags = pt.run_hmm_tagger(sent['ctext'])
@@ -1629,82 +1659,57 @@ class ConstructionMatchingSystem:
                 sent['word'] = pt.getWordList(sent['text'], sent['ctext'], tags,
                                               pfield, lfield)
         else:
-            tt = mnjson.MNTreeTagger(lang)
+            tt = RESOURCES.get(lang, 'tagger')
             tt.cleanText(sentences)
             tt.run(sentences)
         logger.info('end POS tagging')
     
     @staticmethod
-    def incorporateDeps(lang, in_sentences, parsed_sentences, redundancy=False):
+    def incorporateDeps(lang, in_sentences, parsed_sentences, redundancy=False, aligner=None):
         """ A statis method that incorporates dependencies from the 'word' field
         of parsed_sentences into the 'word' field of in_sentences, keeping
         alignment with existing tokenization, by POS tagger/lemmatizers.
+        Parser words are aligned to tagger words by their character offsets in
+        the sentence text (see :py:mod:`tokenalign`).  Where the parser splits a
+        tagger word, the dependency of the part headed outside of the word is used.
         :param in_sentences: tagged input sentences 
         :type in_sentences: list
         :param parsed_sentences: output of dependency parser
         :type parsed_sentences: list
         :param redundancy: preserves redundant information for debugging
         :type redundancy: bool
+        :param aligner: token aligner, which counts alignment failures (default ALIGNER)
+        :type aligner: :py:class:`tokenalign.TokenAligner`
         """
+        if aligner is None:
+            aligner = ALIGNER
         for psent in parsed_sentences:
-            # need to generate hash lookup because list is not in order
-            # and can be missing words
+            # parsed words are not necessarily in order, and can be
+            # missing or repeated
             pwlookup = {}
-            #sys.exit()
             for pw in psent['word']:
                 pwlookup[pw['idx']] = pw
+            pwords = [pw for pidx, pw in sorted(pwlookup.items())]
             # find corresponding original sentence
             isent = in_sentences[psent['idx']]
-            #isent['psent'] = psent
-            # go through each word in the parsed version and map to original
+            iwords = isent['word']
+            text = isent.get('ctext') or isent.get('text')
+            alignment = aligner.align([iw.get('form') for iw in iwords],
+                                      [pw.get('form') for pw in pwords], text)
+            # position of each parser word's head, to choose between split words
+            pposbyn = dict((pw.get('n'), k) for k, pw in enumerate(pwords))
+            heads = [pposbyn.get(pw['dep'].get('head')) if 'dep' in pw else None
+                     for pw in pwords]
+            reps = aligner.representatives(alignment, heads)
             p2imap = {}
             pn2inmap = {'0':'0'}
-            current_iidx = 0
-            # scan through parsed words in order
-            for pidx, pw in sorted(pwlookup.items()):
-                # create parse to initial word mapping
-                for iidx in range(current_iidx,len(isent['word'])):
-                    iw = isent['word'][iidx]
-                    try:
-                        if (pw['form']==iw['form']) or (pw['lem']==iw['lem']):
-                            p2imap[pidx] = iidx
-                            pn2inmap[pw['n']] = iw['n']
-                            current_iidx = iidx+1
-                            break
-                        elif (lang=='es') and (pw['lem']==u'de') and (iw['lem']==u'del')\
-                             and (iw['pos']==u'PDEL') and (pw['pos']==u'SPS00'):
-                            p2imap[pidx] = iidx
-                            pn2inmap[pw['n']] = iw['n']
-                            current_iidx = iidx+1
-                            break
-                    except KeyError:
-                        # not all words have 'lem' fields
-                        continue
-                    # before trying out the next iword, see if the next pword and the
-                    # next iword are a match
-                    try:
-                        npidx = pidx + 1
-                        npw = pwlookup[npidx]
-                        niidx = iidx + 1
-                        niw = isent['word'][niidx]
-                        if (npw['form']==niw['form']) or (npw['lem']==niw['lem']):
-                            # then consider the current iw and pw to be equivalent
-                            p2imap[pidx] = iidx
-                            pn2inmap[pw['n']] = iw['n']
-                            current_iidx = iidx+1
-                            break
-                        # check if psent has an extra word (i.e. the next pword is the
-                        # same as the currect iword)
-                        if (npw['form']==iw['form']) or (npw['lem']==iw['lem']):
-                            # if so, skip go to next pword without advancing
-                            # current iword
-                            break
-                    except:
-                        # if there is any error, forget it, go on to next iw
-                        pass
-                    
-                if current_iidx >= len(isent['word']):
-                    break
+            for k, pw in enumerate(pwords):
+                if alignment[k] is None:
+                    continue
+                iidx = alignment[k][0]
+                pn2inmap[pw['n']] = iwords[iidx]['n']
+                if reps[iidx] == k:
+                    p2imap[pw['idx']] = iidx
             isent['p2imap'] = p2imap
             isent['pn2inmap'] = pn2inmap
             isent['parseword'] = psent['word']
@@ -1751,8 +1756,11 @@ class ConstructionMatchingSystem:
                     iw['dep'] = dep
 
     @staticmethod
+    @METRICS.timed('parseDependencies', items=lambda lang, in_sentences, *args, **kwargs: len(in_sentences))
     def parseDependencies(lang, in_sentences,logger=logging):
-        """ A static method for running the dependency parser.
+        """ A static method for running the dependency parser.  If a parse cache
+        is configured (see :py:mod:`depparsing.parsecache`), only sentences that
+        are not in the cache are parsed.
         :param in_sentences: input sentences (JSON structs)
         :type in_sentence: list
         :param logger: a python logging instance
@@ -1761,12 +1769,19 @@ class ConstructionMatchingSystem:
         logger.info('start dependency parsing on %d sentences', len(in_sentences))
           
         # call to parser
-        out_jdata = parse(lang, [s['ctext'] for s in in_sentences])
+        cache = parse_cache()
+        if cache:
+            out_sentences = cache.parse(lang, [s['ctext'] for s in in_sentences])
+            logger.info('parse cache stats: %s', cache.stats())
+        else:
+            out_jdata = parse(lang, [s['ctext'] for s in in_sentences])
+            out_sentences = out_jdata['sentences']
         #pprint.pprint(out_jdata)
         #self.logger.debug(u'post-parsed jdata:\n'+pprint.pformat(out_jdata))
         #pprint.pprint(out_jdata['sentences'][0][parsername]['word'])
 
-        ConstructionMatchingSystem.incorporateDeps(lang, in_sentences, out_jdata['sentences'])
+        ConstructionMatchingSystem.incorporateDeps(lang, in_sentences, out_sentences)
+        ALIGNER.logStats()
 
         logger.info('end dependency parsing')
 
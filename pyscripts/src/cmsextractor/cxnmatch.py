@@ -0,0 +1,520 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. module:: cxnmatch
+   :platform: Unix
+   :synopsis: In-process evaluation of cxn queries over JSON sentences
+
+The rdflib engine of :py:class:`cmsextractor.docquery.DocumentRepository`
+finds construction matches by converting each sentence into Turtle, parsing
+it into a fresh graph, and running every cxn SPARQL query over it.  This
+module instead compiles cxn queries into join plans that are evaluated
+directly over the ``word``/``dep`` (or ``dparse``) structures of the
+sentence.
+
+A sentence is indexed as the same set of edges that
+:py:meth:`DocumentRepository.getSentenceTriples` would generate (word
+properties, ``follows``/``precedes`` and dependency relations), keyed by
+predicate in both directions.  A compiled query is a basic graph pattern
+(triple patterns plus FILTERs); it is evaluated by repeatedly binding the
+pattern with the fewest candidate edges, so a typical subject/object/
+modifier/possessive cxn becomes a join on one dependency edge list.
+
+Only a subset of SPARQL is compiled: SELECT over a single group of triple
+patterns, with FILTERs using ``regex``, ``=``, ``!=``, ``!``, ``&&`` and
+``||``.  Queries using anything else (OPTIONAL, UNION, property paths,
+typed string literals, ...) raise :py:exc:`CxnCompileError`, and are left
+to the SPARQL engine.
+
+"""
+import re
+
+RDF_NS = u'http://www.w3.org/1999/02/22-rdf-syntax-ns#'
+DOC_NS = u'https://metaphor.icsi.berkeley.edu/metaphor/DocumentOntology.owl#'
+DR_NS = u'https://metaphor.icsi.berkeley.edu/metaphor/DocumentRepository.owl#'
+XSD_NS = u'http://www.w3.org/2001/XMLSchema#'
+NAMESPACES = {u'rdf': RDF_NS, u'doc': DOC_NS, u'dr': DR_NS, u'xsd': XSD_NS}
+
+# variables that getCXNRelatedPairs reads from each result row
+RESULT_VARS = (u'tlemma', u'slemma', u'sentidx', u'tidx', u'sidx')
+
+class CxnCompileError(Exception):
+    """ Raised for cxn queries that cannot be compiled """
+    pass
+
+class Node(object):
+    """ Word or sentence node in a sentence index """
+    __slots__ = ('iri',)
+
+    def __init__(self, iri):
+        self.iri = iri
+
+class Boolean(object):
+    """ xsd:boolean literal (kept apart from ints, which compare equal to bools) """
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return isinstance(other, Boolean) and (other.value == self.value)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash((Boolean, self.value))
+
+def render(value):
+    """ Return the string form of a value, as it appears in SPARQL results """
+    if isinstance(value, Node):
+        return value.iri
+    if isinstance(value, Boolean):
+        return u'true' if value.value else u'false'
+    if isinstance(value, tuple):
+        return value[1]
+    return unicode(value)
+
+class SentenceIndex(object):
+    """ The RDF edges of one sentence, indexed by predicate.  Mirrors the
+    triples generated by DocumentRepository.getSentenceTriples.
+    """
+    RDF_TYPE = u'rdf:type'
+    WORD = (u'iri', DOC_NS + u'Word')
+    SENTENCE = (u'iri', DOC_NS + u'Sentence')
+
+    def __init__(self, sent, sid, pfield, lfield, rpfield, rlfield):
+        self.spo = {}
+        self.pos = {}
+        self.nodes = {}
+        snode = self.node(u'%ss_%s' % (DR_NS, sid))
+        self.add(snode, self.RDF_TYPE, self.SENTENCE)
+        self.add(snode, u'doc:hasIdx', sent[u'idx'])
+        if u'word' not in sent:
+            return
+        w = []
+        wbyn = {}
+        for word in sent[u'word']:
+            idx = word[u'idx']
+            w.append(self.node(u'%sw_%s_%d' % (DR_NS, sid, idx)))
+            wbyn[word[u'n']] = w[idx]
+            self.add(w[idx], u'doc:hasIdx', idx)
+            self.add(w[idx], self.RDF_TYPE, self.WORD)
+            self.add(w[idx], u'doc:inSentence', snode)
+            if word[pfield] != None:
+                self.add(w[idx], u'doc:hasPOS', word[pfield])
+            self.add(w[idx], u'doc:hasForm', word[u'form'])
+            if word[lfield] != None:
+                self.add(w[idx], u'doc:hasLemma', word[lfield])
+            if rlfield in word:
+                self.add(w[idx], u'doc:hasRLemma', word[rlfield])
+            if rpfield in word:
+                self.add(w[idx], u'doc:hasRPOS', word[rpfield])
+            if idx > 0:
+                self.add(w[idx], u'doc:follows', w[idx-1])
+        for word in sent[u'word']:
+            idx = word[u'idx']
+            if idx < len(w)-1:
+                self.add(w[idx], u'doc:precedes', w[idx+1])
+        if 'dparse' in sent:
+            for dep in sent[u'dparse']:
+                if dep[u'type']==u'passive':
+                    try:
+                        self.add(wbyn[dep[u'head']], u'doc:isPassive', Boolean(True))
+                    except:
+                        pass
+                    continue
+                try:
+                    if (dep[u'type']==u'ncmod') and ('subtype' in dep) \
+                            and (dep['subtype']=='poss'):
+                        typestr = 'poss'
+                    else:
+                        typestr = dep['type'].replace(u'-',u'')
+                    self.add(wbyn[dep[u'dep']], u'doc:'+typestr, wbyn[dep['head']])
+                except KeyError:
+                    pass
+            return
+        for word in sent[u'word']:
+            idx = word[u'idx']
+            if 'dep' not in word:
+                continue
+            headn = word['dep']['head']
+            if int(headn) == 0:
+                continue
+            try:
+                if (word['dep']['type']=='ncmod') and ('subtype' in word['dep']) \
+                        and (word['dep']['subtype']=='poss'):
+                    typestr = 'poss'
+                else:
+                    typestr = word['dep']['type'].replace(u'-',u'')
+                self.add(w[idx], u'doc:'+typestr, wbyn[headn])
+            except KeyError:
+                pass
+            except TypeError:
+                pass
+
+    def node(self, iri):
+        # the same IRI is the same node, as it would be in the graph
+        if iri not in self.nodes:
+            self.nodes[iri] = Node(iri)
+        return self.nodes[iri]
+
+    def add(self, s, p, o):
+        objs = self.spo.setdefault(p, {}).setdefault(s, [])
+        if o not in objs:
+            objs.append(o)
+            self.pos.setdefault(p, {}).setdefault(o, []).append(s)
+
+# ======================================================================
+# Query compilation
+# ======================================================================
+TOKEN_RE = re.compile(ur'''
+  (?P<ws>\s+)
+| (?P<string>"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*')(?P<suffix>\^\^\S+?(?=[\s.;,)]|$)|@[a-zA-Z-]+)?
+| (?P<iri><[^<>\s]*>)
+| (?P<var>[?$][A-Za-z_]\w*)
+| (?P<number>[+-]?\d+(?![\w.]\d))
+| (?P<op>!=|&&|\|\||=|!|\.|;|,|\{|\}|\(|\))
+| (?P<name>[A-Za-z_][\w-]*:[\w-]*|:[\w-]+|[A-Za-z_]\w*)
+''', flags=re.X|re.U)
+
+STRING_ESCAPES = {u't': u'\t', u'n': u'\n', u'r': u'\r', u'b': u'\b', u'f': u'\f',
+                  u'"': u'"', u"'": u"'", u'\\': u'\\'}
+
+def tokenize(qstr):
+    tokens = []
+    pos = 0
+    while pos < len(qstr):
+        m = TOKEN_RE.match(qstr, pos)
+        if not m:
+            raise CxnCompileError(u'cannot tokenize query at: %s' % (qstr[pos:pos+20]))
+        pos = m.end()
+        kind = m.lastgroup
+        if kind == 'ws':
+            continue
+        if kind == 'suffix':
+            kind = 'string'
+        tokens.append((kind, m.group(kind) if kind != 'string' else m.group(0)))
+    return tokens
+
+def expandName(name):
+    """ Expand a prefixed name into an IRI """
+    if u':' not in name:
+        raise CxnCompileError(u'unexpected keyword %s' % (name))
+    prefix, local = name.split(u':', 1)
+    if prefix not in NAMESPACES:
+        raise CxnCompileError(u'unknown prefix %s' % (prefix))
+    return NAMESPACES[prefix] + local
+
+def parseString(token):
+    m = re.match(ur'''("(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')(.*)$''', token, flags=re.U|re.S)
+    body, suffix = m.group(1)[1:-1], m.group(2)
+    text = re.sub(ur'\\(.)', lambda e: STRING_ESCAPES.get(e.group(1), e.group(0)),
+                  body, flags=re.U|re.S)
+    if not suffix:
+        return text
+    if suffix.startswith(u'@'):
+        raise CxnCompileError(u'language tagged literals are not supported')
+    datatype = suffix[2:]
+    if datatype.startswith(u'<'):
+        datatype = datatype[1:-1]
+    else:
+        datatype = expandName(datatype)
+    if datatype == XSD_NS + u'integer':
+        return int(text)
+    if datatype == XSD_NS + u'boolean' and text in (u'true', u'false'):
+        return Boolean(text == u'true')
+    # other typed literals (including xsd:string) never equal the plain
+    # literals in sentence graphs
+    raise CxnCompileError(u'unsupported literal type %s' % (datatype))
+
+def predicateKey(iri):
+    """ Return the key under which SentenceIndex stores a predicate """
+    if iri == RDF_NS + u'type':
+        return SentenceIndex.RDF_TYPE
+    if iri.startswith(DOC_NS):
+        return u'doc:' + iri[len(DOC_NS):]
+    # no other predicates occur in sentence graphs
+    return iri
+
+class Parser(object):
+    """ Recursive descent parser for the compilable SPARQL subset """
+    def __init__(self, qstr):
+        self.tokens = tokenize(qstr)
+        self.i = 0
+
+    def peek(self):
+        if self.i < len(self.tokens):
+            return self.tokens[self.i]
+        return (None, None)
+
+    def next(self):
+        token = self.peek()
+        if token[0] is None:
+            raise CxnCompileError(u'unexpected end of query')
+        self.i += 1
+        return token
+
+    def expect(self, value):
+        kind, tvalue = self.next()
+        if tvalue != value and not (kind == 'name' and tvalue.upper() == value):
+            raise CxnCompileError(u'expected %s, found %s' % (value, tvalue))
+
+    def isKeyword(self, token, keyword):
+        return token[0] == 'name' and token[1].upper() == keyword
+
+    def parse(self):
+        if not self.isKeyword(self.next(), u'SELECT'):
+            raise CxnCompileError(u'not a SELECT query')
+        if self.isKeyword(self.peek(), u'DISTINCT') or self.isKeyword(self.peek(), u'REDUCED'):
+            self.next()
+        selected = []
+        while self.peek()[0] == 'var':
+            selected.append(self.next()[1][1:])
+        self.expect(u'WHERE')
+        self.expect(u'{')
+        patterns = []
+        filters = []
+        while self.peek()[1] != u'}':
+            if self.isKeyword(self.peek(), u'FILTER'):
+                self.next()
+                filters.append(self.parseFilter())
+            else:
+                self.parseTriples(patterns)
+            if self.peek()[1] == u'.':
+                self.next()
+        self.next()
+        if self.peek()[0] is not None:
+            raise CxnCompileError(u'unsupported query modifier %s' % (self.peek()[1]))
+        return selected, patterns, filters
+
+    def parseTerm(self, predicate=False):
+        kind, value = self.next()
+        if kind == 'var':
+            return ('var', value[1:])
+        if kind == 'iri':
+            iri = value[1:-1]
+        elif kind == 'name':
+            if predicate and value == u'a':
+                iri = RDF_NS + u'type'
+            elif value in (u'true', u'false') and not predicate:
+                return ('const', Boolean(value == u'true'))
+            else:
+                iri = expandName(value)
+        elif kind == 'string' and not predicate:
+            return ('const', parseString(value))
+        elif kind == 'number' and not predicate:
+            return ('const', int(value))
+        else:
+            raise CxnCompileError(u'unsupported term %s' % (value))
+        if predicate:
+            return ('const', predicateKey(iri))
+        return ('const', (u'iri', iri))
+
+    def parseTriples(self, patterns):
+        subject = self.parseTerm()
+        while True:
+            predicate = self.parseTerm(predicate=True)
+            if predicate[0] == 'var':
+                raise CxnCompileError(u'variable predicates are not supported')
+            while True:
+                patterns.append((subject, predicate[1], self.parseTerm()))
+                if self.peek()[1] != u',':
+                    break
+                self.next()
+            if self.peek()[1] != u';':
+                break
+            self.next()
+            if self.peek()[1] in (u'.', u'}'):
+                break
+
+    def parseFilter(self):
+        if self.peek()[1] == u'(':
+            self.next()
+            expr = self.parseOr()
+            self.expect(u')')
+            return expr
+        return self.parsePrimary()
+
+    def parseOr(self):
+        expr = self.parseAnd()
+        while self.peek()[1] == u'||':
+            self.next()
+            expr = ('or', expr, self.parseAnd())
+        return expr
+
+    def parseAnd(self):
+        expr = self.parseUnary()
+        while self.peek()[1] == u'&&':
+            self.next()
+            expr = ('and', expr, self.parseUnary())
+        return expr
+
+    def parseUnary(self):
+        if self.peek()[1] == u'!':
+            self.next()
+            return ('not', self.parseUnary())
+        return self.parsePrimary()
+
+    def parsePrimary(self):
+        token = self.peek()
+        if token[1] == u'(':
+            self.next()
+            expr = self.parseOr()
+            self.expect(u')')
+            return expr
+        if self.isKeyword(token, u'REGEX'):
+            self.next()
+            self.expect(u'(')
+            arg = self.parseTerm()
+            self.expect(u',')
+            kind, pattern = self.next()
+            if kind != 'string':
+                raise CxnCompileError(u'regex pattern must be a string')
+            pattern = parseString(pattern)
+            flags = re.U
+            if self.peek()[1] == u',':
+                self.next()
+                kind, flagstr = self.next()
+                if kind != 'string':
+                    raise CxnCompileError(u'regex flags must be a string')
+                for flag in parseString(flagstr):
+                    flags |= {u'i': re.I, u'm': re.M, u's': re.S, u'x': re.X}[flag]
+            self.expect(u')')
+            return ('regex', arg, re.compile(pattern, flags))
+        left = self.parseTerm()
+        kind, op = self.next()
+        if op not in (u'=', u'!='):
+            raise CxnCompileError(u'unsupported filter operator %s' % (op))
+        return (op, left, self.parseTerm())
+
+def termVars(term):
+    return set([term[1]]) if term[0] == 'var' else set()
+
+def exprVars(expr):
+    if expr[0] in ('and', 'or'):
+        return exprVars(expr[1]) | exprVars(expr[2])
+    if expr[0] == 'not':
+        return exprVars(expr[1])
+    if expr[0] == 'regex':
+        return termVars(expr[1])
+    return termVars(expr[1]) | termVars(expr[2])
+
+class FilterError(Exception):
+    """ SPARQL expression error: makes the enclosing filter false """
+    pass
+
+def evalTerm(term, binding):
+    if term[0] == 'var':
+        if term[1] not in binding:
+            raise FilterError()
+        return binding[term[1]]
+    return term[1]
+
+def evalExpr(expr, binding):
+    op = expr[0]
+    if op == 'and':
+        return evalExpr(expr[1], binding) and evalExpr(expr[2], binding)
+    if op == 'or':
+        return evalExpr(expr[1], binding) or evalExpr(expr[2], binding)
+    if op == 'not':
+        return not evalExpr(expr[1], binding)
+    if op == 'regex':
+        value = evalTerm(expr[1], binding)
+        if not isinstance(value, basestring):
+            # regex is only defined on string literals
+            raise FilterError()
+        return expr[2].search(value) is not None
+    left = evalTerm(expr[1], binding)
+    right = evalTerm(expr[2], binding)
+    if isinstance(left, Node) or isinstance(right, Node):
+        equal = left is right
+    else:
+        equal = (type(left) == type(right) or
+                 (isinstance(left, basestring) and isinstance(right, basestring))) and \
+                (left == right)
+    return equal if op == u'=' else not equal
+
+def checkFilter(expr, binding):
+    try:
+        return evalExpr(expr, binding)
+    except FilterError:
+        return False
+
+class CompiledCxnQuery(object):
+    """ A cxn query compiled into triple patterns and filters """
+    def __init__(self, qstr):
+        selected, patterns, filters = Parser(qstr).parse()
+        patternvars = set()
+        for s, p, o in patterns:
+            patternvars |= termVars(s) | termVars(o)
+        for var in RESULT_VARS:
+            if (var not in selected) or (var not in patternvars):
+                raise CxnCompileError(u'query does not bind ?%s' % (var))
+        if not patterns:
+            raise CxnCompileError(u'empty query')
+        self.patterns = patterns
+        # filters on variables that are never bound always fail
+        self.unsatisfiable = any(not exprVars(f).issubset(patternvars) for f in filters)
+        self.filters = [(exprVars(f), f) for f in filters]
+
+    def _candidates(self, index, pattern, binding):
+        """ Return the list of (s, o) edges matching pattern under binding """
+        s, p, o = pattern
+        sval = binding.get(s[1]) if s[0] == 'var' else s[1]
+        oval = binding.get(o[1]) if o[0] == 'var' else o[1]
+        if sval is not None:
+            objs = index.spo.get(p, {}).get(sval, ())
+            if oval is not None:
+                return [(sval, oval)] if oval in objs else []
+            return [(sval, obj) for obj in objs]
+        if oval is not None:
+            return [(subj, oval) for subj in index.pos.get(p, {}).get(oval, ())]
+        return [(subj, obj) for subj, objs in index.spo.get(p, {}).iteritems() for obj in objs]
+
+    def _solve(self, index, remaining, binding, results):
+        if not remaining:
+            results.append(dict(binding))
+            return
+        best = None
+        for i, pattern in enumerate(remaining):
+            candidates = self._candidates(index, pattern, binding)
+            if (best is None) or (len(candidates) < len(best[1])):
+                best = (i, candidates)
+                if not candidates:
+                    return
+        i, candidates = best
+        s, p, o = remaining[i]
+        rest = remaining[:i] + remaining[i+1:]
+        for sval, oval in candidates:
+            added = []
+            ok = True
+            for term, value in ((s, sval), (o, oval)):
+                if term[0] != 'var':
+                    continue
+                if term[1] in binding:
+                    if binding[term[1]] != value and not (binding[term[1]] is value):
+                        ok = False
+                else:
+                    binding[term[1]] = value
+                    added.append(term[1])
+            if ok:
+                for fvars, expr in self.filters:
+                    if fvars.issubset(binding) and not checkFilter(expr, binding):
+                        ok = False
+                        break
+            if ok:
+                self._solve(index, rest, binding, results)
+            for var in added:
+                del binding[var]
+
+    def match(self, index):
+        """ Return the set of (tlemma, slemma, sentidx, tidx, sidx) results of
+        the query on a sentence index, as getCXNRelatedPairs reads them.
+        """
+        if self.unsatisfiable:
+            return set()
+        solutions = []
+        self._solve(index, list(self.patterns), {}, solutions)
+        return set((render(b[u'tlemma']), render(b[u'slemma']), int(render(b[u'sentidx'])),
+                    int(render(b[u'tidx'])), int(render(b[u'sidx']))) for b in solutions)
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. module:: docloadbench
+    :platform: Unix
+    :synopsis: Benchmark of loading sentence graphs into Sesame
+
+Times :py:meth:`docquery.DocumentRepository.createSentencesGraph` against a
+local stub of the Sesame HTTP protocol (:py:mod:`sparrow.tests.sesame_stub`),
+comparing the streamed N-Triples bulk loader, with different batch sizes
+and numbers of in-flight uploads, to the previous method of POSTing
+batches of Turtle with add_turtle.  The stub can wait before acknowledging
+each upload, to emulate the time a server takes to commit it.
+
+Sentences are read from MetaNet JSON files, or generated.  Example::
+
+    python docloadbench.py -n 20000 --delay 0.2 -b 50000 -b 150000 -i 1 -i 4
+
+"""
+import sys, time, json, random, argparse, logging, copy, multiprocessing
+from cStringIO import StringIO
+from sparrow.tests.sesame_stub import SesameStub
+from docquery import DocumentRepository
+
+DEPTYPES = [u'nsubj', u'dobj', u'amod', u'prep', u'det', u'ncmod']
+
+def genSentences(n, nwords=20, seed=0):
+    """ Generate n random sentences, with words and dependencies.
+    """
+    rand = random.Random(seed)
+    sents = []
+    for i in xrange(n):
+        words = []
+        for idx in xrange(nwords):
+            lemma = u'w%d' % (rand.randint(0, 5000))
+            word = {u'idx': idx, u'n': unicode(idx+1), u'form': lemma.upper(),
+                    u'lem': lemma, u'pos': u'NN', u'rlem': lemma, u'rpos': u'NN1'}
+            if idx > 0:
+                word[u'dep'] = {u'head': unicode(rand.randint(1, idx)),
+                                u'type': rand.choice(DEPTYPES)}
+            words.append(word)
+        sents.append({u'id': u'%d:1' % (i+1), u'idx': i+1, u'word': words})
+    return sents
+
+def turtleInsert(dr, sentences, batchsize):
+    """ The previous method of createSentencesGraph: batches of Turtle,
+    each posted with add_turtle.  Returns the number of bytes sent.
+    """
+    nbytes = 0
+    dr.sentences = []
+    dr.numwords = 0
+    triplestrings = []
+    for sent in sentences:
+        triplestrings.extend(dr.getSentenceTriples(sent))
+        while len(triplestrings) > batchsize:
+            updatedata = u'%s\n%s' % (dr.turtleHeader, u'\n'.join(triplestrings[:batchsize]))
+            triplestrings = triplestrings[batchsize:]
+            updatedata = updatedata.encode('utf-8')
+            dr.tstore.add_turtle(StringIO(updatedata), dr.gnameiri)
+            nbytes += len(updatedata)
+    if triplestrings:
+        updatedata = u'%s\n%s' % (dr.turtleHeader, u'\n'.join(triplestrings))
+        updatedata = updatedata.encode('utf-8')
+        dr.tstore.add_turtle(StringIO(updatedata), dr.gnameiri)
+        nbytes += len(updatedata)
+    return nbytes
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark loading sentence graphs into a stub Sesame server")
+    parser.add_argument('jsonfiles', nargs='*',
+                        help='MetaNet JSON files to take sentences from')
+    parser.add_argument('-n', '--sentences', type=int, default=5000,
+                        help='Number of sentences to generate, if no files are given')
+    parser.add_argument('-b', '--batchsize', type=int, action='append',
+                        help='Triples per upload (may be repeated)')
+    parser.add_argument('-i', '--inflight', type=int, action='append',
+                        help='Concurrent uploads (may be repeated)')
+    parser.add_argument('--delay', type=float, default=0.0,
+                        help='Seconds the stub server waits before acknowledging an upload')
+    parser.add_argument('-r', '--repeat', type=int, default=1,
+                        help='Number of runs of each configuration (the best is reported)')
+    cmdline = parser.parse_args()
+    logging.basicConfig(level=logging.WARN)
+
+    if cmdline.jsonfiles:
+        sentences = []
+        for fname in cmdline.jsonfiles:
+            sentences.extend(json.load(file(fname), encoding='utf-8')['sentences'])
+    else:
+        sentences = genSentences(cmdline.sentences)
+    batchsizes = cmdline.batchsize or [150000]
+    inflights = cmdline.inflight or [1, 2, 4]
+
+    # the stub server runs in its own process, as a Sesame server would
+    stub = SesameStub(['dproc%d' % (i) for i in range(8)], delay=cmdline.delay)
+    server = multiprocessing.Process(target=stub.serve_forever)
+    server.daemon = True
+    server.start()
+    stub.socket.close()
+    try:
+        dr = DocumentRepository('en', engine='sesame:127.0.0.1:%d' % (stub.port), name='bench')
+        dr.numwords = 0
+        ntriples = 0
+        ntbytes = 0
+        for sent in copy.deepcopy(sentences):
+            data = u'\n'.join(dr.getSentenceNTriples(sent))
+            ntriples += data.count(u'\n') + 1
+            ntbytes += len(data.encode('utf-8')) + 1
+        runs = [('turtle', batchsize, 1) for batchsize in batchsizes]
+        runs += [('ntriples', batchsize, inflight)
+                 for batchsize in batchsizes for inflight in inflights]
+        print '%d sentences, %d triples' % (len(sentences), ntriples)
+        print '%-9s %9s %8s %9s %12s %9s' % ('method', 'batchsize', 'inflight', 'seconds',
+                                            'triples/sec', 'MB sent')
+        for method, batchsize, inflight in runs:
+            best = None
+            for r in range(cmdline.repeat):
+                sents = copy.deepcopy(sentences)
+                start = time.time()
+                if method == 'turtle':
+                    nbytes = turtleInsert(dr, sents, batchsize)
+                else:
+                    dr.createSentencesGraph(sents, batchsize=batchsize, inflight=inflight)
+                    nbytes = ntbytes
+                seconds = time.time() - start
+                dr.deleteSentencesGraph()
+                if (best is None) or (seconds < best):
+                    best = seconds
+            print '%-9s %9d %8d %9.2f %12.0f %9.1f' % (method, batchsize, inflight, best,
+                                                      ntriples / best, nbytes / 1048576.0)
+    finally:
+        server.terminate()
+    return 0
+
+if __name__ == "__main__":
+    status = main()
+    sys.exit(status)
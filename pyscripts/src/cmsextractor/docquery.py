@@ -52,6 +52,12 @@ of the 's possessive::
 Note that regular expression queries must define named match groups ``tlemma``,
 ``slemma``, ``tidx``, and ``sidx``.
 
+With the rdflib engine, SPARQL cxn queries are also compiled by
+:py:mod:`cmsextractor.cxnmatch` and evaluated directly over each sentence's
+JSON structure, so that no per-sentence graph needs to be built.  Queries that
+use SPARQL features the compiler does not handle are run through rdflib, and
+the sentence graph is then built only when one of them is searched for.
+
 """
 import logging, os, time, random, traceback
 import cPickle as pickle
@@ -60,8 +66,36 @@ import codecs, logging, pprint
 from cStringIO import StringIO
 import sparrow
 from sparrow.error import QueryError
+from cxnmatch import CompiledCxnQuery, SentenceIndex, CxnCompileError
 
+# triples per upload, and number of uploads in flight, for createSentencesGraph
 TRIPLES_PER_INSERT = 150000
+INSERTS_IN_FLIGHT = 2
+
+NT_ESCAPES = {u'\\': u'\\\\', u'"': u'\\"', u'\n': u'\\n', u'\r': u'\\r', u'\t': u'\\t'}
+ntEscapeRe = re.compile(ur'[\ud800-\udbff][\udc00-\udfff]|[^ !#-\[\]-~]', flags=re.U)
+# characters that have to be escaped in Turtle string literals
+turtleEscapeRe = re.compile(ur'[\\"\n\r\t]', flags=re.U)
+
+def ntEscapeChar(match):
+    c = match.group(0)
+    if c in NT_ESCAPES:
+        return NT_ESCAPES[c]
+    if len(c) == 2:
+        # surrogate pair on narrow python builds
+        cp = 0x10000 + ((ord(c[0]) - 0xD800) << 10) + (ord(c[1]) - 0xDC00)
+    else:
+        cp = ord(c)
+    if cp > 0xFFFF:
+        return u'\\U%08X' % (cp)
+    return u'\\u%04X' % (cp)
+
+def ntEscape(s):
+    """ Escape a string for use in an N-Triples IRI or literal, as ASCII.
+    """
+    if ntEscapeRe.search(s) is None:
+        return s
+    return ntEscapeRe.sub(ntEscapeChar, s)
     
 class DocumentRepository:
     """
@@ -86,7 +120,8 @@ class DocumentRepository:
         :param rlemf: auxiliary Lemma field to map to hasRLemma
         :type rlemf: str
         :param engine: query engine type (rdflib, redland, sesame).
-            Sesame should be appended with ':' + repository server name (localhost, or DNS)
+            Sesame should be appended with ':' + repository server name (localhost, or DNS),
+            optionally followed by ':' + port (default 8080)
         :type engine: str
         :param name: name of graph in the triplestore
         :type name: str
@@ -112,7 +147,9 @@ class DocumentRepository:
             self.engine = eng
             self.repnum = random.randint(0,7)
             self.repname = 'dproc%d' % (self.repnum)
-            serverstr = 'http://%s:8080/%s' % (server, self.repname)
+            if ':' not in server:
+                server += ':8080'
+            serverstr = 'http://%s/%s' % (server, self.repname)
             self.tstore = sparrow.database('sesame', serverstr)
         else:
             self.logger.error('Unsupported query engine: %s', engine)
@@ -123,9 +160,19 @@ class DocumentRepository:
         self.tstore.register_prefix('dr','https://metaphor.icsi.berkeley.edu/metaphor/DocumentRepository.owl#')
         self.tstore.compute_query_header()
         self.turtleHeader = self.tstore.get_turtle_header()
+        # IRI prefixes for N-Triples
+        self.ntdoc = u'<' + self.tstore.get_ns('doc')
+        self.ntdr = u'<' + self.tstore.get_ns('dr')
+        self.ntxsd = self.tstore.get_ns('xsd')
+        self.nttype = u'<%stype>' % (self.tstore.get_ns('rdf'))
         if not name:
             name = self.random_str(32)
         self.gnameiri = self.tstore.get_ns('dr')[:-1]+'/d_'+name
+        self.sentences = []
+        self.cxnMatchers = {}
+        # sentence added by newSentence whose graph has not been built yet
+        self.pendingSentence = None
+        self.sentenceIndexes = None
         
     def loadCXNQueries(self, infname=None):
         """ Method that parses and loads cxn query specification files.
@@ -176,6 +223,16 @@ class DocumentRepository:
                 self.logger.error("Error in cxn regexp %s: %s" % (cxnname,restr))
                 raise
         self.cxnRegexpStrings = cxnregexps
+
+        self.cxnMatchers = {}
+        if self.engine == 'rdflib':
+            for cxnname, qstr in cxnqueries.iteritems():
+                try:
+                    self.cxnMatchers[cxnname] = CompiledCxnQuery(qstr)
+                except CxnCompileError, e:
+                    self.logger.info(u'cxn %s will be searched with SPARQL: %s', cxnname, e)
+            self.logger.info('Compiled %d of %d sparql cxn queries.',
+                             len(self.cxnMatchers),len(self.cxnQueries))
         self.logger.info('Loaded %d sparql and %d regexp cxn queries from %s.',
                          len(self.cxnQueries),len(self.cxnRegexps),infname)
             
@@ -213,8 +270,14 @@ class DocumentRepository:
         for cxn in qcxnlist:
             self.logger.info('searching for cxn %s', cxn)
             #self.logger.info('query:\n%s',self.cxnQueries[cxn])
+            if (self.pendingSentence is not None) and (cxn in self.cxnMatchers):
+                for sentindex in self.getSentenceIndexes():
+                    for result in self.cxnMatchers[cxn].match(sentindex):
+                        rset.add((cxn,) + result)
+                continue
+            self.buildPendingGraph()
             try:
-                for row in self.tstore.pselect(cxn):
+                for row in self.tstore.pselect_iter(cxn):
                     rset.add((cxn, row['tlemma']['value'],row['slemma']['value'],
                               int(row['sentidx']['value']),
                               int(row['tidx']['value']), int(row['sidx']['value'])))
@@ -237,50 +300,87 @@ class DocumentRepository:
     def newSentence(self, sent):
         """ Create a new graph containing one new sentence.  This method is used by the
         rdflib based CMS execution mode which builds graphs for each sentence separately
-        for cxn searching (for rdflib performance reasons).
+        for cxn searching (for rdflib performance reasons).  The graph itself is
+        built on demand, only if a cxn that could not be compiled is searched for.
         
         :param sent: a sentence dict as per the JSON format
         :type sent: dict
         """
+        self.sentences = [sent]
+        self.numsents = 1
+        self.numwords = 0
+        if u'word' in sent:
+            self.numwords = len(sent[u'word'])
+            # set ranks now, as getWordTriples would, since the graph may never be built
+            for word in sent[u'word']:
+                if u'n' not in word:
+                    word[u'n'] = str(word[u'idx']+1)
+        self.pendingSentence = sent
+        self.sentenceIndexes = None
+
+    def buildPendingGraph(self):
+        """ Build the graph for the sentence added by :py:meth:`newSentence`, if it
+        has not been built yet.
+        """
+        if self.pendingSentence is None:
+            return
+        sent = self.pendingSentence
+        self.pendingSentence = None
         self.deleteSentencesGraph()
         self.sentences = []
-        self.numsents = 1
         self.numwords = 0
         self.addSentence(sent)
+
+    def getSentenceIndexes(self):
+        """ Return the :py:class:`cxnmatch.SentenceIndex` of each sentence, for
+        evaluating compiled cxn queries.
+        """
+        if self.sentenceIndexes is None:
+            self.sentenceIndexes = [SentenceIndex(sent, self.nonWre.sub('_',sent[u'id']),
+                                                  self.pfield, self.lfield,
+                                                  self.rpfield, self.rlfield)
+                                    for sent in self.sentences]
+        return self.sentenceIndexes
                 
-    def createSentencesGraph(self, sentences):
+    def createSentencesGraph(self, sentences, batchsize=None, inflight=None):
         """ Create a graph containing all the sentences provided.  This is used by the
         sesame CMS execution mode which builds a graph for a set of sentences.
+        The triples are streamed to the triplestore as N-Triples, in batches,
+        with several batches uploading at once where the triplestore supports it.
         
         :param sentences: list of sentences (JSON structs)
         :type sentences: list
+        :param batchsize: number of triples per upload (default TRIPLES_PER_INSERT)
+        :type batchsize: int
+        :param inflight: number of concurrent uploads (default INSERTS_IN_FLIGHT)
+        :type inflight: int
         """
-        global TRIPLES_PER_INSERT
+        if batchsize is None:
+            batchsize = TRIPLES_PER_INSERT
+        if inflight is None:
+            inflight = INSERTS_IN_FLIGHT
         
         # note sentences are added to this list later as triples are computed
         self.sentences = []
+        self.pendingSentence = None
+        self.sentenceIndexes = None
         # numbers for stats
         self.numsents = len(sentences)
         self.numwords = 0
         self.logger.info("Inserting %s sentences into triplestore",self.numsents)
         self.logger.info("Graph name <%s>",self.gnameiri)
-        triplestrings = []
-        ntriples = 0
-        for sent in sentences:
-            triples = self.getSentenceTriples(sent)
-            triplestrings.extend(triples)
-            ntriples += len(triples)
-            while len(triplestrings) > TRIPLES_PER_INSERT:
-                triplestoinsert = triplestrings[:TRIPLES_PER_INSERT]
-                triplestrings = triplestrings[TRIPLES_PER_INSERT:]
-                updatedata = u'%s\n%s' % (self.turtleHeader, u'\n'.join(triplestoinsert))
-                self.tstore.add_turtle(StringIO(updatedata), self.gnameiri)
-                self.logger.info('added %d triples'%(ntriples))
-        if triplestrings:
-            updatedata = u'%s\n%s' % (self.turtleHeader, u'\n'.join(triplestrings))
-            self.tstore.add_turtle(StringIO(updatedata), self.gnameiri)
-            self.logger.debug(updatedata)
-        self.logger.info("Done %d triples into triplestore",ntriples)
+        starttime = time.time()
+        loader = self.tstore.bulk_loader(self.gnameiri, batchsize=batchsize, inflight=inflight)
+        try:
+            for sent in sentences:
+                loader.add(self.getSentenceNTriples(sent))
+            loader.close()
+        except:
+            loader.abort()
+            raise
+        ntriples = loader.ntriples
+        self.logger.info("Done %d triples into triplestore in %d uploads, %.1fs",
+                         ntriples, loader.nbatches, time.time() - starttime)
         self.logger.info("Contexts in the repository: %s",pprint.pformat(self.tstore.contexts()))
         if self.numsents:
             self.logger.info("Stats: %d sentences, %.1f words/sent, %.1f triples/sent",
@@ -314,7 +414,7 @@ class DocumentRepository:
             return u'"%s"^^xsd:boolean'%(str(raw).lower())
         if type(raw) is float:
             return u'"%f"^^xsd:float'%(raw)
-        return u'"%s"'%(raw.replace('\\','\\\\').replace('"',ur'\"'))
+        return u'"%s"'%(turtleEscapeRe.sub(lambda m: NT_ESCAPES[m.group(0)], raw))
         
              
     def getDepTriples(self, sent, w, wbyn):
@@ -356,6 +456,8 @@ class DocumentRepository:
             return triples
 
         # No dparse element: use the ones in word instead
+        if u'word' not in sent:
+            return triples
         for word in sent[u'word']:
             idx = word[u'idx']
             if 'dep' not in word:
@@ -471,6 +573,104 @@ class DocumentRepository:
         # dep relations
         deptriples = self.getDepTriples(sent, w, wbyn)
         return striples + wtriples + deptriples
+
+    def getNTLit(self, raw):
+        """ Given a raw value, return an RDF Literal in N-Triples syntax.
+        """
+        if type(raw) is int:
+            return u'"%d"^^<%sinteger>'%(raw, self.ntxsd)
+        if type(raw) is bool:
+            return u'"%s"^^<%sboolean>'%(str(raw).lower(), self.ntxsd)
+        if type(raw) is float:
+            return u'"%f"^^<%sfloat>'%(raw, self.ntxsd)
+        return u'"%s"'%(ntEscape(raw))
+
+    def getSentenceNTriples(self, sent):
+        """ Generate and return the triples of :py:meth:`getSentenceTriples` in
+        N-Triples syntax, with full IRIs, for bulk loading.  Returns a list of
+        strings of one or more lines each.
+        """
+        self.sentences.append(sent)
+        doc = self.ntdoc
+        sid = ntEscape(self.nonWre.sub('_',sent[u'id']))
+        snode = u'%ss_%s>' % (self.ntdr, sid)
+        triples = [u'%s %s %sSentence> .' % (snode, self.nttype, doc),
+                   u'%s %shasIdx> %s .' % (snode, doc, self.getNTLit(sent[u'idx']))]
+        if u'word' not in sent:
+            return triples
+        words = sent[u'word']
+        self.numwords += len(words)
+        # hasIdx, rdf:type and inSentence triples of each word
+        wordtmpl = u'\n'.join([u'%%s %shasIdx> "%%d"^^<%sinteger> .' % (doc, self.ntxsd),
+                               u'%%s %s %sWord> .' % (self.nttype, doc),
+                               u'%%s %sinSentence> %s .' % (doc, snode.replace(u'%', u'%%'))])
+        # words & word properties
+        w = []
+        wbyn = {}
+        for word in words:
+            idx = word[u'idx']
+            w.append(u'%sw_%s_%d>' % (self.ntdr, sid, idx))
+            if u'n' not in word:
+                word[u'n'] = str(idx+1)
+            try:
+                wbyn[word[u'n']] = w[idx]
+            except IndexError:
+                self.logger.error(u'Word index error: \nword=%s\nw=%s\n%s',
+                                  pprint.pformat(words),
+                                  pprint.pformat(w),
+                                  traceback.format_exc())
+                raise
+            wnode = w[idx]
+            triples.append(wordtmpl % (wnode, idx, wnode, wnode))
+            if word[self.pfield] != None:
+                triples.append(u'%s %shasPOS> %s .' % (wnode, doc, self.getNTLit(word[self.pfield])))
+            triples.append(u'%s %shasForm> %s .' % (wnode, doc, self.getNTLit(word[u'form'])))
+            if word[self.lfield] != None:
+                triples.append(u'%s %shasLemma> %s .' % (wnode, doc, self.getNTLit(word[self.lfield])))
+            if self.rlfield in word:
+                triples.append(u'%s %shasRLemma> %s .' % (wnode, doc, self.getNTLit(word[self.rlfield])))
+            if self.rpfield in word:
+                triples.append(u'%s %shasRPOS> %s .' % (wnode, doc, self.getNTLit(word[self.rpfield])))
+            if idx > 0:
+                triples.append(u'%s %sfollows> %s .' % (wnode, doc, w[idx-1]))
+        for word in words:
+            idx = word[u'idx']
+            if idx < len(w)-1:
+                triples.append(u'%s %sprecedes> %s .' % (w[idx], doc, w[idx+1]))
+        # dep relations, as in getDepTriples
+        if 'dparse' in sent:
+            for dep in sent[u'dparse']:
+                if dep[u'type']==u'passive':
+                    if dep[u'head'] in wbyn:
+                        triples.append(u'%s %sisPassive> %s .' % (wbyn[dep[u'head']], doc,
+                                                                  self.getNTLit(True)))
+                    continue
+                if (dep[u'type']==u'ncmod') and ('subtype' in dep) \
+                        and (dep['subtype']=='poss'):
+                    typestr = 'poss'
+                else:
+                    typestr = dep['type'].replace(u'-',u'')
+                if (dep[u'dep'] in wbyn) and (dep['head'] in wbyn):
+                    triples.append(u'%s %s%s> %s .' % (wbyn[dep[u'dep']], doc, ntEscape(typestr),
+                                                       wbyn[dep['head']]))
+            return triples
+        for word in words:
+            idx = word[u'idx']
+            if 'dep' not in word:
+                continue
+            headn = word['dep']['head']
+            if int(headn) == 0:
+                continue
+            try:
+                if (word['dep']['type']=='ncmod') and ('subtype' in word['dep']) \
+                        and (word['dep']['subtype']=='poss'):
+                    typestr = 'poss'
+                else:
+                    typestr = word['dep']['type'].replace(u'-',u'')
+                triples.append(u'%s %s%s> %s .' % (w[idx], doc, ntEscape(typestr), wbyn[headn]))
+            except (KeyError, TypeError, IndexError):
+                pass
+        return triples
         
 def main():
     """ Main function for testing.
@@ -19,6 +19,8 @@ import time
 from mnformats import mnjson
 import os
 from mnpipeline.persiantagger import PersianPOSTagger
+from cmsextractor.scmsmatch import SCMSMatcher
+from cmsextractor.resources import ResourceRegistry
 
 reload(sys)
 sys.setdefaultencoding('utf-8')
@@ -76,15 +78,7 @@ class SimpleConstructionMatchingSystem:
             u'@T@ @W@:5 @S@',
             ]
     cxn_rankings = {}
-    taggers = {}
-    twlist_by_lang = {}
-    twlists_by_lang = {}
-    swlists_by_lang = {}
-    cxns_by_lang = {}
-    old_twlist_by_lang = {}
-    old_swlist_by_lang = {}
-    tword_rank_by_lang = {}
-    cxn_ranks_by_lang = {}
+    twordrank = {}
     
     def __init__(self, exdir=None, wldir=None, cxndir=None, verbose=False):
         global TAGGER_LANGNAME, DOMAIN
@@ -100,30 +94,58 @@ class SimpleConstructionMatchingSystem:
             self.cxndir = cxndir
         self.verbose = verbose
         
-        # setup taggers for all supported langs
-        # pre-load all wordlists cxn lists
-        for l in TAGGER_LANGNAME:
-            if TAGGER_LANGNAME[l]:
-                self.taggers[l] = mnjson.MNTreeTagger(l)
-            else:
-                self.taggers[l] = None
-            wldir = self.wldir + '/' + l + '/'
-            cxndir = self.cxndir + '/' + l + '/'
-            tfile = wldir+"target."+DOMAIN
-            sfile = wldir+"source."+DOMAIN
-            cfile = cxndir+"cxns."+DOMAIN
-            if os.path.exists(tfile) and os.path.exists(sfile):
-                (dtwlist, dtwlists, dswlists) = self.get_domained_wordlists(tfile, sfile)
-                self.twlist_by_lang[l] = dtwlist
-                self.twlists_by_lang[l] = dtwlists
-                self.swlists_by_lang[l] = dswlists
-                self.old_twlist_by_lang[l] = self.get_wordlist(tfile)
-                self.old_swlist_by_lang[l] = self.get_wordlist(sfile)
-                self.tword_rank_by_lang[l] = self.get_ranked_wordlist(tfile)
-            if os.path.exists(cfile):
-                (dcxns, dcxn_ranking) = self.get_cxns(cfile)
-                self.cxns_by_lang[l] = dcxns
-                self.cxn_ranks_by_lang[l] = dcxn_ranking
+        # taggers, wordlists and cxn lists are loaded for a language
+        # when it is first processed
+        self.resources = ResourceRegistry()
+        self.resources.register('tagger', self.load_tagger, forksafe=False)
+        self.resources.register('wordlists', self.load_wordlists)
+        self.resources.register('cxns', self.load_cxns)
+        self.resources.register('matcher', self.load_matcher)
+
+    def load_tagger(self, l):
+        if TAGGER_LANGNAME[l]:
+            return mnjson.MNTreeTagger(l)
+        if l == 'fa':
+            return PersianPOSTagger()
+        return None
+
+    def load_wordlists(self, l):
+        '''
+        load the domained and plain wordlists and the target word ranks
+        of a language, or return None if it has no wordlists
+        '''
+        wldir = self.wldir + '/' + l + '/'
+        tfile = wldir+"target."+DOMAIN
+        sfile = wldir+"source."+DOMAIN
+        if not (os.path.exists(tfile) and os.path.exists(sfile)):
+            return None
+        (dtwlist, dtwlists, dswlists) = self.get_domained_wordlists(tfile, sfile)
+        return {'twlist': dtwlist,
+                'twlists': dtwlists,
+                'swlists': dswlists,
+                'otwlist': self.get_wordlist(tfile),
+                'oswlist': self.get_wordlist(sfile),
+                'twordrank': self.get_ranked_wordlist(tfile)}
+
+    def load_cxns(self, l):
+        '''
+        load the cxns and their rankings of a language, or return None if
+        it has no cxn list
+        '''
+        cfile = self.cxndir + '/' + l + '/' + "cxns."+DOMAIN
+        if not os.path.exists(cfile):
+            return None
+        return self.get_cxns(cfile)
+
+    def load_matcher(self, l):
+        wordlists = self.resources.get(l, 'wordlists')
+        cxns = self.resources.get(l, 'cxns')
+        if (wordlists is None) or (cxns is None):
+            return None
+        # compile the cxn patterns for the language once
+        (dcxns, dcxn_ranking) = cxns
+        cxnpatterns = dict((cxn, self.get_pattern(cxn, l)) for cxn in dcxns)
+        return SCMSMatcher(wordlists['twlist'], wordlists['swlists'], dcxns, cxnpatterns)
         
     def post_process(self, jsondoc, logger=None, matchf=None, posf=None, reportf=None, forcetagger=False):
         """
@@ -233,15 +255,26 @@ class SimpleConstructionMatchingSystem:
 
     def prep_lang_specific_resources(self, lang):
         global SBS_VALUE
+        wordlists = self.resources.get(lang, 'wordlists')
+        cxns = self.resources.get(lang, 'cxns')
+        if (wordlists is None) or (cxns is None):
+            raise KeyError(lang)
         self.lang = lang
-        self.tagger = self.taggers[self.lang]
-        self.twlist = self.twlist_by_lang[self.lang]
-        self.twlists = self.twlists_by_lang[self.lang]
-        self.swlists = self.swlists_by_lang[self.lang]
-        self.otwlist = self.old_twlist_by_lang[self.lang]
-        self.oswlist = self.old_swlist_by_lang[self.lang]
-        self.cxns = self.cxns_by_lang[self.lang]
-        self.cxn_rankings = self.cxn_ranks_by_lang[self.lang]
+        self.tagger = self.resources.get(lang, 'tagger')
+        self.twlist = wordlists['twlist']
+        self.twlists = wordlists['twlists']
+        self.swlists = wordlists['swlists']
+        self.otwlist = wordlists['otwlist']
+        self.oswlist = wordlists['oswlist']
+        self.twordrank = wordlists['twordrank']
+        (self.cxns, self.cxn_rankings) = cxns
+        self.matcher = self.resources.get(lang, 'matcher')
+
+    def unload_lang_specific_resources(self, lang=None):
+        '''
+        unload the resources of a language (of all languages by default)
+        '''
+        self.resources.unload(lang)
         
     def getlmkey(self,lm):
         return '%s:%d:%s:%d' % (lm['target']['lemma'],lm['target']['start'],
@@ -412,7 +445,7 @@ class SimpleConstructionMatchingSystem:
     
     def lemmatize_sentences(self, sentences):
         if self.lang == 'fa':
-            pt = PersianPOSTagger()
+            pt = self.tagger
             for sent in sentences:
                 sent['ctext'] = pt.cleanText(sent['text'])
                 tags = pt.run_hmm_tagger(sent['ctext'])
@@ -509,6 +542,31 @@ class SimpleConstructionMatchingSystem:
         pstatus(u'Match sentence: {0}',msent)
                 
         # do target list matching
+        lm_matches = self.matcher.match(msent)
+        # now need to retrieve spans from the sentence text
+        if lm_matches:
+            if 'lms' not in sentence:
+                sentence['lms'] = []
+            rcode = 1
+        dupe_lm_checker = set()
+        for lm_match in lm_matches:
+            lm = self.convert_lmmatch_to_lm(lm_match, sentence)
+            lmcompkey = self.gen_comparison_key(lm)
+            if lmcompkey in dupe_lm_checker:
+                continue
+            dupe_lm_checker.add(lmcompkey)
+            pstatus(u'Found LM: {0}',lm['name'])
+            sentence['lms'].append(lm)
+        return rcode
+    
+    def find_lm_matches_regex(self, msent):
+        '''
+        Reference implementation of the target / source / cxn matching done
+        by the SCMSMatcher in search_sentence_lemma: returns the list of LM
+        matches in the match sentence, recompiling all patterns for each
+        sentence.  Used to check and benchmark the matcher.
+        '''
+        global GEI
         lm_matches = []
         tmatches = []
         tmatchdupchecker = []
@@ -630,21 +688,7 @@ class SimpleConstructionMatchingSystem:
                                 break
                         except re.error:
                             print >> sys.stderr, u'Invalid cxn regex: {0}'.format(cxnpattern)
-        # now need to retrieve spans from the sentence text
-        if lm_matches:
-            if 'lms' not in sentence:
-                sentence['lms'] = []
-            rcode = 1
-        dupe_lm_checker = set()
-        for lm_match in lm_matches:
-            lm = self.convert_lmmatch_to_lm(lm_match, sentence)
-            lmcompkey = self.gen_comparison_key(lm)
-            if lmcompkey in dupe_lm_checker:
-                continue
-            dupe_lm_checker.add(lmcompkey)
-            pstatus(u'Found LM: {0}',lm['name'])
-            sentence['lms'].append(lm)
-        return rcode
+        return lm_matches
     
     def convert_lmmatch_to_lm(self, lm_match, sentence):
         # deal with target
@@ -739,7 +783,7 @@ class SimpleConstructionMatchingSystem:
     
     def get_tword_raw_score(self, tw):
         global TWORD_RAW_VALUE
-        twordrank = self.tword_rank_by_lang[self.lang]
+        twordrank = self.twordrank
         if tw in twordrank:
             base = float(len(twordrank.keys()) + 1)
             score = ((base - float(twordrank[tw])) / base) * TWORD_RAW_VALUE
@@ -774,12 +818,15 @@ class SimpleConstructionMatchingSystem:
         #print "domain score:",score
         return score
     
-    def get_pattern(self, wlword):
+    def get_pattern(self, wlword, lang=None):
         '''
         given a wordlist word (either target or source), process it is regex
-        matching by adding a pos and word index component
+        matching by adding a pos and word index component.  The preprocessing
+        is that of lang, by default the current language.
         '''
         global ANYW, ANYP
+        if lang is None:
+            lang = self.lang
         wlparts = wlword.split()
         pwlparts = []
         # this loop is because each wordlist word can actually be a multiword
@@ -788,7 +835,7 @@ class SimpleConstructionMatchingSystem:
             w = w.strip().replace(u'$',u'\\$')
             processed_w = w
             # do some preprocessing
-            if self.lang=='en':
+            if lang=='en':
                 if w.endswith('.v'):
                     w = w[:-2]+u'=V\\w*'
                 elif w.endswith('.n'):
@@ -797,7 +844,7 @@ class SimpleConstructionMatchingSystem:
                     w = w[:-4]+u'=RB\\w*'
                 elif w.endswith('.a'):
                     w = w[:-2]+u'=J\\w*'
-            if self.lang=='es':
+            if lang=='es':
                 if w.endswith('. v') or w.endswith('. V'):
                     w = w[:-3]+u'=V\\w*'
                 elif w.endswith('.V pron'):
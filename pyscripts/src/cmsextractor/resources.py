@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. module:: resources
+    :platform: Unix
+    :synopsis: Lazy registry of per-language extractor resources
+
+Per-language resources of the extractors, such as POS tagger handles, word
+lists, cxn patterns and MWE tables, are registered with a loader, and loaded
+for a language the first time they are requested.  A run that handles a
+single language thus only pays for that language.  Resources can be
+unloaded to free their memory.
+
+The registry records the time each load took and the change in the resident
+memory of the process (loads of other resources triggered by a loader are
+accounted to those resources).  Resources that hold handles which cannot be
+shared with forked processes, e.g. tagger subprocesses, are registered as
+not fork-safe and are loaded again in a child process.
+
+Example::
+
+    registry = ResourceRegistry()
+    registry.register('tagger', lambda lang: mnjson.MNTreeTagger(lang), forksafe=False)
+    tagger = registry.get('en', 'tagger')
+    registry.logStats()
+
+"""
+import os, time, logging, resource
+
+def _rss():
+    """ Return the resident memory of the process, in bytes.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except (IOError, ValueError, IndexError):
+        # peak resident memory (kilobytes on Linux)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+class ResourceRegistry:
+    """ Loads registered resources per language on first use.
+    """
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self.loaders = {}
+        # (lang, name) -> (resource, pid of the process that loaded it)
+        self.resources = {}
+        # (lang, name) -> {'loads', 'seconds', 'memory'}
+        self.loadstats = {}
+        # time and memory of nested loads, per active load
+        self._nested = []
+
+    def register(self, name, loader, forksafe=True):
+        """ Register a resource.
+
+        :param name: resource name
+        :type name: str
+        :param loader: function that takes a language and returns the resource
+        :type loader: callable
+        :param forksafe: whether the resource can be used in a forked child process
+        :type forksafe: bool
+        """
+        self.loaders[name] = (loader, forksafe)
+
+    def isLoaded(self, lang, name):
+        """ Return whether the resource is loaded (and usable in this process).
+        """
+        if (lang, name) not in self.resources:
+            return False
+        return self.loaders[name][1] or (self.resources[(lang, name)][1] == os.getpid())
+
+    def get(self, lang, name):
+        """ Return the resource for the language, loading it if needed.
+        """
+        if self.isLoaded(lang, name):
+            return self.resources[(lang, name)][0]
+        loader = self.loaders[name][0]
+        self._nested.append([0.0, 0])
+        start = time.time()
+        startrss = _rss()
+        try:
+            value = loader(lang)
+        finally:
+            seconds = time.time() - start
+            memory = _rss() - startrss
+            nestedseconds, nestedmemory = self._nested.pop()
+        seconds -= nestedseconds
+        memory -= nestedmemory
+        if self._nested:
+            self._nested[-1][0] += seconds + nestedseconds
+            self._nested[-1][1] += memory + nestedmemory
+        self.resources[(lang, name)] = (value, os.getpid())
+        stats = self.loadstats.setdefault((lang, name), {'loads': 0, 'seconds': 0.0, 'memory': 0})
+        stats['loads'] += 1
+        stats['seconds'] += seconds
+        stats['memory'] += memory
+        self.logger.debug('loaded %s for %s in %.2fs (%+.1f MB)', name, lang,
+                          seconds, memory / 1048576.0)
+        return value
+
+    def unload(self, lang=None, name=None):
+        """ Unload the resources of a language and/or name (all by default).
+        Returns the number of resources unloaded.
+        """
+        keys = [key for key in self.resources
+                if ((lang is None) or (key[0] == lang)) and ((name is None) or (key[1] == name))]
+        for key in keys:
+            del self.resources[key]
+        return len(keys)
+
+    def languages(self):
+        """ Return the languages for which resources are loaded.
+        """
+        return sorted(set(lang for lang, name in self.resources))
+
+    def stats(self):
+        """ Return a dict from (lang, name) to (number of loads, seconds spent
+        loading, change in resident memory in bytes).
+        """
+        return dict((key, (s['loads'], s['seconds'], s['memory']))
+                    for key, s in self.loadstats.iteritems())
+
+    def logStats(self):
+        """ Log the load time and memory of each resource.
+        """
+        for (lang, name), (loads, seconds, memory) in sorted(self.stats().iteritems()):
+            self.logger.info('%s %s: %d loads, %.2fs, %+.1f MB', lang, name, loads,
+                             seconds, memory / 1048576.0)
@@ -0,0 +1,465 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. module:: scmsmatch
+    :platform: Unix
+    :synopsis: Precompiled construction pattern matcher for the SCMS
+
+Matching engine for
+:py:class:`cmsextractor.postextraction.SimpleConstructionMatchingSystem`.
+The SCMS matches target and source word list patterns against a *match
+sentence*, a string of ``word=pos=index`` tokens, and then checks which
+constructions (cxns) license each target/source pair.
+:py:class:`SCMSMatcher` produces the same matches as
+:py:meth:`SimpleConstructionMatchingSystem.find_lm_matches_regex`, but does
+the work that does not depend on the sentence once, when the matcher is
+built for a language:
+
+- cxns are turned into patterns once, and the POS checks on their target
+  and source slots are compiled;
+- each word list pattern is indexed by a word that must occur in a sentence
+  for it to match, so that per sentence only the patterns whose word occurs
+  are run;
+- source matches are computed once per target domain, not once per target
+  match.
+
+When the tokens of a sentence are well formed (see :py:class:`MatchSentence`),
+the duplicate checks and the choice of cxns to test use the token positions of
+the matches: a match is a duplicate if an earlier match spans it, and a cxn
+is only tested if the number of tokens between the target and source
+matches fits between its slots.  These are hash lookups where the regex
+version searches every earlier match and tests every cxn.  Sentences or matches
+with characters that the regex version would interpret as regular expression
+syntax are matched the regex way, so the results are the same.
+
+The module's main method benchmarks the matcher against the regex version on
+a synthetic corpus, and checks that the results are identical::
+
+    python -m cmsextractor.scmsmatch -n 2000
+
+"""
+import sys, re, time, random, argparse
+from bisect import bisect_left, bisect_right
+
+GEI = u'GENERAL ECONOMIC INEQUALITY'
+ANYW = u'[^=\\s]+'
+ANYWNC = u'[^=\\s,]+'
+ANYP = u'[^=\\s]+'
+
+# characters that make a match string behave differently from a literal
+# string when used as a regular expression (the SCMS escapes $)
+METACHARS = re.compile(ur'[.^*+?{}\[\]\\|()]', flags=re.U)
+WORDCHAR = re.compile(ur'\w', flags=re.U)
+BOUNDARY = re.compile(ur'\b', flags=re.U)
+# a word of a pattern with a literal lemma: the lemma is the first group
+LITERAL_WORD = re.compile(ur'^([^.^$*+?{}\[\]\\|()=\s]+)=', flags=re.U)
+# pattern words that match exactly one well formed token
+POSPATTERN = u'(?:%s|[A-Za-z]+(?:\\\\w\\*)?)' % (re.escape(ANYP))
+ONE_TOKEN = re.compile(u'^(?:%s|[^.^$*+?{}\\[\\]\\\\|()=\\s]+)=%s=\\\\d\\+$' % (re.escape(ANYW), POSPATTERN),
+                       flags=re.U)
+
+def pattern_literal(pattern):
+    """ Return a lemma (lowercased) that must occur as a token lemma, or after
+    a word boundary in a token lemma, for the word list pattern to match; or
+    None if the pattern has no such lemma.
+
+    :param pattern: pattern produced by get_pattern for a word list word
+    :type pattern: unicode
+    """
+    if u'|' in pattern:
+        return None
+    words = pattern.split(u' ')
+    for w in words:
+        if w.count(u'(') != w.count(u')'):
+            # a group spans words
+            return None
+    for w in words:
+        if (u'(' in w) or (u')' in w):
+            continue
+        m = LITERAL_WORD.match(w)
+        if m:
+            return m.group(1).lower()
+    return None
+
+class MatchSentence:
+    """ A match sentence, with the positions of its tokens.  The sentence is
+    *regular* if each token is ``word=pos=index`` with a non-empty word and
+    POS containing no ``=`` or whitespace, a POS that is not a number, and
+    the index of the token.  In a regular sentence, a match string without
+    regular expression characters occurs only at the position where it was
+    matched, since it ends with the unique ``=pos=index`` of its last token.
+    """
+    def __init__(self, msent):
+        self.text = msent
+        self.starts = []
+        self.ends = []
+        self.posstarts = []
+        self.lemmas = set()
+        self.regular = True
+        pos = 0
+        for idx, token in enumerate(msent.split(u' ')):
+            parts = token.split(u'=')
+            if ((len(parts) != 3) or (not parts[0]) or (not parts[1]) or parts[1].isdigit() or
+                (parts[2] != str(idx)) or re.search(ur'\s', token, re.U)):
+                self.regular = False
+            self.starts.append(pos)
+            self.ends.append(pos + len(token))
+            self.posstarts.append(pos + len(parts[0]))
+            lemma = parts[0]
+            self.lemmas.add(lemma.lower())
+            for m in BOUNDARY.finditer(lemma):
+                if m.start() < len(lemma):
+                    self.lemmas.add(lemma[m.start():].lower())
+            pos += len(token) + 1
+
+    def literal(self, match, span):
+        """ Whether a match can be treated as a literal string that occurs
+        only at its span: it must have no regular expression characters, and
+        end with the whole ``=pos=index`` of a token.
+        """
+        if (not self.regular) or METACHARS.search(match):
+            return False
+        last = self.last_token(span[1])
+        return (last is not None) and (span[0] <= self.posstarts[last])
+
+    def last_token(self, end):
+        """ Index of the token ending at end, or None.
+        """
+        i = bisect_left(self.ends, end)
+        if (i < len(self.ends)) and (self.ends[i] == end):
+            return i
+        return None
+
+    def first_token(self, start):
+        """ Index of the token starting at start, or None.
+        """
+        i = bisect_left(self.starts, start)
+        if (i < len(self.starts)) and (self.starts[i] == start):
+            return i
+        return None
+
+class DupChecker:
+    """ Tracks accepted matches, and answers whether a new match is contained
+    in an accepted one (with the same domain, if domains are used).  This is
+    the substring check of the SCMS, which searches for the new match as a
+    regular expression in each accepted match.
+    """
+    def __init__(self, sentence, usedomain):
+        self.sentence = sentence
+        self.usedomain = usedomain
+        self.accepted = []
+        # (domain, token index) => least start of an accepted match spanning the token's end
+        self.spanstart = {}
+
+    def is_dup(self, match, span, domain):
+        s = self.sentence
+        if s.literal(match, span) and WORDCHAR.match(match):
+            last = s.last_token(span[1])
+            return self.spanstart.get((domain, last), sys.maxint) <= span[0]
+        regexp = u'\\b{0}\\b'.format(match.replace(u'$',u'\\$'))
+        for (pastmatch, pastdomain) in self.accepted:
+            if re.search(regexp, pastmatch, re.U) and ((not self.usedomain) or (pastdomain == domain)):
+                return True
+        return False
+
+    def add(self, match, span, domain):
+        self.accepted.append((match, domain))
+        s = self.sentence
+        if s.regular:
+            for i in range(bisect_right(s.ends, span[0]), bisect_right(s.ends, span[1])):
+                key = (domain, i)
+                if self.spanstart.get(key, sys.maxint) > span[0]:
+                    self.spanstart[key] = span[0]
+
+class WordPatterns:
+    """ A list of word list entries (word, domain, compiled pattern), indexed
+    by the literal lemma each pattern requires.
+    """
+    def __init__(self, entries):
+        self.entries = entries
+        self.unindexed = []
+        self.byliteral = {}
+        for i, (w, domain, regexp) in enumerate(entries):
+            pattern = regexp.pattern
+            if pattern.startswith(u'\\b(') and pattern.endswith(u')\\b'):
+                literal = pattern_literal(pattern[3:-3])
+            else:
+                literal = None
+            if literal is None:
+                self.unindexed.append(i)
+            else:
+                self.byliteral.setdefault(literal, []).append(i)
+
+    def candidates(self, sentence):
+        """ Return the entries that can match the sentence, in order.
+        """
+        if not sentence.regular:
+            return self.entries
+        found = list(self.unindexed)
+        for lemma in sentence.lemmas:
+            if lemma in self.byliteral:
+                found.extend(self.byliteral[lemma])
+        found.sort()
+        return [self.entries[i] for i in found]
+
+class CxnSpec:
+    """ A cxn, compiled: its pattern parts, and the numbers of tokens that
+    can separate its target and source slots.
+    """
+    def __init__(self, cxn, cpattern):
+        self.cxn = cxn
+        self.parts = []
+        tslots = []
+        sslots = []
+        for cpatpart in cpattern.split():
+            if cpatpart.startswith('@T@='):
+                if cpatpart == u'@T@={0}=\\d+'.format(ANYP):
+                    posre = None
+                else:
+                    posre = re.compile(ANYW+cpatpart[3:], re.I|re.U)
+                tslots.append(len(self.parts))
+                self.parts.append(('T', posre))
+            elif cpatpart.startswith('@S@='):
+                if cpatpart == u'@S@={0}=\\d+'.format(ANYP):
+                    posre = None
+                else:
+                    posre = re.compile(ANYW+cpatpart[3:], re.I|re.U)
+                sslots.append(len(self.parts))
+                self.parts.append(('S', posre))
+            elif cpatpart.startswith('@W@') or cpatpart.startswith('@WNC@'):
+                (wordspec,remainder) = cpatpart.split('=',1)
+                if ':' in wordspec:
+                    numwords = int(wordspec.split(':')[1]) - 1
+                else:
+                    numwords = 1
+                if numwords < 1:
+                    numwords = 1
+                if wordspec.startswith('@WNC@'):
+                    wpat = ANYWNC+u'='+remainder
+                else:
+                    wpat = ANYW+u'='+remainder
+                wordspattern = wpat+u'( '+wpat+u'){0,'+str(numwords)+u'}'
+                bounds = None
+                if ONE_TOKEN.match(u'%s=%s' % (ANYW, remainder)):
+                    bounds = (1, numwords + 1)
+                self.parts.append(('P', wordspattern, bounds))
+            else:
+                bounds = None
+                if ONE_TOKEN.match(cpatpart):
+                    bounds = (1, 1)
+                elif cpatpart.startswith(u'(') and cpatpart.endswith(u')?') and \
+                        ONE_TOKEN.match(cpatpart[1:-2]):
+                    bounds = (0, 1)
+                self.parts.append(('P', cpatpart, bounds))
+        # gap bounds, when there is one target and one source slot
+        self.gap = None
+        if (len(tslots) == 1) and (len(sslots) == 1):
+            first, second = sorted([tslots[0], sslots[0]])
+            between = [part[2] for part in self.parts[first+1:second]]
+            if None not in between:
+                self.gap = (tslots[0] < sslots[0],
+                            sum(b[0] for b in between),
+                            sum(b[1] for b in between))
+
+    def pattern(self, tmatch, smatch):
+        """ Return the regular expression for the cxn with the target and
+        source matches filled in, or None if they do not fit its slots.
+        """
+        cxnpatternparts = []
+        tcheck = False
+        scheck = False
+        for part in self.parts:
+            if part[0] == 'T':
+                if (part[1] is None) or part[1].match(tmatch):
+                    cxnpatternparts.append(tmatch)
+                    tcheck = True
+            elif part[0] == 'S':
+                if (part[1] is None) or part[1].match(smatch):
+                    cxnpatternparts.append(smatch)
+                    scheck = True
+            else:
+                cxnpatternparts.append(part[1])
+        if tcheck and scheck:
+            return u' '.join(cxnpatternparts).replace(u'$',u'\\$')
+        return None
+
+    def can_connect(self, sentence, tmatch, tspan, smatch, sspan):
+        """ Whether the cxn can possibly match the sentence with the target
+        and source matches; False only if the number of tokens between them
+        does not fit the cxn.
+        """
+        if ((self.gap is None) or (not sentence.literal(tmatch, tspan)) or
+            (not sentence.literal(smatch, sspan))):
+            return True
+        tfirst, minwords, maxwords = self.gap
+        if tfirst:
+            left, right = tspan, sspan
+        else:
+            left, right = sspan, tspan
+        last = sentence.last_token(left[1])
+        first = sentence.first_token(right[0])
+        if (last is None) or (first is None) or (first <= last):
+            return False
+        return minwords <= first - last - 1 <= maxwords
+
+class SCMSMatcher:
+    """ Finds target/source/cxn matches in match sentences, for one language.
+    """
+    def __init__(self, twlist, swlists, cxns, cxnpatterns):
+        """
+        :param twlist: target word list entries (word, domain, compiled pattern)
+        :type twlist: list
+        :param swlists: source word list entries by domain
+        :type swlists: dict
+        :param cxns: cxns, in order of preference
+        :type cxns: list
+        :param cxnpatterns: pattern of each cxn (see get_pattern)
+        :type cxnpatterns: dict
+        """
+        self.targets = WordPatterns(twlist)
+        self.sources = {}
+        for (tw, twdomain, twregexp) in twlist:
+            if twdomain in self.sources:
+                continue
+            swsearchlist = list(swlists[twdomain])
+            if (twdomain != GEI) and (GEI in swlists):
+                swsearchlist += swlists[GEI]
+            self.sources[twdomain] = WordPatterns(swsearchlist)
+        self.cxns = [CxnSpec(cxn, cxnpatterns[cxn]) for cxn in cxns]
+
+    def find_targets(self, sentence):
+        tmatches = []
+        dupchecker = DupChecker(sentence, True)
+        for (tw, twdomain, twregexp) in self.targets.candidates(sentence):
+            try:
+                for m in twregexp.finditer(sentence.text):
+                    tmatch = m.group(1)
+                    span = m.span(1)
+                    if tmatch and (not dupchecker.is_dup(tmatch, span, twdomain)):
+                        dupchecker.add(tmatch, span, twdomain)
+                        tmatches.append((tmatch, span, tw, twdomain))
+            except re.error:
+                print >> sys.stderr, u'Invalid target regex: {0} in {1}'.format(tw,twdomain)
+        return tmatches
+
+    def find_sources(self, sentence, twdomain):
+        smatches = []
+        dupchecker = DupChecker(sentence, False)
+        for (sw, swdomain, swregexp) in self.sources[twdomain].candidates(sentence):
+            try:
+                for m in swregexp.finditer(sentence.text):
+                    smatch = m.group(1)
+                    span = m.span(1)
+                    if smatch and (not dupchecker.is_dup(smatch, span, None)):
+                        dupchecker.add(smatch, span, None)
+                        smatches.append((smatch, span, sw, swdomain))
+            except re.error:
+                print >> sys.stderr, u'Invalid source regex: {0} in {1}'.format(sw,swdomain)
+        return smatches
+
+    def match(self, msent):
+        """ Return the list of LM matches in the match sentence, as
+        dicts with the keys target, source, cxn, targetw, sourcew,
+        targetwdomain and sourcewdomain.
+
+        :param msent: match sentence (word=pos=index tokens)
+        :type msent: unicode
+        """
+        sentence = MatchSentence(msent)
+        lm_matches = []
+        smatchesbydomain = {}
+        for (tmatch, tspan, tw, twdomain) in self.find_targets(sentence):
+            if twdomain not in smatchesbydomain:
+                smatchesbydomain[twdomain] = self.find_sources(sentence, twdomain)
+            for (smatch, sspan, sw, swdomain) in smatchesbydomain[twdomain]:
+                for spec in self.cxns:
+                    if not spec.can_connect(sentence, tmatch, tspan, smatch, sspan):
+                        continue
+                    cxnpattern = spec.pattern(tmatch, smatch)
+                    if cxnpattern is None:
+                        continue
+                    try:
+                        if re.search(u'\\b{0}\\b'.format(cxnpattern), msent, re.I|re.U):
+                            lm_matches.append({'target':tmatch,
+                                               'source':smatch,
+                                               'cxn':spec.cxn,
+                                               'targetw':tw,
+                                               'sourcew':sw,
+                                               'targetwdomain':twdomain,
+                                               'sourcewdomain':swdomain})
+                            break
+                    except re.error:
+                        print >> sys.stderr, u'Invalid cxn regex: {0}'.format(cxnpattern)
+        return lm_matches
+
+def synthetic_scms(nwords=300, ndomains=4, seed=0):
+    """ Return a SimpleConstructionMatchingSystem for English with synthetic
+    word lists and cxns, and the vocabulary of the word lists.
+    """
+    from cmsextractor.postextraction import SimpleConstructionMatchingSystem
+    class SyntheticSCMS(SimpleConstructionMatchingSystem):
+        def __init__(self):
+            # no taggers or resource files
+            self.lang = u'en'
+    rand = random.Random(seed)
+    scms = SyntheticSCMS()
+    vocab = [u'w%03d' % (i) for i in range(nwords)] + [u'U.S.', u'$', u'anti-tax', u'tax']
+    domains = [u'DOMAIN %d' % (i) for i in range(ndomains - 1)] + [GEI]
+    def entries(words):
+        wl = []
+        for word in words:
+            w = rand.choice([word, word + u'.n', word + u'.v', word + u' ' + rand.choice(vocab),
+                             u'(the)? ' + word])
+            regexp = re.compile(ur'\b({0})\b'.format(scms.get_pattern(w)),flags=re.U|re.I)
+            wl.append((w, rand.choice(domains), regexp))
+        return wl
+    twlist = entries(rand.sample(vocab, len(vocab) // 3))
+    swlists = dict((d, []) for d in domains)
+    for entry in entries(rand.sample(vocab, len(vocab) // 2)):
+        swlists[entry[1]].append(entry)
+    cxns = [u'@S@ of @T@', u'@T@ @S@', u'@S@ @T@', u'@S@ @W@:5 @T@', u'@T@ @W@:5 @S@',
+            u'@T@.n @W@:3 @S@.v', u'@S@ (the)? @T@', u'@T@ of the @S@']
+    return scms, twlist, swlists, cxns, vocab
+
+def synthetic_sentences(vocab, n, seed=1):
+    """ Return n synthetic match sentences over the vocabulary.
+    """
+    rand = random.Random(seed)
+    words = vocab + [u'of', u'the', u'The', u'.', u',', u'(', u'x|y']
+    tags = [u'NN', u'NNS', u'VB', u'VBZ', u'JJ', u'IN', u'DT', u'SENT']
+    sentences = []
+    for _ in range(n):
+        length = rand.randint(5, 40)
+        sentences.append(u' '.join(u'{0}={1}={2}'.format(rand.choice(words), rand.choice(tags), i)
+                                   for i in range(length)))
+    return sentences
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the SCMS matcher against '
+                                     'the regex implementation on a synthetic corpus')
+    parser.add_argument('-n', dest='nsentences', type=int, default=1000,
+                        help='Number of sentences')
+    parser.add_argument('-w', dest='nwords', type=int, default=300,
+                        help='Number of word list words')
+    cmdline = parser.parse_args()
+    scms, twlist, swlists, cxns, vocab = synthetic_scms(cmdline.nwords)
+    scms.twlist = twlist
+    scms.swlists = swlists
+    scms.cxns = cxns
+    matcher = SCMSMatcher(twlist, swlists, cxns, dict((c, scms.get_pattern(c)) for c in cxns))
+    sentences = synthetic_sentences(vocab, cmdline.nsentences)
+    start = time.time()
+    expected = [scms.find_lm_matches_regex(msent) for msent in sentences]
+    regextime = time.time() - start
+    start = time.time()
+    found = [matcher.match(msent) for msent in sentences]
+    matchertime = time.time() - start
+    mismatches = sum(1 for e, f in zip(expected, found) if e != f)
+    print 'sentences: %d, matches: %d' % (len(sentences), sum(len(f) for f in found))
+    print 'regex:   %.3fs (%.1f sentences/s)' % (regextime, len(sentences) / regextime)
+    print 'matcher: %.3fs (%.1f sentences/s)' % (matchertime, len(sentences) / matchertime)
+    print 'speedup: %.1fx, mismatches: %d' % (regextime / matchertime, mismatches)
+    return 1 if mismatches else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
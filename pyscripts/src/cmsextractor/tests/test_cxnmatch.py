@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+from unittest import TestCase, TestSuite, makeSuite, main
+import os, codecs, random, shutil, tempfile, logging
+
+from cmsextractor import docquery
+from cmsextractor.docquery import DocumentRepository
+
+ETC = os.path.join(os.path.dirname(os.path.abspath(docquery.__file__)), '..', '..', 'etc')
+
+# beyond the bundled ones: other relations, boolean and string filters,
+# passives, possessives, and a query that is left to rdflib
+QUERIES = u'''
+START CXN: T.poss S.noun
+SELECT ?tlemma ?slemma ?sentidx ?tidx ?sidx
+WHERE {
+    ?sent rdf:type doc:Sentence ; doc:hasIdx ?sentidx .
+    ?target a doc:Word ; doc:hasIdx ?tidx ; doc:hasLemma ?tlemma ; doc:inSentence ?sent .
+    ?source a doc:Word ; doc:hasIdx ?sidx ; doc:hasLemma ?slemma ; doc:inSentence ?sent .
+    ?target doc:poss ?source .
+    ?source doc:hasPOS ?spos .
+    FILTER (regex(?spos, "^n", "i") && !(?slemma = "crime"))
+}
+END CXN
+
+START CXN: S.verb T.passive
+SELECT ?tlemma ?slemma ?sentidx ?tidx ?sidx
+WHERE {
+    ?sent rdf:type doc:Sentence . ?sent doc:hasIdx ?sentidx .
+    ?target rdf:type doc:Word . ?target doc:hasIdx ?tidx . ?target doc:hasLemma ?tlemma .
+    ?source rdf:type doc:Word . ?source doc:hasIdx ?sidx . ?source doc:hasLemma ?slemma .
+    ?target doc:inSentence ?sent . ?source doc:inSentence ?sent .
+    ?target doc:ncsubj ?source .
+    ?source doc:isPassive true .
+}
+END CXN
+
+START CXN: T.noun S.adj
+SELECT ?tlemma ?slemma ?sentidx ?tidx ?sidx
+WHERE {
+    ?sent rdf:type doc:Sentence . ?sent doc:hasIdx ?sentidx .
+    ?target rdf:type doc:Word . ?target doc:hasIdx ?tidx . ?target doc:hasLemma ?tlemma .
+    ?source rdf:type doc:Word . ?source doc:hasIdx ?sidx . ?source doc:hasLemma ?slemma .
+    ?target doc:inSentence ?sent . ?source doc:inSentence ?sent .
+    ?source doc:precedes ?target .
+    ?source doc:hasPOS ?spos . ?target doc:hasPOS ?tpos .
+    FILTER (?spos = "JJ" || ?spos != ?tpos && regex(?tpos, "^NNS"))
+}
+END CXN
+
+START CXN: T.noun S.any
+SELECT ?tlemma ?slemma ?sentidx ?tidx ?sidx
+WHERE {
+    ?sent rdf:type doc:Sentence . ?sent doc:hasIdx ?sentidx .
+    ?target rdf:type doc:Word . ?target doc:hasIdx ?tidx . ?target doc:hasLemma ?tlemma .
+    ?source rdf:type doc:Word . ?source doc:hasIdx ?sidx . ?source doc:hasLemma ?slemma .
+    ?target doc:inSentence ?sent . ?source doc:inSentence ?sent .
+    ?target doc:follows ?source .
+    OPTIONAL { ?source doc:hasPOS ?spos . }
+    FILTER regex(?tlemma, "^p")
+}
+END CXN
+'''
+
+WORDS = [(u'poverty', u'NN'), (u'crime', u'NN'), (u'taxes', u'NNS'), (u'disease', u'NN'),
+         (u'fight', u'VB'), (u'raise', u'VBZ'), (u'cure', u'VBD'), (u'is', u'VBZ'),
+         (u'deep', u'JJ'), (u'the', u'DT'), (u'of', u'IN')]
+
+DEPS = [u'ncsubj', u'dobj', u'ncmod', u'iobj', u'xcomp-of']
+
+def randomSentence(rand, idx, dparse):
+    n = rand.randint(1, 10)
+    words = []
+    for i in range(n):
+        form, pos = rand.choice(WORDS)
+        words.append({'idx': i, 'form': form, 'lem': form, 'pos': pos})
+    sent = {'id': u'%d.%d' % (idx, rand.randint(0, 3)), 'idx': idx, 'word': words}
+    deps = []
+    for i in range(n):
+        dep = {'type': rand.choice(DEPS), 'dep': str(i + 1), 'head': str(rand.randint(0, n))}
+        if dep['type'] == u'ncmod' and rand.random() < 0.5:
+            dep['subtype'] = u'poss'
+        deps.append(dep)
+    if dparse:
+        sent['dparse'] = [d for d in deps if d['head'] != '0']
+        for _ in range(rand.randint(0, 2)):
+            sent['dparse'].append({'type': u'passive', 'head': str(rand.randint(1, n))})
+    else:
+        for word, dep in zip(words, deps):
+            word['dep'] = {'type': dep['type'], 'head': dep['head']}
+            if 'subtype' in dep:
+                word['dep']['subtype'] = dep['subtype']
+    return sent
+
+class CxnMatchTest(TestCase):
+    """ Compares the compiled cxn queries with rdflib, on random sentences.
+    """
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        fname = os.path.join(self.dir, 'cxn_queries.txt')
+        with codecs.open(os.path.join(ETC, 'en_cxn_queries.txt'), encoding='utf-8') as f:
+            queries = f.read()
+        with codecs.open(fname, 'w', encoding='utf-8') as f:
+            f.write(queries + QUERIES)
+        logging.getLogger(docquery.__name__).setLevel(logging.WARN)
+        self.dr = DocumentRepository('en', engine='rdflib')
+        self.dr.loadCXNQueries(fname)
+
+    def tearDown(self):
+        logging.getLogger(docquery.__name__).setLevel(logging.NOTSET)
+        shutil.rmtree(self.dir)
+
+    def test_compiled(self):
+        self.assertEqual(sorted(set(self.dr.cxnQueries) - set(self.dr.cxnMatchers)),
+                         [u'T.noun S.any'])
+
+    def test_same_results(self):
+        rand = random.Random(4)
+        cxns = sorted(self.dr.cxnMatchers)
+        matched = set()
+        for i in range(80):
+            sent = randomSentence(rand, i, dparse=(i % 2 == 0))
+            self.dr.newSentence(sent)
+            compiled = self.dr.getCXNRelatedPairs(cxns, allcxns=True)
+            # no graph was built
+            self.assertTrue(self.dr.pendingSentence is sent)
+            self.dr.buildPendingGraph()
+            self.assertEqual(compiled, self.dr.getCXNRelatedPairs(cxns, allcxns=True), sent)
+            matched.update(r[0] for r in compiled)
+        # every query matched something
+        self.assertEqual(sorted(matched), cxns)
+
+    def test_fallback(self):
+        sent = {'id': u'1', 'idx': 0, 'word': [{'idx': i, 'form': w, 'lem': w, 'pos': u'NN'}
+                                                for i, w in enumerate([u'deep', u'poverty'])]}
+        self.dr.newSentence(sent)
+        self.assertEqual(self.dr.getCXNRelatedPairs([u'T.noun S.any'], allcxns=True),
+                         [(u'T.noun S.any', u'poverty', u'deep', 0, 1, 0)])
+        self.assertEqual(self.dr.pendingSentence, None)
+
+def test_suite():
+    suite = TestSuite()
+    suite.addTests(makeSuite(CxnMatchTest))
+    return suite
+
+if __name__ == '__main__':
+    main(defaultTest='test_suite')
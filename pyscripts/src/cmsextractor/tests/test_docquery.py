@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+from unittest import TestCase, TestSuite, makeSuite, main
+import logging
+
+import rdflib
+from rdflib.compare import isomorphic
+
+from cmsextractor import docquery
+from cmsextractor.docquery import DocumentRepository
+
+def words(text, **fields):
+    result = []
+    for i, w in enumerate(text.split(u' ')):
+        form, lem, pos = w.split(u'/')
+        word = {u'idx': i, u'form': form, u'lem': lem, u'pos': pos}
+        word.update(dict((k, v[i]) for k, v in fields.iteritems() if v[i] is not None))
+        result.append(word)
+    return result
+
+# literals that need escapes, and characters outside the BMP
+SENTENCES = [
+    {u'id': u'doc:1', u'idx': 0,
+     u'word': words(u'"poverty"/"poverty"/NN is/be/VBZ a\\b/a\\b/DT di\tsease/di\nsease/NN'),
+     u'dparse': [{u'type': u'ncsubj', u'dep': u'1', u'head': u'2'},
+                 {u'type': u'x-comp', u'dep': u'4', u'head': u'2'},
+                 {u'type': u'ncmod', u'subtype': u'poss', u'dep': u'3', u'head': u'4'},
+                 {u'type': u'passive', u'head': u'2'},
+                 # refers to a missing word
+                 {u'type': u'dobj', u'dep': u'9', u'head': u'2'}]},
+    {u'id': u'doc:2 \U0001d538', u'idx': 1,
+     u'word': words(u'Nöt/nöt/RB \U0001F600/\U0001F600/SYM налог/налог/NN'
+                    u' تورم/تورم/N',
+                    rlem=[u'not', None, u'tax', None], rpos=[None, u'X', u'NN', None])},
+    {u'id': u'doc:3', u'idx': 2,
+     u'word': [dict(w, dep=dep) for w, dep in
+               zip(words(u'taxes/tax/NNS rise/rise/VBP fast/fast/RB'),
+                   [{u'type': u'ncsubj', u'head': u'2'}, {u'type': u'root', u'head': u'0'},
+                    {u'type': u'nc-mod', u'subtype': u'poss', u'head': u'2'}])]},
+    {u'id': u'doc:4', u'idx': 3}]
+
+class SentenceGraphTest(TestCase):
+    """ The N-Triples that are bulk loaded describe the same graph as the
+    Turtle that is added sentence by sentence.
+    """
+    def setUp(self):
+        logging.getLogger(docquery.__name__).setLevel(logging.WARN)
+        self.dr = DocumentRepository('en', name='test')
+        # as set by createSentencesGraph
+        self.dr.numwords = 0
+
+    def tearDown(self):
+        logging.getLogger(docquery.__name__).setLevel(logging.NOTSET)
+
+    def turtle(self, sent):
+        g = rdflib.Graph()
+        data = u'%s\n%s' % (self.dr.turtleHeader, u'\n'.join(self.dr.getSentenceTriples(sent)))
+        g.parse(data=data.encode('utf-8'), format='turtle')
+        return g
+
+    def ntriples(self, sent):
+        g = rdflib.Graph()
+        data = u'\n'.join(self.dr.getSentenceNTriples(sent))
+        # N-Triples are ASCII
+        g.parse(data=data.encode('ascii'), format='nt')
+        return g
+
+    def test_isomorphic(self):
+        for sent in SENTENCES:
+            turtle = self.turtle(sent)
+            ntriples = self.ntriples(sent)
+            self.assertTrue(len(turtle) > 0)
+            self.assertTrue(isomorphic(turtle, ntriples),
+                            sorted(set(turtle).symmetric_difference(set(ntriples))))
+
+    def test_literals(self):
+        doc = rdflib.Namespace(self.dr.tstore.get_ns('doc'))
+        graph = self.ntriples(SENTENCES[0])
+        self.assertEqual(len(list(graph.subjects(rdflib.RDF.type, doc.Sentence))), 1)
+        graph += self.ntriples(SENTENCES[1])
+        self.assertEqual(sorted(unicode(o) for o in graph.objects(None, doc.hasForm)),
+                         sorted(w[u'form'] for sent in SENTENCES[:2] for w in sent[u'word']))
+        self.assertEqual(set(unicode(o) for o in graph.objects(None, doc.hasLemma)),
+                         set([u'"poverty"', u'be', u'a\\b', u'di\nsease', u'nöt', u'\U0001F600',
+                              u'налог', u'تورم']))
+        self.assertEqual(sorted(s.rsplit(u'#', 1)[1]
+                                for s in graph.subjects(rdflib.RDF.type, doc.Sentence)),
+                         [u's_doc_1', u's_doc_2_\U0001d538'])
+
+def test_suite():
+    suite = TestSuite()
+    suite.addTests(makeSuite(SentenceGraphTest))
+    return suite
+
+if __name__ == '__main__':
+    main(defaultTest='test_suite')
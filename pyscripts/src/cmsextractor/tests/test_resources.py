@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+from unittest import TestCase, TestSuite, makeSuite, main
+import os, codecs, shutil, tempfile
+
+from cmsextractor.resources import ResourceRegistry
+from cmsextractor.postextraction import SimpleConstructionMatchingSystem
+
+class Loader:
+    """ A loader that counts its calls.
+    """
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, lang):
+        self.calls.append(lang)
+        return {'lang': lang, 'load': len(self.calls)}
+
+class Consumer:
+    """ Uses a registry, like the CMS instances of a process use cms.RESOURCES.
+    """
+    def __init__(self, registry):
+        self.registry = registry
+
+    def tagger(self, lang):
+        return self.registry.get(lang, 'tagger')
+
+class ResourceRegistryTest(TestCase):
+    def setUp(self):
+        self.loader = Loader()
+        self.registry = ResourceRegistry()
+        self.registry.register('tagger', self.loader)
+
+    def test_loads_once(self):
+        tagger = self.registry.get('en', 'tagger')
+        self.assertTrue(self.registry.get('en', 'tagger') is tagger)
+        self.assertEqual(self.loader.calls, ['en'])
+        self.assertEqual(self.registry.stats()[('en', 'tagger')][0], 1)
+
+    def test_shared(self):
+        first, second = Consumer(self.registry), Consumer(self.registry)
+        self.assertTrue(first.tagger('en') is second.tagger('en'))
+        self.assertEqual(self.loader.calls, ['en'])
+
+    def test_languages(self):
+        en, es = self.registry.get('en', 'tagger'), self.registry.get('es', 'tagger')
+        self.assertEqual((en['lang'], es['lang']), ('en', 'es'))
+        self.assertEqual(self.registry.get('en', 'tagger'), en)
+        self.assertEqual(self.loader.calls, ['en', 'es'])
+        self.assertEqual(self.registry.languages(), ['en', 'es'])
+        self.assertEqual(self.registry.unload('en'), 1)
+        self.assertFalse(self.registry.isLoaded('en', 'tagger'))
+        self.assertTrue(self.registry.isLoaded('es', 'tagger'))
+        self.registry.get('en', 'tagger')
+        self.assertEqual(self.loader.calls, ['en', 'es', 'en'])
+
+    def test_forksafe(self):
+        handles = Loader()
+        self.registry.register('handle', handles, forksafe=False)
+        self.registry.get('en', 'tagger')
+        self.registry.get('en', 'handle')
+        # as seen from a forked child process
+        for key, (value, pid) in self.registry.resources.items():
+            self.registry.resources[key] = (value, pid + 1)
+        self.assertTrue(self.registry.isLoaded('en', 'tagger'))
+        self.assertFalse(self.registry.isLoaded('en', 'handle'))
+        self.registry.get('en', 'handle')
+        self.assertEqual(handles.calls, ['en', 'en'])
+
+class SCMSTest(TestCase):
+    """ Runs the SCMS on pre-tagged sentences, with the resources of a
+    language loaded from its registry.
+    """
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        for path, text in (('wordlists/en/target.ei', u'poverty\tPOVERTY\n'),
+                           ('wordlists/en/source.ei', u'disease\tPOVERTY\n'),
+                           ('cxns/en/cxns.ei', u'@T@ @W@:5 @S@\n')):
+            fname = os.path.join(self.dir, path)
+            if not os.path.isdir(os.path.dirname(fname)):
+                os.makedirs(os.path.dirname(fname))
+            with codecs.open(fname, 'w', 'utf-8') as f:
+                f.write(text)
+        self.scms = SimpleConstructionMatchingSystem(exdir=self.dir)
+        # the sentences are tagged already
+        self.scms.resources.register('tagger', lambda lang: None, forksafe=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def doc(self, sbs=True):
+        text = u'poverty is a disease'
+        words, start = [], 0
+        for form, pos in zip(text.split(), ['NN', 'VBZ', 'DT', 'NN']):
+            words.append({'form': form, 'lem': form, 'pos': pos,
+                          'start': start, 'end': start + len(form)})
+            start += len(form) + 1
+        sent = {'id': u'1', 'text': text, 'word': words}
+        if sbs:
+            # as found by the SBS, at the other end of the sentence
+            sent['lms'] = [{'name': u'disease poverty',
+                            'target': {'lemma': u'disease', 'start': 13},
+                            'source': {'lemma': u'poverty', 'start': 0}}]
+        return {'lang': 'en', 'sentences': [sent]}
+
+    def test_post_process(self):
+        doc = self.scms.post_process(self.doc())
+        lms = doc['sentences'][0]['lms']
+        self.assertEqual([lm.get('extractor') for lm in lms], ['SCMS', None])
+        self.assertEqual((lms[0]['target']['form'], lms[0]['source']['form']), (u'poverty', u'disease'))
+        # scored by score_sbs_lms
+        self.assertTrue(lms[1]['score'] > 0)
+        self.assertEqual(self.scms.resources.stats()[('en', 'wordlists')][0], 1)
+
+    def test_run_cms_only(self):
+        doc = self.scms.run_cms_only(self.doc(sbs=False))
+        self.assertEqual([lm['extractor'] for lm in doc['sentences'][0]['lms']], ['SCMS'])
+        self.scms.run_cms_only(self.doc(sbs=False))
+        self.assertEqual(self.scms.resources.stats()[('en', 'matcher')][0], 1)
+
+    def test_missing_language(self):
+        self.assertRaises(KeyError, self.scms.post_process, dict(self.doc(), lang='es'))
+
+def test_suite():
+    suite = TestSuite()
+    suite.addTests(makeSuite(ResourceRegistryTest))
+    suite.addTests(makeSuite(SCMSTest))
+    return suite
+
+if __name__ == '__main__':
+    main(defaultTest='test_suite')
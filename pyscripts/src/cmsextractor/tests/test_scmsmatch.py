@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+from unittest import TestCase, TestSuite, makeSuite, main
+import re
+
+from cmsextractor import scmsmatch
+from cmsextractor.scmsmatch import SCMSMatcher, GEI
+
+def tokens(text):
+    """ A match sentence from word/POS pairs.
+    """
+    return u' '.join(u'%s=%s=%d' % (tuple(w.rsplit(u'/', 1)) + (i,))
+                     for i, w in enumerate(text.split()))
+
+class SCMSMatcherTest(TestCase):
+    """ The matcher finds the same LM matches, in the same order, as the
+    regex implementation it replaces.
+    """
+    def matcher(self, scms, twlist, swlists, cxns):
+        scms.twlist = twlist
+        scms.swlists = swlists
+        scms.cxns = cxns
+        return SCMSMatcher(twlist, swlists, cxns, dict((c, scms.get_pattern(c)) for c in cxns))
+
+    def entries(self, scms, domain, words):
+        return [(w, domain, re.compile(ur'\b({0})\b'.format(scms.get_pattern(w)), flags=re.U|re.I))
+                for w in words]
+
+    def test_synthetic(self):
+        scms, twlist, swlists, cxns, vocab = scmsmatch.synthetic_scms(100)
+        matcher = self.matcher(scms, twlist, swlists, cxns)
+        nmatches = 0
+        for msent in scmsmatch.synthetic_sentences(vocab, 100):
+            found = matcher.match(msent)
+            self.assertEqual(found, scms.find_lm_matches_regex(msent), msent)
+            nmatches += len(found)
+        self.assertTrue(nmatches > 20, nmatches)
+
+    def test_overlapping(self):
+        scms = scmsmatch.synthetic_scms(0)[0]
+        # multi-word entries, entries contained in other entries (of the same
+        # domain or not), and entries with regular expression characters
+        twlist = (self.entries(scms, u'TAXATION', [u'tax cut', u'tax', u'anti-tax', u'cut.n']) +
+                  self.entries(scms, u'POVERTY', [u'tax', u'U.S.', u'(the)? poor']))
+        swlists = {u'TAXATION': self.entries(scms, u'TAXATION', [u'heavy burden', u'burden.n',
+                                                                 u'burden']),
+                   u'POVERTY': self.entries(scms, u'POVERTY', [u'trap', u'$']),
+                   GEI: self.entries(scms, GEI, [u'burden', u'gap.n'])}
+        cxns = [u'@S@ of @T@', u'@T@ @S@', u'@S@ @W@:3 @T@', u'@T@.n @W@:3 @S@.v',
+                u'@S@ (the)? @T@']
+        matcher = self.matcher(scms, twlist, swlists, cxns)
+        sentences = [tokens(u'the/DT heavy/JJ burden/NN of/IN the/DT tax/NN cut/NN'),
+                     tokens(u'anti-tax/JJ U.S./NP burden/NN of/IN the/DT poor/NNS trap/VB'),
+                     tokens(u'the/DT tax/NN gap/NN of/IN $/$ tax/NN cut/VBD the/DT poor/JJ'),
+                     tokens(u'burden/NN burden/NN ,/, tax/NN tax/NN x|y/SYM trap/NN'),
+                     tokens(u'a/DT (/( tax/NN )/) gap/NN'),
+                     # not well formed: indices out of order, a POS that is a number
+                     u'burden=NN=1 of=IN=0 tax=NN=2 cut=3=3',
+                     u'']
+        found = [matcher.match(msent) for msent in sentences]
+        self.assertEqual(found, [scms.find_lm_matches_regex(msent) for msent in sentences])
+        self.assertEqual([(m['target'], m['source'], m['cxn']) for m in found[0]],
+                         [(u'tax=NN=5 cut=NN=6', u'heavy=JJ=1 burden=NN=2', u'@S@ @W@:3 @T@'),
+                          # the tax of the other domain, inside the tax cut
+                          (u'tax=NN=5', u'burden=NN=2', u'@S@ @W@:3 @T@')])
+        self.assertTrue(len(found[1]) > 1)
+        self.assertEqual(found[-1], [])
+
+def test_suite():
+    suite = TestSuite()
+    suite.addTests(makeSuite(SCMSMatcherTest))
+    return suite
+
+if __name__ == '__main__':
+    main(defaultTest='test_suite')
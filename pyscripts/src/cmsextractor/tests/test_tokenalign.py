@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+from unittest import TestCase, TestSuite, makeSuite, main
+
+from cmsextractor.tokenalign import TokenAligner, normalize
+
+class TokenAlignerTest(TestCase):
+    def setUp(self):
+        self.aligner = TokenAligner()
+
+    def iidxs(self, alignment):
+        return [None if a is None else a[0] for a in alignment]
+
+    def test_normalize(self):
+        self.assertEqual(normalize(u' Hello  World\n'), u'helloworld')
+        self.assertEqual(normalize(None), u'')
+
+    def test_identical(self):
+        forms = [u'The', u'economy', u'grows', u'.']
+        alignment = self.aligner.align(forms, forms, u'The economy grows.')
+        self.assertEqual(self.iidxs(alignment), [0, 1, 2, 3])
+        self.assertEqual(self.aligner.stats()['unaligned'], 0)
+
+    def test_split(self):
+        iforms = [u'We', u"don't", u'know', u'del', u'http://www.a.com/b']
+        pforms = [u'we', u'do', u"n't", u'know', u'de', u'el', u'http:', u'www.a.com', u'b']
+        text = u"We don't know del http://www.a.com/b"
+        alignment = self.aligner.align(iforms, pforms, text)
+        self.assertEqual(self.iidxs(alignment), [0, 1, 1, 2, 3, 3, 4, 4, 4])
+        self.assertEqual(self.aligner.stats()['split'], 4)
+
+    def test_merged(self):
+        iforms = [u'sin', u'embargo', u',', u'a', u'pesar', u'de', u'todo']
+        pforms = [u'sin_embargo', u',', u'a_pesar_de', u'todo']
+        alignment = self.aligner.align(iforms, pforms, u'sin embargo, a pesar de todo')
+        # merged tokens are aligned to the tagger token they share most characters with
+        self.assertEqual(self.iidxs(alignment), [1, 2, 4, 6])
+        self.assertEqual(self.aligner.stats()['merged'], 2)
+
+    def test_normalized_forms(self):
+        iforms = [u'taxes', u'(', u'again', u')', u'rise', u':-)']
+        pforms = [u'taxes', u'-LRB-', u'again', u'-RRB-', u'rise']
+        alignment = self.aligner.align(iforms, pforms, u'taxes (again) rise :-)')
+        self.assertEqual(self.iidxs(alignment), [0, 1, 2, 3, 4])
+        stats = self.aligner.stats()
+        self.assertEqual(stats['unaligned'], 0)
+        self.assertEqual(stats['unanchored'], 2)
+
+    def test_repeated_words(self):
+        iforms = [u'the', u'tax', u'of', u'the', u'war', u'of', u'the', u'poor']
+        pforms = [u'the', u'tax', u'of', u'the', u'war', u'of', u'the', u'poor']
+        alignment = self.aligner.align(iforms, pforms)
+        self.assertEqual(self.iidxs(alignment), range(8))
+
+    def test_without_text(self):
+        iforms = [u'Crime', u'is', u'up']
+        pforms = [u'crime', u'is', u'up']
+        self.assertEqual(self.iidxs(self.aligner.align(iforms, pforms)), [0, 1, 2])
+
+    def test_representatives(self):
+        # do <- n't; "do" is headed by "know", outside of "don't"
+        alignment = [(0, 2), (1, 2), (1, 3), (2, 4)]
+        heads = [3, 3, 1, None]
+        self.assertEqual(self.aligner.representatives(alignment, heads), {0: 0, 1: 1, 2: 3})
+
+    def test_stats(self):
+        self.aligner.align([u'a', u'b'], [u'a', u'c'], u'a b')
+        stats = self.aligner.stats()
+        self.assertEqual(stats['sentences'], 1)
+        self.assertEqual(stats['ptokens'], 2)
+        self.aligner.resetStats()
+        self.assertEqual(self.aligner.stats()['sentences'], 0)
+
+def test_suite():
+    suite = TestSuite()
+    suite.addTest(makeSuite(TokenAlignerTest))
+    return suite
+
+if __name__ == '__main__':
+    main(defaultTest='test_suite')
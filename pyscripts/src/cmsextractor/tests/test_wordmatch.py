@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+from unittest import TestCase, TestSuite, makeSuite, main
+import re, random
+
+from cmsextractor.wordmatch import WordListMatcher
+from mnrepository.metanetrdf import MetaNetRepository
+
+class Repository(MetaNetRepository):
+    """ Only the lempos regexps of the repository.
+    """
+    def __init__(self):
+        pass
+
+def wlstructs(lemposlist):
+    """ Word list structs, as made by ConstructionMatchingSystem.createWordListStructs.
+    """
+    mr = Repository()
+    structs = []
+    for lempos in lemposlist:
+        npieces, searchregexp = mr.getMWELemposRegexp(lempos)
+        structs.append({'lempos': lempos,
+                        'npieces': npieces,
+                        'regexp': searchregexp,
+                        're': re.compile(searchregexp, flags=re.U|re.I)})
+    return structs
+
+def sentence(text):
+    """ A sentence's word list from form/lemma/POS triples.
+    """
+    words = []
+    for i, w in enumerate(text.split()):
+        form, lemma, pos = w.split(u'/')
+        words.append({'form': form, 'lem': lemma, 'pos': pos, 'idx': i})
+    return words
+
+def mtext(words):
+    return u' '.join(u'%s=%s=%s=%s' % (w['form'], w['lem'], w['pos'], w['idx']) for w in words)
+
+def regexpMatch(structs, words):
+    """ The search that the matcher replaces: each word list regexp, in
+    order, over the sentence's match string.
+    """
+    results = []
+    for wstruct in structs:
+        for m in wstruct['re'].finditer(mtext(words)):
+            results.append((wstruct, [int(m.group(n+1)) for n in range(wstruct['npieces'])]))
+    return results
+
+class WordListMatcherTest(TestCase):
+    """ The matcher finds the same matches, in the same order, as the
+    regexp search over the match string.
+    """
+    def check(self, lemposlist, text):
+        structs = wlstructs(lemposlist)
+        matcher = WordListMatcher(structs, MetaNetRepository.POSmap, MetaNetRepository.posre)
+        words = sentence(text)
+        found = matcher.match(words, 'lem', 'pos', mtext(words))
+        self.assertEqual(found, regexpMatch(structs, words), text)
+        return [(wstruct['lempos'], idxlist) for wstruct, idxlist in found]
+
+    def test_boundaries(self):
+        lemposlist = [u'trap', u'tax.n', u'tax', u'death']
+        self.assertEqual(self.check(lemposlist,
+                                    u'a/a/DT death-trap/death-trap/NN taxes/tax/NNS '
+                                    u'tax/tax/VB trapped/trap/VBD tax-/tax/NN'),
+                         [(u'trap', [1]), (u'tax.n', [2]), (u'tax', [3])])
+        # a form must end with a word character for a lemma piece to match
+        self.assertEqual(self.check([u'tax.n'], u'tax-/tax/NN tax/tax/NN'), [(u'tax.n', [1])])
+
+    def test_multiword(self):
+        lemposlist = [u'income tax.n', u'tax.n cut.v', u'tax.n', u'of the']
+        self.assertEqual(self.check(lemposlist,
+                                    u'income/income/NN taxes/tax/NNS cut/cut/VBD '
+                                    u'the/the/DT income/income/NN of/of/IN the/the/DT tax/tax/NN'),
+                         [(u'income tax.n', [0, 1]), (u'tax.n cut.v', [1, 2]),
+                          (u'tax.n', [1]), (u'tax.n', [7]), (u'of the', [5, 6])])
+        # overlapping matches of the same lempos are not both found
+        self.assertEqual(self.check([u'tax.n tax.n'], u'a/a/DT tax/tax/NN tax/tax/NN tax/tax/NN'),
+                         [(u'tax.n tax.n', [1, 2])])
+
+    def test_case(self):
+        self.assertEqual(self.check([u'Tax.n', u'income tax', u'CUT.v'],
+                                    u'Income/income/NN TAX/Tax/nn cut/Cut/vbd'),
+                         [(u'Tax.n', [1]), (u'income tax', [0, 1]), (u'CUT.v', [2])])
+
+    def test_nonascii(self):
+        self.assertEqual(self.check([u'налог.n', u'café', u'بار.n', u'niño'],
+                                    u'Налоги/налог/NN el/el/DT café/café/NC '
+                                    u'niños/niño/NC بار/بار/N niño/niño/NC'),
+                         [(u'налог.n', [0]), (u'café', [2]), (u'بار.n', [4]), (u'niño', [5])])
+
+    def test_fallback(self):
+        # lempos with regular expression syntax are matched by their regexp
+        self.assertEqual(self.check([u'U.S.', u'tax.n', u'ta?x.n'],
+                                    u'the/the/DT U.S./U.S./NP tx/tx/NN tax/tax/NN'),
+                         [(u'U.S.', [1]), (u'tax.n', [3]), (u'ta?x.n', [2]), (u'ta?x.n', [3])])
+
+    def test_random(self):
+        rand = random.Random(0)
+        vocab = [u'tax', u'Tax', u'income', u'cut', u'trap', u'death-trap', u'café', u'налог',
+                 u'of', u'the', u'a.b', u'x-', u'U.S.']
+        tags = [u'NN', u'NNS', u'VB', u'VBD', u'JJ', u'IN', u'DT', u'RB', u'nn']
+        exts = [u'', u'.n', u'.v', u'.a', u'.adv', u'.p']
+        lemposlist = sorted(set(u' '.join(rand.choice(vocab) + rand.choice(exts)
+                                          for _ in range(rand.randint(1, 3)))
+                                for _ in range(60)),
+                            key=lambda l: -len(l.split()))
+        for _ in range(200):
+            text = u' '.join(u'%s/%s/%s' % (rand.choice(vocab), rand.choice(vocab).lower(),
+                                            rand.choice(tags))
+                             for _ in range(rand.randint(1, 15)))
+            self.check(lemposlist, text)
+
+def test_suite():
+    suite = TestSuite()
+    suite.addTests(makeSuite(WordListMatcherTest))
+    return suite
+
+if __name__ == '__main__':
+    main(defaultTest='test_suite')
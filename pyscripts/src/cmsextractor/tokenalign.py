@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. module:: tokenalign
+    :platform: Unix
+    :synopsis: Alignment of dependency parser tokens to POS tagger tokens
+
+The dependency parsers and the POS taggers tokenize sentences differently:
+a parser may split a token of the tagger (e.g. Spanish *del* into *de* and
+*el*), merge several of them (e.g. Freeling multiword tokens), or normalize
+forms (e.g. ``-LRB-`` for a parenthesis).  :py:class:`TokenAligner` maps
+the tokens of the parser onto those of the tagger in a single pass over
+each sentence.
+
+Both token sequences are anchored in the text of the sentence, with
+whitespace removed and lowercased: each token is looked for at the current
+character position or, if it is followed there by the next token, up to
+``lookahead`` characters further on (plus the length of the preceding
+tokens that could not be found).  Tokens that cannot be found share the
+characters between their anchored neighbours.  Each parser token is then
+mapped to the tagger token its character span overlaps most.
+
+The aligner counts aligned, split, merged, unanchored and unaligned tokens
+over all the sentences it aligns (see :py:meth:`TokenAligner.stats`).
+
+"""
+import logging
+
+# characters a token may be found after the current position
+LOOKAHEAD = 20
+
+COUNTERS = ['sentences', 'ptokens', 'itokens', 'aligned', 'unaligned', 'unanchored',
+            'split', 'merged', 'failedsentences']
+
+def normalize(form):
+    """ Return the characters of a token form, or of a text, as anchored:
+    lowercased, without whitespace.
+    """
+    if not form:
+        return u''
+    return u''.join(form.lower().split())
+
+class TokenAligner:
+    """ Aligns parser tokens to tagger tokens via their character spans.
+    """
+    def __init__(self, lookahead=LOOKAHEAD):
+        """
+        :param lookahead: characters a token may be found after the current position
+        :type lookahead: int
+        """
+        self.logger = logging.getLogger(__name__)
+        self.lookahead = lookahead
+        self.counts = dict.fromkeys(COUNTERS, 0)
+
+    def spans(self, forms, stream):
+        """ Return the (start, end) character span of each token in the
+        normalized text, and the number of tokens that could not be found.
+
+        :param forms: token forms, in order
+        :type forms: list
+        :param stream: normalized sentence text (see :py:func:`normalize`)
+        :type stream: unicode
+        """
+        norms = [normalize(form) for form in forms]
+        norms.append(u'')
+        spans = [None] * len(forms)
+        pending = []
+        pendingchars = 0
+        nunanchored = 0
+        pos = 0
+        for i in xrange(len(forms)):
+            chars = norms[i]
+            found = -1
+            if chars:
+                found = self._find(stream, chars, norms[i+1], pos,
+                                   pos + pendingchars + self.lookahead, bool(pending))
+                if (found < 0) and (u'_' in chars):
+                    # multiword tokens
+                    chars = chars.replace(u'_', u'')
+                    found = self._find(stream, chars, norms[i+1], pos,
+                                       pos + pendingchars + self.lookahead, bool(pending))
+            if found < 0:
+                pending.append((i, len(chars) or 1))
+                pendingchars += len(chars)
+                continue
+            if pending:
+                nunanchored += len(pending)
+                self._share(spans, pending, pos, found)
+                pending = []
+                pendingchars = 0
+            spans[i] = (found, found + len(chars))
+            pos = found + len(chars)
+        if pending:
+            nunanchored += len(pending)
+            self._share(spans, pending, pos, len(stream))
+        return spans, nunanchored
+
+    def _find(self, stream, chars, nextchars, pos, limit, skipping):
+        """ Find a token at pos or, if the next token follows it, up to
+        limit.  If skipping (over tokens that were not found), the first
+        occurrence up to limit is taken otherwise.
+        """
+        if stream.startswith(chars, pos):
+            return pos
+        first = -1
+        found = stream.find(chars, pos + 1, limit + len(chars))
+        while found >= 0:
+            if (not nextchars) or stream.startswith(nextchars, found + len(chars)):
+                return found
+            if first < 0:
+                first = found
+            found = stream.find(chars, found + 1, limit + len(chars))
+        if skipping:
+            return first
+        return -1
+
+    def _share(self, spans, pending, start, end):
+        """ Divide the characters from start to end among the pending tokens,
+        in proportion to the length of their forms.
+        """
+        total = sum(length for i, length in pending)
+        width = end - start
+        done = 0
+        for i, length in pending:
+            s = start + (done * width) // total
+            done += length
+            spans[i] = (s, start + (done * width) // total)
+
+    def align(self, iforms, pforms, text=None):
+        """ Align parser tokens to tagger tokens.  Returns a list with, for
+        each parser token, a tuple of the index of the tagger token and the
+        number of characters they share, or None if the token could not be
+        aligned.
+
+        :param iforms: tagger token forms
+        :type iforms: list
+        :param pforms: parser token forms
+        :type pforms: list
+        :param text: sentence text (defaults to the tagger tokens)
+        :type text: unicode
+        """
+        if text is None:
+            text = u''.join(form or u'' for form in iforms)
+        stream = normalize(text)
+        ispans, iunanchored = self.spans(iforms, stream)
+        pspans, punanchored = self.spans(pforms, stream)
+        alignment = [None] * len(pforms)
+        nmerged = 0
+        j = 0
+        for k, (s, e) in enumerate(pspans):
+            if s >= e:
+                continue
+            # spans are in order, so tagger tokens before this one can be skipped
+            while (j < len(ispans)) and (ispans[j][1] <= s):
+                j += 1
+            best = None
+            noverlapping = 0
+            jj = j
+            while (jj < len(ispans)) and (ispans[jj][0] < e):
+                overlap = min(e, ispans[jj][1]) - max(s, ispans[jj][0])
+                if overlap > 0:
+                    noverlapping += 1
+                    if (best is None) or (overlap > best[1]):
+                        best = (jj, overlap)
+                jj += 1
+            alignment[k] = best
+            if noverlapping > 1:
+                nmerged += 1
+        naligned = len(alignment) - alignment.count(None)
+        counts = self.counts
+        counts['sentences'] += 1
+        counts['ptokens'] += len(pforms)
+        counts['itokens'] += len(iforms)
+        counts['aligned'] += naligned
+        counts['unaligned'] += len(pforms) - naligned
+        counts['unanchored'] += punanchored + iunanchored
+        counts['merged'] += nmerged
+        counts['split'] += naligned - len(set(a[0] for a in alignment if a is not None))
+        if naligned < len(pforms):
+            counts['failedsentences'] += 1
+        return alignment
+
+    def representatives(self, alignment, heads):
+        """ Choose which of the parser tokens aligned to each tagger token
+        represents it: a token whose head is outside of the group of parser
+        tokens aligned to the tagger token, with the most characters in
+        common with it.  Returns a dict from tagger token index to parser
+        token index.
+
+        :param alignment: output of :py:meth:`align`
+        :type alignment: list
+        :param heads: index of the head of each parser token (None if unknown or root)
+        :type heads: list
+        """
+        reps = {}
+        for k, aligned in enumerate(alignment):
+            if aligned is None:
+                continue
+            iidx, overlap = aligned
+            head = heads[k]
+            outside = (head is None) or (alignment[head] is None) or (alignment[head][0] != iidx)
+            key = (outside, overlap)
+            if (iidx not in reps) or (key > reps[iidx][0]):
+                reps[iidx] = (key, k)
+        return dict((iidx, k) for iidx, (key, k) in reps.iteritems())
+
+    def stats(self):
+        """ Return the counters, as a dict.
+        """
+        return dict(self.counts)
+
+    def resetStats(self):
+        self.counts = dict.fromkeys(COUNTERS, 0)
+
+    def logStats(self):
+        """ Log the counters.
+        """
+        c = self.counts
+        self.logger.info('aligned %d of %d parser tokens to %d tagger tokens in %d sentences: '
+                         '%d unaligned (in %d sentences), %d unanchored, %d split, %d merged',
+                         c['aligned'], c['ptokens'], c['itokens'], c['sentences'],
+                         c['unaligned'], c['failedsentences'], c['unanchored'],
+                         c['split'], c['merged'])
@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. module:: wordmatch
+   :platform: Unix
+   :synopsis: Single-pass matching of target/source word lists against sentences
+
+Compiles the word list structs produced by
+:py:meth:`cmsextractor.cms.ConstructionMatchingSystem.createWordListStructs`
+into a token-level trie, so that every sentence can be matched against
+thousands of lempos and MWEs in a single left-to-right pass over its ``word``
+list, instead of running one regular expression per lempos over the
+sentence's ``mtext`` string.
+
+Each lempos piece is compiled into a trie edge, indexed either by lemma
+(pieces with a POS extension, e.g. ``tax.n``, whose POS class is checked
+with the same patterns as :py:attr:`MetaNetRepository.POSmap`) or by
+word form (pieces without a POS, which are matched against the form).  MWEs
+become paths in the trie.  Lempos whose lemma contains regular expression
+syntax cannot be compiled into exact lookups; those keep using the
+original regular expression over ``mtext``.
+
+Candidates are returned in the same order that the per-regexp search
+produced them: by word list rank (which is sorted longest first) and then
+by position in the sentence.  Callers apply subset suppression on top of
+that order, exactly as before.
+
+"""
+import re
+
+# characters that make a lemma piece a regular expression rather than a literal
+REGEXP_CHARS = frozenset(u'.^$*+?{}[]\\|()')
+
+# constraints imposed by the lempos regexps on the other fields of a word
+FORM_END_RE = re.compile(ur'.*\w$', flags=re.U|re.S)
+FORM_START_RE = re.compile(ur'\w', flags=re.U)
+FORM_WORD_RE = re.compile(ur'\w+$', flags=re.U)
+FORM_SUFFIX_RE = re.compile(ur'(?<=\W)\w', flags=re.U)
+ANY_LEMMA_RE = re.compile(ur'[\w.-]+$', flags=re.U|re.I)
+ANY_POS_RE = re.compile(ur'[\w&$-]+$', flags=re.U|re.I)
+
+class TrieNode(object):
+    """ Node in the word list trie.  Edges are indexed by lowercased lemma
+    (for lempos pieces) and by lowercased form (for word form pieces).
+    """
+    __slots__ = ('bylemma', 'byform', 'ranks')
+
+    def __init__(self):
+        self.bylemma = {}
+        self.byform = {}
+        self.ranks = []
+
+    def child(self, index, key, posclass):
+        """ Return the child reached via key, creating it if necessary.
+        Children reached by the same key but a different POS class are
+        distinct.
+        """
+        edges = index.setdefault(key, [])
+        for pclass, node in edges:
+            if pclass == posclass:
+                return node
+        node = TrieNode()
+        edges.append((posclass, node))
+        return node
+
+class WordListMatcher(object):
+    """ Compiled lexicon matching engine for a sorted list of word list structs.
+    """
+    def __init__(self, wlstructs, posmap, posre):
+        """
+        :param wlstructs: word list structs, sorted longest first
+        :type wlstructs: list
+        :param posmap: mapping from short POS extension to POS tag regexp
+        :type posmap: dict
+        :param posre: regexp that recognizes lempos POS extensions
+        :type posre: re
+        """
+        self.wlstructs = wlstructs
+        self.posre = posre
+        self.root = TrieNode()
+        self.fallback = []
+        self.posclasses = {}
+        for shortpos, posregexp in posmap.iteritems():
+            self.posclasses[shortpos] = re.compile(u'(?:%s)$' % (posregexp),
+                                                   flags=re.U|re.I)
+        for rank, wstruct in enumerate(wlstructs):
+            pieces = self._compilePieces(wstruct['lempos'])
+            if pieces is None:
+                self.fallback.append(rank)
+                continue
+            node = self.root
+            for kind, key, posclass in pieces:
+                if kind == 'lemma':
+                    node = node.child(node.bylemma, key, posclass)
+                else:
+                    node = node.child(node.byform, key, posclass)
+            node.ranks.append(rank)
+
+    def _compilePieces(self, lempos):
+        """ Convert a lempos into a list of (kind, key, posclass) trie edges, or
+        None if it has to be matched by regular expression.
+        """
+        pieces = []
+        for piece in lempos.split():
+            if self.posre.search(piece):
+                lemma, shortpos = piece.rsplit(u'.', 1)
+                if REGEXP_CHARS.intersection(lemma) or (shortpos not in self.posclasses):
+                    return None
+                pieces.append(('lemma', lemma.lower(), shortpos))
+            else:
+                if REGEXP_CHARS.intersection(piece) or not FORM_START_RE.match(piece):
+                    return None
+                pieces.append(('form', piece.lower(), None))
+        return pieces
+
+    def _edges(self, node, word, forms, formre):
+        """ Return the children of node whose edges accept word.  forms
+        lists the strings a word form piece may equal, and formre is the
+        constraint that a lempos piece places on the form.
+        """
+        form, lemma, pos = word
+        children = []
+        if lemma in node.bylemma and formre.match(form):
+            for posclass, child in node.bylemma[lemma]:
+                if self.posclasses[posclass].match(pos):
+                    children.append(child)
+        if node.byform and ANY_LEMMA_RE.match(lemma) and ANY_POS_RE.match(pos):
+            for wform in forms:
+                for posclass, child in node.byform.get(wform, ()):
+                    children.append(child)
+        return children
+
+    def _startForms(self, form):
+        """ The first piece of a lempos regexp is anchored by a word boundary
+        rather than by the start of the token, so a word form piece can also
+        match the part of a form that follows a non-word character (e.g.
+        'trap' in 'death-trap').  Later pieces follow whitespace, and must
+        match the whole form.
+        """
+        forms = [form]
+        for m in FORM_SUFFIX_RE.finditer(form):
+            forms.append(form[m.start():])
+        return forms
+
+    def match(self, words, lfield, pfield, mtext=None):
+        """ Find all word list matches in a sentence.  Returns a list of
+        (wlstruct, idxlist) tuples, ordered by word list rank and then by
+        position, with overlapping matches of the same struct removed (as
+        :py:meth:`re.finditer` would).
+
+        :param words: the sentence's 'word' list
+        :type words: list
+        :param lfield: name of the lemma field
+        :type lfield: str
+        :param pfield: name of the POS field
+        :type pfield: str
+        :param mtext: the sentence's match string, needed only for regexp fallbacks
+        :type mtext: str
+        :return: list of (wlstruct, idxlist)
+        :rtype: list
+        """
+        tokens = [(w['form'].lower(), w[lfield].lower(), w[pfield]) for w in words]
+        ntokens = len(tokens)
+        candidates = []
+        for start in xrange(ntokens):
+            frontier = [self.root]
+            pos = start
+            while frontier and (pos < ntokens):
+                nextfrontier = []
+                if pos == start:
+                    forms = self._startForms(tokens[pos][0])
+                    formre = FORM_END_RE
+                else:
+                    forms = (tokens[pos][0],)
+                    formre = FORM_WORD_RE
+                for node in frontier:
+                    nextfrontier.extend(self._edges(node, tokens[pos], forms, formre))
+                pos += 1
+                for node in nextfrontier:
+                    for rank in node.ranks:
+                        candidates.append((rank, start, pos))
+                frontier = nextfrontier
+        if self.fallback and (mtext is not None):
+            for rank in self.fallback:
+                wstruct = self.wlstructs[rank]
+                for order, matches in enumerate(wstruct['re'].finditer(mtext)):
+                    idxlist = [int(matches.group(n+1)) for n in range(wstruct['npieces'])]
+                    candidates.append((rank, order, idxlist))
+        candidates.sort(key=lambda c: (c[0], c[1]))
+        results = []
+        lastrank = None
+        lastend = 0
+        for rank, start, end in candidates:
+            if isinstance(end, list):
+                results.append((self.wlstructs[rank], end))
+                continue
+            if rank != lastrank:
+                lastrank = rank
+                lastend = 0
+            if start < lastend:
+                # overlaps the previous match of the same lempos
+                continue
+            lastend = end
+            results.append((self.wlstructs[rank],
+                            [int(words[i]['idx']) for i in xrange(start, end)]))
+        return results
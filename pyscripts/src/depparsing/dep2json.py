@@ -26,12 +26,13 @@ from string import split
 from subprocess import check_output
 from tempfile import NamedTemporaryFile
 from textwrap import dedent
-import sys, logging
+import atexit, os, sys, logging
 
 from depparsing.edeps import RaspDepParser, RaspDepBuilder
 from depparsing.parser.freeling.util import to_nodelist
 from depparsing.parser.malt.util import ConllxRecord
 from depparsing.parser.util import parserdesc, sanitized
+from depparsing.parserpool import ParserPool
 from depparsing.util import dpprint, blocks, lines
 from edeps import dependencies
 from util import uopen, uwriter, ureader, cumulative
@@ -282,6 +283,14 @@ class Parser(object):
         :param sentences: a sequence of strings.
         :returns: A list of dependency trees (a forest)
         """
+        if getattr(self, 'pool', None):
+            dependencies = self.pool.parse(sentences)
+            process, keep = self.config
+            if translate:
+                return translate(dependencies, sentences, base=0, parser=self.name, process=process, keep=keep)
+            else:
+                return dependencies
+
         def tmpfile(prefix):
             return NamedTemporaryFile(dir='.', delete=False, prefix=prefix) if self.debug else NamedTemporaryFile(prefix=prefix)
 
@@ -297,14 +306,49 @@ class Parser(object):
                 return dependencies
 
 
+# Parser pools, by language
+_pools = {}
+
+
+def start_pool(lang, workers, timeout=60):
+    """Start a pool of parser processes for a language.  From then on, parse()
+    uses the pool instead of starting a parser for every call.
+
+    :param lang: one of 'en', 'es', 'ru', 'fa'.
+    :param workers: number of parser processes.
+    :param timeout: seconds allowed for parsing one sentence.
+    :returns: a ParserPool object.
+    """
+    if lang not in _pools:
+        pdesc = parserdesc(lang)
+        _pools[lang] = ParserPool(pdesc.command, pdesc.name, workers=workers, timeout=timeout)
+    return _pools[lang]
+
+
+@atexit.register
+def stop_pools():
+    """Stop all parser pools.
+    """
+    for pool in _pools.values():
+        pool.close()
+    _pools.clear()
+
+
 def parser_for(lang):
-    """Create a Parser object for a specific language.
+    """Create a Parser object for a specific language.  If the environment
+    variable MNPARSERWORKERS is set to a positive number, a pool of that many
+    parser processes is started on first use (see start_pool), and the
+    Parser uses it.
 
     :param lang: one of 'en', 'es', 'ru', 'fa'.
     :returns: a Parser object.
     """
     pdesc = parserdesc(lang)
-    return Parser(name=pdesc.name, config=pdesc.config, command=pdesc.command, debug=True, encoding='utf-8')
+    workers = int(os.environ.get('MNPARSERWORKERS', 0))
+    if (lang not in _pools) and (workers > 0):
+        start_pool(lang, workers, float(os.environ.get('MNPARSERTIMEOUT', 60)))
+    return Parser(name=pdesc.name, config=pdesc.config, command=pdesc.command, debug=True, encoding='utf-8',
+                  pool=_pools.get(lang))
 
 
 def translate(deps, sents, base, parser, process, keep):
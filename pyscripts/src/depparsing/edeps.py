@@ -859,8 +859,9 @@ def dependencies(stream, parser, sentence_stream=None, keep=None):
         def tokenized(sentence):
             return util.split(sentence[:-1])
 
-        def normalized(groups):
-            """Make sure the (sent_id, deprecs) iterable has no 'gaps' in the sent_ids.
+        def normalized(groups, end):
+            """Make sure the (sent_id, deprecs) iterable has no 'gaps' in the sent_ids,
+            up to and including end.
             """
             n = 1
             for sent_id, deprecs in groups:
@@ -874,13 +875,17 @@ def dependencies(stream, parser, sentence_stream=None, keep=None):
                         n += 1
                     yield sent_id, deprecs
                 n += 1
+            # e.g., a last sentence the parser pool failed on
+            while n <= end:
+                yield n, ()
+                n += 1
 
 
         ss1, ss2 = tee(sentence_stream)
         tokenized_sentences = map(tokenized, ss1)
         cumulatives = cumulative(ss2)
 #         words = OrderedDict()
-        by_line_num = normalized(groupby(make_deprec(), lambda (sent_id, r): sent_id))
+        by_line_num = normalized(groupby(make_deprec(), lambda (sent_id, r): sent_id), len(tokenized_sentences))
         for i, (sentence, (sent_id, deprecs)) in enumerate(izip(tokenized_sentences, by_line_num)):
             dr1, dr2 = tee(deprecs)
             assert i + 1 == sent_id, pformat((i + 1, sent_id, sentence, [d for d in deprecs]))
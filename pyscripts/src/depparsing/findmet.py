@@ -70,16 +70,24 @@ cluster = dict(ru=(env('{BASE}/clusterslist_RU_uncollapsed_noun.txt'),
                en=(env('{DEMO}/clusters/en/Noun_Clusters.txt'),
                    env('{DEMO}/clusters/en/Verb_Clusters.txt')))
 
+def cluster_index(clusters):
+    """Returns a map word -> cluster-name, to the first cluster (in the order
+    of clusters.items()) that contains the word.
+    """
+    index = dict()
+    for cname, words in clusters.items():
+        for word in words:
+            index.setdefault(word, cname)
+    return index
+
 def build_metaphors(seeds, nclusters, vclusters):
-    def find(seed, clusters):
-        cnames = [cname for cname, words in clusters.items() if seed in words]
-        return cnames[0] if cnames else None
+    nindex, vindex = cluster_index(nclusters), cluster_index(vclusters)
 
     mm = dict()
     orphans = []
     for seed in seeds:
         reltype, nseed, vseed = seed
-        nn, vn = find(nseed, nclusters), find(vseed, vclusters)
+        nn, vn = nindex.get(nseed), vindex.get(vseed)
 #         dprint(seed, nn, vn)
         if nn and vn: 
             new_nvpairs = dict(((n, v), seed) for n in nclusters[nn] for v in vclusters[vn])
@@ -6,6 +6,7 @@ from __future__ import print_function
 
 import sys, re
 from util import uopen, uwriter
+from relstore import RelationStore, SentenceStore, is_store, OFFSETS
 from pprint import pprint
 
 def find(relation, stream):
@@ -21,6 +22,13 @@ def find(relation, stream):
         
         
 def main(indexname, verb, noun):
+    if is_store(indexname):
+        # A binary index, built by relstore.py
+        store = RelationStore(indexname)
+        for i, sent_id in enumerate(store.lookup(verb.decode('utf8'), noun.decode('utf8'))):
+            print(i + 1, store.sentence(sent_id)[:-1] if store.sentences else sent_id)
+        store.close()
+        return
     with uopen(indexname, 'r') as stream:
         for i, (_, sentence) in enumerate(find((verb, noun), stream)):
             print(i + 1, sentence)
@@ -47,7 +55,15 @@ def split(f, decode=False, sep=None):
 from os import path
 from itertools import islice
 
+_stores = {}
+
 def sentence(sent_id, files=512, chunk=4096):
+    if path.exists(OFFSETS):
+        # Seek directly, with the offset table written by relstore.py
+        store = _stores.get((files, chunk))
+        if store is None:
+            store = _stores[files, chunk] = SentenceStore('.', files, chunk)
+        return store.sentence(sent_id)
     fn, pos = divmod(sent_id - 1, chunk)
     dn = fn // files
     with uopen(path.join('%.2x' % dn, '%.4x.ss' % fn)) as f:
@@ -4,9 +4,12 @@ Created on Apr 27, 2012
 @author: lucag
 '''
 
-import sys, codecs
+import sys, os, codecs, json, time
 import xml.parsers.expat
 
+from os import makedirs
+from os.path import join, dirname, abspath, exists, getsize
+
 from xml.dom.pulldom import START_ELEMENT, END_ELEMENT, parse
 from xml.sax.saxutils import unescape
 from pprint import pprint
@@ -65,9 +68,18 @@ class Handler(object):
     """Expat handler: closure bug workaround.
     """
     def __init__(self):
-        update(self, text=[], words=[], relations=[], results=[], status=None)
+        update(self, text=[], words=[], relations=[], results=[], data=[], status=None)
         
+    def flush(self):
+        # a text node may come in pieces when the file is parsed by chunks
+        if self.data:
+            data = ''.join(self.data)
+            self.data = []
+            if data != '\n':
+                self.text.append(data)
+
     def start_element(self, name, attr):
+        self.flush()
         if name == S:
             update(self, text=[], words=[], relations=[], s_n=attr['n'], status=S)
         if self.status == S:
@@ -112,47 +124,162 @@ class Handler(object):
                             print '>> skipping sentence', self.s_n
          
     def end_element(self, name):
+        self.flush()
         if name == S:
             self.status = None
             self.results.append((tuple(self.text), self.relations))
     
     def char_data(self, data):
-        if data != '\n':
-            self.text.append(data) 
+        self.data.append(data)
         
 M = 2 ** 20
-def relindex2(stream, words=[]):
-    """Generate a map rel --> *sentence from stream.
+def relstream(stream, bufsize=M):
+    """Generate (text, relations) pairs from stream, as each sentence is
+    closed: the file is parsed by chunks of bufsize bytes, so memory does not
+    grow with its size.
     """
     parser = xml.parsers.expat.ParserCreate()
     parser.buffer_text = True
-    parser.buffer_size = 10 * M
+    parser.buffer_size = bufsize
     
     handler = Handler()    
     parser.StartElementHandler = handler.start_element
     parser.EndElementHandler = handler.end_element
     parser.CharacterDataHandler = handler.char_data
 
-    parser.ParseFile(stream)
-    return handler.results
+    while True:
+        data = stream.read(bufsize)
+        parser.Parse(data, not data)
+        if handler.results:
+            results, handler.results = handler.results, []
+            for result in results:
+                yield result
+        if not data:
+            break
+
+
+def relindex2(stream, words=[]):
+    """Generate a map rel --> *sentence from stream.
+    """
+    return list(relstream(stream, 10 * M))
+
+
+def write_relations(write, sentences):
+    """Write the relations of (text, relations) pairs as index lines.
+    Returns the number of sentences.
+    """
+    n = 0
+    for words, relations in sentences:
+        n += 1
+        for t, v, s in relations:
+            try:
+                write('%s|%s %s|%s\n' % (t, '%s:%d' % v, '%s:%d' % s, ''.join(words))) 
+            except TypeError:
+                pprint((t, v, s))
+                raise
+    return n
+
+
+def index_file((fileno, filename, partdir, runsdir)):
+    """Index one file, in a worker process.  The index lines are written to a
+    part file in partdir and, if runsdir is given, the relations to a sorted
+    run, with the sentences numbered from 1 in the file, and the sentences to
+    a text file, for relstore.merge_shards.  Returns the part file name and
+    the size, CPU time and sentences of the file.
+    """
+    from relstore import write_run
+    start = time.clock()
+    part = join(partdir, '%.6d.part' % fileno)
+    postings = {}
+    shard = dict(sentences=0, relations=0)
+    with codecs.open(part, 'w', encoding='utf-8') as outstream, open(filename, 'rb') as instream:
+        sentences = relstream(instream)
+        if runsdir:
+            sentences = shard_sentences(sentences, postings, shard,
+                                        join(runsdir, '%.6d.txt' % fileno))
+        nsentences = write_relations(outstream.write, sentences)
+    if runsdir:
+        name = '%.6d' % fileno
+        write_run(join(runsdir, name + '.run'), postings)
+        shard.update(file=filename, run=name + '.run', text=name + '.txt')
+        with open(join(runsdir, name + '.json'), 'w') as f:
+            json.dump(shard, f, sort_keys=True)
+    return part, getsize(filename), time.clock() - start, nsentences
+
+
+def shard_sentences(sentences, postings, shard, textname):
+    """Pass (text, relations) pairs through, while gathering the postings of
+    their relations and writing their text, one sentence per line.
+    """
+    from relstore import encode_key
+    with codecs.open(textname, 'w', encoding='utf-8') as text:
+        for words, relations in sentences:
+            shard['sentences'] += 1
+            text.write(u' '.join(u''.join(words).splitlines()) + u'\n')
+            for t, (v, _), (s, _) in relations:
+                shard['relations'] += 1
+                ids = postings.setdefault(encode_key(t, v, s), [])
+                if not ids or ids[-1] != shard['sentences']:
+                    ids.append(shard['sentences'])
+            yield words, relations
 
 
 def main(args):
     from glob import iglob
-    
-    infname, outfname = args
-    with codecs.open(outfname, 'w', encoding='utf-8') as outstream:
-        write = outstream.write
-        for filename in iglob(infname):
-            print 'processing %s' % filename
-            with codecs.open(filename) as instream:
-                for words, relations in relindex2(instream):
-                    for t, v, s in relations:
-                        try:
-                            write('%s|%s %s|%s\n' % (t, '%s:%d' % v, '%s:%d' % s, ''.join(words))) 
-                        except TypeError:
-                            pprint((t, v, s))
-                            raise
+    from multiprocessing import Pool
+    import argparse, tempfile, shutil
+
+    parser = argparse.ArgumentParser(description='Write the ncsubj and dobj relations of RASP XML files')
+    parser.add_argument('infname', help='input file glob')
+    parser.add_argument('outfname', help='index file')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='worker processes')
+    parser.add_argument('-r', '--runs', dest='runsdir',
+                        help='also write sorted relation runs, per file, to this directory'
+                        ' (to merge with relstore.py merge)')
+    cmdline = parser.parse_args(args)
+
+    filenames = list(iglob(cmdline.infname))
+    start = time.time()
+    nbytes = nsentences = 0
+    cpuseconds = 0.0
+    if cmdline.runsdir and not exists(cmdline.runsdir):
+        makedirs(cmdline.runsdir)
+    with codecs.open(cmdline.outfname, 'w', encoding='utf-8') as outstream:
+        if cmdline.jobs < 2 and not cmdline.runsdir:
+            write = outstream.write
+            for filename in filenames:
+                print 'processing %s' % filename
+                filestart = time.clock()
+                with codecs.open(filename) as instream:
+                    nsentences += write_relations(write, relstream(instream))
+                nbytes += getsize(filename)
+                cpuseconds += time.clock() - filestart
+        else:
+            # Files are indexed in parallel, and their parts appended in order
+            partdir = tempfile.mkdtemp(prefix='index', dir=dirname(abspath(cmdline.outfname)))
+            pool = Pool(max(1, cmdline.jobs))
+            try:
+                tasks = [(i, filename, partdir, cmdline.runsdir) for i, filename in enumerate(filenames)]
+                for filename, (part, size, seconds, n) in izip(filenames, pool.imap(index_file, tasks)):
+                    print 'processed %s' % filename
+                    with open(part, 'rb') as partstream:
+                        shutil.copyfileobj(partstream, outstream.stream)
+                    os.remove(part)
+                    nbytes += size
+                    nsentences += n
+                    cpuseconds += seconds
+                pool.close()
+                pool.join()
+            except:
+                pool.terminate()
+                raise
+            finally:
+                shutil.rmtree(partdir, ignore_errors=True)
+    seconds = time.time() - start
+    print '%d files, %.1f MB, %d sentences in %.1fs: %.2f MB/s, %.2f MB/s per core' % (
+        len(filenames), nbytes / float(M), nsentences, seconds,
+        nbytes / float(M) / seconds if seconds else 0.0,
+        nbytes / float(M) / cpuseconds if cpuseconds else 0.0)
 
 
 def test(fname):
@@ -0,0 +1,423 @@
+"""
+.. module:: metlexicon
+    :platform: Unix
+    :synopsis: Compiled metaphor lexicons for the seed-based metaphor finder.
+
+    Building a metaphor finder (parsemet.MetaphorFinderEx) means reading the
+    noun and verb cluster files, optionally extending every cluster word with
+    its WordNet derivations, and expanding every seed into all the <noun, verb>
+    pairs of the seed's clusters.  This module does that once, and saves the
+    result in a lexicon file, mmap'ed when the lexicon is loaded: a word ->
+    cluster index for nouns and verbs, and the full <noun, verb> -> seed
+    table.
+
+    Lexicon files are named after a hash of the contents of their inputs (seed
+    file, cluster files) and of the language and extension flag, so a lexicon
+    is rebuilt whenever one of them changes.  Lexicons are also kept in
+    memory, per process.
+
+    The noun and verb indexes are open addressing hash tables, keyed by
+    tagged word.  A verb maps to its id and cluster; a noun to its cluster,
+    and to the sorted ids of the verbs it forms metaphors with, along with
+    the seed of each pair.  Looking up a <noun, verb> pair is thus two hash
+    lookups and a binary search.  The words looked up are decoded once, into
+    in-process dicts in front of the mmap, so repeated lookups (the common
+    case over a corpus) are dict lookups.
+
+    Run with 'bench' to compare cold (compiling) and warm (loading) startup,
+    and lookup rates with those of findmet.MetaphorBuilder.
+"""
+
+from __future__ import print_function
+
+import sys, os, json, mmap, struct, hashlib, tempfile, time, zlib, argparse
+from array import array
+from collections import defaultdict
+from itertools import izip
+
+from findmet import read_clusters, extended, tagged, cluster_index
+from util import uopen, read_seed, N, V
+
+MAGIC = 'METLEX01'
+# Bump when the format, or the way lexicons are built, changes
+VERSION = 1
+HEADER = struct.Struct('<8sQQ')
+# A hash table slot: offset of the key (followed by the value), key length, value length
+SLOT = struct.Struct('<QII')
+EMPTY = 2 ** 64 - 1
+# Noun values: offset and number of its verbs, then its cluster; verb values: id, then cluster
+NOUN = struct.Struct('<QI')
+VERB = struct.Struct('<I')
+# Verb and seed ids, in native byte order
+ID = 'I'
+IDSIZE = array(ID).itemsize
+SEP = '\x00'
+
+# Lexicons loaded in this process, by file names, stats, language and flag
+_loaded = {}
+
+
+def word_key((word, pos)):
+    return word.encode('utf-8') + SEP + pos.encode('utf-8')
+
+
+def parse_word(data):
+    word, pos = data.split(SEP)
+    return word.decode('utf-8'), pos.decode('utf-8')
+
+
+def slot_of(key, nslots):
+    return (zlib.crc32(key) & 0xffffffff) & (nslots - 1)
+
+
+def write_table(out, items):
+    """Writes (key, value) byte string pairs as an open addressing hash table,
+    at the current position of out.  Returns its descriptor.
+    """
+    nslots = 2
+    while nslots < 2 * len(items):
+        nslots *= 2
+    slots = [(EMPTY, 0, 0)] * nslots
+    start = out.tell()
+    for key, value in items:
+        i = slot_of(key, nslots)
+        while slots[i][0] != EMPTY:
+            i = (i + 1) & (nslots - 1)
+        slots[i] = (out.tell(), len(key), len(value))
+        out.write(key)
+        out.write(value)
+    slotsoffset = out.tell()
+    for slot in slots:
+        out.write(SLOT.pack(*slot))
+    return dict(data=start, slots=slotsoffset, nslots=nslots, size=len(items))
+
+
+def lexicon_key(lang, seed_fname, noun_fn, verb_fn, extend):
+    """Returns the hash of the inputs of a lexicon.
+    """
+    h = hashlib.sha1()
+    h.update('%s %s %s %s\n' % (VERSION, sys.byteorder, lang, bool(extend)))
+    if extend:
+        # derivations come from WordNet
+        import nltk
+        h.update('nltk %s\n' % nltk.__version__)
+    for fname in (seed_fname, noun_fn, verb_fn):
+        with open(fname, 'rb') as f:
+            while True:
+                data = f.read(1 << 20)
+                if not data:
+                    break
+                h.update(data)
+        h.update('\x00')
+    return h.hexdigest()
+
+
+def compile_lexicon(fname, lang, seed_fname, noun_fn, verb_fn, extend, key=None):
+    """Builds a lexicon the way parsemet.MetaphorFinderEx builds its metaphor
+    builder, and writes it to fname.  Returns its metadata.
+    """
+    def tag_ext(pos): return lambda words: extended(tagged(words, pos))
+    def tag(pos): return lambda words: tagged(words, pos)
+    with uopen(seed_fname) as lines:
+        seeds = read_seed(l.rstrip().split() for l in lines)
+    op = tag_ext if extend else tag
+    with uopen(noun_fn) as nlines, uopen(verb_fn) as vlines:
+        nclusters = read_clusters((l.rstrip().split() for l in nlines), op(N))
+        vclusters = read_clusters((l.rstrip().split() for l in vlines), op(V))
+    nindex, vindex = cluster_index(nclusters), cluster_index(vclusters)
+
+    # As findmet.build_metaphors, on verb ids: noun -> verb id -> seed id,
+    # where later seeds replace earlier ones
+    verbs = sorted(vindex)
+    vids = dict((v, i) for i, v in enumerate(verbs))
+    vclusterids = dict((cname, [vids[v] for v in words]) for cname, words in vclusters.iteritems())
+    seedlist = []
+    seedids = {}
+    orphans = []
+    bynoun = defaultdict(dict)
+    for seed in seeds:
+        reltype, nseed, vseed = seed
+        nn, vn = nindex.get(nseed), vindex.get(vseed)
+        if nn and vn:
+            i = seedids.get(seed)
+            if i is None:
+                i = seedids[seed] = len(seedlist)
+                seedlist.append(seed)
+            pairs = dict.fromkeys(vclusterids[vn], i)
+            for n in nclusters[nn]:
+                bynoun[n].update(pairs)
+        else:
+            orphans.append(seed)
+    nmetaphors = sum(len(pairs) for pairs in bynoun.itervalues())
+    metadata = dict(lang=lang, extend=bool(extend), key=key, version=VERSION,
+                    inputs=dict(seeds=seed_fname, nouns=noun_fn, verbs=verb_fn),
+                    seeds=seedlist, orphans=orphans, metaphors=nmetaphors)
+    with open(fname, 'wb') as out:
+        out.write('\0' * HEADER.size)
+        nouns = []
+        for n, cname in nindex.iteritems():
+            pairs = bynoun.pop(n, {})
+            nvids = sorted(pairs)
+            nouns.append((word_key(n), NOUN.pack(out.tell(), len(nvids)) + cname.encode('utf-8')))
+            out.write(array(ID, nvids).tostring())
+            out.write(array(ID, [pairs[vid] for vid in nvids]).tostring())
+        metadata['tables'] = dict(
+            nouns=write_table(out, nouns),
+            verbs=write_table(out, [(word_key(v), VERB.pack(vids[v]) + vindex[v].encode('utf-8'))
+                                    for v in verbs]))
+        metaoffset = out.tell()
+        out.write(json.dumps(metadata, sort_keys=True))
+        metalength = out.tell() - metaoffset
+        out.seek(0)
+        out.write(HEADER.pack(MAGIC, metaoffset, metalength))
+    return metadata
+
+
+class MetaphorLexicon(object):
+    """A compiled lexicon.  Can be used in place of findmet.MetaphorBuilder.
+    """
+    def __init__(self, fname):
+        self.fname = fname
+        with open(fname, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, metaoffset, metalength = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            raise ValueError('%s is not a metaphor lexicon' % fname)
+        self.metadata = json.loads(self.data[metaoffset:metaoffset + metalength])
+        self.tables = self.metadata['tables']
+        self.seeds = [(rel, tuple(n), tuple(v)) for rel, n, v in self.metadata['seeds']]
+        self.orphans = [(rel, tuple(n), tuple(v)) for rel, n, v in self.metadata['orphans']]
+        # Words looked up so far: noun -> {verb id: seed}, verb -> verb id (None if unknown)
+        self.nouncache = {}
+        self.verbcache = {}
+
+    def get(self, table, key):
+        """Returns the value of key in a table, or None.
+        """
+        t = self.tables[table]
+        nslots, slots, data = t['nslots'], t['slots'], self.data
+        i = slot_of(key, nslots)
+        while True:
+            offset, keylen, vallen = SLOT.unpack_from(data, slots + i * SLOT.size)
+            if offset == EMPTY:
+                return None
+            if keylen == len(key) and data[offset:offset + keylen] == key:
+                return data[offset + keylen:offset + keylen + vallen]
+            i = (i + 1) & (nslots - 1)
+
+    def items(self, table):
+        """Yields the (key, value) byte strings of a table.
+        """
+        t = self.tables[table]
+        for i in xrange(t['nslots']):
+            offset, keylen, vallen = SLOT.unpack_from(self.data, t['slots'] + i * SLOT.size)
+            if offset != EMPTY:
+                yield self.data[offset:offset + keylen], self.data[offset + keylen:offset + keylen + vallen]
+
+    def noun_seeds(self, n):
+        """Returns the {verb id: seed} dict of a tagged noun, or None.
+        """
+        try:
+            return self.nouncache[n]
+        except KeyError:
+            pass
+        value = self.get('nouns', word_key(n))
+        if value is None:
+            seeds = None
+        else:
+            offset, count = NOUN.unpack_from(value)
+            ids = array(ID)
+            ids.fromstring(self.data[offset:offset + 2 * count * IDSIZE])
+            seeds = dict((vid, self.seeds[sid]) for vid, sid in izip(ids[:count], ids[count:]))
+        self.nouncache[n] = seeds
+        return seeds
+
+    def verb_id(self, v):
+        """Returns the id of a tagged verb, or None.
+        """
+        try:
+            return self.verbcache[v]
+        except KeyError:
+            pass
+        value = self.get('verbs', word_key(v))
+        vid = self.verbcache[v] = VERB.unpack_from(value)[0] if value is not None else None
+        return vid
+
+    def seed(self, n, v):
+        """Returns the seed of a <noun, verb> pair of tagged words, or None.
+        """
+        seeds = self.nouncache[n] if n in self.nouncache else self.noun_seeds(n)
+        if not seeds:
+            return None
+        vid = self.verbcache[v] if v in self.verbcache else self.verb_id(v)
+        return seeds.get(vid)
+
+    def cluster(self, word, pos=N):
+        """Returns the name of the cluster of a word, or None.
+        """
+        if pos == N:
+            value, size = self.get('nouns', word_key((word, pos))), NOUN.size
+        else:
+            value, size = self.get('verbs', word_key((word, pos))), VERB.size
+        return value[size:].decode('utf-8') if value is not None else None
+
+    def find(self, relations):
+        """Same as findmet.MetaphorBuilder.find.
+        """
+        # self.seed, inlined
+        nouncache, verbcache = self.nouncache, self.verbcache
+        found = []
+        for n, v in relations:
+            seeds = nouncache[n] if n in nouncache else self.noun_seeds(n)
+            if seeds:
+                seed = seeds.get(verbcache[v] if v in verbcache else self.verb_id(v))
+                if seed is not None:
+                    found.append((n, v) + seed)
+        return found
+
+    @property
+    def metaphors(self):
+        """The <noun, verb> -> seed table, as a dict.
+        """
+        verbs = dict((VERB.unpack_from(value)[0], parse_word(key))
+                     for key, value in self.items('verbs'))
+        mm = dict()
+        for key, value in self.items('nouns'):
+            n = parse_word(key)
+            offset, count = NOUN.unpack_from(value)
+            ids = array(ID)
+            ids.fromstring(self.data[offset:offset + 2 * count * IDSIZE])
+            for vid, sid in zip(ids[:count], ids[count:]):
+                mm[n, verbs[vid]] = self.seeds[sid]
+        return mm
+
+    def close(self):
+        self.data.close()
+
+
+def default_dir():
+    from depparsing.parser.util import config
+    return config('{TMP}/lexicons')
+
+
+def cluster_files(lang):
+    from findmet import cluster
+    return cluster[lang]
+
+
+def load(lang, seed_fname, extend=False, lexdir=None, noun_fn=None, verb_fn=None):
+    """Returns the lexicon for a language, seed file and extension flag,
+    compiling it into lexdir first if needed.  Cluster files default to
+    those of the language (see findmet.cluster).
+    """
+    if not (noun_fn and verb_fn):
+        noun_fn, verb_fn = cluster_files(lang)
+    lexdir = lexdir or default_dir()
+    fnames = (seed_fname, noun_fn, verb_fn)
+    stats = tuple((os.path.abspath(f), os.stat(f).st_mtime, os.stat(f).st_size) for f in fnames)
+    memokey = (lang, bool(extend), os.path.abspath(lexdir), stats)
+    lexicon = _loaded.get(memokey)
+    if lexicon is not None:
+        return lexicon
+    key = lexicon_key(lang, seed_fname, noun_fn, verb_fn, extend)
+    fname = os.path.join(lexdir, '%s-%s.metlex' % (lang, key))
+    if not os.path.exists(fname):
+        if not os.path.exists(lexdir):
+            try:
+                os.makedirs(lexdir)
+            except OSError:
+                # created by another process meanwhile
+                pass
+        # written under a temporary name, so concurrent loads never see a partial lexicon
+        fd, tmpname = tempfile.mkstemp(prefix='.%s-' % lang, dir=lexdir)
+        os.close(fd)
+        try:
+            compile_lexicon(tmpname, lang, seed_fname, noun_fn, verb_fn, extend, key)
+            os.chmod(tmpname, 0644)
+            os.rename(tmpname, fname)
+        except:
+            os.remove(tmpname)
+            raise
+    lexicon = _loaded[memokey] = MetaphorLexicon(fname)
+    return lexicon
+
+
+def bench(lang, seed_fname, extend, lexdir, noun_fn, verb_fn, probes):
+    """Times compiling (cold), loading (warm) and in-process reuse of a
+    lexicon, then lookups, from the mmap and from the word caches, compared
+    with findmet.MetaphorBuilder.
+    """
+    from findmet import MetaphorBuilder
+    if not (noun_fn and verb_fn):
+        noun_fn, verb_fn = cluster_files(lang)
+    lexdir = lexdir or tempfile.mkdtemp(prefix='metlex')
+    key = lexicon_key(lang, seed_fname, noun_fn, verb_fn, extend)
+    fname = os.path.join(lexdir, '%s-%s.metlex' % (lang, key))
+    if os.path.exists(fname):
+        os.remove(fname)
+    _loaded.clear()
+
+    def timed(label, f):
+        start = time.time()
+        result = f()
+        print('%-28s %9.3fs' % (label, time.time() - start))
+        return result
+
+    def builder():
+        def op(pos):
+            return (lambda words: extended(tagged(words, pos))) if extend else (lambda words: tagged(words, pos))
+        with uopen(seed_fname) as lines:
+            seeds = read_seed(l.rstrip().split() for l in lines)
+        with uopen(noun_fn) as nlines, uopen(verb_fn) as vlines:
+            nclusters = read_clusters((l.rstrip().split() for l in nlines), op(N))
+            vclusters = read_clusters((l.rstrip().split() for l in vlines), op(V))
+        return MetaphorBuilder(lang, nclusters, vclusters, seeds)
+
+    mbuilder = timed('MetaphorBuilder', builder)
+    timed('cold (compile and load)', lambda: load(lang, seed_fname, extend, lexdir, noun_fn, verb_fn))
+    _loaded.clear()
+    lexicon = timed('warm (hash inputs and load)', lambda: load(lang, seed_fname, extend, lexdir, noun_fn, verb_fn))
+    timed('in process', lambda: load(lang, seed_fname, extend, lexdir, noun_fn, verb_fn))
+
+    pairs = mbuilder.metaphors.keys()
+    nouns = [n for n, _ in pairs] or [(u'', N)]
+    verbs = [v for _, v in pairs] or [(u'', V)]
+    # half known pairs, half random combinations
+    queries = [pairs[i % len(pairs)] if (i % 2 and pairs) else
+               (nouns[(i * 7919) % len(nouns)], verbs[(i * 104729) % len(verbs)])
+               for i in xrange(probes)]
+    lexicon.nouncache.clear()
+    lexicon.verbcache.clear()
+    # the first pass reads each word from the mmap, the second from the cache
+    for label, finder in (('MetaphorBuilder', mbuilder), ('lexicon, first pass', lexicon),
+                          ('lexicon, cached', lexicon)):
+        start = time.time()
+        found = finder.find(queries)
+        seconds = time.time() - start
+        print('%-28s %9.0f lookups/s, %d found' % (label, probes / seconds if seconds else 0, len(found)))
+    if sorted(mbuilder.find(queries)) != sorted(lexicon.find(queries)):
+        print('lexicon and MetaphorBuilder results differ!')
+        return 1
+    return 0
+
+
+def main(args):
+    p = argparse.ArgumentParser(description='Compile metaphor lexicons')
+    p.add_argument('command', choices=['compile', 'bench'])
+    p.add_argument('-l', dest='lang', choices=['en', 'es', 'ru'], required=True, metavar='<language>')
+    p.add_argument('-s', dest='seed_fn', required=True, metavar='<seed-filename>')
+    p.add_argument('-x', dest='extend_seeds', action='store_true', help='Extend clusters with WordNet derivations')
+    p.add_argument('-d', dest='lexdir', metavar='<dir>', help='Lexicon directory')
+    p.add_argument('--nouns', dest='noun_fn', metavar='<filename>', help='Noun cluster file')
+    p.add_argument('--verbs', dest='verb_fn', metavar='<filename>', help='Verb cluster file')
+    p.add_argument('-n', dest='probes', type=int, default=100000, help='Lookups to time')
+    a = p.parse_args(args)
+    if a.command == 'bench':
+        return bench(a.lang, a.seed_fn, a.extend_seeds, a.lexdir, a.noun_fn, a.verb_fn, a.probes)
+    lexicon = load(a.lang, a.seed_fn, a.extend_seeds, a.lexdir, a.noun_fn, a.verb_fn)
+    print(lexicon.fname, lexicon.metadata['metaphors'], 'metaphors')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,185 @@
+# -*- coding: UTF-8 -*-
+
+"""
+.. module:: parsecache
+    :platform: Unix
+    :synopsis: Persistent cache of translated dependency parses.
+
+A content-addressed cache of dependency parses, so that a sentence is parsed
+only once across documents, test sets and re-runs.  Entries are keyed by a
+hash of the language, the parser (its name and command line, which changes
+with the installed parser version) and the sentence text, normalised the
+same way it is before being fed to the parser.  The values are the
+translated sentences produced by :py:func:`depparsing.dep2json.parse` (the
+``word`` and ``dparse`` records that
+:py:meth:`cmsextractor.cms.ConstructionMatchingSystem.incorporateDeps` reads).
+
+The cache is an SQLite file; its size is bounded by a number of entries,
+beyond which the least recently used entries are evicted.  Several
+processes can share the same file.
+
+The cache is enabled by setting the environment variable ``MNPARSECACHE``
+to the path of the cache file; ``MNPARSECACHESIZE`` sets the maximum number
+of entries (default 1000000).
+
+"""
+
+from __future__ import print_function
+
+from hashlib import sha1
+from json import dumps, loads
+import os, re, sqlite3, time, logging
+
+from depparsing.dep2json import parse
+from depparsing.parser.util import parserdesc, sanitized
+
+logger = logging.getLogger(__name__)
+
+# Increment when the format of the values changes
+CACHE_VERSION = 1
+
+_space_re = re.compile(r'\s+', re.UNICODE)
+
+# Key prefixes (cache version, language and parser), by language
+_key_prefixes = {}
+
+
+def normalized(ctext):
+    """Normalise a sentence text for use in a cache key.
+    """
+    return _space_re.sub(u' ', sanitized(ctext)).strip()
+
+
+class ParseCache(object):
+
+    """A size-bounded persistent map from sentence keys to translated parses.
+    """
+
+    def __init__(self, fname, maxentries=1000000):
+        """:param fname: path of the cache file.
+        :param maxentries: maximum number of entries kept.
+        """
+        self.fname = fname
+        self.maxentries = maxentries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._conn = None
+        self._pid = None
+
+    def _connection(self):
+        # connections must not be shared across fork(), so reopen in children
+        if (self._conn is None) or (self._pid != os.getpid()):
+            self._conn = sqlite3.connect(self.fname, timeout=60)
+            self._conn.execute('CREATE TABLE IF NOT EXISTS parse '
+                               '(key TEXT PRIMARY KEY, value TEXT, atime REAL)')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS parse_atime ON parse (atime)')
+            self._conn.commit()
+            self._pid = os.getpid()
+        return self._conn
+
+    def close(self):
+        if self._conn is not None and self._pid == os.getpid():
+            self._conn.close()
+        self._conn = None
+
+    @staticmethod
+    def key(lang, ctext):
+        """Return the cache key of a sentence.
+
+        :param lang: one of 'en', 'es', 'ru', 'fa'.
+        :param ctext: the sentence text.
+        """
+        if lang not in _key_prefixes:
+            pdesc = parserdesc(lang)
+            _key_prefixes[lang] = u'\t'.join([unicode(CACHE_VERSION), lang, pdesc.name,
+                                              u' '.join(pdesc.command)])
+        h = sha1()
+        h.update((u'%s\t%s' % (_key_prefixes[lang], normalized(ctext))).encode('utf-8'))
+        return h.hexdigest()
+
+    def get(self, keys):
+        """Look up a list of keys.
+
+        :returns: a dict from key to (JSON encoded) value, for the keys found.
+        """
+        conn = self._connection()
+        found = {}
+        keys = list(set(keys))
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            rows = conn.execute('SELECT key, value FROM parse WHERE key IN (%s)' % ','.join('?' * len(chunk)),
+                                chunk)
+            for key, value in rows:
+                found[key] = value
+        if found:
+            now = time.time()
+            conn.executemany('UPDATE parse SET atime=? WHERE key=?', [(now, k) for k in found])
+            conn.commit()
+        return found
+
+    def put(self, items):
+        """Store (key, value) pairs, evicting the least recently used entries if the
+        cache grows beyond its maximum size.
+        """
+        if not items:
+            return
+        conn = self._connection()
+        now = time.time()
+        conn.executemany('INSERT OR REPLACE INTO parse VALUES (?, ?, ?)',
+                         [(k, dumps(v, ensure_ascii=False), now) for k, v in items])
+        n = conn.execute('SELECT COUNT(*) FROM parse').fetchone()[0]
+        if n > self.maxentries:
+            excess = n - self.maxentries
+            conn.execute('DELETE FROM parse WHERE key IN '
+                         '(SELECT key FROM parse ORDER BY atime LIMIT ?)', (excess,))
+            self.evictions += excess
+        conn.commit()
+
+    def stats(self):
+        return dict(hits=self.hits, misses=self.misses, evictions=self.evictions)
+
+    def parse(self, lang, sentences):
+        """Parse a list of sentences, parsing only those not in the cache.
+
+        :param lang: one of 'en', 'es', 'ru', 'fa'.
+        :param sentences: a sequence of sentence texts.
+        :returns: the list of translated sentences, as in the 'sentences' of the
+            JSON returned by dep2json.parse; 'idx' is the position in sentences.
+        """
+        keys = [self.key(lang, s) for s in sentences]
+        found = self.get(keys)
+        parsed = []
+        missing = []
+        for i, k in enumerate(keys):
+            if k in found:
+                parsed.append(dict(loads(found[k]), idx=i))
+            else:
+                missing.append(i)
+        self.hits += len(keys) - len(missing)
+        self.misses += len(missing)
+        logger.debug('parse cache: %d hits, %d misses', len(keys) - len(missing), len(missing))
+        if missing:
+            out = parse(lang, [sentences[i] for i in missing])
+            items = []
+            for psent in out['sentences']:
+                i = missing[psent['idx']]
+                items.append((keys[i], dict((k, v) for k, v in psent.iteritems() if k != 'idx')))
+                parsed.append(dict(psent, idx=i))
+            self.put(items)
+        return sorted(parsed, key=lambda s: s['idx'])
+
+
+_caches = {}
+
+
+def parse_cache():
+    """Return the ParseCache named by the environment variable MNPARSECACHE,
+    or None if it is not set.
+    """
+    fname = os.environ.get('MNPARSECACHE')
+    if not fname:
+        return None
+    if fname not in _caches:
+        _caches[fname] = ParseCache(fname, int(os.environ.get('MNPARSECACHESIZE', 1000000)))
+    return _caches[fname]
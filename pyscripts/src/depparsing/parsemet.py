@@ -19,7 +19,7 @@ from pprint import pprint, pformat
 
 from depparsing.parser.util import parserdesc
 from edeps import dependencies
-from findmet import MetaphorBuilder, read_clusters, extended, tagged
+import metlexicon
 from util import update, uopen, read_seed, N, V, uwriter, ureader, dprint, dpprint
 from depparsing.dep2json import parser_for, translate
 from textwrap import dedent
@@ -116,19 +116,11 @@ def dump((n, v), indent=0, stream=uerr):
 
 
 class MetaphorFinderEx(object):
-    """Metaphor finder. Efficient version.
+    """Metaphor finder. Efficient version: the metaphors are looked up in a
+    compiled lexicon (see metlexicon), shared by the finders of a process.
     """
-    def __init__(self, lang, seed_fname, extend_seeds):
-        def tag_ext(pos): return lambda words: extended(tagged(words, pos))
-        def tag(pos): return lambda words: tagged(words, pos)
-        noun_fn, verb_fn = cluster(lang)
-        with uopen(seed_fname) as lines:
-            seeds = read_seed(l.rstrip().split() for l in lines)
-        op = tag_ext if extend_seeds else tag
-        with uopen(noun_fn) as nlines, uopen(verb_fn) as vlines:
-            nclusters = read_clusters((l.rstrip().split() for l in nlines), op(N))
-            vclusters = read_clusters((l.rstrip().split() for l in vlines), op(V))
-        update(self, mbuilder=MetaphorBuilder(lang, nclusters, vclusters, seeds))
+    def __init__(self, lang, seed_fname, extend_seeds, lexicon_dir=None):
+        update(self, mbuilder=metlexicon.load(lang, seed_fname, extend_seeds, lexicon_dir))
 
     def find(self, relations):
         """Find metaphors in relations.
@@ -150,7 +142,7 @@ rtype = {'en': {'verb-subject': 'ncsubj',
 
 
 
-def m4detect(lang, json_in, seed_fn, invoke_parser=False, extend_seeds=False, **kw):
+def m4detect(lang, json_in, seed_fn, invoke_parser=False, extend_seeds=False, lexicon_dir=None, **kw):
     """Metaphor detection using the seed system.
 
     :param lang: language (one of 'en', 'es', 'ru', 'fa')
@@ -158,6 +150,7 @@ def m4detect(lang, json_in, seed_fn, invoke_parser=False, extend_seeds=False, **
     :param seed_fn: a list of seeds
     :param invoke_parser: invoke parser on the sentences in the json doc
     :param extended_seeds: whether or not try to extend seeds (English only)
+    :param lexicon_dir: directory of the compiled metaphor lexicons
     :returrns: a json_in with a list of the found LMs appended to each sentence
     """
     relations, json_out = extract(json_in, lang, invoke_parser)
@@ -198,8 +191,7 @@ def m4detect(lang, json_in, seed_fn, invoke_parser=False, extend_seeds=False, **
                     source=dom(verb, v_rel),
                     seed=u' '.join(u'%s.%s' % s for s in seed))
 
-    # TODO: optimization: this should be created once at the beginning. Perhaps on import?
-    mfinder = MetaphorFinderEx(lang, seed_fn, extend_seeds)
+    mfinder = MetaphorFinderEx(lang, seed_fn, extend_seeds, lexicon_dir)
 
     # TODO: this is inefficient: Python will evaluate arguments anyway
 #     dprint('All possible metaphors:')
@@ -226,8 +218,8 @@ def m4detect(lang, json_in, seed_fn, invoke_parser=False, extend_seeds=False, **
     return jsonout
 
 
-def all_metaphors(lang, seed_fn, extend_seeds, **_):
-    mfinder = MetaphorFinderEx(lang, seed_fn, extend_seeds)
+def all_metaphors(lang, seed_fn, extend_seeds, lexicon_dir=None, **_):
+    mfinder = MetaphorFinderEx(lang, seed_fn, extend_seeds, lexicon_dir)
     return mfinder.mbuilder.metaphors
 
 def argparser():
@@ -247,6 +239,8 @@ def argparser():
                    help='Seed file name')
     p.add_argument('-o', dest='out_fn', required=False, default='-', metavar='<filename>',
                    help='Output file name')
+    p.add_argument('-c', dest='lexicon_dir', required=False, metavar='<dir>',
+                   help='Directory of the compiled metaphor lexicons')
     p.add_argument('-m', dest='debug_meta', action='store_true',
                    help='Debug metaphors: output stored metaphors (language and seed file needed)')
 #     p.add_argument('-d', dest='debug', action='store_true',
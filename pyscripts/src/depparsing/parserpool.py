@@ -0,0 +1,443 @@
+# -*- coding: UTF-8 -*-
+
+"""
+.. module:: parserpool
+    :platform: Unix
+    :synopsis: A pool of long-lived dependency parser processes.
+
+Keeps a number of parser processes (RASP, Freeling, Malt) running, so that
+the cost of starting a parser and loading its models is paid once per
+process instead of once per call to :py:func:`depparsing.dep2json.parse`.
+
+Sentences are streamed to each worker one line at a time; the worker's
+output is read back sentence by sentence, using the parser's output format
+to find where the output for one sentence ends (a *frame*):
+
+- ``rasp``: a header line, a ``gr-list`` (or empty) line, the GRs and a
+  blank line, as read by :py:class:`depparsing.edeps.RaspDepParser`;
+- ``malt-*`` (CoNLL-X): the token lines, terminated by a blank line;
+- ``freeling``: the tree lines, terminated by a blank line.  Freeling numbers
+  the sentences it reads, so those numbers are rewritten to be relative to
+  each call.
+
+The output of :py:meth:`ParserPool.parse` is the same list of lines that
+running the parser once over all the sentences would produce, so it can be
+handed to the translators in :py:mod:`depparsing.dep2json` unchanged.
+
+Each sentence must be parsed within a timeout (plus a startup allowance for
+the first sentence a worker parses, while it loads its models); a worker that times out or
+dies is restarted and the sentence retried.  A sentence that still fails is
+logged and gets an error parse (see :py:meth:`Frame.failed`), so the other
+sentences of the call are not lost.
+
+Parser commands must flush their output after every sentence: the pool runs
+them under ``stdbuf -oL`` when it is available, and Freeling with
+``--flush``, so that every input line is a sentence.
+
+For testing, the module can act as a stub parser that emits canned output::
+
+    python -m depparsing.parserpool --stub conllx
+
+and can run a pool over sentences read from stdin::
+
+    python -m depparsing.parserpool -n 4 -f conllx -- python -m depparsing.parserpool --stub conllx
+
+"""
+
+from __future__ import print_function
+
+from argparse import ArgumentParser
+from distutils.spawn import find_executable
+from Queue import Queue, Empty
+from subprocess import Popen, PIPE
+from tempfile import TemporaryFile
+import os, re, select, sys, threading, time, logging
+
+from depparsing.parser.util import sanitized
+
+logger = logging.getLogger(__name__)
+
+
+class ParserError(Exception):
+    """Raised when a sentence cannot be parsed by any worker (only if the
+    pool is not lenient).
+    """
+    pass
+
+
+class Frame(object):
+
+    """Base class for frames: recognizes the end of the parser's output for
+    one sentence.
+    """
+
+    # Options the parser command needs to answer one input line at a time
+    options = []
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.seen = False
+
+    def complete(self, line):
+        """Consume a line of output; returns True if it ends the sentence.
+        """
+        if len(line.strip()) > 0:
+            self.seen = True
+            return False
+        return self.seen
+
+    def renumbered(self, lines, n):
+        """Return the lines of the n-th sentence (counting from 1), as they
+        would have been output by a fresh parser.
+        """
+        return lines
+
+    def failed(self, sentence, n):
+        """Return the lines of an empty parse of the n-th sentence, standing
+        in for the output of a sentence the parser failed on.
+        """
+        return ['']
+
+
+class ConllxFrame(Frame):
+
+    """A CoNLL-X (Malt) sentence: token lines, followed by a blank line.
+    """
+
+    def failed(self, sentence, n):
+        # A blank line alone would end the parse for MaltDepParser: use
+        # unattached tokens instead
+        return [u'\t'.join([unicode(i), w, w, u'_', u'_', u'_', u'0', u'_', u'_', u'_']).encode('utf-8')
+                for i, w in enumerate(sentence.split(), start=1)] + ['']
+
+
+class FreelingFrame(Frame):
+
+    """A Freeling dependency tree, whose lines are prefixed by the sentence
+    number, followed by a blank line.
+    """
+    number_re = re.compile(r'^\d+:')
+    options = ['--flush']
+
+    def renumbered(self, lines, n):
+        prefix = '%d:' % n
+        return [self.number_re.sub(prefix, l) for l in lines]
+
+
+class RaspFrame(Frame):
+
+    """A RASP sentence: header, gr-list, GRs, blank line.
+    """
+    HEADER, GR, BODY = 'HGB'
+    header_re = re.compile(r'(\)) +-?\d +; +\((?:-?\d+\.\d+)?\)')
+
+    def reset(self):
+        self.status = self.HEADER
+
+    def complete(self, line):
+        if self.status is self.HEADER:
+            if self.header_re.search(line):
+                self.status = self.GR
+            return False
+        if self.status is self.GR:
+            self.status = self.BODY
+            return False
+        return len(line.strip()) == 0
+
+    def failed(self, sentence, n):
+        # A header with no GRs
+        words = u' '.join(u'|%s|' % w.replace(u'|', u'\\|') for w in sentence.split())
+        return [(u'(%s) 0 ; ()' % words).encode('utf-8'), '', '']
+
+
+# Frames for the parsers named in depparsing.parser.util
+FRAMES = {'rasp': RaspFrame,
+          'freeling': FreelingFrame,
+          'malt-es': ConllxFrame,
+          'malt-ru': ConllxFrame,
+          'malt-fa': ConllxFrame,
+          'conllx': ConllxFrame}
+
+
+def line_buffered(command, options=()):
+    """Return command, with options added, run under ``stdbuf -oL`` (if
+    available and not already used), so that its output is line buffered.
+    """
+    command = list(command) + [o for o in options if o not in command]
+    if not command or os.path.basename(command[0]) == 'stdbuf':
+        return command
+    stdbuf = find_executable('stdbuf')
+    return [stdbuf, '-oL'] + command if stdbuf else command
+
+
+class Worker(object):
+
+    """A parser process, parsing one sentence at a time.
+    """
+
+    def __init__(self, command, frame, timeout, startup, encoding='utf-8'):
+        """:param command: the parser command line (a list).
+        :param frame: a Frame class, for the parser's output format.
+        :param timeout: seconds allowed for parsing one sentence.
+        :param startup: additional seconds allowed for the first sentence.
+        """
+        self.frame = frame()
+        self.command = line_buffered(command, self.frame.options)
+        self.timeout = timeout
+        self.startup = startup
+        self.started = False
+        self.encoding = encoding
+        self.process = None
+        self.errfile = None
+        self.buffer = ''
+
+    def start(self):
+        self.errfile = TemporaryFile(prefix='err-')
+        self.process = Popen(self.command, stdin=PIPE, stdout=PIPE, stderr=self.errfile,
+                             bufsize=0, close_fds=True)
+        self.buffer = ''
+        self.started = False
+        logger.debug('started parser process %d: %s', self.process.pid, ' '.join(self.command))
+
+    def stop(self):
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.close()
+        except IOError:
+            pass
+        if self.process.poll() is None:
+            try:
+                self.process.kill()
+            except OSError:
+                pass
+        self.process.wait()
+        self.process.stdout.close()
+        self.errfile.close()
+        self.process = None
+
+    def restart(self):
+        self.stop()
+        self.start()
+
+    def stderr(self):
+        """Return the tail of the parser's error output, for diagnostics.
+        """
+        try:
+            self.errfile.seek(0, os.SEEK_END)
+            size = self.errfile.tell()
+            self.errfile.seek(max(0, size - 2048))
+            return self.errfile.read()
+        except (IOError, ValueError):
+            return ''
+
+    def readline(self, deadline):
+        """Read a line of output, waiting at most until deadline.
+        Returns None on timeout or if the parser exits.
+        """
+        fd = self.process.stdout.fileno()
+        while '\n' not in self.buffer:
+            wait = deadline - time.time()
+            if wait <= 0:
+                return None
+            ready, _, _ = select.select([fd], [], [], wait)
+            if not ready:
+                return None
+            data = os.read(fd, 65536)
+            if not data:
+                return None
+            self.buffer += data
+        line, self.buffer = self.buffer.split('\n', 1)
+        return line
+
+    def parse(self, sentence):
+        """Parse one sentence; returns the list of output lines for it, or
+        None if the parser timed out or died.
+        """
+        if self.process is None:
+            self.start()
+        try:
+            self.process.stdin.write(sentence.encode(self.encoding) + '\n')
+            self.process.stdin.flush()
+        except IOError:
+            return None
+        deadline = time.time() + self.timeout + (0 if self.started else self.startup)
+        self.frame.reset()
+        lines = []
+        while True:
+            line = self.readline(deadline)
+            if line is None:
+                return None
+            lines.append(line)
+            if self.frame.complete(line):
+                self.started = True
+                return lines
+
+
+class ParserPool(object):
+
+    """A pool of warm parser processes.
+    """
+
+    def __init__(self, command, name, workers=2, timeout=60, startup=600, retries=1, batch=50,
+                 encoding='utf-8', lenient=True):
+        """:param command: the parser command line (a list).
+        :param name: the parser name (see FRAMES), which determines the output format.
+        :param workers: number of parser processes.
+        :param timeout: seconds allowed for parsing one sentence.
+        :param startup: additional seconds allowed for a worker's first sentence.
+        :param retries: times a failed sentence is retried on a restarted worker.
+        :param batch: number of sentences handed to a worker at a time.
+        :param lenient: if True, a sentence that cannot be parsed gets an error
+            parse; otherwise it raises ParserError.
+        """
+        self.name = name
+        self.frame = FRAMES[name]
+        self.retries = retries
+        self.lenient = lenient
+        # the numbers of the sentences of the last call that got an error parse
+        self.failed = []
+        self.batch = batch
+        self.workers = [Worker(command, self.frame, timeout, startup, encoding) for _ in range(workers)]
+        self.lock = threading.Lock()
+
+    def close(self):
+        for w in self.workers:
+            w.stop()
+
+    def _parse_batch(self, worker, sentences, base):
+        """Parse a batch of sentences on worker; base is the number of the
+        first sentence (counting from 1).
+        """
+        frame = self.frame()
+        output = []
+        for n, sentence in enumerate(sentences, start=base):
+            for attempt in range(self.retries + 1):
+                lines = worker.parse(sentence)
+                if lines is not None:
+                    break
+                logger.warning('parser %s failed on sentence %d (attempt %d), restarting:\n%s',
+                               self.name, n, attempt + 1, worker.stderr())
+                worker.restart()
+            else:
+                if not self.lenient:
+                    raise ParserError(u'cannot parse sentence %d: %s' % (n, sentence))
+                logger.error(u'parser %s cannot parse sentence %d, skipped: %s', self.name, n, sentence)
+                self.failed.append(n)
+                lines = frame.failed(sentence, n)
+            output.extend(frame.renumbered(lines, n))
+        return output
+
+    def parse(self, sentences):
+        """Parse a list of sentences.
+
+        :param sentences: a sequence of strings.
+        :returns: the parser's output, as a list of lines.
+        """
+        sentences = [sanitized(s) for s in sentences]
+        batches = Queue()
+        nbatches = 0
+        for i in range(0, len(sentences), self.batch):
+            batches.put((nbatches, i + 1, sentences[i:i + self.batch]))
+            nbatches += 1
+        results = [None] * nbatches
+        errors = []
+
+        def run(worker):
+            while not errors:
+                try:
+                    k, base, batch = batches.get_nowait()
+                except Empty:
+                    return
+                try:
+                    results[k] = self._parse_batch(worker, batch, base)
+                except Exception as x:
+                    errors.append(x)
+
+        # the workers serve one call at a time
+        with self.lock:
+            self.failed = []
+            threads = [threading.Thread(target=run, args=(w,)) for w in self.workers[:nbatches]]
+            for t in threads:
+                t.daemon = True
+                t.start()
+            for t in threads:
+                t.join()
+        if errors:
+            raise errors[0]
+        output = [l for r in results for l in r]
+        output.append('')
+        return output
+
+
+def stub_parser(fmt, instream, outstream):
+    """A stand-in for a parser, for testing: emits canned output in the given
+    format for every input line.  A sentence containing the word STUBHANG is
+    never answered, and one containing STUBCRASH kills the process.
+    """
+    n = 0
+    for line in iter(instream.readline, ''):
+        words = line.decode('utf-8').split()
+        n += 1
+        if u'STUBCRASH' in words:
+            os._exit(1)
+        if u'STUBHANG' in words:
+            time.sleep(3600)
+        if fmt == 'rasp':
+            out = [u'(%s) 1 ; (-1.000)' % u' '.join(u'|%s:%d_NN1|' % (w, i)
+                                                   for i, w in enumerate(words, start=1)),
+                   u'', u'gr-list: 1']
+            out.extend(u'(|ncmod| _ |%s:%d_NN1| |%s:%d_NN1|)' % (words[0], 1, w, i)
+                       for i, w in enumerate(words[1:], start=2))
+        elif fmt == 'freeling':
+            out = [u'%d:grup-verb/top/(%s %s NC 0 %d -) [' % (n, words[0], words[0].lower(),
+                                                               len(words[0]))]
+            out.extend(u'%d:  sn/dobj/(%s %s NC 0 %d -)' % (n, w, w.lower(), len(w))
+                       for w in words[1:])
+            out.append(u'%d:]' % n)
+        else:
+            out = [u'\t'.join([unicode(i), w, w.lower(), u'N', u'N', u'_',
+                               unicode(0 if i == 1 else 1), u'ROOT' if i == 1 else u'dep',
+                               u'_', u'_'])
+                   for i, w in enumerate(words, start=1)]
+        out.append(u'')
+        outstream.write(u'\n'.join(out).encode('utf-8') + '\n')
+        outstream.flush()
+
+
+def argparser():
+    p = ArgumentParser(description='Run a pool of parser processes over sentences read from stdin')
+    p.add_argument('-n', dest='workers', type=int, default=2,
+                   help='Number of parser processes')
+    p.add_argument('-f', dest='name', default='conllx', choices=sorted(FRAMES),
+                   help='Parser (output format)')
+    p.add_argument('-t', dest='timeout', type=float, default=60,
+                   help='Timeout per sentence, in seconds')
+    p.add_argument('--stub', dest='stub', choices=['rasp', 'freeling', 'conllx'],
+                   help='Act as a stub parser emitting canned output in this format')
+    p.add_argument('--flush', dest='flush', action='store_true',
+                   help='Ignored (the stub answers every line, like Freeling with --flush)')
+    p.add_argument('command', nargs='*',
+                   help='Parser command line')
+    return p
+
+
+def main(args):
+    if args.stub:
+        stub_parser(args.stub, sys.stdin, sys.stdout)
+        return 0
+    pool = ParserPool(args.command, args.name, workers=args.workers, timeout=args.timeout)
+    try:
+        sentences = [l.decode('utf-8').rstrip('\n') for l in sys.stdin]
+        t = time.time()
+        output = pool.parse(sentences)
+        print('\n'.join(output), end='')
+        print('parsed %d sentences in %.2fs' % (len(sentences), time.time() - t), file=sys.stderr)
+    finally:
+        pool.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(argparser().parse_args()))
@@ -0,0 +1,749 @@
+# coding=utf-8
+"""Indexed relation store: a binary replacement for the flat text index
+written by index.main and scanned by findrel.
+
+A store maps (reltype, verb, noun) keys to posting lists of sentence ids.
+The keys are kept sorted, in blocks of BLOCKSIZE front-coded keys; the first
+key of each block is loaded in memory when the store is opened, so that a
+lookup is a binary search over the blocks plus the decoding of one block.
+Posting lists are delta and varint encoded.  The file is mmap'ed.
+
+Sentences are addressed by id, in the scattered chunk layout of ost.py and
+findrel.sentence (<dir>/%.2x/%.4x.ss, FILES files per directory, CHUNK
+sentences per file, ids starting at 1).  An offset table (ss.offsets, in the
+same directory) gives the byte offset of each sentence in its chunk file, so
+fetching a sentence is one seek.
+
+Usage:
+    relstore.py build <xml-glob> <store> [-s <sentence-dir>]   (BNC XML, via index.relindex2)
+    relstore.py text <text-index> <store> [-s <sentence-dir>]  (output of index.main)
+    relstore.py merge <runs-dir> <store> [-s <sentence-dir>]   (sorted runs of index.py -r)
+    relstore.py offsets <sentence-dir>                         (offset table of existing chunks)
+    relstore.py query <store> <verb> [<noun>] [-t <reltype>]
+    relstore.py bench <store> [-n <probes>]
+"""
+
+from __future__ import print_function
+
+import sys, os, io, json, mmap, struct, heapq, random, tempfile, codecs, time, argparse
+from bisect import bisect_right
+from itertools import izip
+
+# Layout of the sentence chunks (see ost.scatter and findrel.sentence)
+FILES, CHUNK = 512, 4096
+OFFSETS = 'ss.offsets'
+OFFSET = struct.Struct('=Q')
+# Offset of the ids missing from short chunk files (the table is in native byte order)
+MISSING = 2 ** 64 - 1
+
+MAGIC = 'RELSTOR1'
+HEADER = struct.Struct('<8sIQQQQQ')
+BLOCKSIZE = 64
+# Postings held in memory by the builder before a sorted run is written out
+MAXPOSTINGS = 5 * 10 ** 6
+
+SEP = '\x00'
+
+
+def encode_key(reltype, verb, noun):
+    """Returns the byte string key of a relation.  Keys sort by relation
+    type, verb, then noun.
+    """
+    return SEP.join(cleaned(p).encode('utf-8') for p in (reltype, verb, noun))
+
+
+def decode_key(key):
+    return tuple(p.decode('utf-8') for p in key.split(SEP))
+
+
+def cleaned(part):
+    """Run files are line based: no tabs or line breaks in keys.
+    """
+    return u' '.join(part.split()) if part else u''
+
+
+def put_varint(out, n):
+    while n >= 0x80:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def get_varint(buf, pos):
+    """Returns the integer at pos in bytearray buf, and the next position.
+    """
+    n = shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        n |= (b & 0x7f) << shift
+        if b < 0x80:
+            return n, pos
+        shift += 7
+
+
+def encode_postings(ids):
+    out = bytearray()
+    last = 0
+    for i in ids:
+        put_varint(out, i - last)
+        last = i
+    return out
+
+
+def decode_postings(buf, count):
+    buf = bytearray(buf)
+    ids = []
+    pos = last = 0
+    for _ in xrange(count):
+        d, pos = get_varint(buf, pos)
+        last += d
+        ids.append(last)
+    return ids
+
+
+def chunk_path(root, sent_id, files=FILES, chunk=CHUNK, ext='ss'):
+    """Returns the chunk file of a sentence, and its line in the file.
+    """
+    fn, pos = divmod(sent_id - 1, chunk)
+    return os.path.join(root, '%.2x' % (fn // files), '%.4x.%s' % (fn, ext)), pos
+
+
+class SentenceWriter(object):
+    """Writes sentences, one per line, in the chunk layout, along with their
+    offset table.
+    """
+    def __init__(self, root, files=FILES, chunk=CHUNK):
+        self.root, self.files, self.chunk = root, files, chunk
+        self.offsets = open(os.path.join(root, OFFSETS), 'wb')
+        self.out = None
+        self.count = 0
+
+    def write(self, text):
+        """Writes a sentence, and returns its id.
+        """
+        self.count += 1
+        fname, pos = chunk_path(self.root, self.count, self.files, self.chunk)
+        if pos == 0:
+            if self.out:
+                self.out.close()
+            if not os.path.exists(os.path.dirname(fname)):
+                os.makedirs(os.path.dirname(fname))
+            self.out = open(fname, 'wb')
+        self.offsets.write(OFFSET.pack(self.out.tell()))
+        # one sentence per line, also for codecs' notion of a line
+        self.out.write(u' '.join(text.splitlines()).encode('utf-8') + '\n')
+        return self.count
+
+    def close(self):
+        if self.out:
+            self.out.close()
+        self.offsets.close()
+
+
+def build_offsets(root, files=FILES, chunk=CHUNK, ext='ss'):
+    """Writes the offset table of existing chunk files (e.g. written by
+    ost.py).  Lines are counted as findrel.sentence does, i.e. as read by
+    codecs, so that ids are the same.  Returns the number of sentences.
+    """
+    count = 0
+    with open(os.path.join(root, OFFSETS), 'wb') as offsets:
+        fn = 0
+        padding = 0
+        while True:
+            fname, _ = chunk_path(root, 1 + fn * chunk, files, chunk, ext)
+            if not os.path.exists(fname):
+                break
+            # ids of a short chunk file, followed by others
+            offsets.write(struct.pack('=%dQ' % padding, *[MISSING] * padding))
+            table = []
+            offset = 0
+            with codecs.open(fname, encoding='utf-8') as f:
+                for line in f:
+                    if len(table) == chunk:
+                        break
+                    table.append(offset)
+                    offset += len(line.encode('utf-8'))
+            count = fn * chunk + len(table)
+            padding = chunk - len(table)
+            offsets.write(struct.pack('=%dQ' % len(table), *table))
+            fn += 1
+    return count
+
+
+class SentenceStore(object):
+    """Sentences by id, via the offset table of a chunk directory.
+    """
+    def __init__(self, root, files=FILES, chunk=CHUNK, ext='ss', maxopen=64):
+        self.root, self.files, self.chunk, self.ext = root, files, chunk, ext
+        self.maxopen = maxopen
+        self.handles = {}
+        with open(os.path.join(root, OFFSETS), 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            self.offsets = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else ''
+        self.size = size // OFFSET.size
+
+    def __len__(self):
+        return self.size
+
+    def offset(self, sent_id):
+        if not 0 < sent_id <= self.size:
+            return MISSING
+        return OFFSET.unpack_from(self.offsets, OFFSET.size * (sent_id - 1))[0]
+
+    def sentence(self, sent_id):
+        """Returns the line of a sentence, with its line terminator, as
+        findrel.sentence does, or None if there is no such sentence.
+        """
+        start = self.offset(sent_id)
+        if start == MISSING:
+            return None
+        fname, pos = chunk_path(self.root, sent_id, self.files, self.chunk, self.ext)
+        end = self.offset(sent_id + 1) if pos + 1 < self.chunk else MISSING
+        f = self.handles.get(fname)
+        if f is None:
+            if len(self.handles) >= self.maxopen:
+                for h in self.handles.values():
+                    h.close()
+                self.handles.clear()
+            f = self.handles[fname] = open(fname, 'rb')
+        f.seek(start)
+        if end == MISSING:
+            data = f.read()
+            # as read by codecs: up to the first line break
+            lines = data.decode('utf-8').splitlines(True)
+            return lines[0] if lines else u''
+        return f.read(end - start).decode('utf-8')
+
+    def close(self):
+        for h in self.handles.values():
+            h.close()
+        self.handles.clear()
+        if self.offsets:
+            self.offsets.close()
+
+
+class RelationStoreWriter(object):
+    """Writes a store from (key, sorted ids) pairs, in key order.
+    """
+    def __init__(self, fname, blocksize=BLOCKSIZE):
+        self.blocksize = blocksize
+        self.out = open(fname, 'wb')
+        self.out.write('\0' * HEADER.size)
+        self.blocks = tempfile.TemporaryFile()
+        self.firstkeys = []
+        self.blockoffsets = []
+        self.block = bytearray()
+        self.nblock = 0
+        self.lastkey = ''
+        self.lastpost = 0
+        self.nkeys = 0
+        self.npostings = 0
+        self.reltypes = set()
+
+    def add(self, key, ids):
+        assert key > self.lastkey or not self.nkeys, 'keys must be added in order'
+        post = self.out.tell()
+        self.out.write(encode_postings(ids))
+        if self.nblock == self.blocksize:
+            self.flush()
+        if self.nblock == 0:
+            self.firstkeys.append(key)
+            self.blockoffsets.append(self.blocks.tell())
+            shared = 0
+            self.lastpost = 0
+        else:
+            shared = 0
+            limit = min(len(key), len(self.lastkey))
+            while shared < limit and key[shared] == self.lastkey[shared]:
+                shared += 1
+        self.reltypes.add(key[:key.index(SEP)])
+        block = self.block
+        put_varint(block, shared)
+        put_varint(block, len(key) - shared)
+        block.extend(key[shared:])
+        put_varint(block, len(ids))
+        put_varint(block, post - self.lastpost)
+        self.lastpost = post
+        self.lastkey = key
+        self.nblock += 1
+        self.nkeys += 1
+        self.npostings += len(ids)
+
+    def flush(self):
+        if self.nblock:
+            self.blocks.write(self.block)
+            self.block = bytearray()
+            self.nblock = 0
+
+    def close(self, metadata=None):
+        self.flush()
+        blocksoffset = self.out.tell()
+        self.blocks.seek(0)
+        while True:
+            data = self.blocks.read(1 << 20)
+            if not data:
+                break
+            self.out.write(data)
+        self.blocks.close()
+        indexoffset = self.out.tell()
+        index = bytearray()
+        for key, offset in izip(self.firstkeys, self.blockoffsets):
+            put_varint(index, len(key))
+            index.extend(key)
+            put_varint(index, offset)
+        self.out.write(index)
+        metaoffset = self.out.tell()
+        metadata = dict(metadata or {}, keys=self.nkeys, postings=self.npostings,
+                        blocksize=self.blocksize, reltypes=sorted(t.decode('utf-8') for t in self.reltypes))
+        self.out.write(json.dumps(metadata, sort_keys=True))
+        self.out.seek(0)
+        self.out.write(HEADER.pack(MAGIC, self.blocksize, self.nkeys, len(self.firstkeys),
+                                   blocksoffset, indexoffset, metaoffset))
+        self.out.close()
+
+
+def write_run(fname, postings):
+    """Writes postings (key -> sorted ids) as a sorted run.
+    """
+    with open(fname, 'wb') as out:
+        for key in sorted(postings):
+            out.write('%s\t%s\n' % (key, ' '.join(str(i) for i in postings[key])))
+
+
+def read_run(fname, offset=0):
+    """Reads a sorted run, adding offset to its ids.
+    """
+    with open(fname, 'rb') as f:
+        for line in f:
+            key, ids = line.rstrip('\n').split('\t')
+            yield key, [offset + int(i) for i in ids.split()]
+
+
+def _tagged(n, source):
+    for key, ids in source:
+        yield key, n, ids
+
+
+def merged(sources):
+    """Yields (key, ids) in key order from sorted (key, ids) sources, whose
+    ids increase from one source to the next: the ids of a key are
+    concatenated in the order of the sources.
+    """
+    current, acc = None, []
+    for key, _, ids in heapq.merge(*[_tagged(n, source) for n, source in enumerate(sources)]):
+        if key != current:
+            if current is not None:
+                yield current, acc
+            current, acc = key, []
+        if acc and ids[0] == acc[-1]:
+            ids = ids[1:]
+        acc.extend(ids)
+    if current is not None:
+        yield current, acc
+
+
+class RelationStoreBuilder(object):
+    """Builds a store from sentences and their relations, as returned by
+    index.relindex2.  Postings are gathered in memory and written out in
+    sorted runs of up to maxpostings, which are merged when closing.  If a
+    sentence directory is given, the sentences are written there in the
+    chunk layout (with their offset table), under the ids in the store.
+    """
+    def __init__(self, fname, sentdir=None, files=FILES, chunk=CHUNK,
+                 maxpostings=MAXPOSTINGS, blocksize=BLOCKSIZE, tmpdir=None):
+        self.fname, self.sentdir, self.blocksize = fname, sentdir, blocksize
+        self.files, self.chunk = files, chunk
+        self.maxpostings = maxpostings
+        self.tmpdir = tmpdir or os.path.dirname(os.path.abspath(fname))
+        if sentdir:
+            if not os.path.exists(sentdir):
+                os.makedirs(sentdir)
+            self.sentences = SentenceWriter(sentdir, files, chunk)
+        else:
+            self.sentences = None
+        self.postings = {}
+        self.inmemory = 0
+        self.runs = []
+        self.nsentences = 0
+        self.nrelations = 0
+
+    def add(self, words, relations):
+        """Adds a sentence (a sequence of text pieces), and its relations,
+        as (reltype, (verb, n), (noun, n)) triples.  Returns its id.
+        """
+        if self.sentences:
+            sent_id = self.sentences.write(u''.join(words))
+        else:
+            sent_id = self.nsentences + 1
+        self.nsentences = sent_id
+        for reltype, (verb, _), (noun, _) in relations:
+            self.add_relation(sent_id, reltype, verb, noun)
+        return sent_id
+
+    def add_relation(self, sent_id, reltype, verb, noun):
+        ids = self.postings.setdefault(encode_key(reltype, verb, noun), [])
+        self.nrelations += 1
+        if ids and ids[-1] == sent_id:
+            return
+        ids.append(sent_id)
+        self.inmemory += 1
+        if self.inmemory >= self.maxpostings:
+            self.spill()
+
+    def spill(self):
+        fd, fname = tempfile.mkstemp(prefix='relrun', dir=self.tmpdir)
+        os.close(fd)
+        write_run(fname, self.postings)
+        self.runs.append(fname)
+        self.postings = {}
+        self.inmemory = 0
+
+    def merged(self):
+        """Yields (key, ids) in key order, from the runs and the postings in
+        memory.
+        """
+        inmemory = ((key, self.postings[key]) for key in sorted(self.postings))
+        return merged([read_run(fname) for fname in self.runs] + [inmemory])
+
+    def close(self):
+        """Writes the store.  Returns its metadata.
+        """
+        if self.sentences:
+            self.sentences.close()
+        writer = RelationStoreWriter(self.fname, self.blocksize)
+        for key, ids in self.merged():
+            writer.add(key, ids)
+        metadata = {'sentences': self.nsentences, 'relations': self.nrelations,
+                    'files': self.files, 'chunk': self.chunk}
+        if self.sentdir:
+            metadata['sentdir'] = os.path.relpath(os.path.abspath(self.sentdir),
+                                                  os.path.dirname(os.path.abspath(self.fname)))
+        writer.close(metadata)
+        for fname in self.runs:
+            os.remove(fname)
+        self.runs = []
+        return dict(metadata, keys=writer.nkeys, postings=writer.npostings)
+
+
+def read_shards(runsdir):
+    """Returns the shards written to a directory by index.py, in input
+    order.
+    """
+    from glob import glob
+    shards = []
+    for fname in sorted(glob(os.path.join(runsdir, '*.json'))):
+        with open(fname) as f:
+            shard = json.load(f)
+        for k in ('run', 'text'):
+            shard[k] = os.path.join(runsdir, shard[k])
+        shards.append(shard)
+    return shards
+
+
+def merge_shards(shards, fname, sentdir=None, files=FILES, chunk=CHUNK, blocksize=BLOCKSIZE):
+    """Builds a store from the sorted runs of index.py workers, one per input
+    file (see read_shards).  The ids of a run are the numbers of the
+    sentences in its file; they are offset by the sentences of the
+    preceding files, so that the store is the same as the one built from
+    all the files in order.  Returns its metadata.
+    """
+    sources = []
+    nsentences = nrelations = 0
+    for shard in shards:
+        sources.append(read_run(shard['run'], nsentences))
+        nsentences += shard['sentences']
+        nrelations += shard['relations']
+    writer = RelationStoreWriter(fname, blocksize)
+    for key, ids in merged(sources):
+        writer.add(key, ids)
+    metadata = {'sentences': nsentences, 'relations': nrelations, 'files': files, 'chunk': chunk}
+    if sentdir:
+        if not os.path.exists(sentdir):
+            os.makedirs(sentdir)
+        sentences = SentenceWriter(sentdir, files, chunk)
+        for shard in shards:
+            with io.open(shard['text'], encoding='utf-8', newline='\n') as f:
+                for line in f:
+                    sentences.write(line[:-1])
+        sentences.close()
+        metadata['sentdir'] = os.path.relpath(os.path.abspath(sentdir),
+                                              os.path.dirname(os.path.abspath(fname)))
+    writer.close(metadata)
+    return dict(metadata, keys=writer.nkeys, postings=writer.npostings)
+
+
+def is_store(fname):
+    try:
+        with open(fname, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except IOError:
+        return False
+
+
+class RelationStore(object):
+    """Read access to a store.
+    """
+    def __init__(self, fname, sentdir=None):
+        self.fname = fname
+        with open(fname, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, self.blocksize, self.nkeys, nblocks, self.blocksoffset,
+         indexoffset, metaoffset) = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            raise ValueError('%s is not a relation store' % fname)
+        self.metadata = json.loads(self.data[metaoffset:])
+        index = bytearray(self.data[indexoffset:metaoffset])
+        self.firstkeys, self.blockoffsets = [], []
+        pos = 0
+        while pos < len(index):
+            n, pos = get_varint(index, pos)
+            self.firstkeys.append(str(index[pos:pos + n]))
+            offset, pos = get_varint(index, pos + n)
+            self.blockoffsets.append(self.blocksoffset + offset)
+        self.blockoffsets.append(indexoffset)
+        assert len(self.firstkeys) == nblocks
+        if sentdir is None and self.metadata.get('sentdir'):
+            sentdir = os.path.join(os.path.dirname(os.path.abspath(fname)), self.metadata['sentdir'])
+        self.sentences = None
+        if sentdir and os.path.exists(os.path.join(sentdir, OFFSETS)):
+            self.sentences = SentenceStore(sentdir, self.metadata.get('files', FILES),
+                                           self.metadata.get('chunk', CHUNK))
+
+    def __len__(self):
+        return self.nkeys
+
+    def block(self, b):
+        """Yields the (key, count, postings offset) entries of block b.
+        """
+        buf = bytearray(self.data[self.blockoffsets[b]:self.blockoffsets[b + 1]])
+        pos = post = 0
+        key = ''
+        while pos < len(buf):
+            shared, pos = get_varint(buf, pos)
+            n, pos = get_varint(buf, pos)
+            key = key[:shared] + str(buf[pos:pos + n])
+            count, pos = get_varint(buf, pos + n)
+            delta, pos = get_varint(buf, pos)
+            post += delta
+            yield key, count, post
+
+    def _postings(self, count, post):
+        # a posting takes at most 9 bytes
+        return decode_postings(self.data[post:post + 9 * count], count)
+
+    def postings(self, reltype, verb, noun):
+        """Returns the sorted ids of the sentences of a relation.
+        """
+        key = encode_key(reltype, verb, noun)
+        b = bisect_right(self.firstkeys, key) - 1
+        if b < 0:
+            return []
+        for k, count, post in self.block(b):
+            if k == key:
+                return self._postings(count, post)
+            if k > key:
+                break
+        return []
+
+    def reltypes(self):
+        """Returns the relation types in the store.
+        """
+        return self.metadata['reltypes']
+
+    def lookup(self, verb, noun, reltype=None):
+        """Returns the sorted ids of the sentences with a (verb, noun)
+        relation, of a given type or of any type.
+        """
+        if reltype:
+            return self.postings(reltype, verb, noun)
+        ids = set()
+        for t in self.reltypes():
+            ids.update(self.postings(t, verb, noun))
+        return sorted(ids)
+
+    def scan(self, prefix):
+        """Yields the (reltype, verb, noun, count, postings offset) of the
+        keys starting with a byte string prefix.
+        """
+        b = max(0, bisect_right(self.firstkeys, prefix) - 1)
+        for b in xrange(b, len(self.firstkeys)):
+            for key, count, post in self.block(b):
+                if key.startswith(prefix):
+                    reltype, verb, noun = decode_key(key)
+                    yield reltype, verb, noun, count, post
+                elif key > prefix:
+                    return
+
+    def find(self, verb=None, noun=None, reltype=None):
+        """Yields (reltype, verb, noun, ids) of the relations matching the
+        given parts.  Without a verb, all the keys of a type are scanned.
+        """
+        types = [reltype] if reltype else self.reltypes()
+        for t in types:
+            prefix = t.encode('utf-8') + SEP
+            if verb is not None:
+                prefix += cleaned(verb).encode('utf-8') + SEP
+                if noun is not None:
+                    ids = self.postings(t, verb, noun)
+                    if ids:
+                        yield t, cleaned(verb), cleaned(noun), ids
+                    continue
+            for rt, v, n, count, post in self.scan(prefix):
+                if noun is None or n == noun:
+                    yield rt, v, n, self._postings(count, post)
+
+    def keys(self):
+        for t, v, n, _, _ in self.scan(''):
+            yield t, v, n
+
+    def sentence(self, sent_id):
+        if self.sentences is None:
+            raise ValueError('no sentences for %s' % self.fname)
+        return self.sentences.sentence(sent_id)
+
+    def close(self):
+        if self.sentences:
+            self.sentences.close()
+        self.data.close()
+
+
+def parse_text_index(stream):
+    """Reads a text index, as written by index.main, and yields (sentence,
+    relations) pairs as relindex2 does.  Consecutive lines of the same
+    sentence are taken as one sentence.
+    """
+    last, relations = None, []
+    for line in stream:
+        try:
+            reltype, rel, text = line.rstrip(u'\n').split(u'|', 2)
+            verb, noun = [p.rsplit(u':', 1) for p in rel.split(u' ')]
+        except ValueError:
+            print(u'skipping', line, file=sys.stderr)
+            continue
+        if text != last and last is not None:
+            yield (last,), relations
+            relations = []
+        last = text
+        relations.append((reltype, (verb[0], int(verb[1])), (noun[0], int(noun[1]))))
+    if last is not None:
+        yield (last,), relations
+
+
+def build(sentences, fname, sentdir=None, **kw):
+    """Builds a store from (words, relations) pairs.  Returns its metadata.
+    """
+    builder = RelationStoreBuilder(fname, sentdir, **kw)
+    for words, relations in sentences:
+        builder.add(words, relations)
+    return builder.close()
+
+
+def xml_sentences(pattern):
+    from glob import iglob
+    from index import relindex2
+    # in the order of index.py
+    for filename in iglob(pattern):
+        print('processing %s' % filename, file=sys.stderr)
+        with open(filename, 'rb') as instream:
+            for words, relations in relindex2(instream):
+                yield words, relations
+
+
+def text_sentences(fname):
+    with io.open(fname, encoding='utf-8') as stream:
+        for sentence in parse_text_index(stream):
+            yield sentence
+
+
+def bench(store, probes, seed=0):
+    """Times random (verb, noun) probes, half of them for relations in the
+    store.  Returns probes per second.
+    """
+    rand = random.Random(seed)
+    sample = []
+    for i, (t, v, n) in enumerate(store.keys()):
+        if len(sample) < probes:
+            sample.append((v, n))
+        else:
+            r = rand.randint(0, i)
+            if r < probes:
+                sample[r] = (v, n)
+    if not sample:
+        return 0.0
+    queries = [rand.choice(sample) if rand.random() < 0.5 else
+               (rand.choice(sample)[0], rand.choice(sample)[1]) for _ in xrange(probes)]
+    start = time.time()
+    found = 0
+    for verb, noun in queries:
+        found += len(store.lookup(verb, noun))
+    seconds = time.time() - start
+    print('%d probes in %.3fs: %.0f probes/s, %d postings' % (probes, seconds, probes / seconds, found))
+    if store.sentences:
+        ids = [rand.randint(1, len(store.sentences)) for _ in xrange(probes)]
+        start = time.time()
+        for i in ids:
+            store.sentence(i)
+        seconds = time.time() - start
+        print('%d sentence fetches in %.3fs: %.0f/s' % (probes, seconds, probes / seconds))
+    return probes / seconds
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description='Indexed relation store')
+    commands = parser.add_subparsers(dest='command')
+    for name, help in (('build', 'build from BNC XML files, via index.relindex2'),
+                       ('text', 'build from a text index written by index.main')):
+        p = commands.add_parser(name, help=help)
+        p.add_argument('source', help='XML file glob, or text index')
+        p.add_argument('store')
+        p.add_argument('-s', '--sentences', dest='sentdir', help='directory to write sentences to')
+        p.add_argument('-m', '--max-postings', dest='maxpostings', type=int, default=MAXPOSTINGS,
+                       help='postings held in memory before writing a sorted run')
+    p = commands.add_parser('merge', help='build from the sorted runs of index.py workers')
+    p.add_argument('runsdir')
+    p.add_argument('store')
+    p.add_argument('-s', '--sentences', dest='sentdir', help='directory to write sentences to')
+    p = commands.add_parser('offsets', help='write the offset table of existing sentence chunks')
+    p.add_argument('sentdir')
+    p.add_argument('--files', type=int, default=FILES)
+    p.add_argument('--chunk', type=int, default=CHUNK)
+    p = commands.add_parser('query', help='print the sentences of a relation')
+    p.add_argument('store')
+    p.add_argument('verb')
+    p.add_argument('noun', nargs='?')
+    p.add_argument('-t', '--type', dest='reltype')
+    p = commands.add_parser('bench', help='time random probes')
+    p.add_argument('store')
+    p.add_argument('-n', '--probes', type=int, default=10000)
+    cmdline = parser.parse_args([a.decode('utf-8') for a in args])
+
+    if cmdline.command in ('build', 'text'):
+        source = xml_sentences if cmdline.command == 'build' else text_sentences
+        metadata = build(source(cmdline.source), cmdline.store, cmdline.sentdir,
+                         maxpostings=cmdline.maxpostings)
+        print(json.dumps(metadata, sort_keys=True))
+    elif cmdline.command == 'merge':
+        metadata = merge_shards(read_shards(cmdline.runsdir), cmdline.store, cmdline.sentdir)
+        print(json.dumps(metadata, sort_keys=True))
+    elif cmdline.command == 'offsets':
+        print(build_offsets(cmdline.sentdir, cmdline.files, cmdline.chunk), 'sentences')
+    elif cmdline.command == 'query':
+        store = RelationStore(cmdline.store)
+        out = codecs.getwriter('utf-8')(sys.stdout)
+        i = 0
+        for reltype, verb, noun, ids in store.find(cmdline.verb, cmdline.noun, cmdline.reltype):
+            for sent_id in ids:
+                i += 1
+                text = store.sentence(sent_id).rstrip(u'\n') if store.sentences else u''
+                print(i, sent_id, reltype, verb, noun, text, sep=u'\t', file=out)
+        store.close()
+    elif cmdline.command == 'bench':
+        store = RelationStore(cmdline.store)
+        bench(store, cmdline.probes)
+        store.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+from unittest import TestCase, TestSuite, makeSuite, main
+from StringIO import StringIO
+import os, io, shutil, tempfile
+
+from depparsing.index import relindex2, relstream, index_file, write_relations
+from depparsing import relstore
+from depparsing.tests.test_relstore import BNC
+
+# the sentences of BNC, as the expat ParseFile version of relindex2 read them
+SENTENCES = [((u'Government ', u'raises ', u'taxes'),
+              [(u'ncsubj', (u'raise', 1), (u'government', 0)),
+               (u'dobj', (u'raise', 1), (u'tax', 2))]),
+             ((u'We ', u'fight ', u'poverty'),
+              [(u'dobj', (u'fight', 1), (u'poverty', 2))]),
+             ((u'Crime ', u'raises ', u'taxes ', u'and ', u'caf\xe9 ', u'prices'),
+              [(u'ncsubj', (u'raise', 1), (u'crime', 0)),
+               (u'dobj', (u'raise', 1), (u'tax', 2)),
+               (u'dobj', (u'raise', 1), (u'tax', 2))])]
+
+LINES = (u'ncsubj|raise:1 government:0|Government raises taxes\n'
+         u'dobj|raise:1 tax:2|Government raises taxes\n'
+         u'dobj|fight:1 poverty:2|We fight poverty\n'
+         u'ncsubj|raise:1 crime:0|Crime raises taxes and caf\xe9 prices\n'
+         u'dobj|raise:1 tax:2|Crime raises taxes and caf\xe9 prices\n'
+         u'dobj|raise:1 tax:2|Crime raises taxes and caf\xe9 prices\n')
+
+class RelStreamTest(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.data = BNC.encode('utf-8')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def lines(self, sentences):
+        out = io.StringIO()
+        write_relations(out.write, sentences)
+        return out.getvalue()
+
+    def test_chunks(self):
+        # sentences are the same however the file is read
+        self.assertEqual(self.lines(SENTENCES), LINES)
+        self.assertEqual(list(relindex2(StringIO(self.data))), SENTENCES)
+        for bufsize in (1, 7, 64, 1 << 20):
+            self.assertEqual(list(relstream(StringIO(self.data), bufsize)), SENTENCES)
+
+    def test_shards(self):
+        # two files, indexed separately and merged
+        names = []
+        for i in range(2):
+            names.append(os.path.join(self.dir, '%d.xml' % i))
+            with open(names[-1], 'wb') as f:
+                f.write(self.data)
+        runsdir = os.path.join(self.dir, 'runs')
+        os.makedirs(runsdir)
+        for i, name in enumerate(names):
+            part, size, seconds, n = index_file((i, name, self.dir, runsdir))
+            self.assertEqual(n, 3)
+            with io.open(part, encoding='utf-8') as f:
+                self.assertEqual(f.read(), LINES)
+        merged = os.path.join(self.dir, 'merged.rel')
+        metadata = relstore.merge_shards(relstore.read_shards(runsdir), merged,
+                                         os.path.join(self.dir, 'ss'))
+        self.assertEqual(metadata['sentences'], 6)
+        built = os.path.join(self.dir, 'built.rel')
+        sentences = [s for name in names for s in relindex2(open(name, 'rb'))]
+        relstore.build(sentences, built, os.path.join(self.dir, 'ss'))
+        with open(merged, 'rb') as f1, open(built, 'rb') as f2:
+            self.assertEqual(f1.read(), f2.read())
+        store = relstore.RelationStore(merged)
+        self.assertEqual(store.postings(u'dobj', u'raise', u'tax'), [1, 3, 4, 6])
+        self.assertEqual(store.sentence(5), u'We fight poverty\n')
+        store.close()
+
+def test_suite():
+    suite = TestSuite()
+    suite.addTest(makeSuite(RelStreamTest))
+    return suite
+
+if __name__ == '__main__':
+    main(defaultTest='test_suite')
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+from unittest import TestCase, TestSuite, makeSuite, main
+import os, shutil, tempfile, codecs
+
+from depparsing import metlexicon
+from depparsing.findmet import MetaphorBuilder, read_clusters, tagged
+from depparsing.util import read_seed, N, V
+
+NOUNS = u'''poverty poverty disease crime
+tax tax price debt
+café café
+'''
+VERBS = u'''fight fight attack kill
+raise raise lift
+cure cure
+'''
+SEEDS = u'''poverty fight -
+- raise tax
+crime lift -
+- cure café
+- attack debt
+unknown fight -
+'''
+
+class MetaphorLexiconTest(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.lexdir = os.path.join(self.dir, 'lexicons')
+        self.fnames = []
+        for name, text in (('seeds', SEEDS), ('nouns', NOUNS), ('verbs', VERBS)):
+            fname = os.path.join(self.dir, name)
+            with codecs.open(fname, 'w', 'utf-8') as f:
+                f.write(text)
+            self.fnames.append(fname)
+        metlexicon._loaded.clear()
+
+    def tearDown(self):
+        metlexicon._loaded.clear()
+        shutil.rmtree(self.dir)
+
+    def load(self):
+        seed_fn, noun_fn, verb_fn = self.fnames
+        return metlexicon.load('en', seed_fn, False, self.lexdir, noun_fn, verb_fn)
+
+    def builder(self):
+        seed_fn, noun_fn, verb_fn = self.fnames
+        def lines(fname):
+            with codecs.open(fname, 'r', 'utf-8') as f:
+                return [l.rstrip().split() for l in f]
+        seeds = read_seed(lines(seed_fn))
+        nclusters = read_clusters(lines(noun_fn), lambda words: tagged(words, N))
+        vclusters = read_clusters(lines(verb_fn), lambda words: tagged(words, V))
+        return MetaphorBuilder('en', nclusters, vclusters, seeds)
+
+    def test_same_as_builder(self):
+        lexicon, builder = self.load(), self.builder()
+        self.assertEqual(lexicon.metaphors, builder.metaphors)
+        self.assertEqual(sorted(lexicon.orphans), sorted(builder.orphans))
+        nouns = [(w, N) for w in u'poverty disease crime tax price debt café unknown'.split()]
+        verbs = [(w, V) for w in u'fight attack kill raise lift cure'.split()]
+        relations = [(n, v) for n in nouns for v in verbs]
+        self.assertEqual(lexicon.find(relations), builder.find(relations))
+        self.assertEqual(lexicon.seed((u'café', N), (u'cure', V)),
+                         ('obj-verb', (u'café', N), (u'cure', V)))
+        self.assertEqual(lexicon.seed((u'disease', N), (u'cure', V)), None)
+        self.assertEqual(lexicon.cluster(u'kill', V), u'fight')
+
+    def test_cache(self):
+        lexicon = self.load()
+        nouns = [(w, N) for w in u'poverty crime café unknown'.split()]
+        verbs = [(w, V) for w in u'fight lift cure kill'.split()]
+        relations = [(n, v) for n in nouns for v in verbs]
+        found = lexicon.find(relations)
+        self.assertEqual(sorted(lexicon.nouncache), sorted(nouns))
+        self.assertEqual(lexicon.nouncache[(u'unknown', N)], None)
+        self.assertEqual(sorted(lexicon.verbcache), sorted(verbs))
+        # cached lookups give the same results as lookups in the mmap
+        self.assertEqual(lexicon.find(relations), found)
+        self.assertEqual([lexicon.seed(n, v) for n, v in relations],
+                         [self.builder().metaphors.get((n, v)) for n, v in relations])
+        self.assertEqual(lexicon.seed((u'crime', N), (u'raise', V)),
+                         ('subj-verb', (u'crime', N), (u'lift', V)))
+        self.assertEqual(lexicon.seed((u'poverty', N), (u'unknown', V)), None)
+        self.assertEqual(lexicon.verbcache[(u'unknown', V)], None)
+
+    def test_reuse(self):
+        lexicon = self.load()
+        self.assertTrue(self.load() is lexicon)
+        self.assertEqual(os.listdir(self.lexdir), [os.path.basename(lexicon.fname)])
+        # a new process loads the compiled lexicon
+        metlexicon._loaded.clear()
+        self.assertEqual(self.load().fname, lexicon.fname)
+        self.assertEqual(len(os.listdir(self.lexdir)), 1)
+        # changing an input compiles a new lexicon
+        with codecs.open(self.fnames[0], 'a', 'utf-8') as f:
+            f.write(u'disease cure -\n')
+        changed = self.load()
+        self.assertNotEqual(changed.fname, lexicon.fname)
+        self.assertEqual(changed.seed((u'disease', N), (u'cure', V)),
+                         ('subj-verb', (u'disease', N), (u'cure', V)))
+
+def test_suite():
+    suite = TestSuite()
+    suite.addTests(makeSuite(MetaphorLexiconTest))
+    return suite
+
+if __name__ == '__main__':
+    main(defaultTest='test_suite')
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+from unittest import TestCase, TestSuite, makeSuite, main
+import os, shutil, tempfile
+
+from depparsing import parsecache
+from depparsing.parsecache import ParseCache
+
+SENTENCES = [u'Poverty is a disease .',
+             u'They raise taxes .',
+             u'Crime fights back .',
+             u'A café opened .']
+
+class Parser(object):
+    """ Stands in for dep2json.parse, and records the sentences it parses.
+    """
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, lang, sentences):
+        self.calls.append(list(sentences))
+        out = []
+        for i, text in enumerate(sentences):
+            words = [{'idx': j, 'n': j + 1, 'form': w, 'lem': w.lower(), 'pos': u'X'}
+                     for j, w in enumerate(text.split())]
+            out.append({'idx': i, 'ctext': text, 'word': words,
+                        'dparse': [{'type': u'dep', 'dep': j + 1, 'head': 1}
+                                   for j in range(1, len(words))]})
+        return {'lang': lang, 'sentences': out}
+
+class ParseCacheTest(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.fname = os.path.join(self.dir, 'parses.db')
+        self.parser = Parser()
+        self.parse = parsecache.parse
+        parsecache.parse = self.parser
+        self.caches = []
+
+    def tearDown(self):
+        parsecache.parse = self.parse
+        parsecache._key_prefixes.clear()
+        for cache in self.caches:
+            cache.close()
+        shutil.rmtree(self.dir)
+
+    def cache(self, **kw):
+        cache = ParseCache(self.fname, **kw)
+        self.caches.append(cache)
+        return cache
+
+    def test_round_trip(self):
+        expected = self.parser('en', SENTENCES)['sentences']
+        self.parser.calls = []
+        first = self.cache().parse('en', SENTENCES)
+        self.assertEqual(first, expected)
+        self.assertEqual(self.parser.calls, [SENTENCES])
+        # from the file, in another cache instance
+        cache = self.cache()
+        self.assertEqual(cache.parse('en', SENTENCES), expected)
+        self.assertEqual(len(self.parser.calls), 1)
+        self.assertEqual(cache.stats(), {'hits': 4, 'misses': 0, 'evictions': 0})
+        # positions are those of the call
+        self.assertEqual(cache.parse('en', SENTENCES[::-1]),
+                         [dict(s, idx=i) for i, s in enumerate(expected[::-1])])
+
+    def test_changed_input(self):
+        cache = self.cache()
+        cache.parse('en', SENTENCES)
+        changed = list(SENTENCES)
+        changed[1] = u'They cut taxes .'
+        # only spacing differs: still a hit
+        changed[2] = u'  Crime   fights back .'
+        out = cache.parse('en', changed)
+        self.assertEqual(self.parser.calls[1:], [[u'They cut taxes .']])
+        self.assertEqual([s['idx'] for s in out], range(4))
+        self.assertEqual([w['form'] for w in out[1]['word']], [u'They', u'cut', u'taxes', u'.'])
+        self.assertEqual(out[2]['word'], self.parser('en', [SENTENCES[2]])['sentences'][0]['word'])
+        self.assertEqual(cache.stats(), {'hits': 3, 'misses': 5, 'evictions': 0})
+        # another language, parser or cache version is a miss
+        cache.parse('es', SENTENCES[:1])
+        self.assertEqual(self.parser.calls[-1], SENTENCES[:1])
+        version = parsecache.CACHE_VERSION
+        try:
+            parsecache.CACHE_VERSION = version + 1
+            parsecache._key_prefixes.clear()
+            cache.parse('en', SENTENCES[3:])
+            self.assertEqual(self.parser.calls[-1], SENTENCES[3:])
+        finally:
+            parsecache.CACHE_VERSION = version
+
+    def test_eviction(self):
+        cache = self.cache(maxentries=3)
+        cache.parse('en', SENTENCES[:2])
+        cache.parse('en', SENTENCES[2:])
+        self.assertEqual(cache.stats()['evictions'], 1)
+        # the least recently used one went
+        cache.parse('en', SENTENCES[1:])
+        self.assertEqual(cache.stats()['misses'], 4)
+        cache.parse('en', SENTENCES[:1])
+        self.assertEqual(cache.stats()['misses'], 5)
+
+def test_suite():
+    suite = TestSuite()
+    suite.addTests(makeSuite(ParseCacheTest))
+    return suite
+
+if __name__ == '__main__':
+    main(defaultTest='test_suite')
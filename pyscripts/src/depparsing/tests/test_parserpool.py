@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+from unittest import TestCase, TestSuite, makeSuite, main
+from subprocess import Popen, PIPE
+import os, sys, logging
+
+from depparsing import parserpool
+from depparsing.parserpool import ParserPool, ParserError, line_buffered
+from depparsing.edeps import dependencies
+
+SRC = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(parserpool.__file__))))
+
+SENTENCES = [u'Poverty is a disease .',
+             u'They raise taxes .',
+             u'Crime fights back .',
+             u'A café opened .',
+             u'It rains .']
+
+def stub(fmt):
+    return [sys.executable, '-m', 'depparsing.parserpool', '--stub', fmt]
+
+class ParserPoolTest(TestCase):
+    def setUp(self):
+        self.path = os.environ.get('PYTHONPATH')
+        os.environ['PYTHONPATH'] = os.pathsep.join([SRC] + ([self.path] if self.path else []))
+        self.pools = []
+        # the failures are logged
+        logging.getLogger(parserpool.__name__).setLevel(logging.CRITICAL)
+
+    def tearDown(self):
+        for pool in self.pools:
+            pool.close()
+        if self.path is None:
+            del os.environ['PYTHONPATH']
+        else:
+            os.environ['PYTHONPATH'] = self.path
+        logging.getLogger(parserpool.__name__).setLevel(logging.NOTSET)
+
+    def pool(self, fmt, **kw):
+        kw = dict(dict(workers=2, batch=2, timeout=10, startup=10), **kw)
+        pool = ParserPool(stub(fmt), fmt, **kw)
+        self.pools.append(pool)
+        return pool
+
+    def single(self, fmt, sentences):
+        """The output of a single run of the stub over all sentences.
+        """
+        p = Popen(stub(fmt), stdin=PIPE, stdout=PIPE)
+        out, _ = p.communicate(u''.join(s + u'\n' for s in sentences).encode('utf-8'))
+        return out.split('\n')
+
+    def test_line_buffered(self):
+        command = line_buffered(['analyzer', '-f', 'dep.cfg'], ['--flush'])
+        self.assertEqual(command[-4:], ['analyzer', '-f', 'dep.cfg', '--flush'])
+        if parserpool.find_executable('stdbuf'):
+            self.assertEqual(command[1], '-oL')
+        self.assertEqual(line_buffered(command, ['--flush']), command)
+        worker = self.pool('freeling').workers[0]
+        self.assertEqual(worker.command[-3:], ['--stub', 'freeling', '--flush'])
+
+    def test_same_output(self):
+        for fmt in ('conllx', 'freeling', 'rasp'):
+            pool = self.pool(fmt)
+            self.assertEqual(pool.parse(SENTENCES), self.single(fmt, SENTENCES), fmt)
+            # the workers are still running, and sentence numbers are per call
+            self.assertEqual(pool.parse(SENTENCES[:3]), self.single(fmt, SENTENCES[:3]), fmt)
+            self.assertEqual(pool.failed, [])
+
+    def blocks(self, fmt, lines):
+        """Split the output of the stub into the lines of each sentence.
+        """
+        frame, blocks = parserpool.FRAMES[fmt](), [[]]
+        for line in lines[:-1]:
+            blocks[-1].append(line)
+            if frame.complete(line):
+                frame.reset()
+                blocks.append([])
+        return blocks[:-1]
+
+    def test_crash(self):
+        sentences = SENTENCES[:2] + [u'STUBCRASH now .'] + SENTENCES[2:]
+        for fmt in ('conllx', 'freeling', 'rasp'):
+            pool = self.pool(fmt, workers=1, batch=10)
+            output = pool.parse(sentences)
+            self.assertEqual(pool.failed, [3])
+            # an error parse for that sentence only, the worker restarted for the next ones
+            expected = self.blocks(fmt, self.single(fmt, sentences[:2] + [u'Placeholder .'] + sentences[3:]))
+            expected[2] = pool.frame().failed(sentences[2], 3)
+            self.assertEqual([l for l in output if l], [l for b in expected for l in b if l], fmt)
+            self.assertEqual(output.count(''), sum(b.count('') for b in expected) + 1, fmt)
+
+    def test_empty_parses(self):
+        # the translators still see a parse for every sentence
+        sentences = [u'STUBCRASH'] + SENTENCES[:2] + [u'STUBCRASH here .']
+        for fmt, parser in (('conllx', 'malt-fa'), ('freeling', 'freeling'), ('rasp', 'rasp')):
+            output = self.pool(fmt).parse(sentences)
+            parsed = list(dependencies(iter(output), parser, iter(sentences)))
+            self.assertEqual(len(parsed), len(sentences), fmt)
+            self.assertEqual([len(list(deps)) for _, deps in parsed][1:3],
+                             [len(s.split()) for s in sentences[1:3]], fmt)
+
+    def test_hang(self):
+        sentences = SENTENCES[:2] + [u'STUBHANG now .'] + SENTENCES[2:]
+        pool = self.pool('conllx', workers=1, timeout=0.5, startup=5, retries=0)
+        output = pool.parse(sentences)
+        self.assertEqual(pool.failed, [3])
+        self.assertEqual(output.count(''), len(sentences) + 1)
+        strict = self.pool('conllx', workers=1, timeout=0.5, startup=5, retries=0, lenient=False)
+        self.assertRaises(ParserError, strict.parse, sentences)
+
+def test_suite():
+    suite = TestSuite()
+    suite.addTests(makeSuite(ParserPoolTest))
+    return suite
+
+if __name__ == '__main__':
+    main(defaultTest='test_suite')
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+from unittest import TestCase, TestSuite, makeSuite, main
+from StringIO import StringIO
+import os, shutil, tempfile
+
+from depparsing.index import relindex2
+from depparsing import relstore
+from depparsing.relstore import RelationStore, SentenceStore
+
+BNC = u'''<bncDoc>
+<s n="1"><w lem="government" pos="SUBST" n="1">Government </w><w lem="raise" pos="VERB" n="2">raises </w><w lem="tax" pos="SUBST" n="3">taxes</w><gr type="ncsubj" head="2" dep="1"/><gr type="dobj" head="2" dep="3"/></s>
+<s n="2"><w lem="we" pos="PRON" n="1">We </w><w lem="fight" pos="VERB" n="2">fight </w><w lem="poverty" pos="SUBST" n="3">poverty</w><gr type="ncsubj" head="2" dep="1"/><gr type="dobj" head="2" dep="3"/></s>
+<s n="3"><w lem="crime" pos="SUBST" n="1">Crime </w><w lem="raise" pos="VERB" n="2">raises </w><w lem="tax" pos="SUBST" n="3">taxes </w><w lem="and" pos="CONJ" n="4">and </w><w lem="café" pos="SUBST" n="5">café </w><w lem="price" pos="SUBST" n="6">prices</w><gr type="ncsubj" head="2" dep="1"/><gr type="dobj" head="2" dep="3"/><gr type="dobj" head="2" dep="3"/></s>
+</bncDoc>
+'''
+
+def sentences():
+    return relindex2(StringIO(BNC.encode('utf-8')))
+
+class RelationStoreTest(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.fname = os.path.join(self.dir, 'rels.rel')
+        self.sentdir = os.path.join(self.dir, 'ss')
+        self.metadata = relstore.build(sentences(), self.fname, self.sentdir, chunk=2, blocksize=2)
+        self.store = RelationStore(self.fname)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.dir)
+
+    def test_metadata(self):
+        self.assertEqual(self.metadata['sentences'], 3)
+        self.assertEqual(self.metadata['keys'], 4)
+        self.assertEqual(self.store.reltypes(), [u'dobj', u'ncsubj'])
+
+    def test_postings(self):
+        self.assertEqual(self.store.postings(u'dobj', u'raise', u'tax'), [1, 3])
+        self.assertEqual(self.store.postings(u'ncsubj', u'raise', u'crime'), [3])
+        self.assertEqual(self.store.postings(u'dobj', u'raise', u'crime'), [])
+        self.assertEqual(self.store.lookup(u'raise', u'government'), [1])
+        self.assertEqual(self.store.lookup(u'fight', u'we'), [])
+
+    def test_find(self):
+        found = [(t, v, n, ids) for t, v, n, ids in self.store.find(u'raise')]
+        self.assertEqual(found, [(u'dobj', u'raise', u'tax', [1, 3]),
+                                 (u'ncsubj', u'raise', u'crime', [3]),
+                                 (u'ncsubj', u'raise', u'government', [1])])
+        self.assertEqual([v for _, v, _, _ in self.store.find(noun=u'poverty')], [u'fight'])
+
+    def test_sentences(self):
+        self.assertEqual(self.store.sentence(2), u'We fight poverty\n')
+        self.assertEqual(self.store.sentence(3), u'Crime raises taxes and café prices\n')
+        self.assertEqual(self.store.sentence(4), None)
+        self.assertTrue(os.path.exists(os.path.join(self.sentdir, '00', '0001.ss')))
+
+    def test_runs(self):
+        # the same store, merged from sorted runs
+        fname = os.path.join(self.dir, 'runs.rel')
+        relstore.build(sentences(), fname, chunk=2, blocksize=2, maxpostings=1)
+        with open(self.fname, 'rb') as f1, open(fname, 'rb') as f2:
+            data1, data2 = f1.read(), f2.read()
+        self.assertEqual(data1[:data1.index('{')], data2[:data2.index('{')])
+
+    def test_offsets(self):
+        table = os.path.join(self.sentdir, relstore.OFFSETS)
+        with open(table, 'rb') as f:
+            written = f.read()
+        self.assertEqual(relstore.build_offsets(self.sentdir, chunk=2), 3)
+        with open(table, 'rb') as f:
+            self.assertEqual(f.read(), written)
+        store = SentenceStore(self.sentdir, chunk=2)
+        self.assertEqual(store.sentence(1), u'Government raises taxes\n')
+        store.close()
+
+    def test_text_index(self):
+        lines = [u'dobj|raise:2 tax:3|Government raises taxes\n',
+                 u'ncsubj|raise:2 government:1|Government raises taxes\n',
+                 u'dobj|fight:2 poverty:3|We fight poverty\n']
+        parsed = list(relstore.parse_text_index(lines))
+        self.assertEqual(len(parsed), 2)
+        self.assertEqual(parsed[0][1][1], (u'ncsubj', (u'raise', 2), (u'government', 1)))
+
+def test_suite():
+    suite = TestSuite()
+    suite.addTest(makeSuite(RelationStoreTest))
+    return suite
+
+if __name__ == '__main__':
+    main(defaultTest='test_suite')
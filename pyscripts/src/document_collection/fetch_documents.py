@@ -5,47 +5,269 @@
 
 given an input json of urls retrieved from Yahoo, fetch the html
 
+documents are fetched concurrently by a pool of worker threads, with at most
+--per-host fetches from the same host at a time, and at least --delay seconds
+between the starts of two fetches from the same host.  fetches that fail with
+a timeout, a connection error, or a 429 or 5xx response are retried, waiting
+--backoff seconds, then twice as long every time.  redirects are followed.
+
+each url gets a doc_id, its position in the input file.  document doc_id is
+stored in <directory>/<name>/<doc_id>.html (url, query, then the html), where
+name is the last component of directory, and the input json, with the
+doc_ids, in <directory>/<name>.json.  every fetch is recorded in the journal
+<directory>/<name>.journal, so an interrupted run can be started again: it
+only fetches the documents that are not done yet.
+
 .. moduleauthor:: Jason Bolton <jebolton@icsi.berkeley.edu>
 
 %prog [options]
 
 -l --links            file path of json to retrieve\n
 -d --directory        directory to store html in\n
+-s --start            where to start in input file\n
+-w --workers          number of concurrent fetches\n
+--per-host            number of concurrent fetches per host\n
+--delay               seconds between fetches from the same host\n
+-r --retries          times to retry a failed fetch\n
+--backoff             seconds to wait before the first retry\n
+-t --timeout          seconds a fetch may take\n
 
 """
 
+import httplib
 import json
 import os
-import re
+import Queue
+import socket
+import threading
 import time
-import urllib
 import urllib2
 import urlparse
 
-#from random import random
-#from optparse import OptionParser
-from time import sleep
+from collections import deque
 
-# command line options
-#parser = OptionParser()
+USER_AGENT = "Mozilla/5.0 (compatible; fetch_documents)"
 
-#parser.add_option("-l", "--links", dest="links_filename", 
-        #help="file with json of urls to retrieve")
+FAILED_HTML = "Failed to retrieve html for this document."
 
-#parser.add_option("-s", "--start", dest="start_point",
-        #help="where to start in input file",default=0)
+class FetchError(Exception):
+    """ a failed fetch; retry tells whether trying again may help, wait how
+    long the server asked to wait (Retry-After) """
+    def __init__(self, message, retry=True, wait=None):
+        Exception.__init__(self, message)
+        self.retry = retry
+        self.wait = wait
 
-#parser.add_option("-d", "--directory", dest="directory",
-        #help="what directory to store files",default="fetched_documents")
+def fetch(url, timeout=10, blocksize=8192):
+    """ fetch url, following redirects, in about timeout seconds at most
+    (checked between blocks, like curl -m).  returns the final url, the
+    status code and the body """
+    deadline = time.time() + timeout
+    request = urllib2.Request(url, headers={"User-Agent": USER_AGENT})
+    try:
+        response = urllib2.urlopen(request, timeout=timeout)
+        try:
+            chunks = []
+            while True:
+                if time.time() > deadline:
+                    raise FetchError("timed out after %s seconds" % timeout)
+                chunk = response.read(blocksize)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+            return response.geturl(), response.getcode(), "".join(chunks)
+        finally:
+            response.close()
+    except urllib2.HTTPError, e:
+        # the server may get better, but not the other client errors
+        wait = e.info().get("Retry-After", "") if e.info() else ""
+        raise FetchError("HTTP error %d" % e.code, e.code == 429 or e.code >= 500,
+                         float(wait) if wait.isdigit() else None)
+    except (urllib2.URLError, socket.error, httplib.HTTPException), e:
+        raise FetchError("%s: %s" % (e.__class__.__name__, e))
+    except ValueError, e:
+        # not a url
+        raise FetchError(str(e), False)
 
-#(options,args) = parser.parse_args()
+class Job(object):
+    """ the fetch of one document """
+    def __init__(self, url_data):
+        self.doc_id = url_data["doc_id"]
+        self.url = url_data["url"]
+        self.query = url_data["query"]
+        self.host = urlparse.urlparse(self.url).netloc.lower()
+        self.attempts = 0
 
-if __name__ == "__main__":
+class Scheduler(object):
+    """ hands out jobs to the workers, taking hosts in turn, with at most
+    per_host jobs of a host running at a time and their starts at least
+    delay seconds apart """
+    def __init__(self, jobs, per_host=2, delay=1.0):
+        self.per_host = per_host
+        self.delay = delay
+        self.cond = threading.Condition()
+        # host -> deque of (earliest start, job)
+        self.queues = {}
+        self.active = {}
+        self.next_start = {}
+        self.hosts = []
+        for job in jobs:
+            if job.host not in self.queues:
+                self.queues[job.host] = deque()
+                self.active[job.host] = 0
+                self.next_start[job.host] = 0
+                self.hosts.append(job.host)
+            self.queues[job.host].append((0, job))
+        self.unfinished = len(jobs)
+
+    def get(self):
+        """ wait for the next job that can start, return None when all jobs
+        are finished """
+        with self.cond:
+            while True:
+                if not self.unfinished:
+                    return None
+                now = time.time()
+                wait = None
+                for host in self.hosts:
+                    queue = self.queues[host]
+                    if not queue or self.active[host] >= self.per_host:
+                        continue
+                    start = max(self.next_start[host], queue[0][0])
+                    if start <= now:
+                        _, job = queue.popleft()
+                        self.active[host] += 1
+                        self.next_start[host] = now + self.delay
+                        # the other hosts come first next time
+                        self.hosts.remove(host)
+                        self.hosts.append(host)
+                        return job
+                    wait = start - now if wait is None else min(wait, start - now)
+                self.cond.wait(wait)
+
+    def done(self, job, retry_at=None):
+        """ finish a job, or put it back to start again at retry_at """
+        with self.cond:
+            self.active[job.host] -= 1
+            if retry_at is None:
+                self.unfinished -= 1
+            else:
+                self.queues[job.host].append((retry_at, job))
+            self.cond.notify_all()
+
+def html_location(html_dir, doc_id):
+    return os.path.join(html_dir, str(doc_id) + ".html")
+
+def read_journal(journal_fn):
+    """ return the last journal record of each doc_id """
+    records = {}
+    if os.path.exists(journal_fn):
+        for line in file(journal_fn):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # cut short when the run was interrupted
+                continue
+            records[record["doc_id"]] = record
+    return records
+
+def is_done(record, url_data, html_dir):
+    return (record is not None and record["status"] == "done" and record["url"] == url_data["url"]
+            and os.path.exists(html_location(html_dir, url_data["doc_id"])))
+
+def run_job(job, html_dir, timeout):
+    """ fetch the document of job and store it, return its journal record """
+    job.attempts += 1
+    record = {"doc_id": job.doc_id, "url": job.url, "attempts": job.attempts}
+    start = time.time()
+    final_url, code, contents = fetch(job.url, timeout)
+    if not contents:
+        raise FetchError("empty document", False)
+    location = html_location(html_dir, job.doc_id)
+    # written under another name first, so there is never a partial document
+    part = os.path.join(html_dir, "." + str(job.doc_id) + ".html.part")
+    new_file = file(part, "wb")
+    new_file.write(job.url.encode("utf-8") + "\n")
+    new_file.write(job.query.encode("utf-8") + "\n")
+    new_file.write(contents)
+    new_file.close()
+    os.rename(part, location)
+    record.update(status="done", code=code, final_url=final_url, bytes=len(contents),
+                  seconds=round(time.time() - start, 3))
+    return record
+
+def fetch_all(url_datas, html_dir, journal_fn, workers=8, per_host=2, delay=1.0,
+              retries=3, backoff=2.0, timeout=10, verbose=True):
+    """ fetch the documents of url_datas (dicts with doc_id, url and query)
+    into html_dir, except those already done according to the journal.
+    returns the journal records by doc_id """
+    journal = read_journal(journal_fn)
+    jobs = [Job(url_data) for url_data in url_datas
+            if not is_done(journal.get(url_data["doc_id"]), url_data, html_dir)]
+    if verbose:
+        print "%d documents to fetch, %d already fetched" % (len(jobs), len(url_datas) - len(jobs))
+    scheduler = Scheduler(jobs, per_host, delay)
+    results = Queue.Queue()
+
+    def work():
+        while True:
+            job = scheduler.get()
+            if job is None:
+                return
+            retry_at = None
+            try:
+                record = run_job(job, html_dir, timeout)
+            except Exception, e:
+                retry = isinstance(e, FetchError) and e.retry and job.attempts <= retries
+                if retry:
+                    wait = max(backoff * 2 ** (job.attempts - 1), e.wait or 0)
+                    retry_at = time.time() + wait
+                    results.put(("retry", "%s (%s), retrying in %.1fs" % (job.url, e, wait)))
+                record = {"doc_id": job.doc_id, "url": job.url, "attempts": job.attempts,
+                          "status": "failed", "error": str(e) or e.__class__.__name__}
+            scheduler.done(job, retry_at)
+            if retry_at is None:
+                results.put(("record", record))
+
+    threads = [threading.Thread(target=work) for _ in xrange(min(workers, len(jobs)))]
+    for thread in threads:
+        # so that an interrupted run exits
+        thread.daemon = True
+        thread.start()
+    journal_file = file(journal_fn, "a")
+    try:
+        remaining = len(jobs)
+        while remaining:
+            try:
+                # with a timeout, so that Ctrl-C gets through
+                kind, data = results.get(timeout=1)
+            except Queue.Empty:
+                continue
+            if kind == "retry":
+                if verbose:
+                    print "ERROR fetching this page: " + data
+                continue
+            journal_file.write(json.dumps(data) + "\n")
+            journal_file.flush()
+            journal[data["doc_id"]] = data
+            remaining -= 1
+            if verbose:
+                if data["status"] == "done":
+                    print "fetched %s > %s" % (data["url"], html_location(html_dir, data["doc_id"]))
+                else:
+                    print "ERROR fetching this page: %s (%s)" % (data["url"], data["error"])
+    finally:
+        journal_file.close()
+    for thread in threads:
+        thread.join()
+    return journal
+
+def main(args=None):
     from optparse import OptionParser
     # command line options
     parser = OptionParser()
 
-    parser.add_option("-l", "--links", dest="links_filename", 
+    parser.add_option("-l", "--links", dest="links_filename",
             help="file with json of urls to retrieve")
 
     parser.add_option("-s", "--start", dest="start_point",
@@ -54,55 +276,58 @@ if __name__ == "__main__":
     parser.add_option("-d", "--directory", dest="directory",
             help="what directory to store files",default="fetched_documents")
 
-    (options,args) = parser.parse_args()
+    parser.add_option("-w", "--workers", dest="workers", type="int",
+            help="number of concurrent fetches",default=8)
+
+    parser.add_option("--per-host", dest="per_host", type="int",
+            help="number of concurrent fetches per host",default=2)
+
+    parser.add_option("--delay", dest="delay", type="float",
+            help="seconds between fetches from the same host",default=1.0)
+
+    parser.add_option("-r", "--retries", dest="retries", type="int",
+            help="times to retry a failed fetch",default=3)
+
+    parser.add_option("--backoff", dest="backoff", type="float",
+            help="seconds to wait before the first retry, doubled every time",default=2.0)
+
+    parser.add_option("-t", "--timeout", dest="timeout", type="float",
+            help="seconds a fetch may take",default=10)
+
+    (options,args) = parser.parse_args(args)
     # get links json
     sp = int(options.start_point)
     links_json = json.loads(file(options.links_filename).read())
-    # check if dir is present
-    if not os.path.isdir(options.directory):
-        os.system('mkdir '+options.directory)
+    # until I change boilerpipe it needs a dir within a dir, so set that up here
+    name = os.path.basename(os.path.normpath(options.directory))
+    html_dir = os.path.join(options.directory, name)
+    if not os.path.isdir(html_dir):
+        os.makedirs(html_dir)
     # first assign id to each doc
     curr_id = 0
     for url_data in links_json["urls"]:
         url_data["doc_id"] = curr_id
         curr_id += 1
-    # now fetch each document
-    for url_data in links_json['urls']:
-        url = url_data['url']
-        query = url_data['query']
-        #all_docs = os.listdir(options.directory)
-        #all_docs = [int(d.split('.')[0]) for d in all_docs]
-        #if not all_docs:
-            #max_doc_number = 0
-        #else:
-            #max_doc_number = max(all_docs)
-        #new_doc_number = max_doc_number + 1
-        # fetch the document
-        new_doc_number = url_data["doc_id"]
-        try:
-            print "fetching "+url
-            html_location = options.directory+'/'+str(new_doc_number)+".html"
-            new_file = file(html_location,"w")
-            new_file.write(url+"\n")
-            new_file.write(query+"\n")
-            new_file.close()
-            os.system("curl -m 10 "+url+" >> "+html_location)
-            print "curl "+url+" > "+html_location
-            print "done fetching...checking results"
-            contents = file(html_location).read()
-            if not contents:
-                os.system('rm '+html_location)
-                print "ERROR fetching this page: "+url
-            # TO DO: resolve character set issue so HTML can be stored in JSON
-            #url_data["html"] = contents
-        except:
-            print "document failed...oh well..."
-            url_data["html"] = "Failed to retrieve html for this document."
-
-    # until I change boilerpipe it needs a dir within a dir, so set that up here
-    os.system('cd '+options.directory+' ; mkdir '+options.directory.split('/')[-1]+' ; mv *html '+options.directory.split('/')[-1])
-    # dump updated json with html per url
-    # TO DO: resolve character set issue
-    json_dump_file = file(options.directory+"/"+options.directory.split('/')[-1]+".json","w")
+    # now fetch the documents
+    start = time.time()
+    journal = fetch_all(links_json["urls"][sp:], html_dir,
+                        os.path.join(options.directory, name + ".journal"),
+                        options.workers, options.per_host, options.delay,
+                        options.retries, options.backoff, options.timeout)
+    failed = 0
+    for url_data in links_json["urls"][sp:]:
+        if journal[url_data["doc_id"]]["status"] != "done":
+            url_data["html"] = FAILED_HTML
+            failed += 1
+    print "done fetching: %d documents, %d failed (%.1fs)" % (len(links_json["urls"]) - sp, failed,
+                                                             time.time() - start)
+    # dump updated json with doc ids
+    # TO DO: resolve character set issue so HTML can be stored in JSON
+    json_dump_file = file(os.path.join(options.directory, name + ".json"),"w")
     json_dump_file.write(json.dumps(links_json))
     json_dump_file.close()
+    return 0
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main())
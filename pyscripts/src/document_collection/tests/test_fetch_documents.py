@@ -0,0 +1,159 @@
+from unittest import TestCase, TestSuite, makeSuite, main
+from StringIO import StringIO
+import BaseHTTPServer, SocketServer
+import os, sys, json, shutil, tempfile, threading, time
+
+from document_collection import fetch_documents
+from document_collection.fetch_documents import fetch_all, read_journal
+
+class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # the client gave up on /stall
+        pass
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """ /page/<name> is a page; /slow a page that takes a while; /stall never
+    answers in time; /flaky fails the first time; /broken always fails;
+    /missing does not exist; /redirect redirects to /page/target """
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.hits[self.path] = server.hits.get(self.path, 0) + 1
+            server.starts.append(time.time())
+            server.running += 1
+            server.max_running = max(server.max_running, server.running)
+            hits = server.hits[self.path]
+        try:
+            if self.path.startswith("/page/"):
+                self.reply(200, "<html>%s</html>" % self.path[6:])
+            elif self.path.startswith("/slow"):
+                time.sleep(0.2)
+                self.reply(200, "<html>slow</html>")
+            elif self.path == "/stall":
+                time.sleep(1)
+                self.reply(200, "<html>too late</html>")
+            elif self.path == "/flaky":
+                self.reply(503 if hits == 1 else 200, "<html>flaky</html>")
+            elif self.path == "/broken":
+                self.reply(500, "<html>error</html>")
+            elif self.path == "/redirect":
+                self.send_response(302)
+                self.send_header("Location", "/page/target")
+                self.end_headers()
+            else:
+                self.reply(404, "<html>not found</html>")
+        finally:
+            with server.lock:
+                server.running -= 1
+
+    def reply(self, code, body):
+        self.send_response(code)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class FetchDocumentsTest(TestCase):
+    def setUp(self):
+        self.server = Server(("127.0.0.1", 0), Handler)
+        self.server.lock = threading.Lock()
+        self.server.hits = {}
+        self.server.starts = []
+        self.server.running = self.server.max_running = 0
+        threading.Thread(target=self.server.serve_forever).start()
+        self.base = "http://127.0.0.1:%d" % self.server.server_address[1]
+        self.dir = tempfile.mkdtemp()
+        self.stdout = sys.stdout
+        sys.stdout = StringIO()
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.dir)
+
+    def url_datas(self, paths):
+        return [{"doc_id": i, "url": self.base + path, "query": u"query %d" % i}
+                for i, path in enumerate(paths)]
+
+    def test_main(self):
+        paths = ["/page/a", "/slow", "/stall", "/flaky", "/broken", "/missing", "/redirect", "/page/b"]
+        links_fn = os.path.join(self.dir, "links.json")
+        with open(links_fn, "w") as f:
+            json.dump({"urls": [{"url": self.base + path, "query": u"q\xe9"} for path in paths]}, f)
+        directory = os.path.join(self.dir, "bundle")
+        args = ["-l", links_fn, "-d", directory, "-w", "4", "--delay", "0",
+                "-r", "2", "--backoff", "0.05", "-t", "0.5"]
+        self.assertEqual(fetch_documents.main(args), 0)
+
+        html_dir = os.path.join(directory, "bundle")
+        self.assertEqual(sorted(os.listdir(html_dir)),
+                         ["0.html", "1.html", "3.html", "6.html", "7.html"])
+        with open(os.path.join(html_dir, "6.html")) as f:
+            self.assertEqual(f.read(), self.base + "/redirect\nq\xc3\xa9\n<html>target</html>")
+        with open(os.path.join(html_dir, "3.html")) as f:
+            self.assertEqual(f.read().splitlines()[2], "<html>flaky</html>")
+        with open(os.path.join(directory, "bundle.json")) as f:
+            urls = json.load(f)["urls"]
+        self.assertEqual([u["doc_id"] for u in urls], range(len(paths)))
+        self.assertEqual([i for i, u in enumerate(urls) if "html" in u], [2, 4, 5])
+
+        journal = read_journal(os.path.join(directory, "bundle.journal"))
+        self.assertEqual([journal[i]["status"] for i in range(len(paths))],
+                         ["done", "done", "failed", "done", "failed", "failed", "done", "done"])
+        self.assertEqual(journal[6]["final_url"], self.base + "/page/target")
+        hits = self.server.hits
+        # retried twice; not retried
+        self.assertEqual((hits["/flaky"], hits["/broken"], hits["/stall"], hits["/missing"]), (2, 3, 3, 1))
+
+        # a second run only fetches what failed
+        before = dict(hits)
+        self.assertEqual(fetch_documents.main(args), 0)
+        self.assertEqual(dict((path, n - before.get(path, 0)) for path, n in hits.items() if n != before.get(path)),
+                         {"/stall": 3, "/broken": 3, "/missing": 1})
+        self.assertEqual(len(os.listdir(html_dir)), 5)
+
+    def test_resume(self):
+        html_dir = os.path.join(self.dir, "html")
+        os.mkdir(html_dir)
+        journal_fn = os.path.join(self.dir, "journal")
+        url_datas = self.url_datas(["/page/%d" % i for i in range(6)])
+        fetch_all(url_datas[:3], html_dir, journal_fn, delay=0)
+        # interrupted while writing the journal
+        with open(journal_fn, "a") as f:
+            f.write('{"doc_id": 3, "url"')
+        # and a document lost
+        os.remove(os.path.join(html_dir, "1.html"))
+        journal = fetch_all(url_datas, html_dir, journal_fn, delay=0)
+        self.assertEqual(sorted(journal), range(6))
+        self.assertEqual(self.server.hits["/page/0"], 1)
+        self.assertEqual(self.server.hits["/page/1"], 2)
+        self.assertEqual(sorted(os.listdir(html_dir)), ["%d.html" % i for i in range(6)])
+
+    def test_limits(self):
+        html_dir = self.dir
+        url_datas = self.url_datas(["/slow/%d" % i for i in range(6)])
+        fetch_all(url_datas, html_dir, os.path.join(self.dir, "journal1"),
+                  workers=6, per_host=2, delay=0, verbose=False)
+        self.assertEqual(self.server.max_running, 2)
+
+        self.server.starts = []
+        url_datas = self.url_datas(["/page/%d" % i for i in range(4)])
+        fetch_all(url_datas, html_dir, os.path.join(self.dir, "journal2"),
+                  workers=4, per_host=4, delay=0.1, verbose=False)
+        starts = sorted(self.server.starts)
+        self.assertEqual(len(starts), 4)
+        self.assertTrue(min(b - a for a, b in zip(starts, starts[1:])) >= 0.09, starts)
+
+def test_suite():
+    suite = TestSuite()
+    suite.addTests(makeSuite(FetchDocumentsTest))
+    return suite
+
+if __name__ == '__main__':
+    main(defaultTest='test_suite')
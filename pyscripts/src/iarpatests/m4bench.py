@@ -0,0 +1,334 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. module:: m4bench
+   :platform: Unix
+   :synopsis: Throughput benchmark of the m4detect LM detection pipeline
+
+Runs the phases of the m4detect LM detection pipeline
+(:py:func:`iarpatests.m4detect.runLMDetection`) on synthetic corpora of
+given sizes and languages (see :py:mod:`iarpatests.synthcorpus`), with stub
+POS taggers and dependency parsers in place of TreeTagger, the Persian
+taggers and the parsers.  Each phase is run in isolation, on the output of the
+previous phases, and the whole pipeline is run end to end.  Every run is
+done in a separate process, which reports:
+
+- the wall and CPU time of the run, and the sentences processed per second
+- the peak resident memory of the process
+- the time taken to load the input and write the output JSON
+- the number of LMs in the output, and of errors logged
+- the time spent in each step of the phases (see :py:mod:`mnpipeline.metrics`)
+
+The phases, and their settings, are those of the m4detect configuration
+(same configuration file and command line options as m4detect); the
+resources they need, e.g. the MetaNet repository for CMS and CNMS, must be
+available.  Use e.g. ``-e rdflib`` to run CMS without a Sesame server.
+
+The results are written to a JSON report, along with the commit and host
+they were obtained on, and can be compared to an earlier report.  Example::
+
+    python m4bench.py --config mnsystem.conf -l en -n 1000 -n 10000 --report before.json
+    (change the code)
+    python m4bench.py --config mnsystem.conf -l en -n 1000 -n 10000 --report after.json \\
+        --compare before.json
+
+"""
+import sys, os, time, json, logging, resource, platform, subprocess, tempfile, shutil, traceback
+from multiprocessing import Process, Pipe
+from datetime import datetime
+import iarpaxml as ix
+import m4detect
+import synthcorpus
+from mnformats import mnjson
+from mnformats.mnconfig import MetaNetConfigParser
+from mnpipeline.metrics import METRICS
+from cmsextractor import cms
+
+# report format version
+REPORT_VERSION = 1
+
+class _ErrorCounter(logging.Handler):
+    """ Counts the errors logged during a run (phases log their errors rather
+    than raising them).
+    """
+    def __init__(self):
+        logging.Handler.__init__(self, logging.ERROR)
+        self.count = 0
+
+    def emit(self, record):
+        self.count += 1
+
+def installStubs(tagger, parser):
+    """ Have the CMS, the SCMS and the Persian LMS use the stub tagger and
+    parser.
+    """
+    cms.RESOURCES.register('tagger', lambda l: tagger, forksafe=False)
+    cms.parse = parser.parse
+    # every SCMS registers its own tagger loader, which would build a TreeTagger
+    m4detect.SimpleConstructionMatchingSystem.load_tagger = lambda self, l: tagger
+    # and the LMS makes new Persian taggers for every document and sentence
+    lmstagger = synthcorpus.StubLMSTagger(tagger)
+    m4detect.externalExtr_v1.PersianPOSTagger = lambda *args: lmstagger
+    m4detect.externalExtr_v1.segExtractor.PersianPOSTagger = lambda *args: lmstagger
+    # the parse cache would bypass the stub parser
+    os.environ.pop('MNPARSECACHE', None)
+
+def countLMs(jdata):
+    n = len(jdata.get('lmlist') or [])
+    for sent in jdata.get('sentences', []):
+        n += len(sent.get('lms', []))
+    return n
+
+def _runChild(conn, task):
+    """ Run the phases of a task in this (child) process, and send the
+    measurements back.
+    """
+    try:
+        lang, infname, outfname, goldfname, phases, cmdline, config = task
+        counter = _ErrorCounter()
+        logging.getLogger().addHandler(counter)
+        tagger, parser = synthcorpus.stubs(lang, mnjson.loadfile(goldfname))
+        installStubs(tagger, parser)
+        METRICS.reset()
+        start = time.time()
+        jdata = mnjson.loadfile(infname)
+        loadseconds = time.time() - start
+        nsents = len(jdata['sentences'])
+        startcpu = os.times()
+        start = time.time()
+        jdata = m4detect.runLMDetection(jdata, cmdline, config, None, phases=phases)
+        seconds = time.time() - start
+        endcpu = os.times()
+        start = time.time()
+        if outfname:
+            mnjson.writefile(outfname, jdata)
+        writeseconds = time.time() - start
+        result = {'sentences': nsents,
+                  'seconds': seconds,
+                  'cpuseconds': (endcpu[0] - startcpu[0]) + (endcpu[1] - startcpu[1]),
+                  'sentspersec': nsents / seconds if seconds > 0 else None,
+                  'loadseconds': loadseconds,
+                  'writeseconds': writeseconds,
+                  # ru_maxrss is in kilobytes on Linux
+                  'peakrss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+                  'lms': countLMs(jdata),
+                  'errors': counter.count,
+                  'steps': METRICS.stats()['steps']}
+        conn.send((True, result))
+    except:
+        conn.send((False, traceback.format_exc()))
+    finally:
+        conn.close()
+
+def runTask(task):
+    """ Run a task in a new process.  Returns the measurements, or None if
+    the run failed.
+    """
+    recv, send = Pipe(False)
+    proc = Process(target=_runChild, args=(send, task))
+    proc.start()
+    send.close()
+    try:
+        ok, result = recv.recv()
+    except EOFError:
+        ok, result = False, 'process exited with code %s' % (proc.exitcode)
+    proc.join()
+    if not ok:
+        logging.error('benchmark run of %s failed:\n%s', u','.join(task[4]), result)
+        return None
+    return result
+
+def configuredPhases(cmdline, config, lang):
+    """ Return the phases m4detect runs for a language.
+    """
+    phases = config.getList('extractionphases', lang, required=True)
+    if not cmdline.nogmrmapping:
+        phases = phases + (config.getList('mappingphases', lang) or [])
+    return phases
+
+def benchCorpus(cmdline, config, workdir, lang, nsents, vocab):
+    """ Generate a corpus, and run the benchmark on it.  Returns the list of
+    runs.
+    """
+    corpusfname = os.path.join(workdir, '%s-%d.json' % (lang, nsents))
+    goldfname = synthcorpus.goldFileName(corpusfname)
+    start = time.time()
+    jdata, gold = synthcorpus.generateCorpus(vocab, nsents, cmdline.words, cmdline.seed)
+    mnjson.writefile(corpusfname, jdata)
+    mnjson.writefile(goldfname, gold)
+    nwords = sum(len(g['word']) for g in gold)
+    del jdata, gold
+    logging.info('generated %d sentences (%d words) of %s in %.1fs', nsents, nwords, lang,
+                 time.time() - start)
+    if cmdline.phases:
+        phases = [phase.strip() for phase in cmdline.phases.split(',')]
+    else:
+        phases = configuredPhases(cmdline, config, lang)
+    runs = []
+    def bench(mode, phaselist, infname, outfname):
+        best = None
+        for r in range(cmdline.repeat):
+            result = runTask((lang, infname, outfname, goldfname, phaselist, cmdline, config))
+            if (result is not None) and ((best is None) or (result['seconds'] < best['seconds'])):
+                best = result
+        run = {'lang': lang, 'sentences': nsents, 'words': nwords, 'mode': mode,
+               'phase': u','.join(phaselist)}
+        if best is None:
+            run['failed'] = True
+        else:
+            run.update(best)
+        runs.append(run)
+        printRun(run)
+        return best
+    if not cmdline.nophases:
+        # each phase on the output of the previous ones
+        infname = corpusfname
+        for i, phase in enumerate(phases):
+            outfname = os.path.join(workdir, '%s-%d.%d.%s.json' % (lang, nsents, i, phase))
+            if bench('phase', [phase], infname, outfname) is None:
+                break
+            infname = outfname
+    if not cmdline.nopipeline:
+        bench('pipeline', phases, corpusfname, None)
+    return runs
+
+def printHeader():
+    print '%-4s %8s %-9s %-20s %9s %9s %10s %8s %6s %6s' % (
+        'lang', 'sents', 'mode', 'phase', 'seconds', 'cpu', 'sents/sec', 'peak MB',
+        'lms', 'errors')
+
+def printRun(run):
+    if run.get('failed'):
+        print '%-4s %8d %-9s %-20s %s' % (run['lang'], run['sentences'], run['mode'],
+                                          run['phase'], 'FAILED')
+        return
+    print '%-4s %8d %-9s %-20s %9.2f %9.2f %10.1f %8.1f %6d %6d' % (
+        run['lang'], run['sentences'], run['mode'], run['phase'], run['seconds'],
+        run['cpuseconds'], run['sentspersec'] or 0.0, run['peakrss'] / 1048576.0,
+        run['lms'], run['errors'])
+
+def runKey(run):
+    return (run['lang'], run['sentences'], run['mode'], run['phase'])
+
+def compareReports(baseline, report):
+    """ Print the runs of a report next to those of a baseline report.
+    """
+    print
+    print 'compared to %s (%s)' % (baseline.get('commit'), baseline.get('created'))
+    print '%-4s %8s %-9s %-20s %9s %9s %8s %9s %9s' % (
+        'lang', 'sents', 'mode', 'phase', 'before', 'after', 'speedup', 'MB before', 'MB after')
+    before = dict((runKey(run), run) for run in baseline['runs'] if not run.get('failed'))
+    for run in report['runs']:
+        old = before.get(runKey(run))
+        if (old is None) or run.get('failed'):
+            continue
+        print '%-4s %8d %-9s %-20s %9.2f %9.2f %7.2fx %9.1f %9.1f' % (
+            run['lang'], run['sentences'], run['mode'], run['phase'], old['seconds'],
+            run['seconds'], old['seconds'] / run['seconds'] if run['seconds'] else 0.0,
+            old['peakrss'] / 1048576.0, run['peakrss'] / 1048576.0)
+
+def gitCommit():
+    """ Return the commit of the working copy, or None.
+    """
+    try:
+        with open(os.devnull, 'w') as devnull:
+            return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=devnull,
+                                           cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def loadConfig(cmdline):
+    """ Read the m4detect configuration, from the same file m4detect would.
+    """
+    cfname = cmdline.configfname or os.environ.get(ix.CONFIG_ENV)
+    if not cfname:
+        cfname = "./" + os.path.basename(ix.DEFAULT_CONFIGFNAME)
+        if not os.path.exists(cfname):
+            cfname = ix.DEFAULT_CONFIGFNAME
+    logging.info('reading configuration from %s', cfname)
+    if cmdline.gmr and (not cmdline.configmode):
+        cmdline.configmode = 'gmr.general'
+    return MetaNetConfigParser(cfname, 'm4detect', cmdline.configmode)
+
+def main():
+    """
+    Runs the m4detect benchmark.
+    """
+    m4test = ix.IARPATestCommand('metad', 'Benchmark of the m4detect LM detection pipeline'\
+                                 ' on synthetic corpora.')
+    aparser = m4test.getArgParser()
+    m4detect.addArguments(aparser)
+    aparser.add_argument("-l", "--lang", action="append",
+                         help="Language of the corpora (may be repeated; default en)")
+    aparser.add_argument("-n", "--sentences", type=int, action="append",
+                         help="Corpus size in sentences (may be repeated; default 1000)")
+    aparser.add_argument("-w", "--words", type=int, default=20,
+                         help="Mean sentence length in words")
+    aparser.add_argument("--seed", type=int, default=0, help="Random seed of the corpora")
+    aparser.add_argument("--vocab-json", dest="vocabjson", action="append", default=[],
+                         help="Tagged MetaNet JSON file to sample words from (may be repeated)")
+    aparser.add_argument("--wordlist", action="append", default=[],
+                         help="Word list to sample words from (may be repeated)")
+    aparser.add_argument("--cxn-patterns", dest="cxnpatterns", action="append", default=[],
+                         help="Cxn query file whose relations are planted (may be repeated)")
+    aparser.add_argument("--phases", help="Phases to run (comma separated), instead of"\
+                         " the configured extraction and mapping phases")
+    aparser.add_argument("--no-phases", dest="nophases", action="store_true",
+                         help="Do not run the phases in isolation")
+    aparser.add_argument("--no-pipeline", dest="nopipeline", action="store_true",
+                         help="Do not run the pipeline end to end")
+    aparser.add_argument("-r", "--repeat", type=int, default=1,
+                         help="Runs of each configuration (the fastest is reported)")
+    aparser.add_argument("--work-dir", dest="workdir",
+                         help="Directory for the corpora and phase outputs (kept)."\
+                         " By default, a temporary directory is used and removed.")
+    aparser.add_argument("--report", default="m4bench.json",
+                         help="Report file name")
+    aparser.add_argument("--compare", help="Earlier report to compare the results to")
+    cmdline = aparser.parse_args()
+    m4test.cmdline = cmdline
+    m4test.setupPyLogging()
+    if not cmdline.verbose:
+        logging.getLogger().setLevel(logging.WARN)
+    cmdline.allcxns = True
+    cmdline.json = True
+    config = loadConfig(cmdline)
+
+    langs = cmdline.lang or ['en']
+    sizes = cmdline.sentences or [1000]
+    workdir = cmdline.workdir or tempfile.mkdtemp(prefix='m4bench-')
+    if not os.path.isdir(workdir):
+        os.makedirs(workdir)
+    report = {'version': REPORT_VERSION,
+              'created': datetime.now().strftime('%Y-%m-%dT%H:%M:%S'),
+              'commit': gitCommit(),
+              'host': platform.node(),
+              'platform': platform.platform(),
+              'python': platform.python_version(),
+              'cpus': os.sysconf('SC_NPROCESSORS_ONLN'),
+              'settings': {'words': cmdline.words, 'seed': cmdline.seed,
+                           'repeat': cmdline.repeat, 'phases': cmdline.phases,
+                           'engine': cmdline.engine, 'mode': cmdline.configmode,
+                           'vocabjson': cmdline.vocabjson, 'wordlist': cmdline.wordlist,
+                           'cxnpatterns': cmdline.cxnpatterns},
+              'runs': []}
+    printHeader()
+    try:
+        for lang in langs:
+            vocab = synthcorpus.makeVocabulary(lang, cmdline.vocabjson, cmdline.wordlist,
+                                               cmdline.cxnpatterns)
+            for nsents in sizes:
+                report['runs'].extend(benchCorpus(cmdline, config, workdir, lang, nsents, vocab))
+    finally:
+        if not cmdline.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    with open(cmdline.report, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    if cmdline.compare:
+        with open(cmdline.compare) as f:
+            compareReports(json.load(f), report)
+    return 0
+
+if __name__ == "__main__":
+    status = main()
+    sys.exit(status)
@@ -34,6 +34,7 @@ from multiprocessing import Pool
 from source.subdims_matcher import subdim_match
 from string import capwords
 from depparsing import parsemet
+from mnpipeline.metrics import METRICS, SamplingProfiler
 from datetime import datetime
 from dateutil.tz import tzlocal
 
@@ -46,6 +47,12 @@ sys.stderr = codecs.getwriter('utf8')(sys.stderr)
 # for parallel processing
 CHUNKSIZE = 1
 
+# state shared with shard workers, which inherit it by forking (see runShards)
+SHARDSTATE = None
+
+# sampling profiler of the run, if enabled (see startInstrumentation)
+PROFILER = None
+
     
 def clearLMs(sentences):
     """ Clear existing LMs from the input file.  This is used when running the extractor on
@@ -219,7 +226,37 @@ class DepParseFound(Exception):
     def __str__(self):
         return repr(self.value)
 
-def runSBS(cmdline, config, jdata, paramrec={}):
+def sbsNeedsParser(cmdline, config, jdata):
+    """Decide whether the dependency parser has to be run before SBS: unless
+    configured otherwise, it is run if none of the first few words of the first
+    few sentences has a dependency parse.  When the document is sharded, this is
+    decided once on the whole document, so that all the shards agree.
+    
+    :returns: whether to run the dependency parser
+    
+    """
+    if cmdline.nodepcheck:
+        return False
+    lang = jdata[u'lang']
+    if u'invoke_parser' in config.getComponentOptions('sbs'):
+        return config.getFlagFromComp('sbs','invoke_parser',lang,required=True)
+    try:
+        sentLimit = min(3,len(jdata[u'sentences']))
+        for sent in jdata[u'sentences'][0:sentLimit]:
+            if u'word' not in sent:
+                continue
+            wLimit = min(5,len(sent[u'word']))
+            for w in sent[u'word'][0:wLimit]:
+                if u'dep' in w:
+                    raise DepParseFound()
+    except DepParseFound:
+        return False
+    except:
+        logging.error('Error while determining whether to invoke dep parser')
+        raise
+    return True
+
+def runSBS(cmdline, config, jdata, paramrec={}, runParser=None):
 
     lang = jdata[u'lang']
     options = config.getComponentOptions('sbs')
@@ -235,27 +272,8 @@ def runSBS(cmdline, config, jdata, paramrec={}):
     paramrec['sbs'] = sbsparams
     
     # run CMS dep parser if needed
-    if cmdline.nodepcheck:
-        runParser = False
-    else:
-        runParser = True
-        if u'invoke_parser' in options:
-            runParser = config.getFlagFromComp('sbs','invoke_parser',lang,required=True)
-        else:
-            try:
-                sentLimit = min(3,len(jdata[u'sentences']))
-                for sent in jdata[u'sentences'][0:sentLimit]:
-                    if u'word' not in sent:
-                        continue
-                    wLimit = min(5,len(jdata[u'sentences'][0][u'word']))
-                    for w in jdata[u'sentences'][0][u'word'][0:wLimit]:
-                        if u'dep' in w:
-                            raise DepParseFound()
-            except DepParseFound:
-                runParser = False
-            except:
-                logging.error('Error while determining whether to invoke dep parser')
-                raise
+    if runParser is None:
+        runParser = sbsNeedsParser(cmdline, config, jdata)
         
     if runParser:
         ConstructionMatchingSystem.preProcess(lang, jdata['sentences'],
@@ -443,7 +461,9 @@ def runLMDetectionInstance((infilename, outfilename, cmdline, config)):
             rlogger.setLevel(logging.DEBUG)
         rlogger.addHandler(infohand)
     
-    jdata = mnjson.loadfile(infilename)
+    startInstrumentation(cmdline)
+    with METRICS.step('json.load'):
+        jdata = mnjson.loadfile(infilename)
     
     logger = None
     jdata = runLMDetection(jdata, cmdline, config, logger)
@@ -452,10 +472,147 @@ def runLMDetectionInstance((infilename, outfilename, cmdline, config)):
         raise
     
     # write output file
-    mnjson.writefile(outfilename, jdata)
+    with METRICS.step('json.write', items=len(jdata['sentences'])):
+        mnjson.writefile(outfilename, jdata)
+    writeInstrumentation(cmdline, infilename, outfilename, jdata)
     logging.info('done LM detection')
 
-def runLMDetection(jdata, cmdline, config, logger):
+def startInstrumentation(cmdline):
+    """Clear the step metrics of the process (see :py:mod:`mnpipeline.metrics`)
+    and, if profiling is enabled, start the sampling profiler.
+    
+    :param cmdline: command line parameters 
+    :type cmdline: parse output from (:py:mod:`argparse`)
+    
+    """
+    global PROFILER
+    METRICS.reset()
+    PROFILER = None
+    if cmdline.profile:
+        PROFILER = SamplingProfiler(cmdline.profileinterval)
+        PROFILER.start()
+
+def writeInstrumentation(cmdline, infilename, outfilename, jdata):
+    """Stop the sampling profiler, if running, and write the step metrics and
+    profile of the run to <outfilename>.metrics.json, and the profiled stacks
+    to <outfilename>.profile.folded, if enabled.
+    
+    :param cmdline: command line parameters 
+    :type cmdline: parse output from (:py:mod:`argparse`)
+    :param infilename: input file name
+    :type infilename: str
+    :param outfilename: output file name
+    :type outfilename: str
+    :param jdata: MetaNet JSON format data
+    :type jdata: dict
+    
+    """
+    if PROFILER:
+        PROFILER.stop()
+    if not (cmdline.metrics or cmdline.profile):
+        return
+    info = {'infilename': infilename,
+            'outfilename': outfilename,
+            'lang': jdata.get('lang'),
+            'sentences': len(jdata.get('sentences', [])),
+            'phases': jdata.get('parameters', {}).get('extractionphases')}
+    METRICS.writefile(outfilename + '.metrics.json', info, PROFILER)
+    if PROFILER:
+        PROFILER.writeFolded(outfilename + '.profile.folded')
+
+def initMapping(cmdline, config, lang, mrdatadir, paramrec):
+    """Configure and initialize the MetaNet repository and the Conceptual Network
+    Mapper used by the CMS and CNMS.
+    
+    :param cmdline: command line parameters 
+    :type cmdline: parse output from (:py:mod:`argparse`)
+    :param config: configuration file parameters
+    :type config: instance of (:py:mod:`mnformats.mnconfig.MetaNetConfigParser`)
+    :param lang: language
+    :type lang: str
+    :param mrdatadir: MetaNet repository data directory
+    :type mrdatadir: str
+    :param paramrec: record of the parameters of the run, which is updated
+    :type paramrec: dict
+    :returns: tuple of the MetaNet repository and the mapper
+    
+    """
+    # configure and initialize Conceptual Network Mapper
+    tconranking = config.getListFromComp('cnms','targetconceptranking', lang)
+    secondaryminscore = config.getFloatFromComp('cnms','secondaryminscore', lang)
+    mappinglimit = config.getIntFromComp('cnms','sourcelimit', lang)
+    conceptmode = config.getValue('casemode',default='general')
+    expansionTypes = config.getListFromComp('cnms','expansiontypes',lang=lang)
+    expansionScoreScale = config.getFloatFromComp('cnms','expansionscorescale',lang=lang,
+                                                  default=1.0)
+    disableclosestframe = config.getFlagFromComp('cnms','disableclosestframe',lang=lang)
+    fndatadir = config.getValue('framenetdatadir',lang=lang)
+    wikdatadir = config.getValue('wiktionarydatadir',lang=lang)
+    pwfdatadir = config.getValue('persianwordformsdatadir')
+    
+    cnmsparams = {}
+    cnmsparams['targetconceptranking'] = tconranking
+    cnmsparams['secondaryminscore'] = secondaryminscore
+    cnmsparams['sourcelimit'] = mappinglimit
+    cnmsparams['expansiontypes'] = expansionTypes
+    cnmsparams['expansionscorescale'] = expansionScoreScale
+    cnmsparams['disableclosestframe'] = disableclosestframe
+    paramrec['cnms'] = cnmsparams
+    paramrec['casemode'] = conceptmode
+    paramrec['framenetdatadir'] = fndatadir
+    paramrec['wiktionarydatadir'] = wikdatadir
+    paramrec['persianwordformsdatadir'] = pwfdatadir
+    
+    fndata = None
+    wikdata = None
+    pwforms = None
+    if lang=='en':
+        if ('fn' in expansionTypes) or (not disableclosestframe):
+            if not fndatadir:
+                logging.error('FN expansion requires "framenetdatadir" parameter')
+            else:
+                fndata = FrameNet(cachedir=fndatadir)
+        if ('wik' in expansionTypes):
+            if not wikdatadir:
+                logging.error('Wiktionary expansion requires "wiktionarydatadir" parameter')
+            else:
+                wikdata = Wiktionary(dbdir=wikdatadir)
+    if lang=='fa':
+        if not pwfdatadir:
+            logging.warn('Persian extraction/mapping not using precomputed word forms.'\
+                         ' Set "persianwordformsdatadir" to enable.')
+        pwforms = PersianWordForms(pwfdir=pwfdatadir)
+
+    # configure and initialize MetaNet Repository
+    metanetrep = MetaNetRepository(lang, useSE=cmdline.useSE,mrbasedir=mrdatadir,
+                                   fndata=fndata,wikdata=wikdata,pwforms=pwforms)
+    metanetrep.initLookups()
+    
+    cnmapper = ConceptualNetworkMapper(lang, cmdline.cachedir,
+                                       targetConceptRank=tconranking,
+                                       disableFN=disableclosestframe,
+                                       expansionTypes=expansionTypes,
+                                       expansionScoreScale=expansionScoreScale,
+                                       sourceMappingLimit=mappinglimit, 
+                                       minSecondaryScore=secondaryminscore,
+                                       metanetrep=metanetrep,
+                                       conceptMode=conceptmode)
+    return metanetrep, cnmapper
+
+def runLMDetection(jdata, cmdline, config, logger, phases=None):
+    """Run the LM detection pipeline configured for the language of a document.
+    
+    :param jdata: MetaNet JSON format data
+    :type jdata: dict
+    :param cmdline: command line parameters 
+    :type cmdline: parse output from (:py:mod:`argparse`)
+    :param config: configuration file parameters
+    :type config: instance of (:py:mod:`mnformats.mnconfig.MetaNetConfigParser`)
+    :param phases: phases to run instead of the configured extraction and mapping phases
+    :type phases: list
+    :returns: JSON dict with LMs added
+    
+    """
     jdata['start_processing_time'] = datetime.now(tzlocal()).strftime("%Y-%m-%d %H:%M:%S %z")
     lang = jdata['lang']
     
@@ -471,7 +628,9 @@ def runLMDetection(jdata, cmdline, config, logger):
     paramrec['extractionphases'] = lmd_pipeline
     paramrec['mappingphases'] = lmd_mapping
     
-    if not cmdline.nogmrmapping:
+    if phases is not None:
+        lmd_pipeline = list(phases)
+    elif not cmdline.nogmrmapping:
         lmd_pipeline += lmd_mapping
     
     tfamlist = config.getList('targetfamilies', lang)
@@ -495,107 +654,34 @@ def runLMDetection(jdata, cmdline, config, logger):
     paramrec['mrdatadir'] = mrdatadir
 
     if ('CNMS' in lmd_pipeline) or ('CMS' in lmd_pipeline):
-        # configure and initialize Conceptual Network Mapper
-        tconranking = config.getListFromComp('cnms','targetconceptranking', lang)
-        secondaryminscore = config.getFloatFromComp('cnms','secondaryminscore', lang)
-        mappinglimit = config.getIntFromComp('cnms','sourcelimit', lang)
-        conceptmode = config.getValue('casemode',default='general')
-        expansionTypes = config.getListFromComp('cnms','expansiontypes',lang=lang)
-        expansionScoreScale = config.getFloatFromComp('cnms','expansionscorescale',lang=lang,
-                                                      default=1.0)
-        disableclosestframe = config.getFlagFromComp('cnms','disableclosestframe',lang=lang)
-        fndatadir = config.getValue('framenetdatadir',lang=lang)
-        wikdatadir = config.getValue('wiktionarydatadir',lang=lang)
-        pwfdatadir = config.getValue('persianwordformsdatadir')
-        
-        cnmsparams = {}
-        cnmsparams['targetconceptranking'] = tconranking
-        cnmsparams['secondaryminscore'] = secondaryminscore
-        cnmsparams['sourcelimit'] = mappinglimit
-        cnmsparams['expansiontypes'] = expansionTypes
-        cnmsparams['expansionscorescale'] = expansionScoreScale
-        cnmsparams['disableclosestframe'] = disableclosestframe
-        paramrec['cnms'] = cnmsparams
-        paramrec['casemode'] = conceptmode
-        paramrec['framenetdatadir'] = fndatadir
-        paramrec['wiktionarydatadir'] = wikdatadir
-        paramrec['persianwordformsdatadir'] = pwfdatadir
-        
-        fndata = None
-        wikdata = None
-        pwforms = None
-        if lang=='en':
-            if ('fn' in expansionTypes) or (not disableclosestframe):
-                if not fndatadir:
-                    logging.error('FN expansion requires "framenetdatadir" parameter')
-                else:
-                    fndata = FrameNet(cachedir=fndatadir)
-            if ('wik' in expansionTypes):
-                if not wikdatadir:
-                    logging.error('Wiktionary expansion requires "wiktionarydatadir" parameter')
-                else:
-                    wikdata = Wiktionary(dbdir=wikdatadir)
-        if lang=='fa':
-            if not pwfdatadir:
-                logging.warn('Persian extraction/mapping not using precomputed word forms.'\
-                             ' Set "persianwordformsdatadir" to enable.')
-            pwforms = PersianWordForms(pwfdir=pwfdatadir)
-
-        # configure and initialize MetaNet Repository
-        metanetrep = MetaNetRepository(lang, useSE=cmdline.useSE,mrbasedir=mrdatadir,
-                                       fndata=fndata,wikdata=wikdata,pwforms=pwforms)
-        metanetrep.initLookups()
-        
-        cnmapper = ConceptualNetworkMapper(lang, cmdline.cachedir,
-                                           targetConceptRank=tconranking,
-                                           disableFN=disableclosestframe,
-                                           expansionTypes=expansionTypes,
-                                           expansionScoreScale=expansionScoreScale,
-                                           sourceMappingLimit=mappinglimit, 
-                                           minSecondaryScore=secondaryminscore,
-                                           metanetrep=metanetrep,
-                                           conceptMode=conceptmode)
+        with METRICS.step('init'):
+            metanetrep, cnmapper = initMapping(cmdline, config, lang, mrdatadir,
+                                                   paramrec)
         
         if cmdline.cmsgenwcacheonly:
             runCMSGenWCacheOnly(cmdline, jdata, metanetrep, cnmapper,
                                 tfamlist, tsnamelist, tconlist, tcongrouplist,
                                 sfamlist, ssnamelist, sconlist)
             return {}
+    else:
+        metanetrep = None
+        cnmapper = None
     
     
     logging.info('running LM pipeline: %s', u', '.join(lmd_pipeline))
-    # run the systems    
-    for phase in lmd_pipeline:
-        try:
-            if phase == 'LMS':
-                logging.info('starting LMS phase...')
-                jdata = runLMS(cmdline, jdata)
-            elif phase == 'LMS2':
-                logging.info('starting LMS2 phase...')
-                jdata = runLMS2(cmdline, jdata)
-            elif phase == 'SCMS':
-                logging.info('starting SCMS phase ...')
-                jdata = runSCMS(cmdline, jdata, logger)
-            elif phase == 'CMS':
-                logging.info('starting CMS phase ...')
-                jdata = runCMS(cmdline, config, jdata, metanetrep, cnmapper, 
-                               tfamlist, tsnamelist, tconlist, tcongrouplist,
-                               sfamlist, ssnamelist, sconlist)
-            elif phase == 'CNMS':
-                logging.info('starting CNMS phase ...')
-                jdata = runCNMS(cmdline, config, jdata, cnmapper)
-            elif phase == 'DIS':
-                logging.info('start DIS phase ...')
-                jdata = runDIS(cmdline, jdata)
-            elif phase == 'PRE':
-                logging.info('start PRE phase ...')
-                jdata = runPRE(cmdline, jdata)
-            elif phase == 'SBS':
-                logging.info('start SBS phase ...')
-                jdata = runSBS(cmdline, config, jdata)
-        except:
-            logging.error("Error running phase %s:\n%s", phase,
-                          traceback.format_exc())    
+    searchlists = (tfamlist, tsnamelist, tconlist, tcongrouplist,
+                   sfamlist, ssnamelist, sconlist)
+    # decided on the input document, before any phase adds parses to some
+    # of its sentences, and before it is sharded
+    sbsParser = None
+    if 'SBS' in lmd_pipeline:
+        sbsParser = sbsNeedsParser(cmdline, config, jdata)
+    if getattr(cmdline, 'shards', 0) > 1:
+        jdata = runShards(lmd_pipeline, cmdline, config, jdata, logger,
+                          metanetrep, cnmapper, searchlists, sbsParser)
+    else:
+        jdata = runPhases(lmd_pipeline, cmdline, config, jdata, logger,
+                          metanetrep, cnmapper, searchlists, sbsParser)
     
     if tconlist:
         # if a tconlist is specified, then severely penalize any LM with a target concept
@@ -615,21 +701,165 @@ def runLMDetection(jdata, cmdline, config, logger):
     jdata['parameters'] = paramrec
     jdata['end_processing_time'] = datetime.now(tzlocal()).strftime("%Y-%m-%d %H:%M:%S %z")
     return jdata
+
+def runPhases(lmd_pipeline, cmdline, config, jdata, logger, metanetrep, cnmapper, searchlists,
+              sbsParser=None):
+    """Run the phases of the LM detection pipeline on a document.
+    
+    :param lmd_pipeline: names of the phases to run, in order
+    :type lmd_pipeline: list
+    :param jdata: MetaNet JSON format data
+    :type jdata: dict
+    :param metanetrep: MetaNet repository instance (None unless CMS/CNMS are run)
+    :type metanetrep: :py:class:`mnrepository.metanetrdf.MetaNetRepository`
+    :param cnmapper: Conceptual Network Mapper instance (None unless CMS/CNMS are run)
+    :type cnmapper: :py:class:`mnrepository.cnmapping.ConceptualNetworkMapper`
+    :param searchlists: target and source family/frame/concept lists
+    :type searchlists: tuple
+    :param sbsParser: whether SBS runs the dependency parser (None to decide
+                      when SBS runs, see :py:func:`sbsNeedsParser`)
+    :type sbsParser: bool
+    :returns: JSON dict with LMs added
     
-def main():
     """
-    Runs linguistic metaphor detection.
+    (tfamlist, tsnamelist, tconlist, tcongrouplist,
+     sfamlist, ssnamelist, sconlist) = searchlists
+    # run the systems    
+    for phase in lmd_pipeline:
+        try:
+            with METRICS.step(phase, items=len(jdata['sentences'])):
+                if phase == 'LMS':
+                    logging.info('starting LMS phase...')
+                    jdata = runLMS(cmdline, jdata)
+                elif phase == 'LMS2':
+                    logging.info('starting LMS2 phase...')
+                    jdata = runLMS2(cmdline, jdata)
+                elif phase == 'SCMS':
+                    logging.info('starting SCMS phase ...')
+                    jdata = runSCMS(cmdline, jdata, logger)
+                elif phase == 'CMS':
+                    logging.info('starting CMS phase ...')
+                    jdata = runCMS(cmdline, config, jdata, metanetrep, cnmapper, 
+                                   tfamlist, tsnamelist, tconlist, tcongrouplist,
+                                   sfamlist, ssnamelist, sconlist)
+                elif phase == 'CNMS':
+                    logging.info('starting CNMS phase ...')
+                    jdata = runCNMS(cmdline, config, jdata, cnmapper)
+                elif phase == 'DIS':
+                    logging.info('start DIS phase ...')
+                    jdata = runDIS(cmdline, jdata)
+                elif phase == 'PRE':
+                    logging.info('start PRE phase ...')
+                    jdata = runPRE(cmdline, jdata)
+                elif phase == 'SBS':
+                    logging.info('start SBS phase ...')
+                    jdata = runSBS(cmdline, config, jdata, runParser=sbsParser)
+        except:
+            METRICS.count('errors.%s' % phase)
+            logging.error("Error running phase %s:\n%s", phase,
+                          traceback.format_exc())    
+    if cnmapper:
+        cnmapper.mapcache.flush()
+        cnmapper.mapcache.logStats()
+    return jdata
+
+def runShardInstance((start, end)):
+    """Run the LM detection phases on the sentences [start:end] of the document
+    in SHARDSTATE.  This is intended to be run via :py:mod:`multiprocessing`, in
+    a process forked after SHARDSTATE was set, so that the repository state
+    is inherited rather than rebuilt.  Sentence indices are made relative to
+    the shard while the phases run, and restored afterwards.
+    
+    :returns: tuple of top level fields, sentences, aggregated LMs (or None),
+              and the step metrics and profile of the shard
     """
-    global CHUNKSIZE
-    # ------------------------------------------------------------------- #
-    # INITIALIZATION
-    
-    m4test = ix.IARPATestCommand('metad',
-                                 'Linguistic Metaphor Detection System.  Finds LMs in IARPA XML TestItems, '\
-                                 'or sentences given in MetaNet\'s JSON format.')
+    (lmd_pipeline, cmdline, config, jdata, logger, metanetrep, cnmapper, searchlists,
+     sbsParser) = SHARDSTATE
+    shard = dict((k, v) for k, v in jdata.iteritems() if k not in ('sentences', 'lmlist'))
+    shard['sentences'] = jdata['sentences'][start:end]
+    for sent in shard['sentences']:
+        sent['idx'] -= start
+    logging.info('running shard with sentences %d to %d', start, end - 1)
+    METRICS.reset()
+    profiler = None
+    if cmdline.profile:
+        profiler = SamplingProfiler(cmdline.profileinterval)
+        profiler.start()
+    shard = runPhases(lmd_pipeline, cmdline, config, shard, logger,
+                      metanetrep, cnmapper, searchlists, sbsParser)
+    metrics = METRICS.stats()
+    if profiler:
+        profiler.stop()
+        metrics['profile'] = profiler.stats()
+    for sent in shard['sentences']:
+        sent['idx'] += start
+    sentences = shard.pop('sentences')
+    lmlist = shard.pop('lmlist', None)
+    return shard, sentences, lmlist, metrics
 
-    # add some custom cmdline parameters
-    aparser = m4test.getArgParser()
+def runShards(lmd_pipeline, cmdline, config, jdata, logger, metanetrep, cnmapper, searchlists,
+              sbsParser=None):
+    """Run the LM detection phases on a document whose sentences are split into
+    contiguous shards, processed in parallel by forked workers.  The results are
+    merged back in sentence order, so the output is the same as that of
+    :py:func:`runPhases` on the whole document.
+    
+    Sharding requires that each sentence's idx be its position in the document,
+    since the phases use idx to locate sentences; otherwise, the document is
+    processed as a whole.  Decisions that depend on the document, such as
+    sbsParser, have to be made before sharding.  Top level fields that the
+    phases add or change are taken from the first shard that has them.
+    """
+    global SHARDSTATE
+    sentences = jdata['sentences']
+    nshards = min(cmdline.shards, len(sentences))
+    wellformed = all(sent.get('idx') == i for i, sent in enumerate(sentences))
+    if (nshards < 2) or (not wellformed) or (not sentences[0].get('id')):
+        logging.info('not sharding: %d sentences, well-formed indices: %s',
+                     len(sentences), wellformed)
+        return runPhases(lmd_pipeline, cmdline, config, jdata, logger,
+                         metanetrep, cnmapper, searchlists, sbsParser)
+    bounds = [len(sentences) * k / nshards for k in range(nshards + 1)]
+    shards = zip(bounds[:-1], bounds[1:])
+    logging.info('running pipeline on %d shards', nshards)
+    SHARDSTATE = (lmd_pipeline, cmdline, config, jdata, logger, metanetrep, cnmapper, searchlists,
+                  sbsParser)
+    pool = Pool(nshards)
+    try:
+        results = pool.map(runShardInstance, shards, CHUNKSIZE)
+    finally:
+        pool.close()
+        pool.join()
+        SHARDSTATE = None
+    merged = dict((k, v) for k, v in jdata.iteritems() if k not in ('sentences', 'lmlist'))
+    changed = set()
+    merged['sentences'] = []
+    lmlist = jdata.get('lmlist')
+    for shard, shardsents, shardlms, metrics in results:
+        for k, v in shard.iteritems():
+            if (k not in changed) and ((k not in merged) or (merged[k] != v)):
+                merged[k] = v
+                changed.add(k)
+        merged['sentences'].extend(shardsents)
+        METRICS.merge(metrics)
+        if PROFILER and metrics.get('profile'):
+            PROFILER.merge(metrics['profile'])
+        if shardlms is not None:
+            if lmlist is None:
+                lmlist = []
+            lmlist.extend(shardlms)
+    if lmlist is not None:
+        merged['lmlist'] = lmlist
+    return merged
+    
+def addArguments(aparser):
+    """Add the m4detect command line parameters to an argument parser.  These
+    are shared with the benchmark harness (:py:mod:`iarpatests.m4bench`).
+    
+    :param aparser: argument parser
+    :type aparser: :py:class:`argparse.ArgumentParser`
+    
+    """
     aparser.add_argument("-c", "--cxns", help="Run only these cxns (comma separated)")
     aparser.add_argument("-e", "--engine", help="Querying engine (CMS).  Options are"\
                          " (rdflib, redland, sesame)."\
@@ -660,6 +890,22 @@ def main():
                          help="Run detection jobs in parallel."\
                          "Note that in this mode, the input file is interpreted"\
                          " as containing a list of JSON input files to process.")
+    aparser.add_argument("--shards", type=int, default=0,
+                         help="Split the sentences of the input file into this many"\
+                         " shards, and run the detection phases on them in parallel."\
+                         " Run with --cms-genwcache-only first, so that the CMS"\
+                         " search word cache is not generated concurrently.")
+    aparser.add_argument("--metrics", action="store_true",
+                         help="Write the time spent in each phase and step to"\
+                         " <outfilename>.metrics.json.")
+    aparser.add_argument("--profile", action="store_true",
+                         help="Sample the Python call stack while running, and add the"\
+                         " functions the most time is spent in to the metrics file."\
+                         " The stacks are written to <outfilename>.profile.folded,"\
+                         " for flame graph tools.  Implies --metrics.")
+    aparser.add_argument("--profile-interval", dest="profileinterval", type=float,
+                         default=0.005,
+                         help="Profiler sampling interval, in seconds of CPU time.")
     aparser.add_argument("--pos", help="Override default POS field name ('pos')",
                          default="pos")
     aparser.add_argument("--disable-gmr-mapping", dest="nogmrmapping", action="store_true",
@@ -672,6 +918,21 @@ def main():
                          help="For non-English languages, this option allows frame and "\
                          "frame families names to be given in English.  Translation is "\
                          "accomplished via Interwiki links.")
+
+def main():
+    """
+    Runs linguistic metaphor detection.
+    """
+    global CHUNKSIZE
+    # ------------------------------------------------------------------- #
+    # INITIALIZATION
+    
+    m4test = ix.IARPATestCommand('metad',
+                                 'Linguistic Metaphor Detection System.  Finds LMs in IARPA XML TestItems, '\
+                                 'or sentences given in MetaNet\'s JSON format.')
+
+    # add some custom cmdline parameters
+    addArguments(m4test.getArgParser())
     
     cmdline, config = m4test.parseCmdLineConfig('m4detect')
     cmdline.allcxns = True
@@ -683,6 +944,9 @@ def main():
         if cmdline.cmsgenwcacheonly:
             logging.error('Options --parallel and --cms-genwcache-only are not compatible')
             raise
+        if cmdline.shards > 1:
+            logging.error('Options --parallel and --shards are not compatible')
+            raise
         cmdline.json = True
         # PARALLEL MODE
         poolitems = []
@@ -702,7 +966,9 @@ def main():
     
     # -------------------------------------------------------------------- #
     # SINGLE-PROCESS MODE: NOT PARALLEL
-    jdata = m4test.getJSON()
+    startInstrumentation(cmdline)
+    with METRICS.step('json.load'):
+        jdata = m4test.getJSON()
     lang = jdata['lang']
     
     # ------------------------------------------------------------------- #
@@ -744,7 +1010,9 @@ def main():
     
     # ------------------------------------------------------------------- #
     # OUTPUT FILE GENERATION
-    m4test.writeOutput(jdata)
+    with METRICS.step('json.write', items=len(jdata['sentences'])):
+        m4test.writeOutput(jdata)
+    writeInstrumentation(cmdline, cmdline.infilename, cmdline.outfilename, jdata)
         
 if __name__ == "__main__":
     status = main()
@@ -160,6 +160,8 @@ def main():
         out_jdata = in_jdata
 
     currentTestItem = ''
+    # DSMS lookups: (source, (verb, relation)) and (source, (verb, noun))
+    assigns, gassigns = [], []
     parser_name = parserdesc(lang).name
     # XXX makes no sense!
 #     for in_sent, parsed_sent, in_sent in zip(in_sentences, out_jdata['sentences'], in_jdata['sentences']):
@@ -223,25 +225,31 @@ def main():
                     target_l, source_l, _r = found_lms[0]
                     target['rlemma'] = target_l
                     source['rlemma'] = source_l
+                    # looked up below, together with those of the other LMs
                     if _r != '-':
                         r = _r.split('.')[0] if '.' in _r else _r
-                        dimensions = mapping.assign2(source_l, r)
+                        assigns.append((source, (source_l, r)))
                     else:
-                        dimensions = mapping.gassign(source_l, target_l)
-                        
-                    scon = dimensions[0].upper() if dimensions else None
+                        gassigns.append((source, (source_l, target_l)))
                 else:
-                    scon = None
                     target_l = target['lemma'] if 'lemma' in target else target['form']
                     source_l = source['lemma'] if 'lemma' in source else source['form']
 #                     dd = ', '.join(' '.join(d) for d in deprels(words))
 #                     log('could not find %s - %s in %s' % (target_f, source_f, dd))
-                source['concept'] = scon+dsmsScoreStr if scon else 'NONE'
-                if scon:
-                    if source.get('extractor'):
-                        source['extractor'] += ':DSMS'
-                    else:
-                        source['extractor'] = 'DSMS'
+                    source['concept'] = 'NONE'
+
+    # DSMS source concepts, from the relation frequencies of all the LMs at once
+    if assigns or gassigns:
+        dimensions = (mapping.assign_many(p for _, p in assigns) +
+                      mapping.gassign_many(p for _, p in gassigns))
+        for (source, _), dims in zip(assigns + gassigns, dimensions):
+            scon = dims[0].upper() if dims else None
+            source['concept'] = scon+dsmsScoreStr if scon else 'NONE'
+            if scon:
+                if source.get('extractor'):
+                    source['extractor'] += ':DSMS'
+                else:
+                    source['extractor'] = 'DSMS'
 
     # ------------------------------------------------------------------- #
     # OUTPUT FILE GENERATION
@@ -0,0 +1,558 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. module:: synthcorpus
+   :platform: Unix
+   :synopsis: Synthetic MetaNet JSON corpora, with stub POS taggers and dependency parsers
+
+Generates corpora of any size in the MetaNet JSON format for English, Spanish,
+Russian and Persian, for benchmarking the extraction pipeline (see
+:py:mod:`iarpatests.m4bench`).  Sentences are built from clauses (subject,
+verb, object, and optional modifiers and prepositional phrases) in the word
+order of the language, with words sampled from a :py:class:`Vocabulary`.
+The vocabulary has a small built-in word list per language, and can be
+extended from tagged MetaNet JSON files (whose lemma and POS frequencies
+are then sampled from), from word lists, and from cxn pattern files (whose
+dependency relations are then planted between nouns and verbs).
+
+Along with the corpus, the generator returns the tagging and dependency
+parse of each sentence.  :py:class:`StubTagger`, :py:class:`StubPersianTagger`,
+:py:class:`StubLMSTagger` and :py:class:`StubParser` serve these in place of
+TreeTagger, the Persian taggers and the dependency parsers, in the formats
+those produce, so that the pipeline can run without them.  Dependency labels
+follow the label set of the parser of each language.  Example::
+
+    python synthcorpus.py -l en -n 10000 corpus.json
+
+writes corpus.json and its annotations, corpus.gold.json.
+
+"""
+import sys, re, random, bisect, codecs, argparse, logging
+from mnformats import mnjson
+
+# per language: word order, word classes (by POS tag regexp), default tag of
+# each class, dependency labels, and a built-in word list of (form, lemma, tag)
+LANGS = {
+    'en': {'order': 'SVO',
+           'adjafter': False,
+           'classes': [('N', u'^N'), ('V', u'^V'), ('A', u'^J'), ('D', u'^DT'), ('P', u'^IN')],
+           'tags': {'N': u'NN', 'V': u'VV', 'A': u'JJ', 'D': u'DT', 'P': u'IN'},
+           'labels': {'subj': u'ncsubj', 'obj': u'dobj', 'det': u'det', 'mod': u'ncmod',
+                      'prep': u'ncmod', 'pobj': u'dobj', 'conj': u'conj', 'punct': None},
+           'conj': (u'and', u'and', u'CC'),
+           'stop': (u'.', u'.', u'SENT'),
+           'comma': (u',', u',', u','),
+           'words': {
+               'N': [(u'tax', u'tax', u'NN'), (u'taxes', u'tax', u'NNS'),
+                     (u'poverty', u'poverty', u'NN'), (u'wealth', u'wealth', u'NN'),
+                     (u'government', u'government', u'NN'), (u'crime', u'crime', u'NN'),
+                     (u'economy', u'economy', u'NN'), (u'burden', u'burden', u'NN'),
+                     (u'people', u'people', u'NNS'), (u'bureaucracy', u'bureaucracy', u'NN'),
+                     (u'democracy', u'democracy', u'NN'), (u'election', u'election', u'NN'),
+                     (u'money', u'money', u'NN'), (u'families', u'family', u'NNS'),
+                     (u'war', u'war', u'NN'), (u'jobs', u'job', u'NNS')],
+               'V': [(u'raises', u'raise', u'VVZ'), (u'cut', u'cut', u'VVD'),
+                     (u'fights', u'fight', u'VVZ'), (u'grows', u'grow', u'VVZ'),
+                     (u'attacked', u'attack', u'VVD'), (u'carry', u'carry', u'VVP'),
+                     (u'kills', u'kill', u'VVZ'), (u'escaped', u'escape', u'VVD'),
+                     (u'builds', u'build', u'VVZ'), (u'crushes', u'crush', u'VVZ')],
+               'A': [(u'heavy', u'heavy', u'JJ'), (u'rich', u'rich', u'JJ'),
+                     (u'poor', u'poor', u'JJ'), (u'big', u'big', u'JJ'),
+                     (u'crippling', u'crippling', u'JJ')],
+               'D': [(u'the', u'the', u'DT'), (u'a', u'a', u'DT'), (u'this', u'this', u'DT')],
+               'P': [(u'of', u'of', u'IN'), (u'in', u'in', u'IN'), (u'on', u'on', u'IN'),
+                     (u'from', u'from', u'IN')]}},
+    'es': {'order': 'SVO',
+           'adjafter': True,
+           'classes': [('N', u'^N'), ('V', u'^V'), ('A', u'^ADJ'), ('D', u'^(ART|DM)'),
+                       ('P', u'^PREP')],
+           'tags': {'N': u'NC', 'V': u'VLfin', 'A': u'ADJ', 'D': u'ART', 'P': u'PREP'},
+           'labels': {'subj': u'subj', 'obj': u'dobj', 'det': u'spec', 'mod': u's.a',
+                      'prep': u'sp', 'pobj': u'comp', 'conj': u'coor', 'punct': u'f'},
+           'conj': (u'y', u'y', u'CC'),
+           'stop': (u'.', u'.', u'FS'),
+           'comma': (u',', u',', u'CM'),
+           'words': {
+               'N': [(u'impuesto', u'impuesto', u'NC'), (u'impuestos', u'impuesto', u'NC'),
+                     (u'pobreza', u'pobreza', u'NC'), (u'riqueza', u'riqueza', u'NC'),
+                     (u'gobierno', u'gobierno', u'NC'), (u'crimen', u'crimen', u'NC'),
+                     (u'economía', u'economía', u'NC'), (u'carga', u'carga', u'NC'),
+                     (u'gente', u'gente', u'NC'), (u'democracia', u'democracia', u'NC'),
+                     (u'elecciones', u'elección', u'NC'), (u'dinero', u'dinero', u'NC')],
+               'V': [(u'sube', u'subir', u'VLfin'), (u'combate', u'combatir', u'VLfin'),
+                     (u'crece', u'crecer', u'VLfin'), (u'atacó', u'atacar', u'VLfin'),
+                     (u'lleva', u'llevar', u'VLfin'), (u'mata', u'matar', u'VLfin'),
+                     (u'aplasta', u'aplastar', u'VLfin')],
+               'A': [(u'pesada', u'pesado', u'ADJ'), (u'rico', u'rico', u'ADJ'),
+                     (u'pobre', u'pobre', u'ADJ'), (u'grande', u'grande', u'ADJ')],
+               'D': [(u'el', u'el', u'ART'), (u'la', u'el', u'ART'), (u'una', u'uno', u'ART')],
+               'P': [(u'de', u'de', u'PREP'), (u'en', u'en', u'PREP'), (u'contra', u'contra', u'PREP')]}},
+    'ru': {'order': 'SVO',
+           'adjafter': False,
+           'classes': [('N', u'^N'), ('V', u'^V'), ('A', u'^A'), ('D', u'^P'), ('P', u'^S')],
+           'tags': {'N': u'Ncmsnn', 'V': u'Vmip3s-a-e', 'A': u'Afpmsnf', 'D': u'P--msna',
+                    'P': u'Sp-l'},
+           'labels': {'subj': u'предик', 'obj': u'1-компл', 'det': u'опред', 'mod': u'опред',
+                      'prep': u'обст', 'pobj': u'предл', 'conj': u'сочин', 'punct': u'PUNC'},
+           'conj': (u'и', u'и', u'C'),
+           'stop': (u'.', u'.', u'SENT'),
+           'comma': (u',', u',', u','),
+           'words': {
+               'N': [(u'налог', u'налог', u'Ncmsnn'), (u'налоги', u'налог', u'Ncmpnn'),
+                     (u'бедность', u'бедность', u'Ncfsnn'), (u'богатство', u'богатство', u'Ncnsnn'),
+                     (u'правительство', u'правительство', u'Ncnsnn'),
+                     (u'преступность', u'преступность', u'Ncfsnn'),
+                     (u'экономика', u'экономика', u'Ncfsnn'), (u'бремя', u'бремя', u'Ncnsnn'),
+                     (u'народ', u'народ', u'Ncmsny'), (u'демократия', u'демократия', u'Ncfsnn'),
+                     (u'выборы', u'выборы', u'Ncmpnn')],
+               'V': [(u'душит', u'душить', u'Vmip3s-a-e'), (u'растёт', u'расти', u'Vmip3s-a-e'),
+                     (u'убивает', u'убивать', u'Vmip3s-a-e'), (u'несёт', u'нести', u'Vmip3s-a-e'),
+                     (u'побеждает', u'побеждать', u'Vmip3s-a-e')],
+               'A': [(u'тяжёлый', u'тяжёлый', u'Afpmsnf'), (u'большой', u'большой', u'Afpmsnf'),
+                     (u'бедный', u'бедный', u'Afpmsnf')],
+               'D': [(u'этот', u'этот', u'P--msna'), (u'наш', u'наш', u'P--msna')],
+               'P': [(u'в', u'в', u'Sp-l'), (u'на', u'на', u'Sp-a'), (u'для', u'для', u'Sp-g')]}},
+    'fa': {'order': 'SOV',
+           'adjafter': True,
+           'classes': [('N', u'^N'), ('V', u'^V'), ('A', u'^ADJ'), ('D', u'^DET'), ('P', u'^P$')],
+           'tags': {'N': u'N', 'V': u'V', 'A': u'ADJ', 'D': u'DET', 'P': u'P'},
+           'labels': {'subj': u'SBJ', 'obj': u'OBJ', 'det': u'NPREMOD', 'mod': u'NPOSTMOD',
+                      'prep': u'VPP', 'pobj': u'POSDEP', 'conj': u'VCONJ', 'punct': u'PUNC'},
+           'conj': (u'و', u'و', u'CONJ'),
+           'stop': (u'.', u'.', u'DELM'),
+           'comma': (u'،', u'،', u'DELM'),
+           'words': {
+               'N': [(u'مالیات', u'مالیات', u'N'), (u'فقر', u'فقر', u'N'), (u'ثروت', u'ثروت', u'N'),
+                     (u'دولت', u'دولت', u'N'), (u'جرم', u'جرم', u'N'), (u'اقتصاد', u'اقتصاد', u'N'),
+                     (u'مردم', u'مردم', u'N'), (u'بار', u'بار', u'N'), (u'انتخابات', u'انتخابات', u'N')],
+               'V': [(u'گرفت', u'گرفتن', u'V'), (u'کشت', u'کشتن', u'V'), (u'برد', u'بردن', u'V'),
+                     (u'ساخت', u'ساختن', u'V'), (u'شکست', u'شکستن', u'V')],
+               'A': [(u'سنگین', u'سنگین', u'ADJ'), (u'بزرگ', u'بزرگ', u'ADJ'), (u'فقیر', u'فقیر', u'ADJ')],
+               'D': [(u'این', u'این', u'DET'), (u'آن', u'آن', u'DET')],
+               'P': [(u'از', u'از', u'P'), (u'به', u'به', u'P'), (u'در', u'در', u'P')]}},
+}
+
+# predicates of cxn queries that are not dependency relations
+CXN_STRUCTURAL = set([u'hasIdx', u'hasLemma', u'hasPOS', u'hasForm', u'inSentence', u'type'])
+cxnRelationRe = re.compile(ur'\?(\w+)\s+doc:(\w+)\s+\?(\w+)', flags=re.U)
+
+class _Sampler:
+    """ Weighted sampling from a list of items.
+    """
+    def __init__(self, items, weights):
+        self.items = items
+        self.cumulative = []
+        total = 0.0
+        for weight in weights:
+            total += weight
+            self.cumulative.append(total)
+        self.total = total
+
+    def sample(self, rand):
+        return self.items[bisect.bisect_right(self.cumulative, rand.random() * self.total)]
+
+class Vocabulary:
+    """ Words of a language by class (N, V, A, D, P), with sampling weights,
+    and the dependency relations planted by cxn patterns.
+    """
+    def __init__(self, lang):
+        """
+        :param lang: language
+        :type lang: str
+        """
+        self.logger = logging.getLogger(__name__)
+        self.lang = lang
+        self.spec = LANGS[lang]
+        self.classre = [(cls, re.compile(regexp, flags=re.U)) for cls, regexp in self.spec['classes']]
+        # class -> (form, lemma, tag) -> weight
+        self.weights = dict((cls, {}) for cls, regexp in self.spec['classes'])
+        self.cxnlabels = []
+        self.samplers = None
+
+    def wordClass(self, tag):
+        """ Return the class of a POS tag, or None.
+        """
+        for cls, regexp in self.classre:
+            if regexp.match(tag):
+                return cls
+        return None
+
+    def add(self, cls, form, lemma, tag, weight=1.0):
+        entry = (form, lemma, tag)
+        self.weights[cls][entry] = self.weights[cls].get(entry, 0.0) + weight
+        self.samplers = None
+
+    def addJSON(self, fname):
+        """ Add the tagged words of a MetaNet JSON file, weighted by frequency.
+        """
+        jdata = mnjson.loadfile(fname)
+        nwords = 0
+        for sent in jdata['sentences']:
+            for w in sent.get('word', []):
+                if not (w.get('form') and w.get('lem') and w.get('pos')):
+                    continue
+                cls = self.wordClass(w['pos'])
+                if cls:
+                    self.add(cls, w['form'], w['lem'], w['pos'])
+                    nwords += 1
+        self.logger.info('added %d tagged words from %s', nwords, fname)
+
+    def addWordList(self, fname):
+        """ Add words from a list with one word per line, either as
+        lemma.pos (e.g. tax.n, raise.v, heavy.a), or as form, lemma and tag
+        separated by tabs.  Words are weighted by rank (Zipf's law).
+        """
+        posclasses = {'n': 'N', 'v': 'V', 'a': 'A', 'adj': 'A', 'prep': 'P'}
+        rank = 0
+        with codecs.open(fname, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if (not line) or line.startswith('#'):
+                    continue
+                fields = line.split(u'\t')
+                if len(fields) >= 3:
+                    form, lemma, tag = fields[:3]
+                    cls = self.wordClass(tag)
+                else:
+                    lemma, _, pos = fields[0].rpartition(u'.')
+                    if not lemma:
+                        lemma, pos = pos, u'n'
+                    cls = posclasses.get(pos.lower())
+                    form = lemma.replace(u'_', u' ')
+                    tag = self.spec['tags'].get(cls)
+                if cls:
+                    rank += 1
+                    self.add(cls, form, lemma, tag, 1.0 / rank)
+        self.logger.info('added %d words from %s', rank, fname)
+
+    def addCxnPatterns(self, fname):
+        """ Add the dependency relations between targets and sources of the
+        cxn patterns in a cxn query file.
+        """
+        with codecs.open(fname, encoding='utf-8') as f:
+            for dependent, label, head in cxnRelationRe.findall(f.read()):
+                if label in CXN_STRUCTURAL:
+                    continue
+                if set([dependent, head]) == set([u'target', u'source']):
+                    self.cxnlabels.append(label)
+        self.logger.info('%d cxn relations in %s: %s', len(self.cxnlabels), fname,
+                         u', '.join(sorted(set(self.cxnlabels))))
+
+    def sampler(self, cls):
+        if self.samplers is None:
+            self.samplers = {}
+            for c, words in self.weights.iteritems():
+                if words:
+                    entries = sorted(words)
+                    self.samplers[c] = _Sampler(entries, [words[e] for e in entries])
+                else:
+                    # built-in words, weighted by rank
+                    entries = self.spec['words'][c]
+                    self.samplers[c] = _Sampler(entries, [1.0 / (r + 1) for r in range(len(entries))])
+        return self.samplers[cls]
+
+    def lookup(self):
+        """ Return a dict from form to (lemma, tag), for all words.
+        """
+        table = {}
+        for cls, regexp in self.spec['classes']:
+            for form, lemma, tag in self.sampler(cls).items:
+                table.setdefault(form, (lemma, tag))
+        for form, lemma, tag in [self.spec['conj'], self.spec['stop'], self.spec['comma']]:
+            table.setdefault(form, (lemma, tag))
+        return table
+
+class SentenceGenerator:
+    """ Generates sentences with their tagging and dependency parse.
+    """
+    def __init__(self, vocab, seed=0, cxnrate=0.3):
+        """
+        :param vocab: vocabulary
+        :type vocab: :py:class:`Vocabulary`
+        :param seed: random seed
+        :type seed: int
+        :param cxnrate: share of noun to verb relations labeled by cxn patterns
+        :type cxnrate: float
+        """
+        self.vocab = vocab
+        self.spec = vocab.spec
+        self.rand = random.Random(seed)
+        self.cxnrate = cxnrate
+
+    def _word(self, words, entry, role=None, head=None):
+        """ Append a word, and return its index.
+        """
+        form, lemma, tag = entry
+        words.append({'form': form, 'lem': lemma, 'pos': tag, 'role': role, 'head': head})
+        return len(words) - 1
+
+    def _nounPhrase(self, words, role, head):
+        """ Append a noun phrase depending on head, and return the index of the noun.
+        """
+        rand = self.rand
+        vocab = self.vocab
+        det = vocab.sampler('D').sample(rand) if rand.random() < 0.6 else None
+        adj = vocab.sampler('A').sample(rand) if rand.random() < 0.3 else None
+        noun = vocab.sampler('N').sample(rand)
+        parts = []
+        if det:
+            parts.append(('det', det))
+        if adj and not self.spec['adjafter']:
+            parts.append(('mod', adj))
+        parts.append((role, noun))
+        if adj and self.spec['adjafter']:
+            parts.append(('mod', adj))
+        first = len(words)
+        nidx = first + [r for r, e in parts].index(role)
+        for i, (r, entry) in enumerate(parts):
+            self._word(words, entry, r, head if r == role else nidx)
+        return nidx
+
+    def _clause(self, words, head):
+        """ Append a clause headed by a verb, which depends on head (None
+        for the root), and return the index of the verb.
+        """
+        rand = self.rand
+        vocab = self.vocab
+        verb = vocab.sampler('V').sample(rand)
+        objlabel = 'obj'
+        if self.vocab.cxnlabels and (rand.random() < self.cxnrate):
+            objlabel = rand.choice(self.vocab.cxnlabels)
+        # the noun phrases point at the verb, whose position is only known
+        # once they are placed: use a placeholder and patch it
+        placeholder = -1
+        start = len(words)
+        if self.spec['order'] == 'SVO':
+            self._nounPhrase(words, 'subj', placeholder)
+            vidx = self._word(words, verb, 'conj' if head is not None else None, head)
+            self._nounPhrase(words, objlabel, placeholder)
+        else:
+            self._nounPhrase(words, 'subj', placeholder)
+            self._nounPhrase(words, objlabel, placeholder)
+            vidx = None
+        if rand.random() < 0.4:
+            pidx = self._word(words, vocab.sampler('P').sample(rand), 'prep', placeholder)
+            self._nounPhrase(words, 'pobj', pidx)
+        if vidx is None:
+            vidx = self._word(words, verb, 'conj' if head is not None else None, head)
+        for w in words[start:]:
+            if w['head'] == placeholder:
+                w['head'] = vidx
+        return vidx
+
+    def sentence(self, length):
+        """ Generate a sentence of at least length words.  Returns the text and
+        the list of words, each with form, lem, pos, idx, n, start, end, and
+        dep (a dict with the type, and the n of the head).
+        """
+        words = []
+        root = self._clause(words, None)
+        while len(words) < length:
+            self._word(words, self.spec['comma'], 'punct', root)
+            self._word(words, self.spec['conj'], 'conj', root)
+            self._clause(words, root)
+        self._word(words, self.spec['stop'], 'punct', root)
+        labels = self.spec['labels']
+        pieces = []
+        pos = 0
+        for idx, w in enumerate(words):
+            if pieces and w['form'] not in (self.spec['comma'][0], self.spec['stop'][0]):
+                pieces.append(u' ')
+                pos += 1
+            w['idx'] = idx
+            w['n'] = idx + 1
+            w['start'] = pos
+            pieces.append(w['form'])
+            pos += len(w['form'])
+            w['end'] = pos
+            role = w.pop('role')
+            head = w.pop('head')
+            label = labels.get(role, role)
+            if (head is not None) and label:
+                w['dep'] = {'type': label, 'head': head + 1}
+        return u''.join(pieces), words
+
+def generateCorpus(vocab, nsents, length=20, seed=0, name=u'synthetic'):
+    """ Generate a corpus of nsents sentences of about length words.  Returns
+    the MetaNet JSON data (with the sentence texts only) and the annotations:
+    a list with the text and words of each sentence.
+
+    :param vocab: vocabulary
+    :type vocab: :py:class:`Vocabulary`
+    :param nsents: number of sentences
+    :type nsents: int
+    :param length: mean sentence length in words
+    :type length: int
+    :param seed: random seed
+    :type seed: int
+    """
+    gen = SentenceGenerator(vocab, seed)
+    rand = random.Random(seed + 1)
+    docname = u'%s_%s_%d' % (name, vocab.lang, seed)
+    sentences = []
+    gold = []
+    for i in xrange(nsents):
+        text, words = gen.sentence(rand.randint(max(1, length / 2), max(1, length * 3 / 2)))
+        sentences.append(mnjson.getJSONSentence(u'%s:%d' % (docname, i + 1), i, text))
+        gold.append({'text': text, 'word': words})
+    doc = mnjson.getJSONDocumentHeader(name=docname, corp=name,
+                                       desc=u'Synthetic corpus for benchmarking',
+                                       prov=docname, type=u'synthetic', size=nsents,
+                                       lang=vocab.lang)
+    return mnjson.getJSONRoot(vocab.lang, docs=[doc], sents=sentences), gold
+
+class _GoldIndex:
+    """ Annotated words of the generated sentences, by text.  Sentences that
+    are not in the index are tokenized at whitespace, and tagged by lookup
+    in the vocabulary.
+    """
+    def __init__(self, lang, gold, vocab=None):
+        self.lang = lang
+        self.bytext = dict((g['text'].strip(), g['word']) for g in gold)
+        self.lookup = vocab.lookup() if vocab else {}
+
+    def words(self, text):
+        text = text.strip()
+        if text in self.bytext:
+            return self.bytext[text]
+        words = []
+        pos = 0
+        for idx, form in enumerate(text.split()):
+            start = text.find(form, pos)
+            pos = start + len(form)
+            lemma, tag = self.lookup.get(form, (form.lower(), u'X'))
+            words.append({'form': form, 'lem': lemma, 'pos': tag, 'idx': idx, 'n': idx + 1,
+                          'start': start, 'end': pos})
+            if idx > 0:
+                words[-1]['dep'] = {'type': u'dep', 'head': idx}
+        return words
+
+class StubTagger(_GoldIndex):
+    """ Stands in for :py:class:`mnformats.mnjson.MNTreeTagger`.
+    """
+    def cleanText(self, sentences):
+        for sent in sentences:
+            sent['ctext'] = sent['text'].strip()
+
+    def run(self, sentences):
+        for sent in sentences:
+            if not sent['text']:
+                continue
+            sent['word'] = [{'idx': w['idx'], 'form': w['form'], 'pos': w['pos'],
+                             'lem': w['lem'], 'start': w['start'], 'end': w['end'],
+                             'n': str(w['n'])}
+                            for w in self.words(sent.get('ctext') or sent['text'])]
+
+class StubPersianTagger(_GoldIndex):
+    """ Stands in for :py:class:`mnpipeline.persiantagger.PersianPOSTagger`.
+    """
+    def cleanText(self, text):
+        return text.strip()
+
+    def run_hmm_tagger(self, ctext):
+        return [(w['form'], w['pos'], w['lem']) for w in self.words(ctext)]
+
+    def getWordList(self, text, ctext, tags, pfield='pos', lfield='lem'):
+        words = []
+        pos = 0
+        for idx, (form, tag, lemma) in enumerate(tags):
+            start = text.find(form, pos)
+            if start >= 0:
+                pos = start + len(form)
+            words.append({'idx': idx, 'n': str(idx + 1), 'form': form, pfield: tag,
+                          lfield: lemma, 'start': start, 'end': pos})
+        return words
+
+class StubLMSTagger:
+    """ Stands in for :py:class:`lmsextractor.persiantagger.PersianPOSTagger`,
+    which tags in 'word/TAG' format, with the words of another stub.
+    """
+    def __init__(self, index):
+        self.index = index
+
+    def cleanText(self, text):
+        return text.strip()
+
+    def run_hmm_tagger(self, ctext):
+        return [u'%s/%s' % (w['form'], w['pos']) for w in self.index.words(ctext)]
+
+    def run_hmm_tagger_batch(self, ctexts):
+        return [self.run_hmm_tagger(ctext) for ctext in ctexts]
+
+class StubParser(_GoldIndex):
+    """ Stands in for :py:func:`depparsing.dep2json.parse`.
+    """
+    def parse(self, lang, sentences):
+        """ Return the parse of sentences, in the format of
+        :py:func:`depparsing.dep2json.parse`.
+        """
+        out = []
+        for i, text in enumerate(sentences):
+            words = []
+            for w in self.words(text):
+                pw = {'idx': w['idx'], 'n': w['n'], 'form': w['form'], 'lem': w['lem'],
+                      'pos': w['pos'], 'start': w['start'], 'end': w['end']}
+                if 'dep' in w:
+                    pw['dep'] = dict(w['dep'])
+                words.append(pw)
+            out.append({'idx': i, 'ctext': text, 'word': words})
+        return {'lang': lang, 'sentences': out}
+
+def stubs(lang, gold, vocab=None):
+    """ Return the stub tagger and parser for the annotations of a generated
+    corpus (see :py:func:`generateCorpus`).
+    """
+    if lang == 'fa':
+        tagger = StubPersianTagger(lang, gold, vocab)
+    else:
+        tagger = StubTagger(lang, gold, vocab)
+    return tagger, StubParser(lang, gold, vocab)
+
+def goldFileName(fname):
+    """ Return the name of the annotation file of a corpus file.
+    """
+    base = fname[:-3] if fname.endswith('.gz') else fname
+    if base.endswith('.json'):
+        base = base[:-5]
+    return base + '.gold.json'
+
+def makeVocabulary(lang, jsonfiles=(), wordlists=(), cxnfiles=()):
+    """ Return the vocabulary of a language, extended from the given files.
+    """
+    vocab = Vocabulary(lang)
+    for fname in jsonfiles:
+        vocab.addJSON(fname)
+    for fname in wordlists:
+        vocab.addWordList(fname)
+    for fname in cxnfiles:
+        vocab.addCxnPatterns(fname)
+    return vocab
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic MetaNet JSON corpus")
+    parser.add_argument('outfilename', help='Output JSON file')
+    parser.add_argument('-l', '--lang', default='en', choices=sorted(LANGS),
+                        help='Language')
+    parser.add_argument('-n', '--sentences', type=int, default=1000,
+                        help='Number of sentences')
+    parser.add_argument('-w', '--words', type=int, default=20,
+                        help='Mean sentence length in words')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    parser.add_argument('--vocab-json', dest='vocabjson', action='append', default=[],
+                        help='Tagged MetaNet JSON file to sample words from (may be repeated)')
+    parser.add_argument('--wordlist', action='append', default=[],
+                        help='Word list to sample words from (may be repeated)')
+    parser.add_argument('--cxn-patterns', dest='cxnpatterns', action='append', default=[],
+                        help='Cxn query file whose relations are planted (may be repeated)')
+    cmdline = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    vocab = makeVocabulary(cmdline.lang, cmdline.vocabjson, cmdline.wordlist,
+                           cmdline.cxnpatterns)
+    jdata, gold = generateCorpus(vocab, cmdline.sentences, cmdline.words, cmdline.seed)
+    mnjson.writefile(cmdline.outfilename, jdata)
+    mnjson.writefile(goldFileName(cmdline.outfilename), gold)
+    return 0
+
+if __name__ == "__main__":
+    status = main()
+    sys.exit(status)
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+from unittest import TestCase, TestSuite, makeSuite, main, skipIf
+from StringIO import StringIO
+import os, sys, codecs, shutil, tempfile, argparse
+
+try:
+    import openpyxl
+except ImportError:
+    # m4detect needs it
+    openpyxl = None
+
+if openpyxl:
+    from iarpatests import m4bench, synthcorpus
+    from mnformats.mnconfig import MetaNetConfigParser
+
+SCMS_FILES = (('wordlists/en/target.ei', u'poverty\tPOVERTY\n'),
+              ('wordlists/en/source.ei', u'disease\tPOVERTY\n'),
+              ('cxns/en/cxns.ei', u'@T@ @W@:5 @S@\n'))
+
+# the tagger and language models of the LMS, empty
+LMS_FILES = ('bigramProb.txt', 'lexProb.txt', 'cleanTextCorp-UPEC-PerTB.trigram',
+             'cleanTextCorp-UPEC-PerTB.bigrams', 'cleanTextCorp-UPEC-PerTB.unigrams.sortCleaned',
+             'tgtLexExt3.txt', 'srcLexExt3.txt')
+
+@skipIf(openpyxl is None, 'openpyxl is not installed')
+class M4BenchTest(TestCase):
+    """ Runs the benchmark on a small synthetic corpus, with the stubs.
+    """
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        for path, text in SCMS_FILES:
+            fname = os.path.join(self.dir, 'ext', path)
+            if not os.path.isdir(os.path.dirname(fname)):
+                os.makedirs(os.path.dirname(fname))
+            with codecs.open(fname, 'w', 'utf-8') as f:
+                f.write(text)
+        os.mkdir(os.path.join(self.dir, 'lms'))
+        for fname in LMS_FILES:
+            open(os.path.join(self.dir, 'lms', fname), 'w').close()
+        self.configfname = os.path.join(self.dir, 'm4detect.conf')
+        with open(self.configfname, 'w') as f:
+            f.write('[m4detect]\nextractionphases.en: SCMS\nextractionphases.fa: LMS\n')
+        self.workdir = os.path.join(self.dir, 'work')
+        os.mkdir(self.workdir)
+        self.extr = m4bench.m4detect.externalExtr_v1
+        self.saved = (m4bench.m4detect.SimpleConstructionMatchingSystem.__dict__['load_tagger'],
+                      self.extr.PersianPOSTagger, self.extr.segExtractor.PersianPOSTagger,
+                      self.extr.REPDIR)
+        self.extr.REPDIR = os.path.join(self.dir, 'lms')
+        self.stdout = sys.stdout
+        sys.stdout = StringIO()
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+        m4bench.m4detect.SimpleConstructionMatchingSystem.load_tagger = self.saved[0]
+        self.extr.PersianPOSTagger, self.extr.segExtractor.PersianPOSTagger, self.extr.REPDIR = \
+            self.saved[1:]
+        shutil.rmtree(self.dir)
+
+    def cmdline(self, **kw):
+        args = dict(clearLMs=False, nogmrmapping=True, cmsgenwcacheonly=False, shards=0,
+                    extdir=os.path.join(self.dir, 'ext'), verbose=False, phases=None,
+                    nophases=False, nopipeline=False, repeat=1, words=8, seed=0)
+        args.update(kw)
+        return argparse.Namespace(**args)
+
+    def test_installStubs(self):
+        tagger, parser = synthcorpus.stubs('en', [])
+        m4bench.installStubs(tagger, parser)
+        scms = m4bench.m4detect.SimpleConstructionMatchingSystem(os.path.join(self.dir, 'ext'))
+        self.assertTrue(scms.resources.get('en', 'tagger') is tagger)
+        lmstagger = self.extr.PersianPOSTagger()
+        self.assertTrue(lmstagger.index is tagger)
+        self.assertTrue(self.extr.segExtractor.PersianPOSTagger() is lmstagger)
+
+    def bench(self, lang):
+        config = MetaNetConfigParser(self.configfname, 'm4detect')
+        vocab = synthcorpus.makeVocabulary(lang)
+        return m4bench.benchCorpus(self.cmdline(), config, self.workdir, lang, 20, vocab)
+
+    def checkRuns(self, runs, phase):
+        self.assertEqual([(run['mode'], run['phase']) for run in runs],
+                         [('phase', phase), ('pipeline', phase)])
+        for run in runs:
+            self.assertFalse(run.get('failed'))
+            self.assertEqual(run['sentences'], 20)
+            # a real tagger would fail, and log an error
+            self.assertEqual(run['errors'], 0)
+
+    def test_scms(self):
+        self.checkRuns(self.bench('en'), u'SCMS')
+
+    def test_lms(self):
+        self.checkRuns(self.bench('fa'), u'LMS')
+
+def test_suite():
+    suite = TestSuite()
+    suite.addTests(makeSuite(M4BenchTest))
+    return suite
+
+if __name__ == '__main__':
+    main(defaultTest='test_suite')
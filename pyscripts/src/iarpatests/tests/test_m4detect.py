@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+from unittest import TestCase, TestSuite, makeSuite, main, skipIf
+import os, copy, shutil, tempfile, argparse
+
+try:
+    import openpyxl
+except ImportError:
+    # m4detect needs it
+    openpyxl = None
+
+if openpyxl:
+    from iarpatests import m4detect
+    from mnformats.mnconfig import MetaNetConfigParser
+
+def document(nsents, parsed=()):
+    sentences = []
+    for i in range(nsents):
+        words = [{u'form': u'w%d' % j, u'lem': u'w%d' % j} for j in range(3)]
+        if i in parsed:
+            words[1][u'dep'] = {u'type': u'dobj', u'head': u'1'}
+        sentences.append({u'id': u'doc:%d' % (i + 1), u'idx': i,
+                          u'text': u'w0 w1 w2', u'word': words})
+    return {u'lang': u'en', u'name': u'doc', u'sentences': sentences}
+
+def stubSBS(cmdline, config, jdata, paramrec={}, runParser=None):
+    """ Records the parse decision.
+    """
+    if runParser is None:
+        runParser = m4detect.sbsNeedsParser(cmdline, config, jdata)
+    for sent in jdata['sentences']:
+        sent['lms'] = [{'name': u'lm %s' % sent['id'], 'parsed': runParser}]
+    return jdata
+
+def stubDIS(cmdline, jdata):
+    """ Adds top level fields, from some of the sentences only.
+    """
+    for sent in jdata['sentences']:
+        if sent['id'] == u'doc:5':
+            jdata['dis'] = sent['text']
+    jdata['name'] = u'doc (dis)'
+    return jdata
+
+@skipIf(openpyxl is None, 'openpyxl is not installed')
+class ShardsTest(TestCase):
+    """ Running the phases on shards of a document gives the same output as
+    running them on the whole document.
+    """
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        configfname = os.path.join(self.dir, 'm4detect.conf')
+        with open(configfname, 'w') as f:
+            f.write('[m4detect]\nextractionphases.en: SBS\n')
+        self.config = MetaNetConfigParser(configfname, 'm4detect')
+        self.saved = (m4detect.runSBS, m4detect.runDIS)
+        m4detect.runSBS = stubSBS
+        m4detect.runDIS = stubDIS
+
+    def tearDown(self):
+        m4detect.runSBS, m4detect.runDIS = self.saved
+        shutil.rmtree(self.dir)
+
+    def cmdline(self, **kw):
+        args = dict(clearLMs=False, nogmrmapping=True, cmsgenwcacheonly=False, shards=0,
+                    nodepcheck=False, profile=False)
+        args.update(kw)
+        return argparse.Namespace(**args)
+
+    def detect(self, jdata, shards):
+        jdata = m4detect.runLMDetection(copy.deepcopy(jdata), self.cmdline(shards=shards),
+                                        self.config, None, phases=['SBS', 'DIS'])
+        del jdata['start_processing_time']
+        del jdata['end_processing_time']
+        return jdata
+
+    def test_sbsNeedsParser(self):
+        cmdline = self.cmdline()
+        self.assertTrue(m4detect.sbsNeedsParser(cmdline, self.config, document(6)))
+        # any of the first sentences has parses
+        self.assertFalse(m4detect.sbsNeedsParser(cmdline, self.config, document(6, [2])))
+        self.assertTrue(m4detect.sbsNeedsParser(cmdline, self.config, document(6, [3])))
+        self.assertFalse(m4detect.sbsNeedsParser(self.cmdline(nodepcheck=True), self.config,
+                                                 document(6)))
+
+    def test_shards(self):
+        for parsed in ((), (0,), (3, 4, 5)):
+            jdata = document(6, parsed)
+            whole = self.detect(jdata, 0)
+            self.assertEqual(self.detect(jdata, 3), whole)
+            self.assertEqual([sent['lms'][0]['parsed'] for sent in whole['sentences']],
+                             [not parsed or parsed[0] > 2] * 6)
+        self.assertEqual([sent['lms'][0]['name'] for sent in whole['sentences']],
+                         [u'lm doc:%d' % i for i in range(1, 7)])
+        # fields added by the last shard are kept
+        self.assertEqual((whole['dis'], whole['name']), (u'w0 w1 w2', u'doc (dis)'))
+
+def test_suite():
+    suite = TestSuite()
+    suite.addTests(makeSuite(ShardsTest))
+    return suite
+
+if __name__ == '__main__':
+    main(defaultTest='test_suite')
@@ -216,19 +216,21 @@ class PersianMetaphorExtractor:
         probList = []
         sntCt = -1
         posLines = []
+        perSents = []
         for snt in sents:
             sntCt += 1
             txt = snt["text"]
             if txt.strip() != "":
-                perSent = persianPOSTagger.cleanText(txt).replace("/","-")
-                try:
-                    posLines += persianPOSTagger.run_hmm_tagger(perSent)
-                    posLines += ["\n"]
-                except:
-                    #print "problem pos tagging the following sentence which will be skipped"
-                    #print perSent
-                    posLines += ["NONE/NN\n"]
-                
+                perSents.append(persianPOSTagger.cleanText(txt).replace("/","-"))
+        # tag all the sentences at once
+        for posSent in persianPOSTagger.run_hmm_tagger_batch(perSents):
+            if posSent is None:
+                # problem pos tagging the sentence, which will be skipped
+                posLines += ["NONE/NN\n"]
+            else:
+                posLines += posSent
+                posLines += ["\n"]
+
 
         try:
             self.mozList = mozextract(posLines)
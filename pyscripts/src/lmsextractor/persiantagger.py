@@ -13,8 +13,12 @@ bigram probabilities are loaded by default from:
 This path can be altered via a parameter to the constructor method.
 
 """
-import codecs, logging, re, os
+import codecs, logging, re, os, sys, time, argparse
 import cPickle as pickle
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 REPDIR = '/u/metanet/extraction/persian'
 
@@ -67,6 +71,7 @@ class PersianPOSTagger:
             self.lex_prob_hash = self.load_lex_prob_cache()
         else:
             self.lex_prob_hash = self.preproc_lex_prob()
+        self.compile_model()
             
     def preproc_lex_prob(self):
         """
@@ -107,13 +112,62 @@ class PersianPOSTagger:
         * this is to be able to maintain alignment even if we end up having to skip some sentences in the tagger.
         
         """
-        import math
-    
-        tag_list = self.tag_list
-        bigram_tag_prob = self.bigram_tag_prob
-        lex_prob_hash = self.lex_prob_hash
-        
-        tag_word = []
+        word = self.split_words(text)
+        if self.lex_logprob is not None:
+            best = self.decode_batch([word])[0]
+        else:
+            best = self.decode(word)
+        return self.merge_tags(word, best)
+
+    def run_hmm_tagger_batch(self, texts, batchsize=256):
+        """
+        Tags a list of texts, decoding sentences of similar length together.
+        Returns a list with a taglist in 'word/TAG' format for each text, as
+        :py:meth:`run_hmm_tagger` would, or None for texts that could not
+        be tagged.
+
+        :param texts: texts to tag
+        :type texts: list
+        :param batchsize: maximum number of sentences decoded at once
+        :type batchsize: int
+        """
+        words = [self.split_words(text) for text in texts]
+        bests = [None] * len(words)
+        if self.lex_logprob is not None:
+            order = sorted(range(len(words)), key=lambda i: len(words[i]))
+            for bstart in range(0, len(order), batchsize):
+                batch = order[bstart:bstart+batchsize]
+                try:
+                    for i, best in zip(batch, self.decode_batch([words[i] for i in batch])):
+                        bests[i] = best
+                except Exception:
+                    # decode the sentences one by one, so that only the
+                    # bad ones are skipped
+                    for i in batch:
+                        try:
+                            bests[i] = self.decode_batch([words[i]])[0]
+                        except Exception:
+                            self.logger.debug(u'cannot tag: %s', texts[i])
+        else:
+            for i, word in enumerate(words):
+                try:
+                    bests[i] = self.decode(word)
+                except Exception:
+                    # problem pos tagging the sentence, which will be skipped
+                    self.logger.debug(u'cannot tag: %s', texts[i])
+        taglists = []
+        for word, best in zip(words, bests):
+            try:
+                taglists.append(self.merge_tags(word, best) if best is not None else None)
+            except Exception:
+                taglists.append(None)
+        return taglists
+
+    def split_words(self, text):
+        """
+        Splits the text into words, separating trailing punctuation from the
+        words
+        """
         word = text.split()
 
         # SEPARATING PUNCTUATION FROM THE PREVIOUS WORD
@@ -131,6 +185,68 @@ class PersianPOSTagger:
         if cndtn == True:
             word = new_word
 
+        return word
+
+    def compile_model(self):
+        """
+        Precomputes the log probabilities used by Viterbi decoding: initial
+        and tag bigram log probabilities, and a matrix of lexical log
+        probabilities with a row per word (see :py:attr:`word_ids`) and a
+        column per tag; the last row is for unknown words.  Leaves
+        :py:attr:`lex_logprob` None if numpy is not available or the
+        probabilities cannot be used as they are by :py:meth:`decode`.
+        """
+        import math
+        self.word_ids = {}
+        self.lex_logprob = None
+        if numpy is None:
+            return
+        ntags = len(self.tag_list)
+        try:
+            init_logprob = numpy.array([math.log10(float(self.bigram_tag_prob[14+17*i]))
+                                        for i in range(ntags)])
+            trans_logprob = numpy.array([[math.log10(float(self.bigram_tag_prob[k*17+l]))
+                                          for l in range(ntags)] for k in range(ntags)])
+        except (IndexError, ValueError):
+            self.logger.debug('bigram probabilities cannot be compiled')
+            return
+        if not (numpy.isfinite(init_logprob).all() and numpy.isfinite(trans_logprob).all()):
+            self.logger.debug('bigram probabilities cannot be compiled')
+            return
+        rows = {}
+        unknown = math.log10(0.0000000001)
+        for key, prob in self.lex_prob_hash.iteritems():
+            try:
+                logprob = math.log10(prob)
+            except:
+                logprob = unknown
+            if logprob != logprob:
+                self.logger.debug('lexical probabilities cannot be compiled')
+                return
+            for k in range(ntags):
+                tag = self.tag_list[k]
+                if key.endswith(tag):
+                    w = key[:-len(tag)]
+                    if w not in rows:
+                        rows[w] = [unknown] * ntags
+                    rows[w][k] = logprob
+        words = rows.keys()
+        self.word_ids = dict((w, i) for i, w in enumerate(words))
+        self.lex_logprob = numpy.array([rows[w] for w in words] + [[unknown] * ntags])
+        self.init_logprob = init_logprob
+        self.trans_logprob = trans_logprob
+
+    def decode(self, word):
+        """
+        Viterbi decoding of a list of words.  Returns the list of the indices
+        of the best tags (in :py:attr:`tag_list`) of the words.
+        """
+        import math
+    
+        tag_list = self.tag_list
+        bigram_tag_prob = self.bigram_tag_prob
+        lex_prob_hash = self.lex_prob_hash
+
         # INITIALIZATION
         scoreOne = []
         j = 14
@@ -149,7 +265,6 @@ class PersianPOSTagger:
         scoreThree = []
         scoreTwo = []
         backTrace = [0]
-        length = len(word)
 
         # ITERATION
         for j in range(1,len(word)):
@@ -172,6 +287,48 @@ class PersianPOSTagger:
             scoreOne = scoreThree
             scoreThree = []
 
+        backTrace[0] = indx
+        return backTrace
+
+    def decode_batch(self, words):
+        """
+        Vectorised :py:meth:`decode` of a list of word lists, using the
+        compiled model (see :py:meth:`compile_model`); the tags are the same.
+        Returns a list of lists of tag indices.
+        """
+        if not words:
+            return []
+        maxlen = max(len(word) for word in words)
+        if maxlen == 0:
+            return [[] for word in words]
+        unknown = len(self.lex_logprob) - 1
+        ids = numpy.empty((len(words), maxlen), dtype=numpy.intp)
+        ids.fill(unknown)
+        for b, word in enumerate(words):
+            ids[b,:len(word)] = [self.word_ids.get(w, unknown) for w in word]
+        lex = self.lex_logprob[ids]
+        best = numpy.empty((len(words), maxlen), dtype=numpy.intp)
+        score = self.init_logprob + lex[:,0,:]
+        best[:,0] = score.argmax(axis=1)
+        for j in range(1, maxlen):
+            # score[b,k] = max over l of (score[b,l] + trans[k,l]) + lex[b,j,k]
+            score = (score[:,numpy.newaxis,:] + self.trans_logprob).max(axis=2) + lex[:,j,:]
+            best[:,j] = score.argmax(axis=1)
+        return [best[b,:len(word)].tolist() for b, word in enumerate(words)]
+
+    def merge_tags(self, word, best):
+        """
+        Combines the words with their best tags (see :py:meth:`decode`) into
+        a taglist in 'word/TAG' format, joining complex verbs that are in the
+        lexicon.
+        """
+        tag_list = self.tag_list
+        lex_prob_hash = self.lex_prob_hash
+        tag_word = []
+        length = len(word)
+        indx = best[0]
+        backTrace = best
+
         # BACKTRACING
         counter = 1
         jump = False
@@ -315,4 +472,46 @@ class PersianPOSTagger:
                  'end': end}
             wlist.append(w)
             idx += 1
-        return wlist
\ No newline at end of file
+        return wlist
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description="Benchmark the Persian POS tagger on a file of sentences, "
+        "one per line, comparing the batched decoder with the per-sentence one.")
+    parser.add_argument("infile", help="input file (one sentence per line)")
+    parser.add_argument('-r', '--repdir', default=REPDIR,
+                        help='Directory with the tagger statistics')
+    parser.add_argument('-c', '--clean', action='store_true',
+                        help='Clean text prior to running tagger')
+    parser.add_argument('-b', '--batch-size', dest='batchsize', type=int, default=256,
+                        help='Number of sentences decoded at once')
+    cmdline = parser.parse_args()
+
+    pt = PersianPOSTagger(cmdline.repdir)
+    texts = [l.rstrip() for l in codecs.open(cmdline.infile, 'r', 'utf-8')]
+    texts = [t for t in texts if t.strip()]
+    if cmdline.clean:
+        texts = pt.cleanSentences(texts)
+    start = time.time()
+    expected = []
+    for text in texts:
+        word = pt.split_words(text)
+        try:
+            expected.append(pt.merge_tags(word, pt.decode(word)))
+        except Exception:
+            expected.append(None)
+    before = time.time() - start
+    start = time.time()
+    found = pt.run_hmm_tagger_batch(texts, cmdline.batchsize)
+    after = time.time() - start
+    mismatches = sum(1 for e, f in zip(expected, found) if e != f)
+    print 'sentences: %d' % (len(texts))
+    print 'per-sentence decoder: %.1f sentences/sec' % (len(texts) / before)
+    print 'batched decoder: %.1f sentences/sec' % (len(texts) / after)
+    print 'mismatches: %d' % (mismatches)
+    return 1 if mismatches else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
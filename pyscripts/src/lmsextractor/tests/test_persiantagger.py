@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+from unittest import TestCase, TestSuite, makeSuite, main
+import os, codecs, logging, random, shutil, tempfile
+
+from lmsextractor.persiantagger import PersianPOSTagger
+
+WORDS = [(u'کتاب', 'N'), (u'خوب', 'ADJ'), (u'است', 'V'), (u'این', 'PREM'), (u'در', 'PREP'),
+         (u'و', 'CONJ'), (u'.', 'PUNC'), (u'خانه', 'N'), (u'خوب', 'ADV'), (u'رفت', 'V')]
+
+class PersianPOSTaggerTest(TestCase):
+    """ Compares the batch decoder with the original one, on a small model.
+    """
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        rand = random.Random(12)
+        ntags = len(PersianPOSTagger.tag_list)
+        with codecs.open(os.path.join(self.dir, 'bigramProb.txt'), 'w', 'utf-8') as f:
+            f.write(u'bigrams\n')
+            f.write(u'\n'.join(u'%.6f' % rand.uniform(0.001, 0.5) for _ in range(ntags * ntags)))
+        with codecs.open(os.path.join(self.dir, 'lexProb.txt'), 'w', 'utf-8') as f:
+            f.write(u'lexicon')
+            for word, tag in WORDS:
+                f.write(u'*%s%s*%.6f' % (word, tag, rand.uniform(0.001, 0.9)))
+        self.tagger = PersianPOSTagger(self.dir)
+        # the sentences that cannot be tagged are logged
+        self.tagger.logger.addHandler(logging.NullHandler())
+        words = [w for w, _ in WORDS] + [u'ناشناخته']
+        self.texts = [u' '.join(rand.choice(words) for _ in range(rand.randint(1, 12)))
+                      for _ in range(40)]
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_compiled(self):
+        self.assertTrue(self.tagger.lex_logprob is not None)
+
+    def test_decode_batch(self):
+        words = [self.tagger.split_words(text) for text in self.texts]
+        self.assertEqual(self.tagger.decode_batch(words), [self.tagger.decode(word) for word in words])
+
+    def test_batch(self):
+        expected = [self.tagger.merge_tags(self.tagger.split_words(text),
+                                           self.tagger.decode(self.tagger.split_words(text)))
+                    for text in self.texts]
+        self.assertEqual(self.tagger.run_hmm_tagger_batch(self.texts, batchsize=7), expected)
+        self.assertEqual([self.tagger.run_hmm_tagger(text) for text in self.texts], expected)
+        # and without the compiled model
+        self.tagger.lex_logprob = None
+        self.assertEqual(self.tagger.run_hmm_tagger_batch(self.texts), expected)
+
+    def test_failures(self):
+        # sentences that cannot be tagged are None, the others are tagged
+        decode = self.tagger.decode
+        def failing(word):
+            if u'رفت' in word:
+                raise ValueError('math domain error')
+            return decode(word)
+        self.tagger.decode = failing
+        self.tagger.lex_logprob = None
+        texts = self.texts[:10] + [u'این رفت'] + self.texts[10:20] + [u'']
+        taglists = self.tagger.run_hmm_tagger_batch(texts)
+        self.assertEqual([i for i, t in enumerate(taglists) if t is None],
+                         [i for i, text in enumerate(texts) if u'رفت' in text or not text])
+        for text, taglist in zip(texts, taglists):
+            if taglist is not None:
+                word = self.tagger.split_words(text)
+                self.assertEqual(taglist, self.tagger.merge_tags(word, decode(word)))
+
+    def test_batch_failures(self):
+        # a sentence that cannot be tagged does not stop the others of its batch
+        decode_batch = self.tagger.decode_batch
+        def failing(words):
+            if [word for word in words if u'رفت' in word]:
+                raise ValueError('bad sentence')
+            return decode_batch(words)
+        self.tagger.decode_batch = failing
+        texts = self.texts[:10] + [u'این رفت'] + self.texts[10:20]
+        taglists = self.tagger.run_hmm_tagger_batch(texts, batchsize=7)
+        self.assertEqual([i for i, t in enumerate(taglists) if t is None],
+                         [i for i, text in enumerate(texts) if u'رفت' in text])
+        for text, taglist in zip(texts, taglists):
+            if taglist is not None:
+                word = self.tagger.split_words(text)
+                self.assertEqual(taglist, self.tagger.merge_tags(word, self.tagger.decode(word)))
+
+def test_suite():
+    suite = TestSuite()
+    suite.addTests(makeSuite(PersianPOSTaggerTest))
+    return suite
+
+if __name__ == '__main__':
+    main(defaultTest='test_suite')
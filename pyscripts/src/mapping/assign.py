@@ -15,8 +15,9 @@ Created on Nov 4, 2013.
 
 from __future__ import print_function
 
-import os, json, gzip, sys, sqlite3
+import os, sys, logging
 from depparsing.util import Environment, uopen, uwriter, ureader, update
+from relfreq import RelationFrequencies
 from pprint import pprint
 from textwrap import dedent
 
@@ -27,6 +28,7 @@ env = Environment(CL='/u/metanet/corpolexica',
                   SD='{CL}/{lang}/m4mapping/Source_Domains_{lang}',
                   CACHE='{CL}/{lang}/m4mapping/cache',
                   REL='{CL}/{lang}/m4mapping/relations.db',
+                  FREQ='{CL}/{lang}/m4mapping/relfreq.db',
                   dobj='{BNC}/DirectObjRels.txt-uniqed-sorted', 
                   iobj='{BNC}/IndirectObjRels.txt-underscore-uniqed-sorted', 
                   ncsubj='{BNC}/SubjectRels.txt-uniqed-sorted', 
@@ -64,31 +66,45 @@ def as_var(s):
 
 class Assigner(object):
     """Assign a source (noun) word from a target (i.e. verb)-relation pair.
+    
+    Relation frequencies are looked up in the database built by relfreq, or,
+    if there is none, in the nvrel table of the relations database.  The
+    results are then the same only if nvrel was built from the same BNC
+    relation files as the relfreq database would be; a warning is logged.
     """
-    def __init__(self, lang):
+    def __init__(self, lang, freqdb=None):
         lang = lang.upper()
-        db = env('{REL}', lang=lang)
-        update(self, conn=sqlite3.connect(db), lang=lang)
+        freqdb = freqdb or env('{FREQ}', lang=lang)
+        if os.access(freqdb, os.R_OK):
+            freqs = RelationFrequencies(freqdb)
+        else:
+            reldb = env('{REL}', lang=lang)
+            logging.getLogger(__name__).warning(
+                'No relation frequency database %s: using the nvrel table of %s, '
+                'which gives the same results only if it was built from the same '
+                'relation files', freqdb, reldb)
+            freqs = RelationFrequencies(reldb, table='nvrel')
+        update(self, freqs=freqs, conn=freqs.conn, lang=lang)
         with uopen(env('{SD}', lang=lang)) as domf:
             records = (l.strip().split() for l in domf)
             self.sources = noun2source(records)
         
     def get_verb2nouns(self, verb, relation):
+        """Returns a verb -> [(noun, count)] mapping, for verb only.
+        """
         assert verb.islower() and relation.islower(), (verb, relation)
+        return {verb: self.freqs.nouns(verb, relation)}
+    
+    def assign_many(self, probes):
+        """Assign nouns from many verb-relation pairs at once.
         
-        cachefn = env('{CACHE}/{verb}-{relation}.json.gz', verb=verb, relation=relation)     
-        if os.access(cachefn, os.R_OK):
-            with ureader(gzip.open(cachefn, 'rb')) as cachef:        
-                return json.load(cachef)
-        else:
-            relfn = env(as_var(relation))
-            reverse = relation == 'iobj' # XXX
-            with uwriter(gzip.open(cachefn, 'wb')) as cachef, uopen(relfn) as relf:
-                # Some lines do not contain three fields, so...
-                triples = (r for r in (l.rstrip().split() for l in relf) if len(r) == 3)
-                m = verb2nouns(triples, reverse)
-                json.dump(m, cachef, encoding='utf8', ensure_ascii=False, indent=2)
-                return m
+        :param probes: (verb, relation) pairs.
+        :returns: the list of source domains of each pair, as :py:meth:`assign`.
+        
+        """
+        sources = self.sources
+        return [[sources[n] for n, _ in nouns if sources.get(n)]
+                for nouns in self.freqs.nouns_many(probes)]
     
     def assign2(self, verb, relation):
         """Assign a noun from a verb-relation pair, using a a database. Fast. 
@@ -98,42 +114,41 @@ class Assigner(object):
         :type relation: a string, as specified by the parser used. 
         
         """
-        sql = """\
-            select noun from nvrel 
-            where verb='%s' and reltype='%s' 
-            order by n desc 
-            """
-#         pprint(nouns)
-        ss = []
-        for n, in self.conn.execute(sql % (verb, relation)):
-            s = self.sources.get(n)
-            if s: ss.append(s) 
-        return ss
+        return self.assign_many([(verb, relation)])[0]
                 
     def assign(self, verb, relation):
-        """Assign a noun from a verb-relation pair, creating a cache. Relatively slow. 
+        """Assign a noun from a verb-relation pair. Same as :py:meth:`assign2`.
         
         :param verb: a verb or target word.
         :param relation: a relation name. 
         :type relation: a string, as specified by the parser used. 
         
         """
-        nouns = self.get_verb2nouns(verb, relation)
-        ss = []
-        for n, _ in sorted(nouns.get(verb, ()), key=lambda (n, f): (f, n), reverse=True):
-            s = self.sources.get(n)
-            if s: 
-                ss.append(s) 
-        return ss
+        return self.assign_many([(verb, relation)])[0]
+
+    def relation_many(self, probes):
+        """Possible relations of many verb-noun pairs at once.
+        
+        :param probes: (verb, noun) pairs.
+        :returns: the [(count, relation)] list of each pair, most frequent first.
+        
+        """
+        return self.freqs.relations_many(probes)
 
     def relation(self, verb, noun):
-        sql = """\
-            select     n, reltype 
-            from       nvrel where verb='%s' and noun='%s'
-            order by   n desc 
-            """
-        rr = [r for r in self.conn.execute(sql % (verb, noun))]
-        return rr
+        return self.relation_many([(verb, noun)])[0]
+
+    def gassign_many(self, probes):
+        """Guess the most likely relations of many target-source pairs at once.
+        
+        :param probes: (verb, noun) pairs.
+        :returns: the result of :py:meth:`gassign` for each pair.
+        
+        """
+        probes = list(probes)
+        rr = self.relation_many(probes)
+        assigned = iter(self.assign_many((verb, r[0][1]) for (verb, _), r in zip(probes, rr) if r))
+        return [next(assigned) if r else None for r in rr]
 
     def gassign(self, verb, noun):
         """Guess most likely relation form target and source.
@@ -0,0 +1,215 @@
+"""
+.. module:: relfreq
+    :platform: Unix
+    :synopsis: Indexed verb/noun relation frequencies, with batch lookups.
+
+The relation frequencies of the ``*Rels.txt-uniqed-sorted`` files (lines of
+count, noun and verb, see :py:data:`mapping.assign.env`), built once into a
+SQLite table.  The table has covering indexes in ranking order, so the nouns
+of a <verb, relation> pair, or the relations of a <verb, noun> pair, are
+read from an index range, already sorted.
+
+Batch lookups (:py:meth:`RelationFrequencies.nouns_many`,
+:py:meth:`RelationFrequencies.relations_many`) load the distinct probes
+into a temporary table and resolve all of them with a single join.
+
+Ranking: nouns by count, then noun, both descending (the order of
+``Assigner.assign``); relations by count descending, then relation name.
+
+Build with::
+
+    python relfreq.py build -l EN [-o relfreq.db] [-r dobj=DirectObjRels.txt-uniqed-sorted ...]
+
+"""
+
+from __future__ import print_function
+
+import os, sys, sqlite3, tempfile, time, argparse
+from itertools import groupby
+
+TABLE = 'relfreq'
+
+CREATE = """\
+    CREATE TABLE {0} (n INTEGER, reltype TEXT, noun TEXT, verb TEXT);
+    """
+
+INDEX = """\
+    CREATE INDEX {0}_vr ON {0} (verb, reltype, n DESC, noun DESC);
+    CREATE INDEX {0}_vn ON {0} (verb, noun, n DESC, reltype);
+    ANALYZE;
+    """
+
+PROBES = """\
+    CREATE TEMP TABLE IF NOT EXISTS probes (i INTEGER PRIMARY KEY, a TEXT, b TEXT);
+    DELETE FROM probes;
+    """
+
+NOUNS = """\
+    SELECT   p.i, r.noun, r.n
+    FROM     probes p JOIN {0} r ON r.verb = p.a AND r.reltype = p.b
+    ORDER BY p.i, r.n DESC, r.noun DESC
+    """
+
+RELATIONS = """\
+    SELECT   p.i, r.n, r.reltype
+    FROM     probes p JOIN {0} r ON r.verb = p.a AND r.noun = p.b
+    ORDER BY p.i, r.n DESC, r.reltype
+    """
+
+
+def build(dbname, files, batch=100000):
+    """Builds a relation frequency database from relation files.
+
+    :param dbname: the database file name; it is replaced when complete.
+    :param files: (relation, file name) pairs.
+    :returns: the number of relations per relation type.
+
+    """
+    from depparsing.util import uopen
+    from util import relations
+
+    dbdir = os.path.dirname(os.path.abspath(dbname))
+    fd, tmpname = tempfile.mkstemp(prefix='.relfreq-', dir=dbdir)
+    os.close(fd)
+    counts = dict()
+    try:
+        conn = sqlite3.connect(tmpname)
+        conn.executescript('PRAGMA journal_mode=OFF; PRAGMA synchronous=OFF;')
+        conn.executescript(CREATE.format(TABLE))
+        insert = 'INSERT INTO %s (n, reltype, noun, verb) VALUES (?, ?, ?, ?)' % TABLE
+        for rel, fname in files:
+            # The iobj file lists count, verb, noun, reversed relative to the
+            # other relation files (count, noun, verb); Assigner.get_verb2nouns
+            # read it the same way before it used this table.
+            reverse = rel == 'iobj'
+            with uopen(fname) as f:
+                rows = ((int(c), r, n, v) for c, r, n, v in
+                        relations(rel, (l.rstrip().split() for l in f), reverse))
+                while True:
+                    chunk = [r for _, r in zip(xrange(batch), rows)]
+                    if not chunk:
+                        break
+                    conn.executemany(insert, chunk)
+                    counts[rel] = counts.get(rel, 0) + len(chunk)
+        conn.executescript(INDEX.format(TABLE))
+        conn.commit()
+        conn.close()
+        os.chmod(tmpname, 0644)
+        os.rename(tmpname, dbname)
+    except:
+        os.remove(tmpname)
+        raise
+    return counts
+
+
+class RelationFrequencies(object):
+    """Ranked lookups in a relation frequency database.
+    """
+    def __init__(self, dbname, table=TABLE):
+        """
+        :param dbname: a database built by :py:func:`build`.
+        :param table: the table name; the ``nvrel`` table of mapping.util has
+            the same columns (without the ranking indexes).
+
+        """
+        self.dbname = dbname
+        self.conn = sqlite3.connect(dbname)
+        self.nouns_sql = NOUNS.format(table)
+        self.relations_sql = RELATIONS.format(table)
+
+    def _many(self, sql, probes):
+        """Returns, for each (a, b) probe, the rows of sql (without the probe
+        number).  Repeated probes are resolved once.
+        """
+        probes = list(probes)
+        ids = dict()
+        for p in probes:
+            ids.setdefault(p, len(ids))
+        results = [[] for _ in xrange(len(ids))]
+        if ids:
+            self.conn.executescript(PROBES)
+            self.conn.executemany('INSERT INTO probes (i, a, b) VALUES (?, ?, ?)',
+                                  ((i, a, b) for (a, b), i in ids.iteritems()))
+            for i, rows in groupby(self.conn.execute(sql), lambda r: r[0]):
+                results[i] = [r[1:] for r in rows]
+        return [results[ids[p]] for p in probes]
+
+    def nouns_many(self, probes):
+        """Returns, for each (verb, relation) probe, its [(noun, count)] list,
+        ranked.
+        """
+        return self._many(self.nouns_sql, probes)
+
+    def nouns(self, verb, relation):
+        return self.nouns_many([(verb, relation)])[0]
+
+    def relations_many(self, probes):
+        """Returns, for each (verb, noun) probe, its [(count, relation)] list,
+        ranked.
+        """
+        return self._many(self.relations_sql, probes)
+
+    def relations(self, verb, noun):
+        return self.relations_many([(verb, noun)])[0]
+
+    def close(self):
+        self.conn.close()
+
+
+def bench(dbname, nprobes):
+    """Times one query per probe (as Assigner did) against a batch lookup,
+    and checks that they rank the same way.
+    """
+    freqs = RelationFrequencies(dbname)
+    sample = freqs.conn.execute('SELECT verb, reltype, noun FROM %s ORDER BY random() LIMIT ?'
+                                % TABLE, (nprobes,)).fetchall()
+    probes = [(v, r) for v, r, _ in sample]
+    pairs = [(v, n) for v, _, n in sample]
+
+    def rank(rows):
+        return sorted(rows, key=lambda (noun, f): (f, noun), reverse=True)
+
+    start = time.time()
+    single = [rank(freqs.conn.execute('SELECT noun, n FROM %s WHERE verb=? AND reltype=?'
+                                      % TABLE, p).fetchall()) for p in probes]
+    seconds = time.time() - start
+    print('%-22s %9.0f probes/s' % ('one query per probe', len(probes) / seconds))
+    start = time.time()
+    many = freqs.nouns_many(probes)
+    seconds = time.time() - start
+    print('%-22s %9.0f probes/s' % ('nouns_many', len(probes) / seconds))
+    start = time.time()
+    freqs.relations_many(pairs)
+    seconds = time.time() - start
+    print('%-22s %9.0f probes/s' % ('relations_many', len(pairs) / seconds))
+    if [[tuple(r) for r in rows] for rows in single] != many:
+        print('batch and single lookups differ!')
+        return 1
+    return 0
+
+
+def main(args):
+    from assign import env
+    p = argparse.ArgumentParser(description='Relation frequency database')
+    p.add_argument('command', choices=['build', 'bench'])
+    p.add_argument('-l', dest='lang', choices=['EN', 'ES', 'RU'], default='EN', metavar='<language>')
+    p.add_argument('-o', dest='dbname', metavar='<filename>',
+                   help='Database file name (default: the Assigner one)')
+    p.add_argument('-n', dest='probes', type=int, default=10000, help='Probes to time')
+    p.add_argument('-r', dest='files', action='append', default=[], metavar='<relation>=<filename>',
+                   help='Relation file (default: the BNC ones)')
+    a = p.parse_args(args)
+    dbname = a.dbname or env('{FREQ}', lang=a.lang)
+    if a.command == 'bench':
+        return bench(dbname, a.probes)
+    files = ([f.split('=', 1) for f in a.files] or
+             [(rel, env('{%s}' % rel)) for rel in ('dobj', 'iobj', 'ncsubj', 'ncmod')])
+    start = time.time()
+    counts = build(dbname, files)
+    print(dbname, ', '.join('%s: %d' % c for c in sorted(counts.items())),
+          '(%.1fs)' % (time.time() - start))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+from unittest import TestCase, TestSuite, makeSuite, main
+import os, shutil, tempfile, codecs, sqlite3, logging
+
+from depparsing.util import Environment
+from mapping import assign, relfreq
+from mapping.assign import Assigner
+from mapping.tests.test_relfreq import RELS
+
+# domain, nouns
+DOMAINS = u'''DISEASE poverty crime
+BURDEN tax café
+GOVERNMENT government
+WEALTH money
+'''
+
+class Warnings(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self, logging.WARNING)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+class AssignerTest(TestCase):
+    """ The batch methods give the results of one lookup per probe.
+    """
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.env = assign.env
+        assign.env = Environment(CL=self.dir, SD='{CL}/{lang}/sd', REL='{CL}/{lang}/relations.db',
+                                 FREQ='{CL}/{lang}/relfreq.db')
+        os.makedirs(os.path.join(self.dir, 'EN'))
+        with codecs.open(assign.env('{SD}', lang='EN'), 'w', 'utf-8') as f:
+            f.write(DOMAINS)
+        files = []
+        for rel, text in sorted(RELS.items()):
+            files.append((rel, os.path.join(self.dir, rel)))
+            with codecs.open(files[-1][1], 'w', 'utf-8') as f:
+                f.write(text)
+        relfreq.build(assign.env('{FREQ}', lang='EN'), files)
+        self.assigner = Assigner('en')
+
+    def tearDown(self):
+        self.assigner.freqs.close()
+        assign.env = self.env
+        shutil.rmtree(self.dir)
+
+    def test_assign_many(self):
+        a = self.assigner
+        # no relation, a repeated probe, and nouns without a domain
+        probes = [(u'raise', u'dobj'), (u'sing', u'dobj'), (u'raise', u'ncsubj'),
+                  (u'fight', u'dobj'), (u'raise', u'iobj'), (u'raise', u'dobj'), (u'give', u'iobj')]
+        many = a.assign_many(probes)
+        self.assertEqual(many, [a.assign(v, r) for v, r in probes])
+        self.assertEqual(many, [[u'BURDEN', u'BURDEN'], [], [u'DISEASE', u'GOVERNMENT', u'DISEASE'],
+                                [u'DISEASE', u'DISEASE'], [], [u'BURDEN', u'BURDEN'],
+                                [u'WEALTH', u'BURDEN']])
+        self.assertEqual(a.assign_many(iter(probes)), many)
+        self.assertEqual(a.assign_many([]), [])
+
+    def test_relation_many(self):
+        a = self.assigner
+        probes = [(u'raise', u'tax'), (u'raise', u'money'), (u'fight', u'tax'), (u'give', u'money'),
+                  (u'raise', u'crime'), (u'raise', u'tax')]
+        many = a.relation_many(probes)
+        self.assertEqual(many, [a.relation(v, n) for v, n in probes])
+        self.assertEqual(many, [[(12, u'dobj')], [], [(2, u'ncsubj')], [(5, u'iobj')],
+                                [(3, u'ncsubj')], [(12, u'dobj')]])
+        self.assertEqual(a.relation_many([]), [])
+
+    def test_gassign_many(self):
+        a = self.assigner
+        # probes with no relation come between the others, whose results
+        # all differ, so each result must be given to its own probe
+        probes = [(u'sing', u'tax'), (u'raise', u'tax'), (u'raise', u'money'), (u'fight', u'tax'),
+                  (u'give', u'money'), (u'fight', u'poverty'), (u'sing', u'song')]
+        many = a.gassign_many(iter(probes))
+        self.assertEqual(many, [a.gassign(v, n) for v, n in probes])
+        self.assertEqual(many, [None, [u'BURDEN', u'BURDEN'], None, [u'BURDEN'],
+                                [u'WEALTH', u'BURDEN'], [u'DISEASE', u'DISEASE'], None])
+        self.assertEqual(a.gassign_many([(u'sing', u'tax')]), [None])
+        self.assertEqual(a.gassign_many([]), [])
+
+    def test_nvrel(self):
+        # without a relation frequency database, the nvrel table is used
+        freqdb = assign.env('{FREQ}', lang='EN')
+        conn = sqlite3.connect(assign.env('{REL}', lang='EN'))
+        conn.execute('ATTACH DATABASE ? AS freq', (freqdb,))
+        conn.executescript('CREATE TABLE nvrel (n int, reltype string, noun, verb);'
+                           'INSERT INTO nvrel SELECT * FROM freq.relfreq;')
+        conn.close()
+        os.remove(freqdb)
+        warnings = Warnings()
+        logger = logging.getLogger(assign.__name__)
+        logger.addHandler(warnings)
+        try:
+            nvrel = Assigner('en')
+        finally:
+            logger.removeHandler(warnings)
+        self.assertEqual(len(warnings.messages), 1)
+        self.assertTrue('nvrel' in warnings.messages[0], warnings.messages)
+        probes = [(u'raise', u'tax'), (u'sing', u'tax'), (u'fight', u'poverty')]
+        self.assertEqual(nvrel.gassign_many(probes), self.assigner.gassign_many(probes))
+        nvrel.freqs.close()
+
+def test_suite():
+    suite = TestSuite()
+    suite.addTests(makeSuite(AssignerTest))
+    return suite
+
+if __name__ == '__main__':
+    main(defaultTest='test_suite')
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+from unittest import TestCase, TestSuite, makeSuite, main
+import os, shutil, tempfile, codecs, sqlite3
+
+from mapping import relfreq
+from mapping.assign import verb2nouns
+from mapping.relfreq import RelationFrequencies
+
+# count, noun, verb (iobj: count, verb, noun)
+RELS = dict(dobj=u'''12 tax raise
+3 price raise
+12 café raise
+7 poverty fight
+1 crime fight
+''', ncsubj=u'''4 government raise
+3 crime raise
+9 poverty raise
+2 tax fight
+bad line
+''', iobj=u'''5 give money
+1 give tax
+''')
+
+class RelationFrequenciesTest(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.files = []
+        for rel, text in sorted(RELS.items()):
+            fname = os.path.join(self.dir, rel)
+            with codecs.open(fname, 'w', 'utf-8') as f:
+                f.write(text)
+            self.files.append((rel, fname))
+        self.dbname = os.path.join(self.dir, 'relfreq.db')
+        self.counts = relfreq.build(self.dbname, self.files, batch=2)
+        self.freqs = RelationFrequencies(self.dbname)
+
+    def tearDown(self):
+        self.freqs.close()
+        shutil.rmtree(self.dir)
+
+    def ranked(self, verb, rel):
+        """The ranking of the former Assigner.assign, from the relation file.
+        """
+        with codecs.open(dict(self.files)[rel], 'r', 'utf-8') as f:
+            triples = (r for r in (l.rstrip().split() for l in f) if len(r) == 3)
+            m = verb2nouns(triples, rel == 'iobj')
+        return sorted(m.get(verb, ()), key=lambda (n, f): (f, n), reverse=True)
+
+    def test_build(self):
+        self.assertEqual(self.counts, dict(dobj=5, ncsubj=4, iobj=2))
+        self.assertEqual(sorted(os.listdir(self.dir)), ['dobj', 'iobj', 'ncsubj', 'relfreq.db'])
+
+    def test_nouns(self):
+        probes = [(u'raise', u'dobj'), (u'fight', u'dobj'), (u'raise', u'ncsubj'),
+                  (u'give', u'iobj'), (u'raise', u'dobj'), (u'sing', u'dobj'), (u'raise', u'iobj')]
+        many = self.freqs.nouns_many(probes)
+        self.assertEqual(many, [self.ranked(v, r) for v, r in probes])
+        self.assertEqual(many[0], [(u'tax', 12), (u'café', 12), (u'price', 3)])
+        self.assertEqual(many[3], [(u'money', 5), (u'tax', 1)])
+        self.assertEqual(self.freqs.nouns(u'fight', u'dobj'), many[1])
+        self.assertEqual(self.freqs.nouns_many([]), [])
+
+    def test_relations(self):
+        probes = [(u'raise', u'tax'), (u'raise', u'crime'), (u'fight', u'poverty'), (u'raise', u'money')]
+        self.assertEqual(self.freqs.relations_many(probes),
+                         [[(12, u'dobj')], [(3, u'ncsubj')], [(7, u'dobj')], []])
+        self.assertEqual(self.freqs.relations(u'give', u'money'), [(5, u'iobj')])
+
+    def test_nvrel(self):
+        # the table of mapping.util, without the ranking indexes
+        conn = sqlite3.connect(self.dbname)
+        conn.executescript('CREATE TABLE nvrel (n int, reltype string, noun, verb);'
+                           'INSERT INTO nvrel SELECT * FROM relfreq;')
+        conn.close()
+        nvrel = RelationFrequencies(self.dbname, table='nvrel')
+        probes = [(u'raise', u'dobj'), (u'raise', u'ncsubj')]
+        self.assertEqual(nvrel.nouns_many(probes), self.freqs.nouns_many(probes))
+        nvrel.close()
+
+def test_suite():
+    suite = TestSuite()
+    suite.addTests(makeSuite(RelationFrequenciesTest))
+    return suite
+
+if __name__ == '__main__':
+    main(defaultTest='test_suite')
@@ -146,6 +146,262 @@ def loadfile(fname):
         jdata = ujson.load(file(fname))
     return jdata
 
+class _JSONScanner:
+    """ Incremental scanner over the text of a JSON file, used by
+    :py:class:`StreamReader`.  Reads the file in chunks and decodes one
+    value at a time.
+    """
+    WS = u' \t\n\r'
+    TOKEN_RE = re.compile(ur'"(?:[^"\\]|\\.)*"|[\[\]{}]|"', flags=re.U|re.S)
+    
+    def __init__(self, fname, chunksize):
+        if fname.endswith('.gz'):
+            self.f = gzip.open(fname,'rb')
+        else:
+            self.f = open(fname,'rb')
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.jdecoder = json.JSONDecoder()
+        self.chunksize = chunksize
+        self.buf = u''
+        self.pos = 0
+        self.eof = False
+
+    def close(self):
+        self.f.close()
+
+    def _fill(self):
+        """ Read another chunk into the buffer.  Returns False at end of file. """
+        if self.eof:
+            return False
+        data = self.f.read(self.chunksize)
+        if not data:
+            self.eof = True
+            self.buf = self.buf[self.pos:] + self.decoder.decode('', final=True)
+        else:
+            self.buf = self.buf[self.pos:] + self.decoder.decode(data)
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """ Return the next non-whitespace character, or None at end of file """
+        while True:
+            while (self.pos < len(self.buf)) and (self.buf[self.pos] in self.WS):
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return None
+
+    def expect(self, chars):
+        c = self.peek()
+        if (c is None) or (c not in chars):
+            raise ValueError("expected one of '%s' in JSON stream, found %r" % (chars, c))
+        self.pos += 1
+        return c
+
+    def value(self):
+        """ Decode and return the next JSON value """
+        self.peek()
+        while True:
+            try:
+                # a value that ends at the end of the buffer may be a truncated
+                # number, so ask for more data unless at end of file
+                obj, end = self.jdecoder.raw_decode(self.buf, self.pos)
+                if (end < len(self.buf)) or self.eof:
+                    self.pos = end
+                    return obj
+            except ValueError:
+                if self.eof:
+                    raise
+            self._fill()
+
+    def skip(self):
+        """ Skip over the next JSON value without decoding it """
+        c = self.peek()
+        if c not in u'[{':
+            self.value()
+            return
+        depth = 0
+        while True:
+            for m in self.TOKEN_RE.finditer(self.buf, self.pos):
+                token = m.group(0)
+                if token == u'"':
+                    # string continues in the next chunk
+                    self.pos = m.start()
+                    break
+                self.pos = m.end()
+                if token in u'[{':
+                    depth += 1
+                elif token in u']}':
+                    depth -= 1
+                    if depth == 0:
+                        return
+            else:
+                self.pos = len(self.buf)
+            if not self._fill():
+                raise ValueError('unexpected end of JSON stream')
+
+    def key(self):
+        """ Read an object key and the following colon """
+        key = self.value()
+        self.expect(u':')
+        return key
+
+class StreamReader:
+    """ Incremental reader for files in the MetaNet JSON format.  The top level
+    fields (lang, documents, etc.) are read on opening, and are available in
+    :py:attr:`header`; sentences are then decoded one at a time by iterating
+    over the reader, so that memory use does not grow with the size of the
+    file::
+
+        with StreamReader('corpus.json.gz') as reader:
+            lang = reader.header['lang']
+            for sent in reader:
+                ...
+
+    When the sentences array is not the last field in the file (files written
+    by :py:func:`writefile` often have fields after it), the reader scans past
+    the array once, without decoding it, to read those fields.
+    """
+    def __init__(self, fname, chunksize=1048576):
+        """
+        :param fname: file name (gzipped if it ends in .gz)
+        :type fname: str
+        :param chunksize: number of bytes read at a time
+        :type chunksize: int
+        """
+        self.fname = fname
+        self.chunksize = chunksize
+        self.header = {}
+        self.truncated = None
+        self.scanner = _JSONScanner(fname, chunksize)
+        self.hassentences = self._readFields(self.scanner, self.header, stopAtSentences=True)
+        if self.hassentences:
+            # read the fields that follow the sentences with a second scanner
+            trailer = _JSONScanner(fname, chunksize)
+            try:
+                self._readFields(trailer, self.header, stopAtSentences=False)
+            except ValueError, e:
+                # in a truncated file the sentences before the break can still
+                # be read; the error is raised once they have been
+                if not trailer.eof:
+                    raise
+                self.truncated = e
+            finally:
+                trailer.close()
+        self.started = False
+
+    def _readFields(self, scanner, fields, stopAtSentences):
+        """ Read the top level fields into fields, until the sentences field if
+        stopAtSentences is True.  Returns True if the sentences field was found.
+        """
+        found = False
+        if scanner.expect(u'{'):
+            if scanner.peek() == u'}':
+                return found
+        while True:
+            key = scanner.key()
+            if key == u'sentences':
+                found = True
+                if stopAtSentences:
+                    return found
+                scanner.skip()
+            elif key in fields:
+                scanner.skip()
+            else:
+                fields[key] = scanner.value()
+            if scanner.expect(u',}') == u'}':
+                return found
+
+    def __iter__(self):
+        """ Iterate over the sentences in the file.  Can be done only once. """
+        if self.started:
+            raise ValueError('sentences of %s already read' % (self.fname))
+        self.started = True
+        for sent in self._sentences():
+            yield sent
+        if self.truncated is not None:
+            raise self.truncated
+
+    def _sentences(self):
+        if not self.hassentences:
+            return
+        scanner = self.scanner
+        if scanner.peek() == u'n':
+            # sentences is null
+            scanner.value()
+            return
+        scanner.expect(u'[')
+        if scanner.peek() == u']':
+            return
+        while True:
+            yield scanner.value()
+            if scanner.expect(u',]') == u']':
+                return
+
+    def close(self):
+        self.scanner.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class StreamWriter:
+    """ Incremental writer for files in the MetaNet JSON format.  The top level
+    fields are written first, followed by the sentences as they are passed to
+    :py:meth:`write`.  The resulting file loads (with :py:func:`loadfile`) to
+    the same structure that :py:func:`writefile` would have written::
+
+        with StreamWriter('out.json.gz', reader.header) as writer:
+            for sent in reader:
+                writer.write(process(sent))
+    """
+    def __init__(self, fname, header):
+        """
+        :param fname: file name (gzipped if it ends in .gz)
+        :type fname: str
+        :param header: top level fields of the document, other than sentences
+        :type header: dict
+        """
+        if fname.endswith('.gz'):
+            self.f = gzip.open(fname,"wb")
+        else:
+            self.f = open(fname,"wb")
+        self.f.write('{')
+        for key, value in header.iteritems():
+            if key == u'sentences':
+                continue
+            self.f.write('%s:%s,' % (ujson.dumps(key, ensure_ascii=True),
+                                     ujson.dumps(value, ensure_ascii=True)))
+        self.f.write('"sentences":[')
+        self.nsents = 0
+
+    def write(self, sent):
+        """ Write one sentence """
+        if self.nsents:
+            self.f.write(',')
+        self.f.write(ujson.dumps(sent, ensure_ascii=True))
+        self.nsents += 1
+
+    def writeall(self, sents):
+        for sent in sents:
+            self.write(sent)
+
+    def close(self):
+        if self.f is None:
+            return
+        self.f.write(']}')
+        self.f.close()
+        self.f = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
 ####################################################################################
 ####################################################################################
 #
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+from unittest import TestCase, TestSuite, makeSuite, main
+import os, gzip, shutil, tempfile
+
+from mnformats import mnjson
+from mnformats.mnjson import StreamReader, StreamWriter
+
+def corpus():
+    """ The header and sentences of a file with several documents.
+    """
+    docs, sents = [], []
+    for d, (name, nsents) in enumerate([(u'news1', 4), (u'blog2', 1), (u'página3', 7)]):
+        docs.append(mnjson.getJSONDocumentHeader(name=name, corp=u'test', type=u'news',
+                                                 size=nsents, lang=u'es'))
+        for i in range(nsents):
+            sents.append({'id': u'%s:%d' % (name, i + 1), 'idx': len(sents),
+                          'text': u'Frase %d del documento «%s» , con 1.5e3 [y] {llaves} "\\" .'
+                                  % (i, name),
+                          'lms': [{'score': 0.25 * d, 'name': [u'pobreza', None]}]})
+    header = mnjson.getJSONRoot(lang=u'es', docs=docs)
+    del header['sentences']
+    return header, sents
+
+class StreamTest(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.header, self.sents = corpus()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def read(self, fname, chunksize):
+        with StreamReader(fname, chunksize=chunksize) as reader:
+            return reader.header, list(reader)
+
+    def test_round_trip(self):
+        for name in ('corpus.json', 'corpus.json.gz'):
+            fname = os.path.join(self.dir, name)
+            with StreamWriter(fname, self.header) as writer:
+                writer.write(self.sents[0])
+                writer.writeall(self.sents[1:])
+            self.assertEqual(mnjson.loadfile(fname), dict(self.header, sentences=self.sents))
+            for chunksize in (1, 7, 64, 1048576):
+                self.assertEqual(self.read(fname, chunksize), (self.header, self.sents), chunksize)
+
+    def test_writefile(self):
+        # the fields after the sentences end up in the header too
+        for name in ('corpus.json', 'corpus.json.gz'):
+            fname = os.path.join(self.dir, name)
+            mnjson.writefile(fname, dict(self.header, sentences=self.sents))
+            for chunksize in (5, 1048576):
+                self.assertEqual(self.read(fname, chunksize), (self.header, self.sents), chunksize)
+        fname = os.path.join(self.dir, 'empty.json')
+        with StreamWriter(fname, self.header):
+            pass
+        self.assertEqual(self.read(fname, 3), (self.header, []))
+
+    def test_truncated(self):
+        fname = os.path.join(self.dir, 'corpus.json')
+        with StreamWriter(fname, self.header) as writer:
+            writer.writeall(self.sents)
+        with open(fname, 'rb') as f:
+            data = f.read()
+        start = data.index('"sentences"')
+        ends = [data.index(mnjson.ujson.dumps(sent, ensure_ascii=True)) +
+                len(mnjson.ujson.dumps(sent, ensure_ascii=True)) for sent in self.sents]
+        for end in range(start + 20, len(data), 37) + [len(data) - 1]:
+            for name, opener in (('cut.json', open), ('cut.json.gz', gzip.open)):
+                cut = os.path.join(self.dir, name)
+                with opener(cut, 'wb') as f:
+                    f.write(data[:end])
+                # the complete sentences are read, then the error is raised
+                read = []
+                with StreamReader(cut, chunksize=16) as reader:
+                    self.assertEqual(reader.header, self.header)
+                    try:
+                        for sent in reader:
+                            read.append(sent)
+                    except ValueError:
+                        pass
+                    else:
+                        self.fail('truncated at %d of %d bytes' % (end, len(data)))
+                self.assertEqual(read, self.sents[:len([e for e in ends if e <= end])])
+        # a file cut before the sentences cannot be opened
+        with open(fname, 'wb') as f:
+            f.write(data[:start - 10])
+        self.assertRaises(ValueError, StreamReader, fname)
+
+def test_suite():
+    suite = TestSuite()
+    suite.addTests(makeSuite(StreamTest))
+    return suite
+
+if __name__ == '__main__':
+    main(defaultTest='test_suite')
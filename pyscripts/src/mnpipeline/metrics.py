@@ -0,0 +1,285 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. module:: metrics
+   :platform: Unix
+   :synopsis: Timing of pipeline steps, and a sampling profiler
+
+Records the wall time, CPU time, number of calls and number of items
+processed (e.g. sentences) of the steps of the extraction pipeline: the
+phases of :py:mod:`iarpatests.m4detect` and their main sub-steps, such as
+POS tagging, dependency parsing, and cxn searches.  Steps can be nested;
+each is recorded under its path, e.g. ``CMS/parseDependencies``.  The
+module-level :py:data:`METRICS` instance is shared by all the components of
+a process.
+
+:py:class:`SamplingProfiler` samples the Python call stack of the main
+thread at a fixed interval of CPU time, and reports the functions the most
+time is spent in, as well as the stacks in the folded format used by flame
+graph tools.  Example::
+
+    from mnpipeline.metrics import METRICS
+
+    class Extractor:
+        @METRICS.timed('tag', items=lambda self, sentences: len(sentences))
+        def tag(self, sentences):
+            ...
+
+    with METRICS.step('extraction', items=len(sentences)):
+        extractor.tag(sentences)
+    METRICS.writefile('run.metrics.json')
+
+"""
+import os, sys, time, json, signal, resource, threading, logging, platform, functools
+from collections import defaultdict
+
+def _cputime():
+    """ Return the user and system CPU time of the process, in seconds.
+    """
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+class _Step:
+    """ A step being timed.  Items processed can be added while it runs.
+    """
+    def __init__(self, metrics, name, items):
+        self.metrics = metrics
+        self.name = name
+        self.items = items
+
+    def __enter__(self):
+        self.path = self.metrics._push(self.name)
+        self.start = time.time()
+        self.startcpu = _cputime()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.metrics._pop(self.path, time.time() - self.start,
+                          _cputime() - self.startcpu, self.items)
+        return False
+
+class Metrics:
+    """ Wall time, CPU time, calls and items of named steps, and counters.
+    """
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.reset()
+
+    def reset(self):
+        """ Clear all the recorded steps and counters.
+        """
+        with self.lock:
+            # path -> [calls, seconds, cpuseconds, items]
+            self.steps = {}
+            self.counters = defaultdict(int)
+            self.started = time.time()
+        self.local.stack = []
+
+    def _stack(self):
+        try:
+            return self.local.stack
+        except AttributeError:
+            self.local.stack = []
+            return self.local.stack
+
+    def _push(self, name):
+        stack = self._stack()
+        stack.append(name)
+        return u'/'.join(stack)
+
+    def _pop(self, path, seconds, cpuseconds, items):
+        self._stack().pop()
+        with self.lock:
+            entry = self.steps.get(path)
+            if entry is None:
+                entry = self.steps[path] = [0, 0.0, 0.0, 0]
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] += cpuseconds
+            entry[3] += items or 0
+
+    def step(self, name, items=0):
+        """ Return a context manager that times a step.
+
+        :param name: step name
+        :type name: str
+        :param items: number of items the step processes
+        :type items: int
+        """
+        return _Step(self, name, items)
+
+    def timed(self, name, items=None):
+        """ Decorator that times each call of a function as a step.
+
+        :param name: step name
+        :type name: str
+        :param items: function of the arguments of the call that returns the number of items it processes
+        :type items: callable
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with _Step(self, name, items(*args, **kwargs) if items else 0):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def count(self, name, n=1):
+        """ Add n to a counter.
+        """
+        with self.lock:
+            self.counters[name] += n
+
+    def path(self):
+        """ Return the path of the current step of this thread.
+        """
+        return u'/'.join(self._stack())
+
+    def stats(self):
+        """ Return the steps (by path) and counters, as a dict.
+        """
+        with self.lock:
+            steps = dict((path, {'calls': calls, 'seconds': seconds,
+                                 'cpuseconds': cpuseconds, 'items': items})
+                         for path, (calls, seconds, cpuseconds, items) in self.steps.iteritems())
+            return {'steps': steps, 'counters': dict(self.counters)}
+
+    def merge(self, stats):
+        """ Add the output of :py:meth:`stats` of another process, e.g. a
+        worker, with its steps nested under the current step.
+        """
+        prefix = self.path()
+        with self.lock:
+            for path, s in stats['steps'].iteritems():
+                if prefix:
+                    path = u'%s/%s' % (prefix, path)
+                entry = self.steps.get(path)
+                if entry is None:
+                    entry = self.steps[path] = [0, 0.0, 0.0, 0]
+                entry[0] += s['calls']
+                entry[1] += s['seconds']
+                entry[2] += s['cpuseconds']
+                entry[3] += s['items']
+            for name, n in stats['counters'].iteritems():
+                self.counters[name] += n
+
+    def logStats(self):
+        """ Log the steps, in order of path.
+        """
+        for path, s in sorted(self.stats()['steps'].iteritems()):
+            self.logger.info('%s: %d calls, %.3fs (%.3fs CPU), %d items', path, s['calls'],
+                             s['seconds'], s['cpuseconds'], s['items'])
+
+    def writefile(self, fname, info=None, profiler=None):
+        """ Write the metrics to a JSON file.
+
+        :param fname: file name
+        :type fname: str
+        :param info: additional information on the run (e.g. input file name)
+        :type info: dict
+        :param profiler: sampling profiler whose results to include
+        :type profiler: :py:class:`SamplingProfiler`
+        """
+        data = self.stats()
+        data['created'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+        data['elapsed'] = time.time() - self.started
+        data['host'] = platform.node()
+        data['pid'] = os.getpid()
+        # ru_maxrss is in kilobytes on Linux
+        data['peakrss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        if info:
+            data['run'] = info
+        if profiler:
+            data['profile'] = profiler.stats()
+        with open(fname, 'w') as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+
+class SamplingProfiler:
+    """ Samples the Python call stack of the main thread every interval
+    seconds of CPU time of the process.
+    """
+    def __init__(self, interval=0.005, maxdepth=100):
+        """
+        :param interval: sampling interval, in seconds of CPU time
+        :type interval: float
+        :param maxdepth: maximum number of frames of a stack sample
+        :type maxdepth: int
+        """
+        self.interval = interval
+        self.maxdepth = maxdepth
+        # folded stack -> number of samples
+        self.stacks = defaultdict(int)
+        self.samples = 0
+        self.running = False
+        self.handler = None
+
+    def _sample(self, signum, frame):
+        names = []
+        while (frame is not None) and (len(names) < self.maxdepth):
+            code = frame.f_code
+            names.append('%s (%s:%d)' % (code.co_name, os.path.basename(code.co_filename),
+                                         code.co_firstlineno))
+            frame = frame.f_back
+        names.reverse()
+        self.stacks[';'.join(names)] += 1
+        self.samples += 1
+
+    def start(self):
+        """ Start sampling.  This must be called from the main thread.
+        """
+        if self.running:
+            return
+        self.handler = signal.signal(signal.SIGPROF, self._sample)
+        # signal.signal makes the signal interrupt system calls, which would
+        # then fail with EINTR (pipe and socket reads, waits) all through the run
+        signal.siginterrupt(signal.SIGPROF, False)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        self.running = True
+
+    def stop(self):
+        """ Stop sampling.
+        """
+        if not self.running:
+            return
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, self.handler or signal.SIG_DFL)
+        signal.siginterrupt(signal.SIGPROF, True)
+        self.running = False
+
+    def merge(self, stats):
+        """ Add the samples of the output of :py:meth:`stats` of another
+        profiler, e.g. in a worker process.
+        """
+        for stack, n in stats['stacks'].iteritems():
+            self.stacks[stack] += n
+        self.samples += stats['samples']
+
+    def stats(self, top=40):
+        """ Return the samples, as a dict with the number of samples, the
+        top functions by total samples (with the samples in which the
+        function itself was running), and the folded stacks.
+        """
+        total = defaultdict(int)
+        own = defaultdict(int)
+        for stack, n in self.stacks.items():
+            names = stack.split(';')
+            for name in set(names):
+                total[name] += n
+            own[names[-1]] += n
+        functions = [{'function': name, 'samples': n, 'self': own.get(name, 0),
+                      'share': float(n) / self.samples}
+                     for name, n in sorted(total.iteritems(), key=lambda item: -item[1])[:top]]
+        return {'interval': self.interval, 'samples': self.samples,
+                'functions': functions, 'stacks': dict(self.stacks)}
+
+    def writeFolded(self, fname):
+        """ Write the stacks in the folded format of flame graph tools.
+        """
+        with open(fname, 'w') as f:
+            for stack, n in sorted(self.stacks.iteritems()):
+                f.write('%s %d\n' % (stack, n))
+
+# shared by all the components of a process
+METRICS = Metrics()
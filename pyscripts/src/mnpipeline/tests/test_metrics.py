@@ -0,0 +1,190 @@
+#
+from unittest import TestCase, TestSuite, makeSuite, main
+import os, json, time, signal, shutil, tempfile, threading
+
+from mnpipeline import metrics
+from mnpipeline.metrics import Metrics, SamplingProfiler
+
+def burn(seconds):
+    """ Use CPU time for a while.
+    """
+    end = metrics._cputime() + seconds
+    n = 0
+    while metrics._cputime() < end:
+        n += 1
+    return n
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        self.metrics = Metrics()
+
+    def test_steps(self):
+        m = self.metrics
+        with m.step('CMS', items=3):
+            for i in range(2):
+                with m.step('parse', items=2) as step:
+                    self.assertEqual(m.path(), u'CMS/parse')
+                    step.items += 1
+            try:
+                with m.step('map'):
+                    raise ValueError('failed')
+            except ValueError:
+                pass
+            self.assertEqual(m.path(), u'CMS')
+        self.assertEqual(m.path(), u'')
+        m.count('errors.CMS')
+        m.count('errors.CMS', 2)
+        stats = m.stats()
+        self.assertEqual(sorted(stats['steps']), [u'CMS', u'CMS/map', u'CMS/parse'])
+        self.assertEqual([(s['calls'], s['items']) for _, s in sorted(stats['steps'].items())],
+                         [(1, 3), (1, 0), (2, 6)])
+        self.assertTrue(stats['steps']['CMS']['seconds'] >= stats['steps']['CMS/parse']['seconds'])
+        self.assertEqual(stats['counters'], {'errors.CMS': 3})
+        m.reset()
+        self.assertEqual(m.stats(), {'steps': {}, 'counters': {}})
+
+    def test_timed(self):
+        m = self.metrics
+        class Tagger:
+            @m.timed('tag', items=lambda self, sentences: len(sentences))
+            def tag(self, sentences):
+                """ Tag sentences. """
+                return [s.upper() for s in sentences]
+        tagger = Tagger()
+        self.assertEqual(tagger.tag([u'a', u'b']), [u'A', u'B'])
+        tagger.tag([u'c'])
+        self.assertEqual(Tagger.tag.__doc__, ' Tag sentences. ')
+        step = m.stats()['steps']['tag']
+        self.assertEqual((step['calls'], step['items']), (2, 3))
+
+    def test_cputime(self):
+        m = self.metrics
+        with m.step('burn'):
+            burn(0.05)
+        with m.step('sleep'):
+            time.sleep(0.05)
+        steps = m.stats()['steps']
+        self.assertTrue(steps['burn']['cpuseconds'] >= 0.04, steps)
+        self.assertTrue(steps['sleep']['seconds'] >= 0.04, steps)
+        self.assertTrue(steps['sleep']['cpuseconds'] < 0.04, steps)
+
+    def test_threads(self):
+        # each thread has its own step path
+        m = self.metrics
+        paths = []
+        def worker():
+            with m.step('worker'):
+                paths.append(m.path())
+        with m.step('main'):
+            thread = threading.Thread(target=worker)
+            thread.start()
+            thread.join()
+            paths.append(m.path())
+        self.assertEqual(paths, [u'worker', u'main'])
+
+    def test_merge(self):
+        worker = Metrics()
+        with worker.step('CMS', items=5):
+            with worker.step('parse', items=5):
+                pass
+        worker.count('errors.CMS')
+        m = self.metrics
+        with m.step('shards'):
+            m.merge(worker.stats())
+            m.merge(json.loads(json.dumps(worker.stats())))
+        m.merge(worker.stats())
+        stats = m.stats()
+        self.assertEqual(sorted(stats['steps']),
+                         [u'CMS', u'CMS/parse', u'shards', u'shards/CMS', u'shards/CMS/parse'])
+        self.assertEqual(stats['steps']['shards/CMS']['calls'], 2)
+        self.assertEqual(stats['steps']['shards/CMS/parse']['items'], 10)
+        self.assertEqual(stats['steps']['CMS']['calls'], 1)
+        self.assertEqual(stats['counters'], {'errors.CMS': 3})
+
+    def test_writefile(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            fname = os.path.join(tmpdir, 'run.metrics.json')
+            with self.metrics.step('SCMS', items=2):
+                pass
+            profiler = SamplingProfiler()
+            profiler.merge({'stacks': {'main (m.py:1);f (m.py:5)': 3}, 'samples': 3})
+            self.metrics.writefile(fname, {'infilename': 'in.json'}, profiler)
+            with open(fname) as f:
+                data = json.load(f)
+            self.assertEqual(data['run'], {'infilename': 'in.json'})
+            self.assertEqual(data['steps']['SCMS']['items'], 2)
+            self.assertEqual(data['profile']['samples'], 3)
+            self.assertEqual(data['pid'], os.getpid())
+            self.assertTrue(data['peakrss'] > 0)
+        finally:
+            shutil.rmtree(tmpdir)
+
+class SamplingProfilerTest(TestCase):
+    def setUp(self):
+        self.siginterrupt = signal.siginterrupt
+        self.calls = []
+        def siginterrupt(signum, flag):
+            self.calls.append((signum, flag))
+            self.siginterrupt(signum, flag)
+        signal.siginterrupt = siginterrupt
+
+    def tearDown(self):
+        signal.siginterrupt = self.siginterrupt
+
+    def test_samples(self):
+        profiler = SamplingProfiler(interval=0.002)
+        profiler.start()
+        try:
+            burn(0.2)
+        finally:
+            profiler.stop()
+        self.assertTrue(profiler.samples > 10, profiler.samples)
+        self.assertEqual(signal.getsignal(signal.SIGPROF), signal.SIG_DFL)
+        stats = profiler.stats()
+        self.assertEqual(stats['samples'], profiler.samples)
+        burns = [f for f in stats['functions'] if f['function'].startswith('burn (')]
+        self.assertEqual(len(burns), 1)
+        self.assertTrue(burns[0]['share'] > 0.5, stats['functions'])
+        # no more samples
+        samples = profiler.samples
+        burn(0.05)
+        self.assertEqual(profiler.samples, samples)
+
+    def test_system_calls(self):
+        # system calls are restarted rather than failing with EINTR while sampling
+        profiler = SamplingProfiler()
+        profiler.start()
+        self.assertEqual(self.calls, [(signal.SIGPROF, False)])
+        profiler.start()
+        profiler.stop()
+        self.assertEqual(self.calls, [(signal.SIGPROF, False), (signal.SIGPROF, True)])
+
+    def test_merge(self):
+        profiler = SamplingProfiler()
+        profiler.merge({'stacks': {'main (m.py:1);f (m.py:5)': 3, 'main (m.py:1)': 1},
+                        'samples': 4})
+        profiler.merge({'stacks': {'main (m.py:1);f (m.py:5);g (m.py:9)': 4}, 'samples': 4})
+        stats = profiler.stats()
+        self.assertEqual(stats['samples'], 8)
+        self.assertEqual([(f['function'], f['samples'], f['self']) for f in stats['functions']],
+                         [('main (m.py:1)', 8, 1), ('f (m.py:5)', 7, 3), ('g (m.py:9)', 4, 4)])
+        tmpdir = tempfile.mkdtemp()
+        try:
+            fname = os.path.join(tmpdir, 'run.profile.folded')
+            profiler.writeFolded(fname)
+            with open(fname) as f:
+                self.assertEqual(f.read().splitlines(),
+                                 ['main (m.py:1) 1', 'main (m.py:1);f (m.py:5) 3',
+                                  'main (m.py:1);f (m.py:5);g (m.py:9) 4'])
+        finally:
+            shutil.rmtree(tmpdir)
+
+def test_suite():
+    suite = TestSuite()
+    suite.addTests(makeSuite(MetricsTest))
+    suite.addTests(makeSuite(SamplingProfilerTest))
+    return suite
+
+if __name__ == '__main__':
+    main(defaultTest='test_suite')
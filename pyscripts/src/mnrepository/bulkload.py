@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. module:: bulkload
+   :platform: Unix
+   :synopsis: Batched loading of table rows into the MetaNet LM and GMR databases
+
+Buffers rows destined for a set of database tables and writes them to the
+database in bounded batches, so that :py:mod:`mnrepository.fastdbimport`
+can load rows while it is still processing input files, instead of writing
+complete CSV files and loading them afterwards.
+
+Rows are written through a *sink*:
+
+- :py:class:`LoadDataSink` writes each batch to a temporary CSV file in the
+  format generated by fastdbimport and loads it with the database's
+  ``loadData`` method (``LOAD DATA LOCAL INFILE`` for MySQL);
+- :py:class:`DBAPISink` inserts the rows with ``executemany`` on a DB-API
+  connection, e.g. an SQLite stand-in for testing, optionally creating the
+  tables.
+
+A batch always contains the buffered rows of all the tables, written in
+the order in which the tables were given, so that rows are loaded after
+the rows they refer to; if it fails to load, :py:class:`BulkLoadError` is
+raised.  The loader records the number of rows and the time spent per
+table, and reports throughput in rows per second.
+
+Example::
+
+    loader = TableLoader(['document', 'sentence'], DBAPISink(sqlite3.connect('mn.db'), create=True))
+    loader.add('document', (1, u'doc1', u'BNC'))
+    loader.close()
+    loader.logStats()
+
+"""
+import os, time, logging, tempfile, pprint, traceback
+
+class BulkLoadError(Exception):
+    """ Raised when a batch of rows cannot be loaded.
+    """
+    pass
+
+def rowToLine(row):
+    """ Converts rows, which are tuples, to a CSV line.  It handles the escaping
+    of quotes and the conversion of numbers to strings.  None and empty strings
+    are written as NULL (\\N).
+
+    :param row: a row tuple
+    :type row: tuple
+    """
+    rlist = []
+    for elem in row:
+        if elem == None:
+            rlist.append('\\N')
+            continue
+        if (type(elem) is str) or (type(elem) is unicode):
+            if elem:
+                rlist.append(u'"%s"'%(elem.replace(u'\\',u'\\\\').replace(u'"',ur'\"')))
+            else:
+                rlist.append('\\N')
+            continue
+        if (type(elem) is int) or (type(elem) is float) or (type(elem) is long):
+            rlist.append(str(elem))
+            continue
+        raise TypeError('row contains elem %s of type %s. row contains %s' %(pprint.pformat(elem), pprint.pformat(type(elem)), pprint.pformat(row)) )
+    return u','.join(rlist)
+
+class LoadDataSink:
+    """ Loads batches of rows via temporary CSV files and the database class's
+    loadData method (see :py:meth:`mnrepository.gmrdb.GMRDB.loadData`).
+    """
+    def __init__(self, db, tmpdir=None):
+        """
+        :param db: database instance with a loadData(filename, table) method
+        :type db: :py:class:`mnrepository.metanetdb.MetaNetLMDB` or :py:class:`mnrepository.gmrdb.GMRDB`
+        :param tmpdir: directory for the temporary files (must be readable by the database client)
+        :type tmpdir: str
+        """
+        self.db = db
+        self.tmpdir = tmpdir
+
+    def load(self, table, rows):
+        fd, fname = tempfile.mkstemp(prefix='%s-' % (table), suffix='.txt', dir=self.tmpdir)
+        try:
+            f = os.fdopen(fd, 'wb')
+            for row in rows:
+                f.write(rowToLine(row).encode('utf-8'))
+                f.write('\n')
+            f.close()
+            os.chmod(fname, 0664)
+            self.db.loadData(fname, table)
+        finally:
+            os.remove(fname)
+
+    def close(self):
+        pass
+
+class DBAPISink:
+    """ Inserts batches of rows with executemany on a DB-API connection.
+    Empty strings are inserted as NULL, as they are by :py:class:`LoadDataSink`.
+    """
+    def __init__(self, conn, paramstyle='qmark', create=False):
+        """
+        :param conn: DB-API connection
+        :param paramstyle: 'qmark' (e.g. sqlite3) or 'format' (e.g. MySQLdb)
+        :type paramstyle: str
+        :param create: flag to create missing tables, with untyped columns
+        :type create: bool
+        """
+        self.conn = conn
+        self.marker = '?' if paramstyle == 'qmark' else '%s'
+        self.create = create
+        self.created = set()
+
+    def load(self, table, rows):
+        ncols = len(rows[0])
+        if self.create and (table not in self.created):
+            self.conn.execute('CREATE TABLE IF NOT EXISTS "%s" (%s)' %
+                              (table, ', '.join('c%d' % (i) for i in range(ncols))))
+            self.created.add(table)
+        sql = 'INSERT INTO %s VALUES (%s)' % (table, ', '.join([self.marker] * ncols))
+        cursor = self.conn.cursor()
+        cursor.executemany(sql, [tuple(None if elem == '' else elem for elem in row)
+                                 for row in rows])
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+
+class TableLoader:
+    """ Per-table row buffers, flushed to a sink in bounded batches.
+    """
+    def __init__(self, tables, sink, batchsize=50000):
+        """
+        :param tables: table names, in the order in which rows must be loaded
+        :type tables: list
+        :param sink: sink to load rows with (:py:class:`LoadDataSink` or :py:class:`DBAPISink`)
+        :param batchsize: number of buffered rows (over all tables) that triggers a flush
+        :type batchsize: int
+        """
+        self.logger = logging.getLogger(__name__)
+        self.tables = list(tables)
+        self.sink = sink
+        self.batchsize = batchsize
+        self.buffers = dict((table, []) for table in self.tables)
+        self.nbuffered = 0
+        self.nrows = dict((table, 0) for table in self.tables)
+        self.seconds = dict((table, 0.0) for table in self.tables)
+        self.nbatches = 0
+
+    def add(self, table, row):
+        """ Buffer a row for the table, flushing the buffers if they are full.
+        """
+        self.buffers[table].append(row)
+        self.nbuffered += 1
+        if self.nbuffered >= self.batchsize:
+            self.flush()
+
+    def flush(self):
+        """ Load the buffered rows of all tables, in table order.
+        """
+        if not self.nbuffered:
+            return
+        for table in self.tables:
+            rows = self.buffers[table]
+            if not rows:
+                continue
+            start = time.time()
+            try:
+                self.sink.load(table, rows)
+            except Exception:
+                raise BulkLoadError('failed to load %d rows into %s:\n%s' %
+                                    (len(rows), table, traceback.format_exc()))
+            self.seconds[table] += time.time() - start
+            self.nrows[table] += len(rows)
+            self.buffers[table] = []
+        self.nbuffered = 0
+        self.nbatches += 1
+        self.logger.debug('loaded batch %d', self.nbatches)
+
+    def close(self):
+        self.flush()
+        self.sink.close()
+
+    def stats(self):
+        """ Return a dict from table name to (rows loaded, seconds spent, rows/sec).
+        """
+        stats = {}
+        for table in self.tables:
+            rate = None
+            if self.seconds[table] > 0.0:
+                rate = self.nrows[table] / self.seconds[table]
+            stats[table] = (self.nrows[table], self.seconds[table], rate)
+        return stats
+
+    def logStats(self):
+        """ Log the throughput of each table.
+        """
+        stats = self.stats()
+        for table in self.tables:
+            nrows, seconds, rate = stats[table]
+            if rate is None:
+                self.logger.info('%s: %d rows', table, nrows)
+            else:
+                self.logger.info('%s: %d rows in %.2fs (%.0f rows/sec)', table, nrows, seconds, rate)
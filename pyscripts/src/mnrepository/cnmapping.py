@@ -17,9 +17,11 @@ conceptual network using WordNet, FrameNet, and Wiktionary.
 """
 from mnanalysis.programsources import ProgramSources
 from metanetrdf import MetaNetRepository
-import sys, re, logging, pprint, argparse, time, setproctitle
+import os, sys, re, logging, pprint, argparse, time, setproctitle
 from collections import Counter
 from mnrepository.gmrdb import GMRDB
+from mnrepository.mappingcache import MappingCache
+from mnpipeline.metrics import METRICS
 
 class ConceptualNetworkMapper:
     """
@@ -42,7 +44,7 @@ class ConceptualNetworkMapper:
     def __init__(self,lang, cachedir=None, useSE=None, targetConceptRank=None,
                  disableFN=False, govOnly=False, expansionTypes=[], expansionScoreScale=1.0,
                  sourceMappingLimit=2,minSecondaryScore=0.1,
-                 metanetrep=None,conceptMode='general'):
+                 metanetrep=None,conceptMode='general',mappingCacheSize=200000):
         """ Initialize a ConceptualNetworkMapper instance.
         :param lang: language
         :type lang: str
@@ -68,6 +70,9 @@ class ConceptualNetworkMapper:
         :type metanetrep: :py:mod:`mnrepository.metanetrdf.MetanetRepository`
         :param conceptMode: IARPA concept mode (general or case)
         :type conceptMode: str
+        :param mappingCacheSize: maximum number of memoised word to frame searches kept
+            on disk in the cache directory (0 to keep them in memory only)
+        :type mappingCacheSize: int
         """
         self.logger = logging.getLogger(__name__)
         self.lang = lang
@@ -92,6 +97,35 @@ class ConceptualNetworkMapper:
         self.conceptMode = conceptMode
         self.sourceMappingLimit = sourceMappingLimit
         self.minSecondaryScore = minSecondaryScore
+        self.initMappingCache(cachedir, mappingCacheSize)
+
+    def initMappingCache(self, cachedir=None, maxentries=200000):
+        """ Set up the memoisation of word to frame searches (see
+        :py:mod:`mnrepository.mappingcache`).  The cache is stored next to the
+        repository caches, and invalidated when the repository changes.  When
+        the repository has no local RDF file to hash, or is queried through a
+        SPARQL endpoint, its changes cannot be detected, and the cache is kept
+        in memory only.
+        :param cachedir: directory to save the cache in (defaults to the repository's)
+        :type cachedir: str
+        :param maxentries: maximum number of entries kept (0 to keep them in memory only)
+        :type maxentries: int
+        """
+        fname = None
+        rdfhash = self.mr.getSourceHash()
+        if maxentries:
+            if (rdfhash is None) or hasattr(self.mr, 'tstore'):
+                self.logger.info(u'repository version unknown, keeping the mapping cache in memory')
+            else:
+                if not cachedir:
+                    cachedir = self.mr.cachedir
+                if os.path.isdir(cachedir):
+                    fname = '%s/cache.cnmapping-%s.db' % (cachedir, self.lang)
+        validity = '%s:%s' % (self.mr.GRAPH_CACHE_VERSION, rdfhash)
+        self.mapcache = MappingCache(fname, validity, maxentries=maxentries)
+        # settings that change the results of the searches
+        self.mapcacheSettings = (self.lang, self.disableFN, self.mr.pwf is not None,
+                                 self.mr.fndata is not None, self.mr.wikdata is not None)
 
     def filterSourceConcepts(self, scons, mappingLimit=2, secondaryThreshold=0.2):
         """
@@ -315,7 +349,25 @@ class ConceptualNetworkMapper:
         return sconceptslist
     
     def getFramesFromLemma(self, lemma='', pos='',lpos=''):
-        """ Given lemma, returns frames
+        """ Given lemma, returns frames.  Results are memoised.
+        :param lemma: lemma for search for in Conceptual Network
+        :type lemma: str
+        :param pos: the search word's POS tag
+        :type pos: str
+        :param lpos: the search word's lemma.pos
+        :type lpos: str
+        :return: a set of frames (frame, framename, method)
+        :type: set
+        """
+        key = (self.mapcacheSettings, lemma, pos, lpos)
+        frameset = self.mapcache.get('getFramesFromLemma', key)
+        if frameset is None:
+            frameset = self.searchFramesFromLemma(lemma, pos, lpos)
+            self.mapcache.put('getFramesFromLemma', key, frameset)
+        return frameset
+
+    def searchFramesFromLemma(self, lemma='', pos='',lpos=''):
+        """ Given lemma, returns frames (without memoisation)
         :param lemma: lemma for search for in Conceptual Network
         :type lemma: str
         :param pos: the search word's POS tag
@@ -399,6 +451,7 @@ class ConceptualNetworkMapper:
         """
         Runs the lexical coverage expansion phases as listed on the input word.  Returns
         expanded lists of words, and scores, based on the reliability of the relation used.
+        Results are memoised.
         :param phases: list of expansion phases to run
         :type phases: list
         :param lemma: lemma to expand coverage for
@@ -406,6 +459,17 @@ class ConceptualNetworkMapper:
         :param pos: part of speech
         :type pos: str
         """
+        key = (self.mapcacheSettings, tuple(phases), lemma, pos)
+        result = self.mapcache.get('runExpansionPhases', key)
+        if result is None:
+            result = self.searchExpansionPhases(phases, lemma, pos)
+            self.mapcache.put('runExpansionPhases', key, result)
+        return result
+
+    def searchExpansionPhases(self, phases, lemma, pos):
+        """ Runs the expansion phases on the input word (without memoisation);
+        see :py:meth:`runExpansionPhases`.
+        """
         wdicts = []
         wscores = []
         if 'wnlem' in phases:
@@ -524,11 +588,22 @@ class ConceptualNetworkMapper:
         :param maxRank: how many of the top answers to report
         :type maxRank: int
         """
+        if not expansionTypes:
+            expansionTypes = self.expansionTypes
+        key = (self.mapcacheSettings, tuple(expansionTypes), lemma, pos, maxRank)
+        result = self.mapcache.get('getFramesByExpansion', key)
+        if result is None:
+            result = self.searchFramesByExpansion(lemma, pos, expansionTypes, maxRank)
+            self.mapcache.put('getFramesByExpansion', key, result)
+        return result
+
+    def searchFramesByExpansion(self,lemma,pos,expansionTypes,maxRank=3):
+        """ Expand lexical coverage on the lemma/pos given and return the best
+        matching frames (without memoisation); see :py:meth:`getFramesByExpansion`.
+        """
         phasesByType = {'wn': ['wnlem','wnhyper','wnhypo','wnsisters'],
                         'wik': ['wik'],
                         'fn': ['fnlem','fnchild','fnparent','fnsisters']}
-        if not expansionTypes:
-            expansionTypes = self.expansionTypes
         usedTypes = []
         framescores = {}
         for expType in expansionTypes:
@@ -586,6 +661,7 @@ class ConceptualNetworkMapper:
                 sframeslist.append((frame,self.mr.getNameLiteral(frame),method,self.getSourceConceptsFromFrame(frame,scorescale=scorescale),'CNMS'))
         return sframeslist
 
+    @METRICS.timed('runTargetMapping')
     def runTargetMapping(self,lm,force=False):
         """ Run the target word to frame to concept mapping on the LM.  If a mapping is already 
         detected, the method exits, unless force is specified.
@@ -617,6 +693,7 @@ class ConceptualNetworkMapper:
             lmtarget['cultconcept'] = tcgroup
         return 1
 
+    @METRICS.timed('runSourceMapping')
     def runSourceMapping(self,lm,force=False,sourceMappingLimit=None,minSecondaryScore=None,
                          expansionMaxRank=1,expansionThreshold=0.7):
         """ Run the source word to frame to concept mapping on the LM.  If a mapping is already
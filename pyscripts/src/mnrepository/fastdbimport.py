@@ -11,6 +11,12 @@ the databases are empty.  Each language as well as the case study data can be pr
 in parallel, due to the primary key id numbers being partitioned into roughly equal
 quadrants of the 2G integer space.
 
+With --direct, the table files are not generated: result files are read by worker
+processes, while the main process assigns ids and streams the rows into the databases
+in bounded batches (see :py:mod:`mnrepository.bulkload`).  --sqlite loads the rows
+into SQLite files instead (PREFIX-mn.db and PREFIX-gmr.db), for testing; the GMR
+database is still used for concept and protagonist ids.  The throughput of each table is logged at the end.
+
 .. moduleauthor:: Jisup <jhong@icsi.berkeley.edu>
 """
 
@@ -22,6 +28,7 @@ from metanetrdf import MetaNetRepository
 from mnformats import mnjson
 import argparse
 from multiprocessing import Pool
+from collections import deque
 from metanetdb import MetaNetLMDB
 from gmrdb import GMRDBCase, GMRDBGeneral
 from mnrepository.cnmapping import ConceptualNetworkMapper
@@ -32,7 +39,8 @@ from rdflib import URIRef
 from collections import Counter
 from bncdates import BNC_DATES
 from mnformats.mnconfig import MetaNetConfigParser
-import hashlib, tailer
+from bulkload import TableLoader, LoadDataSink, DBAPISink, BulkLoadError, rowToLine
+import hashlib, tailer, sqlite3
 
 # default configuration filename
 DEFAULT_CONFIGFNAME = '/u/metanet/etc/mnsystem.conf'
@@ -212,6 +220,9 @@ class FastDBImport:
             # the minus -1 will allow 1 instance through
             self.duplicateCounter[hashlib.md5(exclsent.encode()).hexdigest()] = self.maxDupes - 1
         self.validconceptgroups = set(self.gmrdb.getConceptGroupNames())
+        # when set, rows are loaded directly with these instead of written to files
+        self.mnloader = None
+        self.gmrloader = None
         self.logger.info('Initialized in %s mode.  Valid concept groups: %s',
                          self.gmrmode, u','.join(self.validconceptgroups))
         
@@ -348,22 +359,37 @@ class FastDBImport:
         :param row: a row tuple
         :type row: tuple
         """
-        rlist = []
-        for elem in row:
-            if elem == None:
-                rlist.append('\\N')
-                continue
-            if (type(elem) is str) or (type(elem) is unicode):
-                if elem:
-                    rlist.append(u'"%s"'%(elem.replace(u'\\',u'\\\\').replace(u'"',ur'\"')))
-                else:
-                    rlist.append('\\N')
-                continue
-            if (type(elem) is int) or (type(elem) is float) or (type(elem) is long):
-                rlist.append(str(elem))
-                continue
-            raise TypeError('row contains elem %s of type %s. row contains %s' %(pprint.pformat(elem), pprint.pformat(type(elem)), pprint.pformat(row)) )
-        return u','.join(rlist)
+        return rowToLine(row)
+    
+    def writeMNRow(self, table, row):
+        """
+        Write a row of a MetaNet LM database table, to the table file or, when
+        loading directly, to the table loader.
+        
+        :param table: table name
+        :type table: str
+        :param row: a row tuple
+        :type row: tuple
+        """
+        if self.mnloader:
+            self.mnloader.add(table, row)
+        else:
+            print >> self.mndatafiles[table], self.rowtoline(row)
+    
+    def writeGMRRow(self, table, row):
+        """
+        Write a row of a GMR database table, to the table file or, when
+        loading directly, to the table loader.
+        
+        :param table: table name
+        :type table: str
+        :param row: a row tuple
+        :type row: tuple
+        """
+        if self.gmrloader:
+            self.gmrloader.add(table, row)
+        else:
+            print >> self.gmrdatafiles[table], self.rowtoline(row)
     
     def generateTableFiles(self, fileIterator):
         """
@@ -437,6 +463,56 @@ class FastDBImport:
                 self.processResultFile(jdata)
             except:
                 self.logger.error('error processing result file %s\n%s',fname,traceback.format_exc())
+        self.generateCMRows()
+    
+    def importDirect(self, fileIterator, mnloader, gmrloader, workers=2):
+        """
+        Process the JSON files and load the rows for both databases directly,
+        without table files.  Result files are read and pruned by worker processes
+        ahead of the main process, which assigns ids and streams the rows into the
+        loaders; these flush them to the databases in batches as they fill.
+        Assumes completely empty databases.
+        
+        :param fileIterator: iterator over JSON input filenames
+        :type fileIterator: iterable
+        :param mnloader: loader for the MetaNet LM database tables
+        :type mnloader: :py:class:`mnrepository.bulkload.TableLoader`
+        :param gmrloader: loader for the GMR database tables
+        :type gmrloader: :py:class:`mnrepository.bulkload.TableLoader`
+        :param workers: number of processes reading result files (0 to read them in
+            the main process)
+        :type workers: int
+        """
+        self.mnloader = mnloader
+        self.gmrloader = gmrloader
+        try:
+            for fname, jdata, error in iterResultFiles(fileIterator, workers):
+                self.logger.info('start importing %s', fname)
+                if error:
+                    self.logger.error('error reading json file %s\n%s',fname,error)
+                    continue
+                try:
+                    self.processResultFile(jdata)
+                except BulkLoadError:
+                    raise
+                except:
+                    self.logger.error('error processing result file %s\n%s',fname,traceback.format_exc())
+            self.generateCMRows()
+            self.mnloader.close()
+            self.gmrloader.close()
+        finally:
+            self.mnloader = None
+            self.gmrloader = None
+        self.logger.info('MetaNet LM database import throughput:')
+        mnloader.logStats()
+        self.logger.info('GMR database import throughput:')
+        gmrloader.logStats()
+    
+    def generateCMRows(self):
+        """
+        Create the cm table rows for the GMR, from the counts of LMs
+        supporting each (target concept, source concept) pair.
+        """
         # create cm table files for GMR; cmtup is (targetid,sourceid)
         for cmtup in sorted(self.cmsupportcounter.keys(),
                             key=lambda x: self.cmsupportcounter[x]):
@@ -483,7 +559,7 @@ class FastDBImport:
                         mcprotid = 1
                 #cmrow = (cmid, self.gmrlang, cmtup[1], mcprotid)
                 cmrow = (cmid, self.gmrlang, cmtup[0], cmtup[1], mcprotid)
-                print >> self.gmrdatafiles[cmtable], self.rowtoline(cmrow)
+                self.writeGMRRow(cmtable, cmrow)
                 #
                 # SJD:  join tables deleted in v44 
                 #if self.casemode:
@@ -510,7 +586,7 @@ class FastDBImport:
                     self.gmridnum[propertytable] += 1
                     cmpropid = self.gmridnum[propertytable]
                     cmproprow = (cmpropid, cmid, 'mappedFrame',framename,score)
-                    print >> self.gmrdatafiles[propertytable], self.rowtoline(cmproprow)
+                    self.writeGMRRow(propertytable, cmproprow)
             else:
                 self.logger.info('not adding cm (%s, %s) with freq %d',
                                  self.gmrdb.getTargetConceptName(cmtup[0]),
@@ -700,8 +776,9 @@ class FastDBImport:
         # MN DOCUMENTS
         # if document isn't already in the database, plan to insert it by
         # appending to datafile.
-        sentCounter = 0
-        noLMSentCounter = 0
+        # result files pruned by loadResultFile carry counts of the sentences removed
+        sentCounter = jdata.get('nprunedsentences', 0)
+        noLMSentCounter = jdata.get('nprunedsentences', 0)
         if type(jdata['documents'])==dict:
             jdata['documents'] = [jdata['documents']]
         for docheader in jdata['documents']:
@@ -732,7 +809,7 @@ class FastDBImport:
                       docheader['provenance'],
                       self.lang,
                       docheader['size'])
-            print >> self.mndatafiles['document'], self.rowtoline(docrow)
+            self.writeMNRow('document', docrow)
             self.mnrefs['document'][docheader[self.docreffield]] = self.mnidnum['document']
             if protagonistid not in self.protwc:
                 self.protwc[protagonistid] = 0        
@@ -757,7 +834,9 @@ class FastDBImport:
             
             # keep a count of all the words per protagonist.  This is to normalize
             # lm frequency per perspective
-            if 'word' in sent:
+            if 'nwords' in sent:
+                self.protwc[protagonistid] += sent['nwords']
+            elif 'word' in sent:
                 self.protwc[protagonistid] += len(sent['word'])
             elif 'text' in sent:
                 self.protwc[protagonistid] += len(sent['text'].split())
@@ -972,7 +1051,7 @@ class FastDBImport:
                         lmid = self.mnidnum['LM']
                         self.mnrefs['LM'][lmname] = lmid
                         lmrow = self.create_lm_row(lmid, lmname, lm, self.lang)
-                        print >> self.mndatafiles['LM'], self.rowtoline(lmrow)
+                        self.writeMNRow('LM', lmrow)
                         
                     
                     # ============================================================================
@@ -996,7 +1075,7 @@ class FastDBImport:
                             mnsentid = self.mnidnum['sentence']
                             mnsentrow = (mnsentid, sent[u'id'], sent[u'text'], docid)
                             # write to our internal MR
-                            print >> self.mndatafiles['sentence'], self.rowtoline(mnsentrow)
+                            self.writeMNRow('sentence', mnsentrow)
                             self.mnrefs['sentence'][sent[u'id']] = mnsentid
                         sentenceImportedMN = True
                     else:
@@ -1008,7 +1087,7 @@ class FastDBImport:
                     lmirow = (mnlmiid, lmid, mnsentid, None,
                               spant, spans, data, None,
                               None, None, extractor)
-                    print >> self.mndatafiles['LM_instance'], self.rowtoline(lmirow)
+                    self.writeMNRow('LM_instance', lmirow)
                     
                     # =====================================================================================
                     # DETERMINE GMR CONCEPT IDs
@@ -1044,7 +1123,7 @@ class FastDBImport:
                             else:
                                 pubdate = self.getPubDate(sent[u'id'])
                             gmrsentrow = (gmrsentid,self.gmrlang,sent[u'text'],sent[u'id'],self.gmrdoctypebyid[docid],pubdate)
-                            print >> self.gmrdatafiles['lm_sentence'], self.rowtoline(gmrsentrow)
+                            self.writeGMRRow('lm_sentence', gmrsentrow)
                             self.gmrrefs['lm_sentence'][sent[u'id']] = gmrsentid
                             sentenceImportedGMR = True
                             # store hash of the sentence text for duplicate checking
@@ -1063,7 +1142,7 @@ class FastDBImport:
                         gmrlmid = self.gmridnum['lm']
                         gmrlmrow = (gmrlmid,self.gmrlang,lm['target']['form'],lm['source']['form'],
                                     lm['source']['lemma'],gmrsentid, protid, mnlmiid)
-                        print >> self.gmrdatafiles['lm'], self.rowtoline(gmrlmrow)
+                        self.writeGMRRow('lm', gmrlmrow)
     
                         # write to lm2cm_target join table: these tables have no ID field
                         if self.casemode:
@@ -1072,18 +1151,18 @@ class FastDBImport:
                             lm2cmtargettable = 'lm2cm_target_general'
                         self.gmridnum[lm2cmtargettable] += 1
                         lm2cmtargetrow = (gmrlmid,targetconceptid)
-                        print >> self.gmrdatafiles[lm2cmtargettable], self.rowtoline(lm2cmtargetrow)
+                        self.writeGMRRow(lm2cmtargettable, lm2cmtargetrow)
                                      
                         # insert properties for this lm
                         self.gmridnum['lm_property'] += 1
                         lmtproprow = (self.gmridnum['lm_property'],gmrlmid,
                                       'hasMetaScore',str(lmscore),lmscore)
-                        print >> self.gmrdatafiles['lm_property'], self.rowtoline(lmtproprow)
+                        self.writeGMRRow('lm_property', lmtproprow)
                         if (maxmappingframe) and (maxmappingscore > 0.0):
                             self.gmridnum['lm_property'] += 1
                             lmtproprow = (self.gmridnum['lm_property'],gmrlmid,
                                           'hasMappingScore',maxmappingframe,maxmappingscore)
-                            print >> self.gmrdatafiles['lm_property'], self.rowtoline(lmtproprow)
+                            self.writeGMRRow('lm_property', lmtproprow)
                         else:
                             self.logger.warn('LM %s has concept ids, but no mappingframe',lmname)
                             self.logger.debug('---start LM\n%s\n---end LM',pprint.pformat(lm))
@@ -1093,12 +1172,12 @@ class FastDBImport:
                                 self.gmridnum['lm_property'] += 1
                                 lmtproprow = (self.gmridnum['lm_property'],gmrlmid,
                                               'hasTargetFrame',targetframename[:45],None)
-                                print >> self.gmrdatafiles['lm_property'], self.rowtoline(lmtproprow)
+                                self.writeGMRRow('lm_property', lmtproprow)
                                 for sourceframename in sourceframenames:
                                     self.gmridnum['lm_property'] += 1
                                     lmsproprow = (self.gmridnum['lm_property'],gmrlmid,
                                                   'hasSourceFrame',sourceframename[:45],None)
-                                    print >> self.gmrdatafiles['lm_property'], self.rowtoline(lmsproprow)
+                                    self.writeGMRRow('lm_property', lmsproprow)
                             else:
                                 if lm['source'].get('smapmethod') != 'DLS':
                                     self.logger.warn('lm[source] has concept but no frames:\n%s',pprint.pformat(lm['source']))
@@ -1106,7 +1185,7 @@ class FastDBImport:
                             self.logger.warn('lm[target] has concept but no frame:\n%s',pprint.pformat(lm['target']))
                         for sconid in sourceconceptids:
                             lmcmrow = (gmrlmid, sconid, confidence)
-                            print >> self.gmrdatafiles['lm2cm_source'], self.rowtoline(lmcmrow)
+                            self.writeGMRRow('lm2cm_source', lmcmrow)
                             # count up the number of LMs
                             if (targetconceptid, sconid) in self.cmsupportcounter:
                                 self.cmsupportcounter[(targetconceptid,sconid)] += 1
@@ -1171,7 +1250,70 @@ class FastDBImport:
                 os.chmod(self.gmrdatafnames[table], 0664)
                 self.logger.info('importing %s', self.gmrdatafnames[table])
                 self.gmrdb.loadData(self.gmrdatafnames[table],table)
-     
+
+def loadResultFile(fname):
+    """ Read a JSON result file, and prune the parts of it that
+    :py:meth:`FastDBImport.processResultFile` does not use: sentences without
+    LMs are removed (and counted) and word lists are replaced by their length.
+    Runs in worker processes for :py:meth:`FastDBImport.importDirect`, so that the
+    data to send back to the main process is small.  Returns a tuple
+    (filename, JSON dict, None) or, on failure, (filename, None, error message).
+    
+    :param fname: JSON result filename
+    :type fname: str
+    """
+    try:
+        jdata = mnjson.loadfile(fname)
+    except:
+        return fname, None, traceback.format_exc()
+    sentences = []
+    for sent in jdata.get('sentences', []):
+        if not sent.get(u'lms'):
+            continue
+        psent = {}
+        for field in (u'id', u'text', u'lms'):
+            if field in sent:
+                psent[field] = sent[field]
+        if u'word' in sent:
+            psent[u'nwords'] = len(sent[u'word'])
+        sentences.append(psent)
+    jdata['nprunedsentences'] = len(jdata.get('sentences', [])) - len(sentences)
+    jdata['sentences'] = sentences
+    return fname, jdata, None
+
+def iterResultFiles(fileIterator, workers=2, depth=None):
+    """ Generate the results of :py:func:`loadResultFile` on the filenames
+    in fileIterator, in order.  With workers, files are read in a pool of
+    processes, at most depth files ahead of the consumer.
+    
+    :param fileIterator: iterator over JSON input filenames
+    :type fileIterator: iterable
+    :param workers: number of worker processes (0 to read files in this process)
+    :type workers: int
+    :param depth: number of files to read ahead (default twice the number of workers)
+    :type depth: int
+    """
+    fnames = (jfile.strip() for jfile in fileIterator)
+    if not workers:
+        for fname in fnames:
+            yield loadResultFile(fname)
+        return
+    if not depth:
+        depth = 2 * workers
+    pool = Pool(workers)
+    try:
+        pending = deque()
+        for fname in fnames:
+            pending.append(pool.apply_async(loadResultFile, (fname,)))
+            if len(pending) >= depth:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
 def main():
     """ Main method to instantiate classes, connect to the databases,
     and run the conversions and imports.  Run the following to see the command
@@ -1217,6 +1359,17 @@ def main():
                         'process the input files.')
     parser.add_argument('--delete',help='Delete before importing.',
                         action='store_true')
+    parser.add_argument('--direct',action='store_true',
+                        help='Load rows into the databases while processing the input '\
+                        'files, without generating table files.')
+    parser.add_argument('--workers',type=int,default=2,
+                        help='Number of processes reading input files in --direct mode.')
+    parser.add_argument('--batch-size',dest='batchsize',type=int,default=50000,
+                        help='Number of rows to load at a time in --direct mode.')
+    parser.add_argument('--sqlite',dest='sqliteprefix',
+                        help='In --direct mode, load the rows into tables in SQLite files '\
+                        'named PREFIX-mn.db and PREFIX-gmr.db instead of the databases '\
+                        '(for testing).')
     parser.add_argument("--disable-fn", dest="disablefn", action="store_true",
                         help="Disable FN extension for frame search (English).")
     parser.add_argument("--source-mapping-limit",dest="mappinglimit",
@@ -1246,6 +1399,10 @@ def main():
     parser.add_argument("--mode", dest="configmode",
                         help="Used to activate a mode defined in the config file.")
     cmdline = parser.parse_args()
+    if cmdline.direct and (cmdline.genonly or cmdline.importonly or cmdline.gmronly or cmdline.mnonly):
+        parser.error('--direct cannot be combined with --gen-only, --import-only, --gmr-only or --mn-only')
+    if cmdline.sqliteprefix and (not cmdline.direct):
+        parser.error('--sqlite requires --direct')
 
     # this routine has to write its own files
     msgformat = '%(asctime)-15s - %(message)s'
@@ -1357,6 +1514,18 @@ def main():
                         excludeExtractors=excludeExtractors)
         
     flist = codecs.open(cmdline.filenamelist,encoding='utf-8')
+    if cmdline.direct:
+        if cmdline.sqliteprefix:
+            mnsink = DBAPISink(sqlite3.connect(cmdline.sqliteprefix + '-mn.db'), create=True)
+            gmrsink = DBAPISink(sqlite3.connect(cmdline.sqliteprefix + '-gmr.db'), create=True)
+        else:
+            mnsink = LoadDataSink(mndb, cmdline.procdir)
+            gmrsink = LoadDataSink(gmrdb, cmdline.procdir)
+        fdbi.importDirect(flist,
+                          TableLoader(fdbi.mntables, mnsink, cmdline.batchsize),
+                          TableLoader(fdbi.gmrtables, gmrsink, cmdline.batchsize),
+                          workers=cmdline.workers)
+        return
     if not cmdline.importonly:
         fdbi.generateTableFiles(flist)
     if not cmdline.genonly:
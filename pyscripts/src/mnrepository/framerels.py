@@ -0,0 +1,335 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. module:: framerels
+   :platform: Unix
+   :synopsis: Precomputed frame relation closures for the MetaNet repository
+
+Builds, from the repository graph, in-memory indexes of the frame
+relations that :py:class:`mnrepository.metanetrdf.MetaNetRepository` used to
+evaluate with SPARQL property paths (``isSubcaseOfFrame+``,
+``makesUseOfFrame``, ``incorporatesFrameAsRole``, ``isFrameSubfamilyOf+``,
+and the CM source/target links).  Closures are computed once when the index
+is built, so that the frame hierarchy methods and the ``getcmsfrom*``
+queries behind :py:meth:`MetaNetRepository.getCMs` become set lookups.
+
+The index mirrors the queries exactly, including the predicates they name;
+e.g. ``getcmsfromsubcase`` is written with ``isSubCaseOfFrame``, and its
+index answer is computed over that same predicate.
+
+List results differ from the SPARQL ones in one way: they are sorted and
+have no duplicates, where the queries (most of them not ``DISTINCT``)
+return rows in store order and repeat a row for each path that finds it.
+
+The index can be pickled, and is cached next to the other repository
+caches.  The main method benchmarks the index against the SPARQL queries
+and checks that both return the same results::
+
+    python -m mnrepository.framerels -l en -n 200
+
+"""
+import logging, argparse, random, time, sys
+from rdflib import Namespace
+from rdflib.namespace import RDF
+
+MO = Namespace("https://metaphor.icsi.berkeley.edu/metaphor/MetaphorOntology.owl#")
+
+def _adjacency(g, predicate):
+    """ Return a dict mapping each subject to the set of its objects for the
+    given predicate.
+    """
+    adj = {}
+    for s, o in g.subject_objects(predicate):
+        adj.setdefault(s, set()).add(o)
+    return adj
+
+def _invert(adj):
+    inv = {}
+    for s, objs in adj.iteritems():
+        for o in objs:
+            inv.setdefault(o, set()).add(s)
+    return inv
+
+def _closure(adj):
+    """ Return the transitive (non-reflexive) closure of an adjacency dict.
+    """
+    closure = {}
+    for start in adj:
+        seen = set()
+        stack = list(adj[start])
+        while stack:
+            node = stack.pop()
+            if node in seen:
+                continue
+            seen.add(node)
+            stack.extend(adj.get(node, ()))
+        closure[start] = seen
+    return closure
+
+def _steps(adj, nodes, n):
+    """ Return the set of nodes reachable from nodes by walks of exactly n
+    edges.
+    """
+    frontier = set(nodes)
+    for i in range(n):
+        nextfrontier = set()
+        for node in frontier:
+            nextfrontier.update(adj.get(node, ()))
+        frontier = nextfrontier
+    return frontier
+
+class FrameRelationIndex(object):
+    """ Precomputed frame relation index over a MetaNet repository graph.
+    """
+    # getCMs query names that the index can answer
+    CM_QUERIES = ('getdirectcmfromframes', 'getcmsfromsubcase',
+                  'getcmsfromframeslocal', 'getcmsfromframesmed',
+                  'getcmsfromframeslong', 'getusedcms', 'getusedcmslocal')
+
+    def __init__(self, g):
+        """
+        :param g: repository graph
+        :type g: rdflib.Graph
+        """
+        logger = logging.getLogger(__name__)
+        logger.info('building frame relation index...')
+        self.frames = set(g.subjects(RDF.type, MO.Frame))
+        self.families = set(g.subjects(RDF.type, MO.FrameFamily))
+        self.names = _adjacency(g, MO.hasName)
+        self.subcase = _adjacency(g, MO.isSubcaseOfFrame)
+        self.subcaseup = _closure(self.subcase)
+        self.subcasedown = _invert(self.subcaseup)
+        self.subcasechildren = _invert(self.subcase)
+        # the getcmsfromsubcase query is written with this spelling
+        self.subcaseCapup = _closure(_adjacency(g, MO.isSubCaseOfFrame))
+        self.uses = _adjacency(g, MO.makesUseOfFrame)
+        self.usedby = _invert(self.uses)
+        self.roles = _adjacency(g, MO.incorporatesFrameAsRole)
+        # walks over makesUseOfFrame|isSubcaseOfFrame edges
+        self.useorsub = {}
+        for adj in (self.uses, self.subcase):
+            for s, objs in adj.iteritems():
+                self.useorsub.setdefault(s, set()).update(objs)
+        self.infamily = _adjacency(g, MO.isInFrameFamily)
+        self.subfamilyup = _closure(_adjacency(g, MO.isFrameSubfamilyOf))
+        self.cmtargets = _adjacency(g, MO.hasTargetFrame)
+        self.cmsources = _adjacency(g, MO.hasSourceFrame)
+        self.targetcms = _invert(self.cmtargets)
+        self.lexunits = set(g.subjects(RDF.type, MO.LexicalUnit))
+        self.framelus = _adjacency(g, MO.hasLexicalUnit)
+        self.lulemmas = _adjacency(g, MO.hasLemma)
+        logger.info('frame relation index has %d frames, %d subcase links, %d use links',
+                    len(self.frames), sum(len(v) for v in self.subcase.itervalues()),
+                    sum(len(v) for v in self.uses.itervalues()))
+
+    def _up(self, frame):
+        """ isSubcaseOfFrame* from frame """
+        ancestors = set(self.subcaseup.get(frame, ()))
+        ancestors.add(frame)
+        return ancestors
+
+    def _upall(self, frames):
+        result = set()
+        for frame in frames:
+            result.update(self._up(frame))
+        return result
+
+    def _cmsLinking(self, tframes, sframes):
+        """ CMs with a target frame in tframes and a source frame in sframes """
+        cms = set()
+        for tframe in tframes:
+            for cm in self.targetcms.get(tframe, ()):
+                if not self.cmsources.get(cm, set()).isdisjoint(sframes):
+                    cms.add(cm)
+        return cms
+
+    def getCMs(self, queryname, tframe, sframe):
+        """ Answer one of the CM_QUERIES for the given frames, returning a
+        sorted list of CM URIRefs.
+        """
+        if (tframe not in self.frames) or (sframe not in self.frames):
+            return []
+        if queryname == 'getdirectcmfromframes':
+            tset, sset = set([tframe]), set([sframe])
+        elif queryname == 'getcmsfromsubcase':
+            tset = set(self.subcaseCapup.get(tframe, ()))
+            tset.add(tframe)
+            sset = set(self.subcaseCapup.get(sframe, ()))
+            sset.add(sframe)
+        elif queryname == 'getcmsfromframeslocal':
+            tset = self._upall(self.usedby.get(tframe, ()))
+            sset = self._up(sframe)
+        elif queryname in ('getcmsfromframesmed', 'getcmsfromframeslong'):
+            users = set()
+            for iitframe in self._up(tframe):
+                users.update(self.usedby.get(iitframe, ()))
+            tset = self._upall(users)
+            sset = self._up(sframe)
+            if queryname == 'getcmsfromframeslong':
+                sset.update(self._upall(self.usedby.get(sframe, ())))
+        elif queryname == 'getusedcms':
+            tset = self.uses.get(tframe, set())
+            sset = self.uses.get(sframe, set())
+        elif queryname == 'getusedcmslocal':
+            tset = self._upall(self.uses.get(tframe, ()))
+            sset = self._upall(self.uses.get(sframe, ()))
+        else:
+            raise ValueError(u'No indexed version of query %s' % (queryname))
+        return sorted(self._cmsLinking(tset, sset))
+
+    def usesWithin(self, frame1, frame2, lengths):
+        """ True if frame2 is reachable from frame1 by a walk over
+        makesUseOfFrame|isSubcaseOfFrame edges of one of the given lengths.
+        """
+        frontier = set([frame1])
+        for n in range(1, max(lengths) + 1):
+            frontier = _steps(self.useorsub, frontier, 1)
+            if (n in lengths) and (frame2 in frontier):
+                return True
+            if not frontier:
+                break
+        return False
+
+    def fillsRole(self, frame1, frame2):
+        """ True if frame2 (or an ancestor) incorporates frame1 (or an
+        ancestor) as a role. """
+        ancestors1 = self._up(frame1)
+        for iframe2 in self._up(frame2):
+            if not self.roles.get(iframe2, set()).isdisjoint(ancestors1):
+                return True
+        return False
+
+    def framesUsingBoth(self, frame1, frame2):
+        """ Sorted list of (frame, name) for frames that make use of both
+        frames. """
+        others = self.usedby.get(frame1, set()) & self.usedby.get(frame2, set())
+        return sorted((other, name) for other in others
+                      for name in self.names.get(other, ()))
+
+    def commonSubcases(self, frame1, frame2):
+        """ Sorted list of (frame, name) for frames that are subcases of both
+        frames, at a distance of 1 or 2 links. """
+        def subcases(frame):
+            result = set()
+            for child in self.subcasechildren.get(frame, ()):
+                result.add(child)
+                result.update(self.subcasechildren.get(child, ()))
+            return result
+        others = subcases(frame1) & subcases(frame2)
+        return sorted((other, name) for other in others
+                      for name in self.names.get(other, ()))
+
+    def allFamilies(self, frame):
+        """ Sorted list of families of frame, including ancestor families """
+        if frame not in self.frames:
+            return []
+        families = set()
+        for family in self.infamily.get(frame, ()):
+            if family in self.families:
+                families.add(family)
+            for ancestor in self.subfamilyup.get(family, ()):
+                if (family in self.families) and (ancestor in self.families):
+                    families.add(ancestor)
+        return sorted(families)
+
+    def hierarchyLemmas(self, frame):
+        """ Sorted list of (lemma, framename) for the LUs of frame and of all
+        of its (transitive) subcases.  LUs of frame itself are only included
+        if it is in some frame family.
+        """
+        if frame not in self.frames:
+            return []
+        lus = set()
+        if frame in self.infamily:
+            lus.update(self.framelus.get(frame, ()))
+        for subframe in self.subcasedown.get(frame, ()):
+            if subframe in self.frames:
+                lus.update(self.framelus.get(subframe, ()))
+        lemmas = set()
+        for lu in lus:
+            if lu in self.lexunits:
+                lemmas.update(self.lulemmas.get(lu, ()))
+        return sorted((lemma, name) for lemma in lemmas
+                      for name in self.names.get(frame, ()))
+
+def benchmark(mr, nsamples=100, seed=0):
+    """ Time the indexed and SPARQL versions of the frame relation methods of
+    a MetaNetRepository on random frame pairs, and check that they agree.
+    Returns a list of (method, sparql seconds, index seconds, mismatches).
+    """
+    index = mr.framerels
+    rand = random.Random(seed)
+    frames = sorted(index.frames)
+    pairs = [(rand.choice(frames), rand.choice(frames)) for i in range(nsamples)]
+    singles = [p[0] for p in pairs]
+    # for use relations, make sure some of the pairs are actually related
+    for i in range(0, nsamples, 2):
+        frame1 = pairs[i][0]
+        reachable = sorted(_steps(index.useorsub, [frame1], 1 + (i % 4)))
+        if reachable:
+            pairs[i] = (frame1, rand.choice(reachable))
+    def normalize(result):
+        if isinstance(result, list):
+            return sorted(set(result))
+        return result
+    checks = [('getLUsFromFrameHierarchy', singles,
+               lambda f: mr.getLUsFromFrameHierarchy(f)),
+              ('getAllFrameFamilies', singles,
+               lambda f: [row.family for row in mr.getAllFrameFamilies(f)]),
+              ('doesFrame1UseFrame2', pairs, lambda p: mr.doesFrame1UseFrame2(*p)),
+              ('doesFrame1UseFrame2long', pairs, lambda p: mr.doesFrame1UseFrame2long(*p)),
+              ('doesFrame1FillRoleInFrame2', pairs,
+               lambda p: mr.doesFrame1FillRoleInFrame2(*p)),
+              ('frameThatUsesBoth', pairs, lambda p: mr.frameThatUsesBoth(*p)),
+              ('frameThatBothAreSubcasesOf', pairs,
+               lambda p: mr.frameThatBothAreSubcasesOf(*p))]
+    for queryname in FrameRelationIndex.CM_QUERIES:
+        checks.append(('getCMs:' + queryname, pairs,
+                       lambda p, q=queryname: mr.getCMs(q, *p)))
+    report = []
+    for name, args, method in checks:
+        timings = []
+        results = []
+        for useindex in (False, True):
+            mr.framerels = index if useindex else None
+            start = time.time()
+            results.append([normalize(method(arg)) for arg in args])
+            timings.append(time.time() - start)
+        mr.framerels = index
+        mismatches = sum(1 for a, b in zip(*results) if a != b)
+        report.append((name, timings[0], timings[1], mismatches))
+    return report
+
+def main():
+    """ Benchmark the frame relation index against SPARQL """
+    from mnrepository.metanetrdf import MetaNetRepository
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description="Benchmark the frame relation index against the equivalent "\
+                    "SPARQL queries, and check that their results are identical.")
+    parser.add_argument("-l", "--lang", required=True,
+                        help="Language of the repository")
+    parser.add_argument("-i", "--inputrdffile", default=None,
+                        help="RDF file to use, instead of default")
+    parser.add_argument("-c", "--cachedir", default=None,
+                        help="Cache directory (instead of default)")
+    parser.add_argument("-n", "--nsamples", type=int, default=100,
+                        help="Number of frames / frame pairs to query")
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="Verbose messages")
+    cmdline = parser.parse_args()
+    logging.basicConfig(level=logging.INFO if cmdline.verbose else logging.WARN)
+    mr = MetaNetRepository(cmdline.lang, cmdline.inputrdffile, cachedir=cmdline.cachedir)
+    mr.initLookups()
+    status = 0
+    print '%-45s %12s %12s %10s %s' % ('method', 'sparql(s)', 'index(s)', 'speedup', 'mismatches')
+    for name, sparqlsecs, indexsecs, mismatches in benchmark(mr, cmdline.nsamples):
+        speedup = sparqlsecs / indexsecs if indexsecs else float('inf')
+        print '%-45s %12.4f %12.4f %10.1f %d' % (name, sparqlsecs, indexsecs, speedup, mismatches)
+        if mismatches:
+            status = 1
+    return status
+
+if __name__ == '__main__':
+    status = main()
+    sys.exit(status)
@@ -85,13 +85,18 @@ class XCAReports(XlsxWrapper):
         irow = self.addSheetHeader(ws,'Single %s: CM Source/LM Counts (Ranked)' % (label))
         self.lmcounts[prot] = {}
         tconcount = 0
+        # counts for all target concepts at once
+        snames = self.gdb.getSourceConceptNames()
+        cmcounts = self.gdb.getCMSourceCounts(lang,protagonist) # returns only prot CMs
+        lmcounts = self.gdb.getLMCountsByTargetSource(lang,protagonist)
         for tcon in self.gdb.getTargetConcepts():
-            cmsources = self.gdb.getCMSourcesFromTarget(lang,tcon,protagonist) # returns only prot CMs
+            tconlmcounts = lmcounts.get(tcon.id,{})
             cmrows = []
-            for scon in cmsources:
+            for scon, ncms in sorted(cmcounts.get(tcon.id,{}).iteritems()):
                 # should this count all the LMs, or only the ones marked for that prot?
-                lmcount = self.gdb.getCountLMsFromTargetSource(lang,tcon,scon,protagonist)
-                cmrows.append([scon.source_concept,lmcount,Decimal(0),Decimal(0)])
+                lmcount = tconlmcounts.get(scon,0)
+                for i in range(ncms):
+                    cmrows.append([snames[scon],lmcount,Decimal(0),Decimal(0)])
             cmrows.sort(key=lambda row: row[1],reverse=True)
             tconcount += 1
             lmcountsbycmsource = {}
@@ -335,19 +340,21 @@ class XCAReports(XlsxWrapper):
         ws = self.wb.add_worksheet("%s_Lexical_Counts" % (prot))
         irow = self.addSheetHeader(ws,'Single %s: CM Source/LM Source Lexical Counts' % (label))
         
+        snames = self.gdb.getSourceConceptNames()
+        cmcounts = self.gdb.getCMSourceCounts(lang,protagonist)
+        lexcounts = self.gdb.getLexicalCountsByTargetSource(lang,protagonist)
         for tcon in self.gdb.getTargetConcepts():
             irow = self.addRow(ws, irow, 'Target', tcon.target_concept)
             irow = self.addRow(ws, irow, label, prot)
             irow += 1
-            cmsources = self.gdb.getCMSourcesFromTarget(lang,tcon,protagonist)
+            tconlexcounts = lexcounts.get(tcon.id,{})
             lexcountrows = []
             mincount = 2000000000
-            for scon in cmsources:
-                sconlexrows = self.gdb.getCMLexicalCounts(lang,tcon,scon,protagonist)
-                for slrow in sconlexrows:
-                    lexcountrows.append([scon.source_concept,slrow.lm_source_lemma,slrow.count])
-                    if slrow.count < mincount:
-                        mincount = slrow.count
+            for scon, ncms in cmcounts.get(tcon.id,{}).iteritems():
+                for lemma, count in tconlexcounts.get(scon,{}).iteritems():
+                    lexcountrows.extend([snames[scon],lemma,count] for i in range(ncms))
+                    if count < mincount:
+                        mincount = count
             if not lexcountrows:
                 mincount = 0
             irow = self.addRow(ws, irow, 'Minimum LM Count', mincount)
@@ -376,17 +383,7 @@ class XCAReports(XlsxWrapper):
         ws = self.wb.add_worksheet("%s_Schema_Counts" % (prot))
         irow = self.addSheetHeader(ws,'Single %s: Target Schema/Source Schema LM Counts'%(label))
         
-        lms = self.gdb.getLMsFromLang(lang,protagonist)
-        tscounts = {}
-        for lm in lms:
-            targetschema, sourceschemas = self.gdb.getLMProperties(lm)
-            if targetschema not in tscounts:
-                tscounts[targetschema] = {}
-            for sourceschema in sourceschemas:
-                if sourceschema not in tscounts[targetschema]:
-                    tscounts[targetschema][sourceschema] = 1
-                else:
-                    tscounts[targetschema][sourceschema] += 1
+        tscounts = self.gdb.getSchemaCounts(lang,protagonist)
         for tschema in sorted(tscounts.keys()):
             irow = self.addRow(ws, irow, 'Target schema', tschema)
             irow += 1
@@ -202,7 +202,8 @@ class Cm2Lm_Core_General(BaseModel):
 class GMRDB:
     """ Class for accessing the GMR database.  Currently fixed on MySQL.
     """
-    def __init__(self, host=None, socket=None, user=None, passwd=None, dbname='icsi_gmr_21'):
+    def __init__(self, host=None, socket=None, user=None, passwd=None, dbname='icsi_gmr_21',
+                 database=None):
         """
         :param host: database host name (currently unused)
         :type host: str
@@ -216,13 +217,18 @@ class GMRDB:
         :type dbname: str
         :param targetmode: target concept mode (general, case)
         :type targetmode: str
+        :param database: peewee database to use instead of MySQL (e.g. a SqliteDatabase for testing)
+        :type database: :py:class:`peewee.Database`
         """
         global gmrdatabase_proxy
-        mydb = MySQLDatabase(dbname, **{'passwd':passwd,
-                                        'unix_socket':socket,
-                                        'user':user,
-                                        'charset':'utf8',
-                                        'use_unicode':True})
+        if database:
+            mydb = database
+        else:
+            mydb = MySQLDatabase(dbname, **{'passwd':passwd,
+                                            'unix_socket':socket,
+                                            'user':user,
+                                            'charset':'utf8',
+                                            'use_unicode':True})
         gmrdatabase_proxy.initialize(mydb)
         gmrdatabase_proxy.connect()
         self.logger = logging.getLogger(__name__)
@@ -676,6 +682,125 @@ class GMRDB:
             return Lm.select(Lm.lm_source_lemma,fn.Count(Lm.id).alias('count')).join(Lm2Cm_Source).switch(Lm).join(Lm2Cm_Target_Case).where((Lm.language==lang) & (Lm2Cm_Target_Case.cm_target_case==tcon) & (Lm2Cm_Source.cm_source==scon)).group_by(Lm.lm_source_lemma)
 
 
+    # Set-oriented statistics: these compute the counts for all target and source
+    # concepts in a few GROUP BY queries, and return them as nested dicts keyed
+    # by concept ids.  Concepts without CMs or LMs are absent.
+
+    def _nestedCounts(self, query):
+        """ Nest the rows of a grouped count query, whose last column is the
+        count, into dicts keyed by the other columns in order.
+        """
+        counts = {}
+        for row in query.tuples():
+            d = counts
+            for key in row[:-2]:
+                d = d.setdefault(key, {})
+            d[row[-2]] = row[-1]
+        return counts
+
+    def getSourceConceptNames(self):
+        """
+        Retrieve a dict from source concept id to source concept name
+        """
+        return dict(Cm_Source.select(Cm_Source.id, Cm_Source.source_concept).tuples())
+
+    def getCMSourceCountsGeneral(self, lang, prot=None):
+        """
+        Count the CMs of each target and source concept, as listed by
+        getCMSourcesFromTargetGeneral: {tcon id: {scon id: number of CMs}}
+        """
+        query = Cm_General.select(Cm_General.cm_target_general, Cm_General.cm_source, fn.Count(Cm_General.id))
+        if prot:
+            query = query.join(Protagonist).where((Cm_General.language==lang) & (Protagonist.name==prot))
+        else:
+            query = query.where(Cm_General.language==lang)
+        return self._nestedCounts(query.group_by(Cm_General.cm_target_general, Cm_General.cm_source))
+
+    def getCMSourceCountsCase(self, lang, prot=None):
+        """
+        Count the CMs of each target and source concept, as listed by
+        getCMSourcesFromTargetCase: {tcon id: {scon id: number of CMs}}
+        """
+        query = Cm_Case.select(Cm_Case.cm_target_case, Cm_Case.cm_source, fn.Count(Cm_Case.id))
+        if prot:
+            query = query.join(Protagonist).where((Cm_Case.language==lang) & (Protagonist.name==prot))
+        else:
+            query = query.where(Cm_Case.language==lang)
+        return self._nestedCounts(query.group_by(Cm_Case.cm_target_case, Cm_Case.cm_source))
+
+    def getLMCountsByTargetSourceGeneral(self, lang, prot=None):
+        """
+        Count the LMs of each target and source concept, as
+        getCountLMsFromTargetGeneralSource: {tcon id: {scon id: number of LMs}}
+        """
+        query = Lm.select(Lm2Cm_Target_General.cm_target_general, Lm2Cm_Source.cm_source, fn.Count(Lm.id)).join(Lm2Cm_Source).switch(Lm).join(Lm2Cm_Target_General)
+        if prot:
+            query = query.switch(Lm).join(Protagonist).where((Lm.language==lang) & (Protagonist.name==prot))
+        else:
+            query = query.where(Lm.language==lang)
+        return self._nestedCounts(query.group_by(Lm2Cm_Target_General.cm_target_general, Lm2Cm_Source.cm_source))
+
+    def getLMCountsByTargetSourceCase(self, lang, prot=None):
+        """
+        Count the LMs of each target and source concept, as
+        getCountLMsFromTargetCaseSource: {tcon id: {scon id: number of LMs}}
+        """
+        query = Lm.select(Lm2Cm_Target_Case.cm_target_case, Lm2Cm_Source.cm_source, fn.Count(Lm.id)).join(Lm2Cm_Source).switch(Lm).join(Lm2Cm_Target_Case)
+        if prot:
+            query = query.switch(Lm).join(Protagonist).where((Lm.language==lang) & (Protagonist.name==prot))
+        else:
+            query = query.where(Lm.language==lang)
+        return self._nestedCounts(query.group_by(Lm2Cm_Target_Case.cm_target_case, Lm2Cm_Source.cm_source))
+
+    def getLexicalCountsByTargetSourceGeneral(self, lang, prot=None):
+        """
+        Count the LM source lemmas of each target and source concept, as
+        getCMLexicalCountsGeneral: {tcon id: {scon id: {lemma: number of LMs}}}
+        """
+        query = Lm.select(Lm2Cm_Target_General.cm_target_general, Lm2Cm_Source.cm_source, Lm.lm_source_lemma, fn.Count(Lm.id)).join(Lm2Cm_Source).switch(Lm).join(Lm2Cm_Target_General)
+        if prot:
+            query = query.switch(Lm).join(Protagonist).where((Lm.language==lang) & (Protagonist.name==prot))
+        else:
+            query = query.where(Lm.language==lang)
+        return self._nestedCounts(query.group_by(Lm2Cm_Target_General.cm_target_general, Lm2Cm_Source.cm_source, Lm.lm_source_lemma))
+
+    def getLexicalCountsByTargetSourceCase(self, lang, prot=None):
+        """
+        Count the LM source lemmas of each target and source concept, as
+        getCMLexicalCountsCase: {tcon id: {scon id: {lemma: number of LMs}}}
+        """
+        query = Lm.select(Lm2Cm_Target_Case.cm_target_case, Lm2Cm_Source.cm_source, Lm.lm_source_lemma, fn.Count(Lm.id)).join(Lm2Cm_Source).switch(Lm).join(Lm2Cm_Target_Case)
+        if prot:
+            query = query.switch(Lm).join(Protagonist).where((Lm.language==lang) & (Protagonist.name==prot))
+        else:
+            query = query.where(Lm.language==lang)
+        return self._nestedCounts(query.group_by(Lm2Cm_Target_Case.cm_target_case, Lm2Cm_Source.cm_source, Lm.lm_source_lemma))
+
+    def getSchemaCounts(self, lang, prot=None):
+        """
+        Count the source frames of the LMs by target frame, from the LM
+        properties (see getLMProperties): {target frame: {source frame: number of LMs}}.
+        Target frames of LMs without source frames map to empty dicts, and LMs
+        without a target frame are counted under None.  LMs are assumed to have
+        at most one target frame.
+        """
+        TargetFrame = Lm_Property.alias()
+        SourceFrame = Lm_Property.alias()
+        query = (Lm.select(TargetFrame.value, SourceFrame.value, fn.Count(SourceFrame.id))
+                 .join(TargetFrame, JOIN_LEFT_OUTER, on=((TargetFrame.lm==Lm.id) & (TargetFrame.name=='hasTargetFrame')))
+                 .switch(Lm)
+                 .join(SourceFrame, JOIN_LEFT_OUTER, on=((SourceFrame.lm==Lm.id) & (SourceFrame.name=='hasSourceFrame'))))
+        if prot:
+            query = query.switch(Lm).join(Protagonist).where((Lm.language==lang) & (Protagonist.name==prot))
+        else:
+            query = query.where(Lm.language==lang)
+        counts = {}
+        for tframe, sframe, count in query.group_by(TargetFrame.value, SourceFrame.value).tuples():
+            sframes = counts.setdefault(tframe, {})
+            if sframe is not None:
+                sframes[sframe] = count
+        return counts
+
     def getSourceConceptsFromLMSource(self, lm_source):
         return Lm2Cm_Source.select(Lm2Cm_Source.cm_source).join(Lm).where(Lm.lm_source_lemma==lm_source)
 
@@ -800,6 +925,9 @@ class GMRDBGeneral(GMRDB):
     getTargetConceptId = GMRDB.getTargetConceptGeneralId
     getCMLexicalCounts = GMRDB.getCMLexicalCountsGeneral
     getLMLexicalCounts = GMRDB.getLMLexicalCountsGeneral
+    getCMSourceCounts = GMRDB.getCMSourceCountsGeneral
+    getLMCountsByTargetSource = GMRDB.getLMCountsByTargetSourceGeneral
+    getLexicalCountsByTargetSource = GMRDB.getLexicalCountsByTargetSourceGeneral
     getCMFromSourceTargetLang = GMRDB.getCMFromSourceTargetLangGeneral
     getCMidLangSourceTarget = GMRDB.getCMidLangSourceTargetGeneral
     getScoreFromCmLangProperty = GMRDB.getScoreFromCmLangPropertyGeneral
@@ -818,6 +946,9 @@ class GMRDBCase(GMRDB):
     getTargetConceptId = GMRDB.getTargetConceptCaseId
     getCMLexicalCounts = GMRDB.getCMLexicalCountsCase
     getLMLexicalCounts = GMRDB.getLMLexicalCountsCase
+    getCMSourceCounts = GMRDB.getCMSourceCountsCase
+    getLMCountsByTargetSource = GMRDB.getLMCountsByTargetSourceCase
+    getLexicalCountsByTargetSource = GMRDB.getLexicalCountsByTargetSourceCase
     getCMFromSourceTargetLang = GMRDB.getCMFromSourceTargetLangCase
     getCMidLangSourceTarget = GMRDB.getCMidLangSourceTargetCase
     getScoreFromCmLangProperty = GMRDB.getScoreFromCmLangPropertyCase
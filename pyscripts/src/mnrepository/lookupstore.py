@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. module:: lookupstore
+   :platform: Unix
+   :synopsis: Versioned on-disk store for MetaNet repository lookup tables
+
+Stores the lookup dictionaries generated by
+:py:meth:`mnrepository.metanetrdf.MetaNetRepository.createLookups` in a single
+SQLite file, one table per lookup, keyed by the dictionary key.  Processes
+open the file lazily and read only the entries they use; the file itself is
+shared between processes through the OS page cache, so starting a CMS/CNMS
+worker no longer means unpickling every lookup.
+
+The store records a format version and a hash of the RDF file it was built
+from.  :py:meth:`LookupStore.isCurrent` compares these against the current
+RDF file, so a stale store is detected by content, not by modification time.
+
+Example::
+
+    store = LookupStore('/path/to/cache.lookups-en.db')
+    if not store.isCurrent(sourceHash):
+        store.save({'luframe': luframe, 'framelu': framelu}, sourceHash)
+    luframe = store.table('luframe')
+    frames = luframe[u'run.v']
+
+"""
+import os, sqlite3, hashlib, logging
+import cPickle as pickle
+from collections import Mapping
+
+# increment when the layout of the store changes
+STORE_VERSION = 1
+
+def fileHash(fname, blocksize=1048576):
+    """ Return the SHA1 hex digest of the contents of a file.
+    """
+    h = hashlib.sha1()
+    with open(fname, 'rb') as f:
+        while True:
+            block = f.read(blocksize)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
+
+def _keyparts(key):
+    """ Return the (kind, text) pair under which a key is stored.  str and
+    unicode keys compare equal in dicts, so they share a kind; other types
+    (e.g. URIRef) do not compare equal to plain strings, so they are kept
+    apart by class name.
+    """
+    if isinstance(key, str):
+        return u'', key.decode('utf-8')
+    if type(key) is unicode:
+        return u'', key
+    return type(key).__name__.decode('utf-8'), unicode(key)
+
+class LookupTable(Mapping):
+    """ Read-only dictionary view of one table in a :py:class:`LookupStore`.
+    Values are read on first access and then kept in memory.
+    """
+    def __init__(self, store, name):
+        self.store = store
+        self.name = name
+        self._cache = {}
+        self._len = None
+
+    def __getitem__(self, key):
+        try:
+            return self._cache[key]
+        except KeyError:
+            pass
+        kind, text = _keyparts(key)
+        row = self.store._execute('SELECT value FROM "%s" WHERE kind=? AND key=?' % (self.name),
+                                  (kind, text)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        value = pickle.loads(str(row[0]))
+        self._cache[key] = value
+        return value
+
+    def __contains__(self, key):
+        if key in self._cache:
+            return True
+        kind, text = _keyparts(key)
+        row = self.store._execute('SELECT 1 FROM "%s" WHERE kind=? AND key=?' % (self.name),
+                                  (kind, text)).fetchone()
+        return row is not None
+
+    def __iter__(self):
+        for row in self.store._execute('SELECT okey FROM "%s"' % (self.name)):
+            yield pickle.loads(str(row[0]))
+
+    def __len__(self):
+        if self._len is None:
+            self._len = self.store._execute('SELECT COUNT(*) FROM "%s"' % (self.name)).fetchone()[0]
+        return self._len
+
+    def iteritems(self):
+        for row in self.store._execute('SELECT okey, value FROM "%s"' % (self.name)):
+            yield pickle.loads(str(row[0])), pickle.loads(str(row[1]))
+
+class LookupStore:
+    """ SQLite file holding named lookup tables, and metadata identifying the
+    source they were built from.
+    """
+    def __init__(self, fname):
+        """
+        :param fname: path to the store file
+        :type fname: str
+        """
+        self.logger = logging.getLogger(__name__)
+        self.fname = fname
+        self._conn = None
+        self._pid = None
+
+    def _connection(self):
+        # connections must not be shared across fork(), so reopen in children
+        if (self._conn is None) or (self._pid != os.getpid()):
+            self._conn = sqlite3.connect(self.fname, check_same_thread=False)
+            self._conn.text_factory = unicode
+            self._pid = os.getpid()
+        return self._conn
+
+    def _execute(self, sql, params=()):
+        return self._connection().execute(sql, params)
+
+    def close(self):
+        if self._conn is not None and self._pid == os.getpid():
+            self._conn.close()
+        self._conn = None
+
+    def getMeta(self):
+        """ Return the metadata dict of the store, or None if the store does
+        not exist or is unreadable.
+        """
+        if not os.path.exists(self.fname):
+            return None
+        try:
+            return dict(self._execute('SELECT name, value FROM meta').fetchall())
+        except sqlite3.DatabaseError:
+            return None
+
+    def isCurrent(self, sourceHash):
+        """ Check whether the store was written by this version of the code,
+        from a source whose hash is sourceHash.  If sourceHash is None (e.g.
+        the source is not available) only the version is checked.
+        """
+        meta = self.getMeta()
+        if not meta:
+            return False
+        if meta.get(u'version') != unicode(STORE_VERSION):
+            self.logger.info(u'lookup store %s has version %s, expected %d',
+                             self.fname, meta.get(u'version'), STORE_VERSION)
+            return False
+        if (sourceHash is not None) and (meta.get(u'source') != sourceHash):
+            self.logger.info(u'lookup store %s is stale: source hash changed', self.fname)
+            return False
+        return True
+
+    def save(self, tables, sourceHash):
+        """ Write the tables to the store, replacing its current contents.
+        The store is built in a temporary file and moved into place, so
+        processes reading the previous version are not disturbed.
+
+        :param tables: dict of table name to lookup dict
+        :type tables: dict
+        :param sourceHash: hash of the source the lookups were built from
+        :type sourceHash: str
+        """
+        tmpfname = '%s.%d.tmp' % (self.fname, os.getpid())
+        if os.path.exists(tmpfname):
+            os.remove(tmpfname)
+        conn = sqlite3.connect(tmpfname)
+        conn.text_factory = unicode
+        conn.execute('CREATE TABLE meta (name TEXT PRIMARY KEY, value TEXT)')
+        for name, lookup in tables.iteritems():
+            conn.execute('CREATE TABLE "%s" (kind TEXT, key TEXT, okey BLOB, value BLOB, '
+                         'PRIMARY KEY (kind, key))' % (name))
+            rows = []
+            for key, value in lookup.iteritems():
+                kind, text = _keyparts(key)
+                rows.append((kind, text,
+                             sqlite3.Binary(pickle.dumps(key, 2)),
+                             sqlite3.Binary(pickle.dumps(value, 2))))
+            conn.executemany('INSERT INTO "%s" VALUES (?,?,?,?)' % (name), rows)
+        conn.executemany('INSERT INTO meta VALUES (?,?)',
+                         [(u'version', unicode(STORE_VERSION)),
+                          (u'source', sourceHash),
+                          (u'tables', u','.join(sorted(tables.keys())))])
+        conn.commit()
+        conn.close()
+        self.close()
+        os.rename(tmpfname, self.fname)
+        self.logger.info(u'saved %d lookup tables to %s', len(tables), self.fname)
+
+    def table(self, name):
+        """ Return a read-only dict view of the named table.
+        """
+        return LookupTable(self, name)
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. module:: mappingcache
+   :platform: Unix
+   :synopsis: Persistent memoisation of lemma to frame mapping calls
+
+Memoises the word to frame searches of
+:py:class:`mnrepository.cnmapping.ConceptualNetworkMapper`
+(:py:meth:`getFramesFromLemma`, :py:meth:`getFramesByExpansion` and
+:py:meth:`runExpansionPhases`).  These walk WordNet synsets, Wiktionary
+definitions and FrameNet relations, and the same (lemma, pos) pairs recur
+constantly across a corpus, so their results are kept in a bounded
+in-memory LRU cache backed by an SQLite file next to the repository caches.
+
+The file records the cache format version, the repository graph cache
+version and a hash of the RDF file; if any of these changed, the stored
+entries are discarded.  Keys include the mapper settings that change the
+results (e.g. whether FrameNet is used), so mappers with different settings
+can share the file.  Entries beyond the maximum size are evicted least
+recently used first.
+
+Example::
+
+    cache = MappingCache('/path/to/cache.cnmapping-en.db', validity)
+    frames = cache.get('getFramesFromLemma', key)
+    if frames is None:
+        frames = compute()
+        cache.put('getFramesFromLemma', key, frames)
+
+"""
+import os, sqlite3, time, logging, atexit
+import cPickle as pickle
+from collections import OrderedDict
+
+# increment when the format of the cached values changes
+MAPPING_CACHE_VERSION = 1
+
+class MappingCache:
+    """ Bounded, persistent memo table for mapping calls, with hit rate
+    statistics.
+    """
+    def __init__(self, fname, validity, maxentries=200000, mementries=20000, flushEvery=200):
+        """
+        :param fname: path to the cache file (None to keep the cache in memory only)
+        :type fname: str
+        :param validity: string identifying the repository version the entries
+            were computed from; entries from other versions are discarded
+        :type validity: str
+        :param maxentries: maximum number of entries kept in the file
+        :type maxentries: int
+        :param mementries: maximum number of entries kept in memory
+        :type mementries: int
+        :param flushEvery: number of new entries written to the file at a time
+        :type flushEvery: int
+        """
+        self.logger = logging.getLogger(__name__)
+        self.fname = fname
+        self.validity = validity
+        self.maxentries = maxentries
+        self.mementries = mementries
+        self.flushEvery = flushEvery
+        # values are kept pickled, so callers cannot alter cached results
+        self.mem = OrderedDict()
+        self.pending = {}
+        self.touched = set()
+        self.stats = {}
+        self.evictions = 0
+        self._conn = None
+        self._pid = None
+        if self.fname:
+            atexit.register(self.flush)
+
+    def _connection(self):
+        # connections must not be shared across fork(), so reopen in children
+        if (self._conn is None) or (self._pid != os.getpid()):
+            self._conn = sqlite3.connect(self.fname, timeout=60)
+            self._conn.text_factory = str
+            self._conn.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS mapping '
+                               '(key BLOB PRIMARY KEY, value BLOB, atime REAL)')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS mapping_atime ON mapping (atime)')
+            validity = '%d:%s' % (MAPPING_CACHE_VERSION, self.validity)
+            row = self._conn.execute("SELECT value FROM meta WHERE name='validity'").fetchone()
+            if (row is None) or (row[0] != validity):
+                if row is not None:
+                    self.logger.info('mapping cache %s is stale, clearing it', self.fname)
+                self._conn.execute('DELETE FROM mapping')
+                self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('validity', ?)", (validity,))
+            self._conn.commit()
+            self._pid = os.getpid()
+        return self._conn
+
+    def close(self):
+        self.flush()
+        if self._conn is not None and self._pid == os.getpid():
+            self._conn.close()
+        self._conn = None
+
+    def _count(self, method, kind):
+        counts = self.stats.setdefault(method, {'hits': 0, 'misses': 0})
+        counts[kind] += 1
+
+    def _remember(self, dkey, pvalue):
+        self.mem[dkey] = pvalue
+        if len(self.mem) > self.mementries:
+            self.mem.popitem(last=False)
+
+    def get(self, method, key):
+        """ Return the cached result of method for key (a picklable tuple),
+        or None if it is not cached.
+        """
+        dkey = pickle.dumps((method, key), 2)
+        pvalue = self.mem.pop(dkey, None)
+        if (pvalue is None) and self.fname:
+            try:
+                row = self._connection().execute('SELECT value FROM mapping WHERE key=?',
+                                                 (sqlite3.Binary(dkey),)).fetchone()
+            except sqlite3.Error, e:
+                self.logger.warning('mapping cache read failed: %s', e)
+                row = None
+            if row is not None:
+                pvalue = str(row[0])
+        if pvalue is None:
+            self._count(method, 'misses')
+            return None
+        self._count(method, 'hits')
+        self._remember(dkey, pvalue)
+        if self.fname:
+            self.touched.add(dkey)
+        return pickle.loads(pvalue)
+
+    def put(self, method, key, value):
+        """ Store the result of method for key.
+        """
+        dkey = pickle.dumps((method, key), 2)
+        pvalue = pickle.dumps(value, 2)
+        self._remember(dkey, pvalue)
+        if self.fname:
+            self.pending[dkey] = pvalue
+            if len(self.pending) >= self.flushEvery:
+                self.flush()
+
+    def flush(self):
+        """ Write new entries and access times to the file, evicting the least
+        recently used entries if it grows beyond its maximum size.
+        """
+        if not self.fname or not (self.pending or self.touched):
+            return
+        try:
+            conn = self._connection()
+            now = time.time()
+            conn.executemany('INSERT OR REPLACE INTO mapping VALUES (?,?,?)',
+                             [(sqlite3.Binary(k), sqlite3.Binary(v), now)
+                              for k, v in self.pending.iteritems()])
+            conn.executemany('UPDATE mapping SET atime=? WHERE key=?',
+                             [(now, sqlite3.Binary(k)) for k in self.touched
+                              if k not in self.pending])
+            n = conn.execute('SELECT COUNT(*) FROM mapping').fetchone()[0]
+            if n > self.maxentries:
+                excess = n - self.maxentries
+                conn.execute('DELETE FROM mapping WHERE key IN '
+                             '(SELECT key FROM mapping ORDER BY atime LIMIT ?)', (excess,))
+                self.evictions += excess
+            conn.commit()
+        except sqlite3.Error, e:
+            self.logger.warning('mapping cache write failed: %s', e)
+        self.pending = {}
+        self.touched = set()
+
+    def hitRate(self, method=None):
+        """ Return the fraction of lookups (for method, or for all methods)
+        that were answered from the cache, or None if there were none.
+        """
+        if method:
+            counts = [self.stats.get(method, {'hits': 0, 'misses': 0})]
+        else:
+            counts = self.stats.values()
+        hits = sum(c['hits'] for c in counts)
+        total = hits + sum(c['misses'] for c in counts)
+        if not total:
+            return None
+        return float(hits) / total
+
+    def logStats(self):
+        """ Log the hit rate of each memoised method.
+        """
+        for method in sorted(self.stats):
+            counts = self.stats[method]
+            self.logger.info(u'mapping cache %s: %d hits, %d misses (%.1f%% hit rate)',
+                             method, counts['hits'], counts['misses'],
+                             100.0 * self.hitRate(method))
+        if self.evictions:
+            self.logger.info(u'mapping cache: %d entries evicted', self.evictions)
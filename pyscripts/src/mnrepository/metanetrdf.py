@@ -32,6 +32,8 @@ from nltk.corpus import wordnet as wn
 from SPARQLWrapper import SPARQLWrapper, JSON
 from mnrepository.wiktionary import Wiktionary
 from persianwordforms import PersianWordForms
+from mnrepository.lookupstore import LookupStore, fileHash
+from mnrepository.framerels import FrameRelationIndex
 
 class MetaNetRepository:
     """ Class for accessing MetaNet conceptual network repository.  By default
@@ -402,6 +404,15 @@ class MetaNetRepository:
     }
     posre = re.compile(ur'\.(a|v|n|p|prep|r|verb|nn|adj|adv|aa)$',flags=re.U|re.I)
 
+    # increment when the format of the cached rdf graph or of the frame
+    # relation index (cached with the same header) changes
+    GRAPH_CACHE_VERSION = 3
+    # lookup dicts created by createLookups and saved in the lookup store
+    LOOKUP_TABLES = ('luframe', 'framelu', 'fn_luframe', 'fn_framelu',
+                     'lpos2mwe', 'wf2mwe', 'mwere', 'framelemma',
+                     'sconlemma', 'lemscon', 'frameconcept', 'conceptframe',
+                     'sconowner', 'scondef')
+
     def __init__(self,lang='en',rdffname=None,mrbasedir=None,cachedir=None,
                  verbose=False,force=False,useSE=None,
                  govOnly=False, fndata=None, wikdata=None, pwforms=None):
@@ -439,15 +450,16 @@ class MetaNetRepository:
         self.mo = Namespace("https://metaphor.icsi.berkeley.edu/metaphor/MetaphorOntology.owl#")
         self.mr = Namespace("https://metaphor.icsi.berkeley.edu/%s/MetaphorRepository.owl#"%(lang))
         self.cachef = '%s/cache.metanetrdf-%s' % (self.cachedir,self.lang)
+        self.framerelscachef = '%s/cache.framerels-%s' % (self.cachedir,self.lang)
+        self.rdfhash = None
+        self.framerels = None
         
         if rdffname is None:
             self.rdffname = '%s/%s'%(self.mrbasepath,self.mrfile[lang])
         else:
             self.rdffname = rdffname
-        # Use cache if it exists: speeds up lookups significantly       
-        if os.path.exists(self.cachef) and (not self.forcecache):
-            self.loadcache()
-        else:
+        # Use cache if it exists and is current: speeds up lookups significantly
+        if (not os.path.exists(self.cachef)) or self.forcecache or (not self.loadcache()):
             self.logger.info("Loading %s ...",self.rdffname)
             self.g.load(self.rdffname) # this operation is slow
             if not os.path.exists(self.cachedir):
@@ -477,18 +489,30 @@ class MetaNetRepository:
         self.wikdata = wikdata
         self.pwf = pwforms
     
+    def getSourceHash(self):
+        """ Return a hash of the contents of the RDF file, used to detect
+        stale caches.  Returns None if the RDF file is not available.
+        """
+        if self.rdfhash is None and os.path.exists(self.rdffname):
+            self.rdfhash = fileHash(self.rdffname)
+        return self.rdfhash
+    
     def initLookups(self):
-        """ Initialize lookup tables which are cached.
+        """ Initialize lookup tables which are cached.  The cache is an
+        on-disk store (see :py:mod:`mnrepository.lookupstore`) that is read
+        lazily, and regenerated when the RDF file changes.
         """
-        self.lookupscachef = '%s/cache.luframelk-%s' % (self.cachedir,self.lang)
+        self.lookupscachef = '%s/cache.lookups-%s.db' % (self.cachedir,self.lang)
+        self.lookupstore = LookupStore(self.lookupscachef)
         self.pwf = None
-        if os.path.exists(self.lookupscachef) and (not self.forcecache):
+        if (not self.forcecache) and self.lookupstore.isCurrent(self.getSourceHash()):
             self.loadlooksupscache()
         else:
             self.createLookups()
             if not os.path.exists(self.cachedir):
                 os.mkdir(self.cachedir)
             self.cachelookups()
+        self.initFrameRelations()
         self.cxnpfname = u'%s/cxn_patterns_%s.txt' % (self.cachedir,self.lang)
         self.metarcfname = u'%s/metarcs_%s.txt' % (self.cachedir,self.lang)
         if ((not os.path.exists(self.cxnpfname)) or
@@ -502,6 +526,30 @@ class MetaNetRepository:
         else:
             self.logger.info('existing metarc pattern file is newer than rdf')
     
+    def initFrameRelations(self):
+        """ Load or build the frame relation closure index, which answers
+        frame hierarchy queries without SPARQL.  It is cached in the same way
+        as the rdf graph.
+        """
+        rdfhash = self.getSourceHash()
+        if os.path.exists(self.framerelscachef) and (not self.forcecache):
+            f = open(self.framerelscachef,'rb')
+            try:
+                header = pickle.load(f)
+                if (header[0] == self.GRAPH_CACHE_VERSION) and \
+                   ((rdfhash is None) or (header[1] == rdfhash)):
+                    self.logger.info("Loading cached frame relation index...")
+                    self.framerels = pickle.load(f)
+                    return
+                self.logger.info("Cached frame relation index is stale, rebuilding.")
+            finally:
+                f.close()
+        self.framerels = FrameRelationIndex(self.g)
+        f = open(self.framerelscachef,'wb')
+        pickle.dump((self.GRAPH_CACHE_VERSION, rdfhash),f,2)
+        pickle.dump(self.framerels,f,2)
+        f.close()
+    
     def getPOS(self,shortpos):
         return self.POSmap[shortpos]
     
@@ -784,30 +832,21 @@ class MetaNetRepository:
             return set()
         
     def cacheme(self):
+        """ Cache the rdf graph, preceded by a header identifying the cache
+        version and the RDF file it was loaded from.
+        """
         f = open(self.cachef,'wb')
         if self.verbose:
             self.logger.info("Caching rdf graph...")
+        pickle.dump((self.GRAPH_CACHE_VERSION, self.getSourceHash()),f,2)
         pickle.dump(self.g,f,2)
         f.close()
         
     def cachelookups(self):
-        f2 = open(self.lookupscachef,'wb')
-        cachecontent = (self.luframe,
-                        self.framelu,
-                        self.fn_luframe,
-                        self.fn_framelu,
-                        self.lpos2mwe,
-                        self.wf2mwe,
-                        self.mwere,
-                        self.framelemma,
-                        self.sconlemma,
-                        self.lemscon,
-                        self.frameconcept,
-                        self.conceptframe,
-                        self.sconowner,
-                        self.scondef)
-        pickle.dump(cachecontent,f2,2)
-        f2.close()
+        tables = {}
+        for name in self.LOOKUP_TABLES:
+            tables[name] = getattr(self, name)
+        self.lookupstore.save(tables, self.getSourceHash())
         
         # sanity check, write out in txt format--if debug logging mode
         if (self.logger.getEffectiveLevel()==logging.DEBUG):
@@ -873,29 +912,32 @@ class MetaNetRepository:
         fh.close()
     
     def loadcache(self):
+        """ Load the cached rdf graph.  Returns False without loading if the
+        cache is from an older version or from a different RDF file.
+        """
         f = open(self.cachef,'rb')
-        self.logger.info("Loading cached rdf graph...")
-        self.g = pickle.load(f)
-        f.close()
+        try:
+            header = pickle.load(f)
+            if (not isinstance(header, tuple)) or (header[0] != self.GRAPH_CACHE_VERSION):
+                self.logger.info("Cached rdf graph has an old format, bypassing cache.")
+                return False
+            rdfhash = self.getSourceHash()
+            if (rdfhash is not None) and (header[1] != rdfhash):
+                self.logger.info("Cached rdf graph is stale, bypassing cache.")
+                return False
+            self.logger.info("Loading cached rdf graph...")
+            self.g = pickle.load(f)
+        finally:
+            f.close()
+        return True
     
     def loadlooksupscache(self):
-        f2 = open(self.lookupscachef,'rb')
-        self.logger.info("Loading cached LU lookups ...")
-        (self.luframe,
-         self.framelu,
-         self.fn_luframe,
-         self.fn_framelu,
-         self.lpos2mwe,
-         self.wf2mwe,
-         self.mwere,
-         self.framelemma,
-         self.sconlemma,
-         self.lemscon,
-         self.frameconcept,
-         self.conceptframe,
-         self.sconowner,
-         self.scondef) = pickle.load(f2)
-        f2.close()
+        """ Attach the lookup tables in the lookup store.  Entries are read
+        from disk when first used.
+        """
+        self.logger.info("Opening cached LU lookups ...")
+        for name in self.LOOKUP_TABLES:
+            setattr(self, name, self.lookupstore.table(name))
     
     def getSourceConceptDef(self, scon):
         if scon in self.scondef:
@@ -943,7 +985,10 @@ class MetaNetRepository:
                                     bindings={'famname':famname})
         
     def getAllFrameFamilies(self,frame):
-        """ Returns a list of all families and ancester families for the given frame """
+        """ Returns a list of all families and ancester families for the given frame.
+        With the frame relation index, the list is sorted and has no duplicates. """
+        if self.framerels is not None:
+            return [edict(family=family) for family in self.framerels.allFamilies(frame)]
         return self.runNamedSelectQuery('getallfamiliesofframe',
                                    bindings={'frame':frame})
     
@@ -980,8 +1025,14 @@ class MetaNetRepository:
         """
         Takes a frame (URIRef) and returns a list
         of (lemma(str),frame,framename(str),None) tuples. (None for familyname)
+        With the frame relation index, the list is sorted and has no duplicates.
         """
         lulist = []
+        if self.framerels is not None:
+            for lemma, framename in self.framerels.hierarchyLemmas(frame):
+                lulist.append((self.deLitPy(lemma), frame, self.deLitPy(framename),None,
+                              None,None,None))
+            return lulist
         for row in self.runNamedSelectQuery('getlusfromframehierarchy',bindings={'frame':frame}):
             lulist.append((self.deLitPy(row.lemma), frame, self.deLitPy(row.framename),None,
                           None,None,None))
@@ -1119,8 +1170,11 @@ class MetaNetRepository:
     
     def getCMs(self, queryname, tframe, sframe):
         """
-        Given a target frame and a source frame, return CMs
+        Given a target frame and a source frame, return CMs.  The queries
+        that the frame relation index answers return a sorted list.
         """
+        if (self.framerels is not None) and (queryname in FrameRelationIndex.CM_QUERIES):
+            return self.framerels.getCMs(queryname, tframe, sframe)
         cmlist = []
         for row in self.runNamedSelectQuery(queryname,bindings={'tframe':tframe,
                                                            'sframe':sframe}):
@@ -1389,6 +1443,8 @@ class MetaNetRepository:
         """ given 2 frames, return True is frame 1 is either a subcase of frame 2 or if
         frame 1 makes use of frame 2, where either of those relations may be
         arbitrarily chained up to 1 or 2 links """
+        if self.framerels is not None:
+            return self.framerels.usesWithin(frame1, frame2, (1, 2))
         for row in self.runNamedSelectQuery('getifframe1usesframe2',
                                        bindings={'frame1':frame1,
                                                  'frame2':frame2}):
@@ -1399,6 +1455,8 @@ class MetaNetRepository:
         """ given 2 frames, return True is frame 1 is incorporated into frame 2
         as a role, or if a ancestor if frame 1 is incorporated into a role of
         an ancestor of frame 2 """
+        if self.framerels is not None:
+            return self.framerels.fillsRole(frame1, frame2)
         for row in self.runNamedSelectQuery('getifframe1roleinframe2',
                                        bindings={'frame1':frame1,
                                                  'frame2':frame2}):
@@ -1409,6 +1467,8 @@ class MetaNetRepository:
         """ given 2 frames, return True is frame 1 is either a subcase of frame 2 or if
         frame 1 makes use of frame 2, where either of those relations may be
         arbitrarily chained at 3 or 4 links"""
+        if self.framerels is not None:
+            return self.framerels.usesWithin(frame1, frame2, (3, 4))
         for row in self.runNamedSelectQuery('getifframe1usesframe2long',
                                        bindings={'frame1':frame1,
                                                  'frame2':frame2}):
@@ -1417,8 +1477,13 @@ class MetaNetRepository:
     
     def frameThatUsesBoth(self, frame1, frame2):
         """ given 2 frames, return True if there is a frame that makes use of
-        frame 1 and frame 2."""
+        frame 1 and frame 2.  With the frame relation index, the list of
+        (frame, name) is sorted and has no duplicates."""
         otherframes = []
+        if self.framerels is not None:
+            for otherframe, othername in self.framerels.framesUsingBoth(frame1, frame2):
+                otherframes.append((otherframe, self.deLitPy(othername)))
+            return otherframes
         for row in self.runNamedSelectQuery('getifimmediateuse',
                                        bindings={'frame1':frame1,
                                                  'frame2':frame2}):
@@ -1427,8 +1492,14 @@ class MetaNetRepository:
     
     def frameThatBothAreSubcasesOf(self, frame1, frame2):
         """ given 2 frames, return True if there is a frame that 
-        frame 1 and frame 2 are both subcases of with edge distance of 1 or 2."""
+        frame 1 and frame 2 are both subcases of with edge distance of 1 or 2.
+        With the frame relation index, the list of (frame, name) is sorted and
+        has no duplicates."""
         otherframes = []
+        if self.framerels is not None:
+            for otherframe, othername in self.framerels.commonSubcases(frame1, frame2):
+                otherframes.append((otherframe, self.deLitPy(othername)))
+            return otherframes
         for row in self.runNamedSelectQuery('getifcommonsubcase',
                                        bindings={'frame1':frame1,
                                                  'frame2':frame2}):
@@ -0,0 +1,222 @@
+#
+from unittest import TestCase, TestSuite, makeSuite, main, skipIf
+import os, re, json, codecs, shutil, sqlite3, tempfile, logging
+
+from mnrepository.bulkload import TableLoader, DBAPISink, BulkLoadError, rowToLine
+
+try:
+    from mnrepository import fastdbimport
+except ImportError:
+    # needs MySQLdb, setproctitle, jdatetime and tailer
+    fastdbimport = None
+
+def countRows(fname, table):
+    conn = sqlite3.connect(fname)
+    try:
+        return conn.execute('SELECT COUNT(*) FROM "%s"' % (table)).fetchone()[0]
+    finally:
+        conn.close()
+
+class TableLoaderTest(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.dbfname = os.path.join(self.dir, 'mn.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_batches(self):
+        loader = TableLoader(['document', 'sentence'],
+                             DBAPISink(sqlite3.connect(self.dbfname), create=True), batchsize=5)
+        for i in range(3):
+            loader.add('document', (i + 1, u'doc%d' % (i), u''))
+            for j in range(3):
+                loader.add('sentence', (3 * i + j + 1, u'doc%d:%d' % (i, j), u'text', i + 1))
+        # flushed as they filled up
+        self.assertEqual(loader.nbatches, 2)
+        loader.close()
+        self.assertEqual(loader.nbatches, 3)
+        self.assertEqual((countRows(self.dbfname, 'document'), countRows(self.dbfname, 'sentence')),
+                         (3, 9))
+        stats = loader.stats()
+        self.assertEqual((stats['document'][0], stats['sentence'][0]), (3, 9))
+        conn = sqlite3.connect(self.dbfname)
+        # empty strings are loaded as NULL
+        self.assertEqual(conn.execute('SELECT COUNT(*) FROM document WHERE c2 IS NULL').fetchone()[0], 3)
+        conn.close()
+
+    def test_error(self):
+        loader = TableLoader(['document'], DBAPISink(sqlite3.connect(self.dbfname), create=True))
+        loader.add('document', (1, u'doc1'))
+        loader.flush()
+        loader.add('document', (2, u'doc2', u'extra column'))
+        self.assertRaises(BulkLoadError, loader.close)
+
+class FakeGMRDB:
+    """ Concept and protagonist ids, as the GMR database assigns them.
+    """
+    def __init__(self):
+        self.ids = {}
+
+    def getId(self, kind, name):
+        return self.ids.setdefault((kind, name), len(self.ids) + 1)
+
+    def getProtagonistId(self, name):
+        return self.getId('protagonist', name)
+
+    def getTargetConceptId(self, name, group):
+        return self.getId('target', name)
+
+    def getSourceConceptId(self, name, definition):
+        return self.getId('source', name)
+
+    def getName(self, kind, cid):
+        return [name for (k, name), i in self.ids.items() if (k, i) == (kind, cid)][0]
+
+    def getProtagonistName(self, cid):
+        return self.getName('protagonist', cid)
+
+    def getTargetConceptName(self, cid):
+        return self.getName('target', cid)
+
+    def getSourceConceptName(self, cid):
+        return self.getName('source', cid)
+
+    def getConceptGroupNames(self):
+        return ['ECONOMIC_INEQUALITY']
+
+class FakeMNDB:
+    def getUrefFromSID(self, sid):
+        return re.sub(ur':[0-9_]+$', u'', sid, count=1, flags=re.U)
+
+class FakeRepository:
+    def getSourceConceptDef(self, name):
+        return u''
+
+class FakeMapper:
+    """ Maps every LM to POVERTY is a DISEASE, or to WAR for 'fight'.
+    """
+    mr = FakeRepository()
+
+    def runTargetMapping(self, lm):
+        lm['target'].update(concept=u'POVERTY', framename=u'Poverty')
+
+    def runSourceMapping(self, lm, sourceMappingLimit=2, minSecondaryScore=0.2):
+        concept = u'WAR' if lm['source']['lemma'] == u'fight' else u'DISEASE'
+        lm['source'].update(concept=concept, framenames=[concept.capitalize()])
+
+    def copyTargetConcept(self, target, cached):
+        target.update(concept=cached['concept'], framename=cached['framename'])
+
+    def copySourceConcepts(self, lm, cached):
+        lm['source'].update(concept=cached['source']['concept'],
+                            framenames=cached['source']['framenames'])
+
+    def getSourceFramesFromConcept(self, name, minscore=0.0):
+        return [(name.capitalize(), 0.5)]
+
+def resultFile(name, sentences):
+    """ A result file with a document and its sentences; each sentence is
+    given as the list of (source lemma, score) of its LMs.
+    """
+    sents = []
+    for i, lms in enumerate(sentences):
+        text = u'%s sentence %d poverty %s' % (name, i, u' '.join(s for s, _ in lms))
+        sent = {'id': u'%s:%d' % (name, i + 1), 'idx': i, 'text': text,
+                'word': [{'idx': j, 'form': w} for j, w in enumerate(text.split())]}
+        if lms:
+            sent['lms'] = []
+            for k, (source, score) in enumerate(lms):
+                start = text.index(source)
+                sent['lms'].append({'name': u'poverty %s' % (source), 'cxn': u'T-subj_S-verb',
+                                    'extractor': u'CMS', 'score': score,
+                                    'target': {'lemma': u'poverty', 'form': u'poverty',
+                                               'start': text.index(u'poverty'),
+                                               'end': text.index(u'poverty') + 7},
+                                    'source': {'lemma': source, 'form': source,
+                                               'start': start + k, 'end': start + len(source)}})
+        sents.append(sent)
+    return {'lang': 'en', 'sentences': sents,
+            'documents': [{'name': name, 'corpus': u'test', 'type': u'news', 'size': len(sents)}]}
+
+@skipIf(fastdbimport is None, 'fastdbimport dependencies are not installed')
+class ImportDirectTest(TestCase):
+    """ Loads result files into SQLite databases with importDirect, and
+    compares the rows with the table files of generateTableFiles.
+    """
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        files = [('d1', [[(u'cure', 0.8)]] * 12 + [[]] * 3),
+                 ('d2', [[(u'fight', 0.9), (u'cure', 0.2)]] * 3 + [[]] * 2)]
+        self.fnames = []
+        for name, sentences in files:
+            fname = os.path.join(self.dir, '%s.json' % (name))
+            with open(fname, 'w') as f:
+                json.dump(resultFile(name, sentences), f)
+            self.fnames.append(fname)
+        # a file that cannot be read is skipped
+        self.fnames.insert(1, os.path.join(self.dir, 'missing.json'))
+        logging.getLogger(fastdbimport.__name__).setLevel(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.getLogger(fastdbimport.__name__).setLevel(logging.NOTSET)
+        shutil.rmtree(self.dir)
+
+    def importer(self, name):
+        return fastdbimport.FastDBImport('en', FakeMNDB(), FakeGMRDB(), FakeMapper(),
+                                         self.dir, name, scoret=0.4)
+
+    def tableFiles(self):
+        fdbi = self.importer('files')
+        fdbi.generateTableFiles(iter(self.fnames))
+        lines = {}
+        for files in (fdbi.mndatafiles, fdbi.gmrdatafiles):
+            for table, f in files.items():
+                f.close()
+                with codecs.open(f.name, encoding='utf-8') as f:
+                    lines[table] = sorted(f.read().splitlines())
+        return lines
+
+    def importDirect(self, workers):
+        fdbi = self.importer('direct')
+        mnfname = os.path.join(self.dir, 'direct%d-mn.db' % (workers))
+        gmrfname = os.path.join(self.dir, 'direct%d-gmr.db' % (workers))
+        mnloader = fastdbimport.TableLoader(fdbi.mntables,
+                                            DBAPISink(sqlite3.connect(mnfname), create=True), 5)
+        gmrloader = fastdbimport.TableLoader(fdbi.gmrtables,
+                                             DBAPISink(sqlite3.connect(gmrfname), create=True), 5)
+        fdbi.importDirect(iter(self.fnames), mnloader, gmrloader, workers=workers)
+        self.assertTrue(mnloader.nbatches > 1)
+        lines = {}
+        for loader, fname in ((mnloader, mnfname), (gmrloader, gmrfname)):
+            conn = sqlite3.connect(fname)
+            for table in loader.tables:
+                if loader.stats()[table][0]:
+                    rows = conn.execute('SELECT * FROM "%s"' % (table)).fetchall()
+                else:
+                    rows = []
+                lines[table] = sorted(rowToLine(row) for row in rows)
+            conn.close()
+        return lines
+
+    def test_row_counts(self):
+        lines = self.importDirect(workers=0)
+        counts = dict((table, len(rows)) for table, rows in lines.items())
+        self.assertEqual(counts, {'document': 2, 'sentence': 15, 'LM': 2, 'LM_instance': 18,
+                                  'lm_sentence': 15, 'lm': 15, 'lm_property': 60,
+                                  'lm2cm_source': 15, 'lm2cm_target_general': 15,
+                                  'cm_general': 1, 'cm_general_property': 1})
+
+    def test_same_rows(self):
+        expected = self.tableFiles()
+        self.assertEqual(self.importDirect(workers=0), expected)
+        self.assertEqual(self.importDirect(workers=2), expected)
+
+def test_suite():
+    suite = TestSuite()
+    suite.addTests(makeSuite(TableLoaderTest))
+    suite.addTests(makeSuite(ImportDirectTest))
+    return suite
+
+if __name__ == '__main__':
+    main(defaultTest='test_suite')
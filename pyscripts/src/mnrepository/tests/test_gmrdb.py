@@ -0,0 +1,144 @@
+#
+from unittest import TestCase, TestSuite, makeSuite, main
+import datetime
+
+try:
+    from peewee import SqliteDatabase
+    from mnrepository import gmrdb
+except ImportError:
+    gmrdb = None
+
+MODELS = ['Case', 'Cm_Source', 'Protagonist', 'Cm_Target_General', 'Cm_Target_Case',
+          'Cm_General', 'Cm_Case', 'Lm_Sentence', 'Lm', 'Lm2Cm_Source',
+          'Lm2Cm_Target_Case', 'Lm2Cm_Target_General', 'Lm_Property']
+
+def build_fixture(db):
+    """ Creates the GMR tables in db and fills them with a small repository:
+    duplicate CMs for a target/source pair, sources without LMs, LMs of two
+    protagonists and languages, and LMs with zero, one and two source frames.
+    """
+    for name in MODELS:
+        getattr(gmrdb, name).create_table()
+    case = gmrdb.Case.create(description=u'', name=u'case')
+    prots = [gmrdb.Protagonist.create(case=case, description=u'', name=name, owner=u'ICSI')
+             for name in (u'Government', u'Business')]
+    scons = [gmrdb.Cm_Source.create(source_concept=name, source_definition=u'', source_owner=u'ICSI')
+             for name in (u'DISEASE', u'JOURNEY', u'WAR', u'BUILDING')]
+    tgens = [gmrdb.Cm_Target_General.create(cultural_concept=u'', target_concept=name, target_owner=u'GOV')
+             for name in (u'POVERTY', u'TAXATION', u'WEALTH')]
+    tcases = [gmrdb.Cm_Target_Case.create(case_concept=u'', target_concept=name, target_owner=u'GOV')
+              for name in (u'GUN_CONTROL', u'BUREAUCRACY')]
+    for ti, si, lang, pi in [(0, 0, 'EN', 0), (0, 0, 'EN', 1), (0, 1, 'EN', 0), (0, 3, 'EN', 1),
+                             (1, 2, 'EN', 0), (1, 0, 'ES', 0), (1, 1, 'ES', 1)]:
+        gmrdb.Cm_General.create(cm_target_general=tgens[ti], cm_source=scons[si],
+                                language=lang, protagonist=prots[pi])
+        gmrdb.Cm_Case.create(cm_target_case=tcases[ti], cm_source=scons[si],
+                             language=lang, protagonist=prots[pi])
+    sent = gmrdb.Lm_Sentence.create(doc_date=datetime.date(2014, 1, 1), language=u'EN',
+                                    text=u'', type=u'', url=u'')
+    lms = [(0, 0, 'EN', 0, u'cure', [u'Disease'], u'Poverty'),
+           (0, 0, 'EN', 1, u'cure', [u'Disease', u'Cure'], u'Poverty'),
+           (0, 0, 'EN', 0, u'plague', [], u'Poverty'),
+           (0, 1, 'EN', 0, u'road', [u'Journey'], u'Poverty'),
+           (1, 2, 'EN', 1, u'fight', [u'War'], u'Taxation'),
+           (1, 2, 'EN', 0, u'fight', [u'War'], None),
+           (1, 0, 'ES', 0, u'curar', [u'Disease'], u'Taxation'),
+           (2, 2, 'EN', 0, u'battle', [u'War'], u'Wealth')]
+    for ti, si, lang, pi, lemma, sframes, tframe in lms:
+        lm = gmrdb.Lm.create(language=lang, lm_sentence=sent, lm_source=lemma,
+                             lm_source_lemma=lemma, lm_target=u'', protagonist=prots[pi])
+        gmrdb.Lm2Cm_Source.create(cm_source=scons[si], confidence=u'', lm=lm)
+        gmrdb.Lm2Cm_Target_General.create(cm_target_general=tgens[ti], lm=lm)
+        gmrdb.Lm2Cm_Target_Case.create(cm_target_case=tcases[min(ti, 1)], lm=lm)
+        if tframe:
+            gmrdb.Lm_Property.create(lm=lm, name=u'hasTargetFrame', value=tframe)
+        for sframe in sframes:
+            gmrdb.Lm_Property.create(lm=lm, name=u'hasSourceFrame', value=sframe)
+
+class GroupedCountsTest(TestCase):
+    """ Checks the grouped count statistics against the per target and source
+    concept queries they replace.
+    """
+    gdbclass = None
+
+    def setUp(self):
+        self.db = SqliteDatabase(':memory:')
+        self.gdb = self.gdbclass(database=self.db)
+        build_fixture(self.db)
+
+    def tearDown(self):
+        self.db.close()
+
+    def params(self):
+        for lang in ('EN', 'ES', 'RU'):
+            for prot in (None, u'Government', u'Business'):
+                yield lang, prot
+
+    def test_cm_source_counts(self):
+        snames = self.gdb.getSourceConceptNames()
+        for lang, prot in self.params():
+            cmcounts = self.gdb.getCMSourceCounts(lang, prot)
+            for tcon in self.gdb.getTargetConcepts():
+                sources = sorted(scon.source_concept for scon in
+                                 self.gdb.getCMSourcesFromTarget(lang, tcon, prot))
+                grouped = sorted(snames[scon] for scon, ncms in cmcounts.get(tcon.id, {}).iteritems()
+                                 for i in range(ncms))
+                self.assertEqual(sources, grouped)
+
+    def test_lm_counts(self):
+        nonzero = 0
+        for lang, prot in self.params():
+            lmcounts = self.gdb.getLMCountsByTargetSource(lang, prot)
+            for tcon in self.gdb.getTargetConcepts():
+                for scon in gmrdb.Cm_Source.select():
+                    count = self.gdb.getCountLMsFromTargetSource(lang, tcon, scon, prot)
+                    self.assertEqual(count, lmcounts.get(tcon.id, {}).get(scon.id, 0))
+                    nonzero += (count > 0)
+        self.assertTrue(nonzero > 0)
+
+    def test_lexical_counts(self):
+        for lang, prot in self.params():
+            lexcounts = self.gdb.getLexicalCountsByTargetSource(lang, prot)
+            for tcon in self.gdb.getTargetConcepts():
+                for scon in gmrdb.Cm_Source.select():
+                    rows = dict((row.lm_source_lemma, row.count) for row in
+                                self.gdb.getCMLexicalCounts(lang, tcon, scon, prot))
+                    self.assertEqual(rows, lexcounts.get(tcon.id, {}).get(scon.id, {}))
+
+    def test_schema_counts(self):
+        for lang, prot in self.params():
+            tscounts = {}
+            for lm in self.gdb.getLMsFromLang(lang, prot):
+                targetschema, sourceschemas = self.gdb.getLMProperties(lm)
+                counts = tscounts.setdefault(targetschema, {})
+                for sourceschema in sourceschemas:
+                    counts[sourceschema] = counts.get(sourceschema, 0) + 1
+            self.assertEqual(tscounts, self.gdb.getSchemaCounts(lang, prot))
+
+    def test_fixture(self):
+        # a target concept without CMs, and duplicate CMs for a pair
+        cmcounts = self.gdb.getCMSourceCounts('EN')
+        self.assertEqual(sorted(cmcounts.values()[0].values() + cmcounts.values()[1].values()),
+                         [1, 1, 1, 2])
+        self.assertEqual(len(cmcounts), 2)
+        self.assertEqual(self.gdb.getSchemaCounts('EN', u'Government'),
+                         {u'Poverty': {u'Disease': 1, u'Journey': 1},
+                          None: {u'War': 1}, u'Wealth': {u'War': 1}})
+
+class GeneralGroupedCountsTest(GroupedCountsTest):
+    gdbclass = gmrdb.GMRDBGeneral if gmrdb else None
+
+class CaseGroupedCountsTest(GroupedCountsTest):
+    gdbclass = gmrdb.GMRDBCase if gmrdb else None
+
+def test_suite():
+    if gmrdb is None:
+        # peewee not installed?
+        return TestSuite()
+    suite = TestSuite()
+    suite.addTest(makeSuite(GeneralGroupedCountsTest))
+    suite.addTest(makeSuite(CaseGroupedCountsTest))
+    return suite
+
+if __name__ == '__main__':
+    main(defaultTest='test_suite')
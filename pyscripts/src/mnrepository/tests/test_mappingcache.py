@@ -0,0 +1,224 @@
+#
+from unittest import TestCase, TestSuite, makeSuite, main, skipIf
+import os, shutil, sqlite3, tempfile, logging
+
+from mnrepository import mappingcache
+from mnrepository.mappingcache import MappingCache
+
+try:
+    from mnrepository.cnmapping import ConceptualNetworkMapper
+except ImportError:
+    # needs openpyxl and setproctitle
+    ConceptualNetworkMapper = None
+
+def countEntries(fname):
+    conn = sqlite3.connect(fname)
+    try:
+        return conn.execute('SELECT COUNT(*) FROM mapping').fetchone()[0]
+    finally:
+        conn.close()
+
+class MappingCacheTest(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.fname = os.path.join(self.dir, 'cache.cnmapping-en.db')
+        self.caches = []
+        logging.getLogger(mappingcache.__name__).setLevel(logging.WARN)
+
+    def tearDown(self):
+        for cache in self.caches:
+            cache.close()
+        logging.getLogger(mappingcache.__name__).setLevel(logging.NOTSET)
+        shutil.rmtree(self.dir)
+
+    def cache(self, validity='2:abc', **kw):
+        cache = MappingCache(self.fname, validity, **kw)
+        self.caches.append(cache)
+        return cache
+
+    def test_hit_miss(self):
+        cache = self.cache()
+        key = (('en', False), u'disease', u'n')
+        self.assertEqual(cache.get('getFramesFromLemma', key), None)
+        cache.put('getFramesFromLemma', key, set([(u'Disease', u'Disease', 'wikilem')]))
+        frames = cache.get('getFramesFromLemma', key)
+        self.assertEqual(frames, set([(u'Disease', u'Disease', 'wikilem')]))
+        # callers get copies
+        frames.clear()
+        self.assertEqual(len(cache.get('getFramesFromLemma', key)), 1)
+        # the same key for another method is another entry
+        self.assertEqual(cache.get('runExpansionPhases', key), None)
+        self.assertEqual(cache.stats, {'getFramesFromLemma': {'hits': 2, 'misses': 1},
+                                       'runExpansionPhases': {'hits': 0, 'misses': 1}})
+        self.assertEqual(cache.hitRate('getFramesFromLemma'), 2.0 / 3)
+        self.assertEqual(cache.hitRate(), 0.5)
+
+    def test_persistent(self):
+        cache = self.cache(flushEvery=2)
+        for i in range(5):
+            cache.put('getFramesFromLemma', (u'w%d' % i,), [i])
+        self.assertEqual(countEntries(self.fname), 4)
+        cache.close()
+        self.assertEqual(countEntries(self.fname), 5)
+        other = self.cache()
+        self.assertEqual([other.get('getFramesFromLemma', (u'w%d' % i,)) for i in range(5)],
+                         [[i] for i in range(5)])
+        self.assertEqual(other.stats['getFramesFromLemma'], {'hits': 5, 'misses': 0})
+
+    def test_invalidation(self):
+        cache = self.cache()
+        cache.put('getFramesFromLemma', (u'disease',), [1])
+        cache.close()
+        # the repository changed
+        other = self.cache(validity='2:def')
+        self.assertEqual(other.get('getFramesFromLemma', (u'disease',)), None)
+        self.assertEqual(countEntries(self.fname), 0)
+        # and so did the cache format
+        other.put('getFramesFromLemma', (u'disease',), [2])
+        other.close()
+        version = mappingcache.MAPPING_CACHE_VERSION
+        try:
+            mappingcache.MAPPING_CACHE_VERSION = version + 1
+            self.assertEqual(self.cache(validity='2:def').get('getFramesFromLemma', (u'disease',)), None)
+        finally:
+            mappingcache.MAPPING_CACHE_VERSION = version
+
+    def test_eviction(self):
+        cache = self.cache(maxentries=3, flushEvery=1)
+        for i in range(5):
+            cache.put('getFramesFromLemma', (i,), i)
+        self.assertEqual(countEntries(self.fname), 3)
+        self.assertEqual(cache.evictions, 2)
+        cache.close()
+        other = self.cache(maxentries=3)
+        self.assertEqual([other.get('getFramesFromLemma', (i,)) for i in range(5)],
+                         [None, None, 2, 3, 4])
+
+    def test_memory_only(self):
+        cache = MappingCache(None, '2:None', mementries=2)
+        for i in range(3):
+            cache.put('getFramesFromLemma', (i,), i)
+        # the least recently used one went
+        self.assertEqual([cache.get('getFramesFromLemma', (i,)) for i in range(3)], [None, 1, 2])
+        cache.close()
+        self.assertEqual(os.listdir(self.dir), [])
+
+class FakeRepository:
+    """ Looks up frames in a dict, and records the lookups.
+    """
+    GRAPH_CACHE_VERSION = 3
+
+    def __init__(self, cachedir, luframes, fnluframes, rdfhash='abc'):
+        self.cachedir = cachedir
+        self.luframes = luframes
+        self.fnluframes = fnluframes
+        self.rdfhash = rdfhash
+        self.pwf = self.fndata = self.wikdata = None
+        self.lookups = []
+
+    def getSourceHash(self):
+        return self.rdfhash
+
+    def getLemPos(self, lemma, pos):
+        return u'%s.%s' % (lemma, pos)
+
+    def lookupFramesFromLU(self, lu):
+        self.lookups.append(lu)
+        return self.luframes.get(lu, set())
+
+    def lookupFramesFromFNLU(self, lu):
+        self.lookups.append(('fn', lu))
+        return self.fnluframes.get(lu, set())
+
+    def getNameLiteral(self, frame):
+        return frame.upper()
+
+@skipIf(ConceptualNetworkMapper is None, 'cnmapping dependencies are not installed')
+class MapperCacheTest(TestCase):
+    """ The memoised searches of ConceptualNetworkMapper.
+    """
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.mappers = []
+        logging.getLogger(mappingcache.__name__).setLevel(logging.WARN)
+
+    def tearDown(self):
+        for mapper in self.mappers:
+            mapper.mapcache.close()
+        logging.getLogger(mappingcache.__name__).setLevel(logging.NOTSET)
+        shutil.rmtree(self.dir)
+
+    def mapper(self, disableFN=False, **kw):
+        mr = FakeRepository(self.dir, {u'cure.v': set([u'Cure'])},
+                            {u'heal': set([u'Healing'])}, **kw)
+        class Mapper(ConceptualNetworkMapper):
+            def __init__(self):
+                pass
+        # as in ConceptualNetworkMapper.__init__, without the program sources
+        mapper = Mapper()
+        mapper.logger = logging.getLogger('test')
+        mapper.lang = 'en'
+        mapper.mr = mr
+        mapper.disableFN = disableFN
+        mapper.initMappingCache()
+        self.mappers.append(mapper)
+        return mapper
+
+    def test_hit_miss(self):
+        mapper = self.mapper()
+        expected = set([(u'Cure', u'CURE', 'wikilpos')])
+        self.assertEqual(mapper.getFramesFromLemma(u'cure', u'v'), expected)
+        self.assertEqual(mapper.mr.lookups, [u'cure.v'])
+        self.assertEqual(mapper.getFramesFromLemma(u'cure', u'v'), expected)
+        self.assertEqual(mapper.mr.lookups, [u'cure.v'])
+        # another lemma is searched
+        self.assertEqual(mapper.getFramesFromLemma(u'heal'),
+                         set([(u'Healing', u'HEALING', 'fnlem')]))
+        self.assertEqual(mapper.mr.lookups[1:], [u'heal', ('fn', u'heal')])
+        self.assertEqual(mapper.mapcache.stats['getFramesFromLemma'], {'hits': 1, 'misses': 2})
+        mapper.mapcache.close()
+        # and is kept for the next run
+        other = self.mapper()
+        self.assertEqual(other.getFramesFromLemma(u'heal'), set([(u'Healing', u'HEALING', 'fnlem')]))
+        self.assertEqual(other.mr.lookups, [])
+
+    def test_settings(self):
+        mapper = self.mapper()
+        self.assertEqual(len(mapper.getFramesFromLemma(u'heal')), 1)
+        mapper.mapcache.close()
+        # a mapper without FrameNet shares the file, but not the entries
+        other = self.mapper(disableFN=True)
+        self.assertEqual(other.mapcache.fname, mapper.mapcache.fname)
+        self.assertEqual(other.getFramesFromLemma(u'heal'), set())
+        self.assertEqual(other.mr.lookups, [u'heal'])
+
+    def test_invalidation(self):
+        mapper = self.mapper()
+        mapper.getFramesFromLemma(u'cure', u'v')
+        mapper.mapcache.close()
+        # the RDF file changed
+        other = self.mapper(rdfhash='def')
+        other.getFramesFromLemma(u'cure', u'v')
+        self.assertEqual(other.mr.lookups, [u'cure.v'])
+
+    def test_no_source_hash(self):
+        # nothing tells when the repository changes: the cache is not written
+        mapper = self.mapper(rdfhash=None)
+        self.assertEqual(mapper.mapcache.fname, None)
+        mapper.getFramesFromLemma(u'cure', u'v')
+        mapper.getFramesFromLemma(u'cure', u'v')
+        self.assertEqual(mapper.mr.lookups, [u'cure.v'])
+        mapper.mr.tstore = object()
+        mapper.mr.rdfhash = 'abc'
+        mapper.initMappingCache()
+        self.assertEqual(mapper.mapcache.fname, None)
+        self.assertEqual(os.listdir(self.dir), [])
+
+def test_suite():
+    suite = TestSuite()
+    suite.addTests(makeSuite(MappingCacheTest))
+    suite.addTests(makeSuite(MapperCacheTest))
+    return suite
+
+if __name__ == '__main__':
+    main(defaultTest='test_suite')
@@ -0,0 +1,257 @@
+#
+from unittest import TestCase, TestSuite, makeSuite, main
+import os, shutil, tempfile, logging
+import cPickle as pickle
+
+from rdflib import Graph, Literal, URIRef
+from rdflib.namespace import RDF
+
+from mnrepository import metanetrdf
+from mnrepository.metanetrdf import MetaNetRepository
+from mnrepository.framerels import MO, FrameRelationIndex
+
+RDFXML = u'''<?xml version="1.0" encoding="utf-8"?>
+<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+         xmlns:mo="https://metaphor.icsi.berkeley.edu/metaphor/MetaphorOntology.owl#">
+  <mo:Frame rdf:about="https://metaphor.icsi.berkeley.edu/en/MetaphorRepository.owl#Disease">
+    <mo:hasName>Disease</mo:hasName>
+  </mo:Frame>
+  <mo:Frame rdf:about="https://metaphor.icsi.berkeley.edu/en/MetaphorRepository.owl#%s">
+    <mo:hasName>%s</mo:hasName>
+    <mo:isSubcaseOfFrame rdf:resource="https://metaphor.icsi.berkeley.edu/en/MetaphorRepository.owl#Disease"/>
+  </mo:Frame>
+</rdf:RDF>
+'''
+
+class GraphCacheTest(TestCase):
+    """ The cached rdf graph and frame relation index are used only when
+    their header matches the cache version and the RDF file.
+    """
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cachedir = os.path.join(self.dir, 'cache')
+        self.rdffname = os.path.join(self.dir, 'mr_en.owl')
+        self.writeRDF(u'Cancer')
+        self.mrpath = os.environ.pop('MNRDFPATH', None)
+        logging.getLogger(metanetrdf.__name__).setLevel(logging.WARN)
+
+    def tearDown(self):
+        if self.mrpath is not None:
+            os.environ['MNRDFPATH'] = self.mrpath
+        logging.getLogger(metanetrdf.__name__).setLevel(logging.NOTSET)
+        shutil.rmtree(self.dir)
+
+    def writeRDF(self, frame):
+        with open(self.rdffname, 'w') as f:
+            f.write((RDFXML % (frame, frame)).encode('utf-8'))
+
+    def repository(self):
+        return MetaNetRepository('en', rdffname=self.rdffname, cachedir=self.cachedir)
+
+    def frame(self, name):
+        return URIRef(MetaNetRepository.prefixes['mren'] + name)
+
+    def header(self, fname):
+        with open(fname, 'rb') as f:
+            return pickle.load(f)
+
+    def writeCache(self, fname, header, obj):
+        with open(fname, 'wb') as f:
+            pickle.dump(header, f, 2)
+            pickle.dump(obj, f, 2)
+
+    def names(self, mr):
+        return sorted(unicode(o) for o in mr.g.objects(None, MO.hasName))
+
+    def test_graph_cache(self):
+        mr = self.repository()
+        current = (MetaNetRepository.GRAPH_CACHE_VERSION, mr.getSourceHash())
+        self.assertEqual(self.header(mr.cachef), current)
+        # a current cache is loaded instead of the RDF file
+        marked = Graph()
+        marked.add((mr.mr.Marked, MO.hasName, Literal(u'Marked')))
+        self.writeCache(mr.cachef, current, marked)
+        self.assertEqual(self.names(self.repository()), [u'Marked'])
+        # a cache from an older version is rebuilt
+        self.writeCache(mr.cachef, (current[0] - 1, current[1]), marked)
+        self.assertEqual(self.names(self.repository()), [u'Cancer', u'Disease'])
+        self.assertEqual(self.header(mr.cachef), current)
+        # and one from a headerless older format
+        with open(mr.cachef, 'wb') as f:
+            pickle.dump(marked, f, 2)
+        self.assertEqual(self.names(self.repository()), [u'Cancer', u'Disease'])
+        # and one from another RDF file
+        self.writeCache(mr.cachef, current, marked)
+        self.writeRDF(u'Flu')
+        mr = self.repository()
+        self.assertEqual(self.names(mr), [u'Disease', u'Flu'])
+        self.assertNotEqual(mr.getSourceHash(), current[1])
+        self.assertEqual(self.header(mr.cachef), (current[0], mr.getSourceHash()))
+
+    def test_frame_relations_cache(self):
+        mr = self.repository()
+        mr.initFrameRelations()
+        current = (MetaNetRepository.GRAPH_CACHE_VERSION, mr.getSourceHash())
+        self.assertEqual(self.header(mr.framerelscachef), current)
+        self.assertEqual(mr.framerels.subcaseup, {self.frame(u'Cancer'): set([self.frame(u'Disease')])})
+        # a current index is loaded
+        mr.framerels.subcaseup = {}
+        self.writeCache(mr.framerelscachef, current, mr.framerels)
+        mr = self.repository()
+        mr.initFrameRelations()
+        self.assertEqual(mr.framerels.subcaseup, {})
+        # a stale one is rebuilt
+        self.writeCache(mr.framerelscachef, (current[0] - 1, current[1]), mr.framerels)
+        mr = self.repository()
+        mr.initFrameRelations()
+        self.assertEqual(mr.framerels.subcaseup, {self.frame(u'Cancer'): set([self.frame(u'Disease')])})
+        self.assertEqual(self.header(mr.framerelscachef), current)
+        self.writeRDF(u'Flu')
+        mr = self.repository()
+        mr.initFrameRelations()
+        self.assertEqual(mr.framerels.subcaseup, {self.frame(u'Flu'): set([self.frame(u'Disease')])})
+
+# a small repository, as (subject, predicate, object) triples, with subcase
+# chains, frames reached by more than one path, both spellings of the
+# subcase predicate, families, LUs and CMs
+FRAMES = [u'Disease', u'Cancer', u'LungCancer', u'Flu', u'Treatment', u'Cure',
+          u'Fight', u'War', u'Battle', u'Poverty', u'Crime', u'Theft']
+TRIPLES = [(u'Cancer', MO.isSubcaseOfFrame, u'Disease'),
+           (u'LungCancer', MO.isSubcaseOfFrame, u'Cancer'),
+           (u'LungCancer', MO.isSubcaseOfFrame, u'Disease'),
+           (u'Flu', MO.isSubcaseOfFrame, u'Disease'),
+           (u'Cure', MO.isSubcaseOfFrame, u'Treatment'),
+           (u'Battle', MO.isSubcaseOfFrame, u'War'),
+           (u'Battle', MO.isSubcaseOfFrame, u'Fight'),
+           (u'Crime', MO.isSubCaseOfFrame, u'Poverty'),
+           (u'Theft', MO.isSubCaseOfFrame, u'Crime'),
+           (u'Theft', MO.isSubcaseOfFrame, u'Crime'),
+           (u'Treatment', MO.makesUseOfFrame, u'Disease'),
+           (u'Cure', MO.makesUseOfFrame, u'Cancer'),
+           (u'Fight', MO.makesUseOfFrame, u'Disease'),
+           (u'Fight', MO.makesUseOfFrame, u'Treatment'),
+           (u'War', MO.makesUseOfFrame, u'Fight'),
+           (u'Poverty', MO.makesUseOfFrame, u'Crime'),
+           (u'War', MO.incorporatesFrameAsRole, u'Disease'),
+           (u'Fight', MO.incorporatesFrameAsRole, u'Cancer'),
+           (u'Health', RDF.type, MO.FrameFamily),
+           (u'Illness', RDF.type, MO.FrameFamily),
+           (u'Conflict', RDF.type, MO.FrameFamily),
+           (u'Illness', MO.isFrameSubfamilyOf, u'Health'),
+           (u'Disease', MO.isInFrameFamily, u'Illness'),
+           (u'Cancer', MO.isInFrameFamily, u'Illness'),
+           (u'Cancer', MO.isInFrameFamily, u'Health'),
+           (u'War', MO.isInFrameFamily, u'Conflict'),
+           (u'Fight', MO.isInFrameFamily, u'Unknown'),
+           (u'Disease', MO.hasLexicalUnit, u'disease.n'),
+           (u'Disease', MO.hasLexicalUnit, u'illness.n'),
+           (u'Cancer', MO.hasLexicalUnit, u'cancer.n'),
+           (u'Cancer', MO.hasLexicalUnit, u'tumor.n'),
+           (u'LungCancer', MO.hasLexicalUnit, u'tumor.n'),
+           (u'Flu', MO.hasLexicalUnit, u'flu.n'),
+           (u'War', MO.hasLexicalUnit, u'war.n'),
+           (u'Battle', MO.hasLexicalUnit, u'battle.n'),
+           (u'Battle', MO.hasLexicalUnit, u'untyped.n'),
+           (u'POVERTY_IS_A_DISEASE', MO.hasTargetFrame, u'Poverty'),
+           (u'POVERTY_IS_A_DISEASE', MO.hasSourceFrame, u'Disease'),
+           (u'CRIME_IS_WAR', MO.hasTargetFrame, u'Crime'),
+           (u'CRIME_IS_WAR', MO.hasSourceFrame, u'War'),
+           (u'CANCER_IS_A_BATTLE', MO.hasTargetFrame, u'Cancer'),
+           (u'CANCER_IS_A_BATTLE', MO.hasSourceFrame, u'Battle'),
+           (u'CANCER_IS_A_BATTLE', MO.hasSourceFrame, u'War'),
+           (u'TREATMENT_IS_A_FIGHT', MO.hasTargetFrame, u'Treatment'),
+           (u'TREATMENT_IS_A_FIGHT', MO.hasSourceFrame, u'Fight'),
+           (u'DISEASE_IS_A_CRIME', MO.hasTargetFrame, u'Disease'),
+           (u'DISEASE_IS_A_CRIME', MO.hasSourceFrame, u'Crime')]
+
+class FrameRelationsTest(TestCase):
+    """ The frame relation index and the SPARQL queries it replaces give
+    the same results, except that the index results are sorted and have no
+    duplicates.
+    """
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.mrpath = os.environ.pop('MNRDFPATH', None)
+        logging.getLogger(metanetrdf.__name__).setLevel(logging.WARN)
+        ns = MetaNetRepository.prefixes['mren']
+        g = Graph()
+        for frame in FRAMES:
+            g.add((URIRef(ns + frame), RDF.type, MO.Frame))
+            g.add((URIRef(ns + frame), MO.hasName, Literal(frame)))
+        # a frame with two names
+        g.add((URIRef(ns + u'Flu'), MO.hasName, Literal(u'Influenza')))
+        for s, p, o in TRIPLES:
+            if p == MO.hasLexicalUnit:
+                if o != u'untyped.n':
+                    g.add((URIRef(ns + o), RDF.type, MO.LexicalUnit))
+                g.add((URIRef(ns + o), MO.hasLemma, Literal(o.split(u'.')[0])))
+            g.add((URIRef(ns + s), p, o if p == RDF.type else URIRef(ns + o)))
+        rdffname = os.path.join(self.dir, 'mr_en.owl')
+        g.serialize(rdffname, format='xml')
+        self.mr = MetaNetRepository('en', rdffname=rdffname,
+                                    cachedir=os.path.join(self.dir, 'cache'))
+        self.mr.initFrameRelations()
+        self.index = self.mr.framerels
+        self.frames = [URIRef(ns + frame) for frame in FRAMES + [u'Health', u'Missing']]
+
+    def tearDown(self):
+        if self.mrpath is not None:
+            os.environ['MNRDFPATH'] = self.mrpath
+        logging.getLogger(metanetrdf.__name__).setLevel(logging.NOTSET)
+        shutil.rmtree(self.dir)
+
+    def both(self, method, *args):
+        """ The results of method with the SPARQL queries, and with the index """
+        self.mr.framerels = None
+        try:
+            sparql = method(*args)
+        finally:
+            self.mr.framerels = self.index
+        return sparql, method(*args)
+
+    def check(self, method, *args):
+        sparql, index = self.both(method, *args)
+        if isinstance(sparql, list):
+            self.assertEqual(index, sorted(set(sparql)), (method.__name__, args))
+            return index
+        self.assertEqual(index, sparql, (method.__name__, args))
+        return index
+
+    def test_single_frames(self):
+        found = 0
+        for frame in self.frames:
+            lus = self.check(self.mr.getLUsFromFrameHierarchy, frame)
+            sparql, index = self.both(self.mr.getAllFrameFamilies, frame)
+            self.assertEqual([row.family for row in index],
+                             sorted(set(row.family for row in sparql)))
+            found += len(lus) + len(index)
+        # tumor is found through both Cancer and LungCancer
+        sparql, index = self.both(self.mr.getLUsFromFrameHierarchy, self.frames[0])
+        self.assertEqual(sorted(lu[0] for lu in sparql),
+                         [u'cancer', u'disease', u'flu', u'illness', u'tumor', u'tumor'])
+        self.assertEqual([lu[0] for lu in index],
+                         [u'cancer', u'disease', u'flu', u'illness', u'tumor'])
+        self.assertTrue(found > 10, found)
+
+    def test_frame_pairs(self):
+        found = dict((name, 0) for name in FrameRelationIndex.CM_QUERIES)
+        for frame1 in self.frames:
+            for frame2 in self.frames:
+                for method in (self.mr.doesFrame1UseFrame2, self.mr.doesFrame1UseFrame2long,
+                               self.mr.doesFrame1FillRoleInFrame2, self.mr.frameThatUsesBoth,
+                               self.mr.frameThatBothAreSubcasesOf):
+                    self.check(method, frame1, frame2)
+                for queryname in FrameRelationIndex.CM_QUERIES:
+                    found[queryname] += len(self.check(self.mr.getCMs, queryname,
+                                                       frame1, frame2))
+        # every query finds some CMs in the repository
+        self.assertEqual([name for name, n in found.items() if not n], [])
+
+def test_suite():
+    suite = TestSuite()
+    suite.addTests(makeSuite(GraphCacheTest))
+    suite.addTests(makeSuite(FrameRelationsTest))
+    return suite
+
+if __name__ == '__main__':
+    main(defaultTest='test_suite')
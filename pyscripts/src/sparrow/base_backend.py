@@ -7,6 +7,49 @@ from sparrow.utils import (json_to_ntriples,
                            ntriples_to_dict)
 from sparrow.error import TripleStoreError
 
+class BatchLoader(object):
+    """ Collects N-Triples lines and adds them to a context of a triple
+    store in batches, with add_ntriples.  See BaseBackend.bulk_loader.
+    """
+    def __init__(self, store, context, batchsize=100000):
+        self._store = store
+        self._context = context
+        self.batchsize = batchsize
+        self._data = []
+        self._batchtriples = 0
+        self.ntriples = 0
+        self.nbatches = 0
+
+    def add(self, lines):
+        """ Add a sequence of N-Triples strings (unicode), each of one or
+        more lines, without a final newline.
+        """
+        if not lines:
+            return
+        data = u'\n'.join(lines)
+        self._data.append(data)
+        self._data.append(u'\n')
+        self._batchtriples += data.count(u'\n') + 1
+        if self._batchtriples >= self.batchsize:
+            self.flush()
+
+    def flush(self):
+        if not self._data:
+            return
+        data = u''.join(self._data).encode('utf-8')
+        self.ntriples += self._batchtriples
+        self._data = []
+        self._batchtriples = 0
+        self._store.add_ntriples(StringIO(data), self._context)
+        self.nbatches += 1
+
+    def close(self):
+        self.flush()
+
+    def abort(self):
+        self._data = []
+        self._batchtriples = 0
+
 class BaseBackend(object):
 
     def __init__(self):
@@ -15,6 +58,14 @@ class BaseBackend(object):
 
     def add_pquery(self,qidstring,querytext):
         self._pqueries[qidstring] = querytext
+
+    def pselect_iter(self, qid, bindings={}):
+        # backends that can stream results override this
+        return iter(self.pselect(qid, bindings))
+
+    def bulk_loader(self, context, batchsize=100000, inflight=1):
+        # backends that can stream uploads override this
+        return BatchLoader(self, context, batchsize)
     
     def compute_query_header(self):
         self._query_header = "\n".join([u'PREFIX %s: <%s>'%(pref,ns) for pref,ns in self._nsmap.iteritems()])
@@ -4,7 +4,7 @@ from zope.interface import implements
 
 try:
     import rdflib
-    from rdflib import Graph, ConjunctiveGraph, Namespace
+    from rdflib import Graph, ConjunctiveGraph, Namespace, URIRef, BNode, Literal
     from rdflib.plugins.memory import IOMemory
     from rdflib.plugins.sparql import prepareQuery
 except ImportError:
@@ -20,6 +20,60 @@ from sparrow.utils import (parse_sparql_result,
                            ntriples_to_json)
 
 
+def _xml_text(text):
+    # the values as they come out of the SPARQL XML results format, which
+    # parse_sparql_result used to read: empty text is None, and the XML
+    # parser normalizes line endings
+    if not text:
+        return None
+    return text.replace(u'\r\n', u'\n').replace(u'\r', u'\n')
+
+def term_to_binding(term):
+    """ Converts an rdflib term to a binding dictionary, as returned by
+    parse_sparql_result for the term in the SPARQL XML results format.
+    """
+    text = _xml_text(unicode(term))
+    if isinstance(term, URIRef):
+        if text:
+            if text.startswith('<'):
+                text = text[1:]
+            if text.endswith('>'):
+                text = text[:-1]
+        return {'value': text, 'type': u'uri'}
+    elif isinstance(term, BNode):
+        return {'value': text, 'type': u'bnode'}
+    elif isinstance(term, Literal):
+        data = {'value': text, 'type': u'literal'}
+        if term.language:
+            data['lang'] = unicode(term.language)
+        elif term.datatype:
+            data['datatype'] = unicode(term.datatype)
+        return data
+    raise QueryError('Unsupported RDF term: %r' % (term,))
+
+def iter_bindings(result):
+    """ Iterates over the rows of an rdflib SELECT result as binding
+    dictionaries, in the format of parse_sparql_result, converting each
+    row as it is read.
+    """
+    # iterating over the result itself would skip the rows with no bound
+    # variables, which the SPARQL XML results format keeps as {}
+    for row in result.bindings:
+        yield dict((unicode(name), term_to_binding(value))
+                   for name, value in row.iteritems() if value is not None)
+
+def result_to_bindings(result):
+    """ Converts an rdflib query result to the format of
+    parse_sparql_result: a list of binding dictionaries for SELECT
+    queries, a boolean for ASK queries.  Other queries raise a QueryError.
+    """
+    if result.type == 'ASK':
+        return bool(result.askAnswer)
+    if result.type != 'SELECT':
+        raise QueryError('SELECT or ASK Query expected, not %s' % result.type)
+    return list(iter_bindings(result))
+
+
 class RDFLibTripleStore(BaseBackend):
     implements(ITripleStore, ISPARQLEndpoint)
 
@@ -148,9 +202,9 @@ class RDFLibTripleStore(BaseBackend):
         
     def select(self, sparql):
         result = self._query(sparql)
-        return parse_sparql_result(result.serialize())
+        return result_to_bindings(result)
     
-    def pselect(self, qid, bindings={}):
+    def _pquery(self, qid, bindings):
         try:
             result = ConjunctiveGraph(self._store).query(self._pqueries[qid],
                                                          initBindings=bindings)
@@ -160,8 +214,16 @@ class RDFLibTripleStore(BaseBackend):
         except:
             self.logger.error('Error in query: %s', self._querytext[qid])
             raise
-        
-        return parse_sparql_result(result.serialize())
+        return result
+
+    def pselect(self, qid, bindings={}):
+        return result_to_bindings(self._pquery(qid, bindings))
+
+    def pselect_iter(self, qid, bindings={}):
+        result = self._pquery(qid, bindings)
+        if result.type != 'SELECT':
+            raise QueryError('SELECT Query expected')
+        return iter_bindings(result)
         
     def ask(self, sparql):
         result = self._query(sparql)
@@ -4,7 +4,12 @@ import shutil
 import subprocess
 from cStringIO import StringIO
 import socket
+import select
+import httplib
+import threading
+import Queue
 from urllib import quote, urlencode
+from urlparse import urlsplit
 
 import httplib2
 from zope.interface import implements
@@ -19,6 +24,186 @@ from sparrow.utils import (parse_sparql_result,
                            json_to_ntriples,
                            ntriples_to_json)
 
+# chunks of a batch that may be queued for upload
+CHUNKS_QUEUED = 16
+
+class SesameBulkLoader(object):
+    """ Streams N-Triples into a context of a Sesame repository.
+
+    Each batch of triples is POSTed to the statements endpoint as a chunked
+    request body, which is sent while the batch is still being added.  The
+    uploads are made by worker threads over persistent (keep-alive)
+    connections, so that up to ``inflight`` batches are sent concurrently.
+    The url may be http or https.  Upload errors are raised as
+    TripleStoreError by add or close.
+
+    Chunks are not kept once sent, so a batch that fails cannot be sent
+    again.  Instead, a connection that the server closed while it was idle
+    is replaced before a batch is sent over it.
+    """
+    def __init__(self, url, repository, context, batchsize=100000, inflight=2,
+                 chunksize=262144, timeout=None):
+        parts = urlsplit(url)
+        if parts.scheme == 'https':
+            self._connclass = httplib.HTTPSConnection
+        elif parts.scheme == 'http':
+            self._connclass = httplib.HTTPConnection
+        else:
+            raise ConnectionError('Unsupported URL scheme: %s' % url)
+        self._host = parts.hostname
+        self._port = parts.port or self._connclass.default_port
+        self._path = '%s/repositories/%s/statements?%s' % (
+            parts.path, repository, urlencode({'context': context}))
+        self._timeout = timeout
+        self.batchsize = batchsize
+        self.chunksize = chunksize
+        # a batch is a queue of chunks, ended by None
+        self._batches = Queue.Queue(maxsize=inflight)
+        self._batch = None
+        self._batchtriples = 0
+        self._chunk = []
+        self._chunksize = 0
+        self._errors = []
+        self._aborted = False
+        self.ntriples = 0
+        self.nbatches = 0
+        self.nbytes = 0
+        self._workers = []
+        for i in range(inflight):
+            worker = threading.Thread(target=self._work)
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def add(self, lines):
+        """ Add a sequence of N-Triples strings (unicode), each of one or
+        more lines, without a final newline.
+        """
+        if self._errors:
+            self._raise()
+        if not lines:
+            return
+        if self._batch is None:
+            self._batch = Queue.Queue(maxsize=CHUNKS_QUEUED)
+            self._batches.put(self._batch)
+        data = u'\n'.join(lines)
+        self._batchtriples += data.count(u'\n') + 1
+        data = data.encode('utf-8') + '\n'
+        self._chunk.append(data)
+        self._chunksize += len(data)
+        if self._chunksize >= self.chunksize:
+            self._sendChunk()
+        if self._batchtriples >= self.batchsize:
+            self._endBatch()
+
+    def _sendChunk(self):
+        if self._chunk:
+            self._batch.put(''.join(self._chunk))
+            self.nbytes += self._chunksize
+            self._chunk = []
+            self._chunksize = 0
+
+    def _endBatch(self):
+        if self._batch is None:
+            return
+        self._sendChunk()
+        self._batch.put(None)
+        self._batch = None
+        self.ntriples += self._batchtriples
+        self._batchtriples = 0
+        self.nbatches += 1
+
+    def flush(self):
+        """ End the current batch, without waiting for its upload.
+        """
+        self._endBatch()
+
+    def close(self):
+        """ Upload the remaining triples and wait for all uploads to finish.
+        """
+        self._endBatch()
+        for worker in self._workers:
+            self._batches.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+        if self._errors:
+            self._raise()
+
+    def abort(self):
+        """ Stop uploading.  Batches that were not completely sent are
+        discarded by the server.
+        """
+        self._aborted = True
+        self._chunk = []
+        self._chunksize = 0
+        try:
+            self.close()
+        except TripleStoreError:
+            pass
+
+    def _raise(self):
+        raise TripleStoreError('; '.join(self._errors))
+
+    def _work(self):
+        conn = None
+        for batch in iter(self._batches.get, None):
+            chunks = iter(batch.get, None)
+            try:
+                conn = self._upload(conn, chunks)
+            except Exception, err:
+                if conn is not None:
+                    conn.close()
+                    conn = None
+                if not self._aborted:
+                    self._errors.append(str(err) or repr(err))
+            # let the producer finish the batch
+            for chunk in chunks:
+                pass
+        if conn is not None:
+            conn.close()
+
+    def _closed(self, conn):
+        """ Whether the server closed an idle connection: it then has
+        something to read (the end of the stream), where a live one has
+        nothing until a request is sent.
+        """
+        if conn.sock is None:
+            return True
+        try:
+            return bool(select.select([conn.sock], [], [], 0)[0])
+        except (socket.error, select.error, ValueError):
+            return True
+
+    def _upload(self, conn, chunks):
+        if (conn is not None) and self._closed(conn):
+            conn.close()
+            conn = None
+        if conn is None:
+            conn = self._connclass(self._host, self._port, timeout=self._timeout)
+        self._startRequest(conn)
+        for chunk in chunks:
+            if self._aborted:
+                raise TripleStoreError('upload aborted')
+            conn.send('%x\r\n%s\r\n' % (len(chunk), chunk))
+        if self._aborted:
+            raise TripleStoreError('upload aborted')
+        conn.send('0\r\n\r\n')
+        resp = conn.getresponse()
+        content = resp.read()
+        if resp.status != 204:
+            conn.close()
+            raise TripleStoreError(content)
+        if resp.will_close:
+            conn.close()
+            conn = None
+        return conn
+
+    def _startRequest(self, conn):
+        conn.putrequest('POST', self._path, skip_accept_encoding=True)
+        conn.putheader('Content-Type', 'text/plain; charset=utf-8')
+        conn.putheader('Transfer-Encoding', 'chunked')
+        conn.endheaders()
 
 class SesameTripleStore(BaseBackend):
     implements(ITripleStore, ISPARQLEndpoint)
@@ -28,9 +213,11 @@ class SesameTripleStore(BaseBackend):
         self._nsmap = {}
         
     def connect(self, dburi):
-        host, rest = dburi[7:].split(':', 1)
-        port, self._name = rest.split('/', 1)
-        self._url = 'http://%s:%s/openrdf-sesame' % (host, port)
+        parts = urlsplit(dburi)
+        if parts.scheme not in ('http', 'https'):
+            raise ConnectionError('Unsupported URL scheme: %s' % dburi)
+        self._name = parts.path.lstrip('/')
+        self._url = '%s://%s/openrdf-sesame' % (parts.scheme, parts.netloc)
         self._http = httplib2.Http()
         try:
             resp, content = self._http.request(
@@ -101,6 +288,10 @@ class SesameTripleStore(BaseBackend):
     def add_turtle(self, data, context):
         data = self._get_file(data)
         self._add(data, 'turtle', self._get_context(context))
+
+    def bulk_loader(self, context, batchsize=100000, inflight=2):
+        return SesameBulkLoader(self._url, self._name, self._get_context(context),
+                                batchsize, inflight)
         
     def _add(self, file, format, context, base_uri=None):
         data = file.read()
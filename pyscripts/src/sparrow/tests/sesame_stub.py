@@ -0,0 +1,217 @@
+"""
+A minimal stand-in for the Sesame HTTP protocol, for testing and
+benchmarking uploads without a Sesame server.
+
+It serves the repository list, namespace registration, the contexts list
+and the statements endpoint of each repository.  Request bodies may be sent
+with a Content-Length or chunked, over keep-alive (HTTP/1.1) connections.
+Uploaded statements are kept in memory per repository and context, as they
+were sent, without being parsed.  A delay per statements upload can be set
+to emulate the time the server takes to commit them, and an idle timeout
+after which the server closes keep-alive connections.
+
+Example::
+
+    stub = SesameStub(['test'])
+    stub.start()
+    db = sparrow.database('sesame', stub.url('test'))
+    ...
+    stub.stop()
+
+"""
+import threading, time
+import BaseHTTPServer, SocketServer
+from urlparse import urlsplit, parse_qs
+from xml.sax.saxutils import escape
+
+SPARQL_RESULT = '''<?xml version="1.0"?>
+<sparql xmlns="http://www.w3.org/2005/sparql-results#">
+<head>%s</head>
+<results>%s</results>
+</sparql>
+'''
+
+def sparql_result(names, rows):
+    """ Return a SPARQL XML result with uri bindings.
+    """
+    head = ''.join('<variable name="%s"/>' % (name) for name in names)
+    results = ''.join('<result>%s</result>' % (
+        ''.join('<binding name="%s"><uri>%s</uri></binding>' % (name, escape(value))
+                for name, value in zip(names, row)))
+                      for row in rows)
+    return SPARQL_RESULT % (head, results)
+
+class IncompleteBody(Exception):
+    pass
+
+class SesameStubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        # closes the connection when no request comes within the idle timeout
+        self.timeout = self.server.idle
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _body(self):
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                line = self.rfile.readline()
+                if not line:
+                    # the client gave up on the request
+                    raise IncompleteBody()
+                size = int(line.split(';')[0], 16)
+                if size == 0:
+                    # trailers
+                    while self.rfile.readline() not in ('\r\n', '\n', ''):
+                        pass
+                    return ''.join(chunks)
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def _reply(self, status, body='', ctype='text/plain'):
+        self.send_response(status)
+        if body:
+            self.send_header('Content-Type', ctype)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def _route(self):
+        """ Return (repository, operation, argument, query parameters) of the request.
+        """
+        parts = urlsplit(self.path)
+        path = parts.path.strip('/').split('/')
+        params = parse_qs(parts.query)
+        if path[:2] != ['openrdf-sesame', 'repositories']:
+            return None, None, None, params
+        path = path[2:] + [None, None, None]
+        return path[0], path[1], path[2], params
+
+    def do_GET(self):
+        repo, op, arg, params = self._route()
+        if repo is None:
+            self._reply(200, sparql_result(['uri', 'id'],
+                                           [('%s/%s' % (self.server.baseurl, name), name)
+                                            for name in sorted(self.server.statements)]),
+                        'application/sparql-results+xml')
+        elif repo not in self.server.statements:
+            self._reply(404, 'Unknown repository: %s' % (repo))
+        elif op == 'contexts':
+            self._reply(200, sparql_result(['contextID'],
+                                           [(context.strip('<>'),)
+                                            for context in sorted(self.server.statements[repo])]),
+                        'application/sparql-results+xml')
+        elif op == 'size':
+            self._reply(200, str(self.server.size(repo, params.get('context', [None])[0])))
+        else:
+            self._reply(400, 'Unsupported request')
+
+    def do_PUT(self):
+        repo, op, arg, params = self._route()
+        self._body()
+        if (repo in self.server.statements) and (op == 'namespaces'):
+            self._reply(204)
+        else:
+            self._reply(400, 'Unsupported request')
+
+    def do_POST(self):
+        repo, op, arg, params = self._route()
+        try:
+            body = self._body()
+        except IncompleteBody:
+            self.close_connection = 1
+            return
+        if (repo not in self.server.statements) or (op != 'statements'):
+            self._reply(400, 'Unsupported request')
+            return
+        if self.server.delay:
+            time.sleep(self.server.delay)
+        context = params.get('context', [None])[0]
+        ctype = self.headers.get('Content-Type', '').split(';')[0]
+        with self.server.lock:
+            self.server.statements[repo].setdefault(context, []).append((ctype, body))
+            self.server.uploads += 1
+        self._reply(204)
+
+    def do_DELETE(self):
+        repo, op, arg, params = self._route()
+        self._body()
+        if (repo not in self.server.statements) or (op != 'statements'):
+            self._reply(400, 'Unsupported request')
+            return
+        with self.server.lock:
+            self.server.statements[repo].pop(params.get('context', [None])[0], None)
+        self._reply(204)
+
+class SesameStub(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """ Threaded stub Sesame server, on a free local port by default.
+    """
+    daemon_threads = True
+
+    def __init__(self, repositories, port=0, delay=0.0, idle=None):
+        """
+        :param repositories: names of the repositories
+        :type repositories: list
+        :param port: port to listen on (0 for any free port)
+        :type port: int
+        :param delay: seconds to wait before acknowledging each statements upload
+        :type delay: float
+        :param idle: seconds after which idle connections are closed (None to keep them)
+        :type idle: float
+        """
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', port), SesameStubHandler)
+        self.port = self.server_address[1]
+        self.baseurl = 'http://127.0.0.1:%d/openrdf-sesame/repositories' % (self.port)
+        self.delay = delay
+        self.idle = idle
+        self.lock = threading.Lock()
+        # repository -> context -> list of (content type, body)
+        self.statements = dict((name, {}) for name in repositories)
+        self.connections = 0
+        self.uploads = 0
+        self.thread = None
+
+    def url(self, repository):
+        """ Return the sparrow database URI of a repository.
+        """
+        return 'http://127.0.0.1:%d/%s' % (self.port, repository)
+
+    def data(self, repository, context):
+        """ Return the list of (content type, body) uploaded to a context ('<iri>').
+        """
+        with self.lock:
+            return list(self.statements[repository].get(context, []))
+
+    def size(self, repository, context=None):
+        """ Return the number of N-Triples lines uploaded to a context, or to
+        the whole repository.  Uploads in other formats are not counted.
+        """
+        if context is None:
+            contexts = self.statements[repository].keys()
+        else:
+            contexts = [context]
+        n = 0
+        for context in contexts:
+            for ctype, body in self.data(repository, context):
+                if ctype == 'text/plain':
+                    n += sum(1 for line in body.splitlines()
+                             if line.strip() and not line.startswith('#'))
+        return n
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self.thread.join()
@@ -0,0 +1,114 @@
+from unittest import TestCase, TestSuite, makeSuite, main
+import time, httplib
+
+import rdflib
+
+import sparrow
+from sparrow.error import ConnectionError, TripleStoreError
+from sparrow.sesame_backend import SesameBulkLoader
+from sparrow.tests.sesame_stub import SesameStub
+
+CONTEXT = 'http://example.org/graph'
+
+def make_triples(n):
+    return [u'<http://example.org/s%d> <http://example.org/p> "v\\u00E9 %d" .' % (i, i)
+            for i in range(n)]
+
+def parse_uploads(uploads):
+    graph = rdflib.Graph()
+    for ctype, body in uploads:
+        graph.parse(data=body, format='nt')
+    return graph
+
+class SesameBulkLoaderTest(TestCase):
+    def setUp(self):
+        self.stub = SesameStub(['test'])
+        self.stub.start()
+        self.db = sparrow.database('sesame', self.stub.url('test'))
+
+    def tearDown(self):
+        self.db.disconnect()
+        self.stub.stop()
+
+    def test_batches(self):
+        triples = make_triples(1000)
+        loader = self.db.bulk_loader(CONTEXT, batchsize=100, inflight=3)
+        loader.chunksize = 512
+        for i in range(0, len(triples), 7):
+            loader.add(triples[i:i+7])
+        loader.close()
+        uploads = self.stub.data('test', '<%s>' % CONTEXT)
+        self.assertEqual(loader.ntriples, 1000)
+        self.assertEqual(loader.nbatches, 10)
+        self.assertEqual(len(uploads), 10)
+        self.assertEqual(set(ctype for ctype, body in uploads), set(['text/plain']))
+        self.assertEqual(self.db.count(CONTEXT), 1000)
+        expected = rdflib.Graph()
+        expected.parse(data='\n'.join(triples), format='nt')
+        self.assertEqual(set(parse_uploads(uploads)), set(expected))
+        # batches reuse the connections of the workers
+        self.assertTrue(self.stub.connections <= 1 + 3)
+
+    def test_empty(self):
+        loader = self.db.bulk_loader(CONTEXT)
+        loader.close()
+        self.assertEqual(loader.nbatches, 0)
+        self.assertEqual(self.stub.uploads, 0)
+
+    def test_error(self):
+        loader = SesameBulkLoader(self.db._url, 'missing', '<%s>' % CONTEXT,
+                                  batchsize=10, inflight=2)
+        loader.add(make_triples(25))
+        self.assertRaises(TripleStoreError, loader.close)
+
+    def test_idle_connection(self):
+        # the server closes the connection of the worker between batches
+        self.stub.idle = 0.1
+        loader = self.db.bulk_loader(CONTEXT, batchsize=10, inflight=1)
+        loader.add(make_triples(10))
+        while self.stub.uploads < 1:
+            time.sleep(0.01)
+        time.sleep(0.3)
+        loader.add(make_triples(20)[10:])
+        loader.close()
+        self.assertEqual(self.stub.uploads, 2)
+        self.assertEqual(self.stub.connections, 1 + 2)
+        self.assertEqual(set(parse_uploads(self.stub.data('test', '<%s>' % CONTEXT))),
+                         set(parse_uploads([(None, '\n'.join(make_triples(20)))])))
+
+    def test_https(self):
+        loader = SesameBulkLoader('https://example.org/openrdf-sesame', 'test',
+                                  '<%s>' % CONTEXT)
+        conn = loader._connclass(loader._host, loader._port)
+        loader.close()
+        self.assertTrue(isinstance(conn, httplib.HTTPSConnection))
+        self.assertEqual((conn.host, conn.port), ('example.org', 443))
+        self.assertRaises(ConnectionError, SesameBulkLoader, 'ftp://example.org/', 'test',
+                          '<%s>' % CONTEXT)
+
+    def test_abort(self):
+        loader = self.db.bulk_loader(CONTEXT, batchsize=100, inflight=1)
+        loader.add(make_triples(50))
+        loader.abort()
+        self.assertEqual(self.stub.uploads, 0)
+
+class BatchLoaderTest(TestCase):
+    def test_rdflib(self):
+        db = sparrow.database('rdflib', 'memory')
+        loader = db.bulk_loader(CONTEXT, batchsize=30)
+        triples = make_triples(100)
+        for i in range(0, len(triples), 20):
+            loader.add(triples[i:i+20])
+        loader.close()
+        self.assertEqual(loader.ntriples, 100)
+        self.assertEqual(loader.nbatches, 3)
+        self.assertEqual(db.count(CONTEXT), 100)
+
+def test_suite():
+    suite = TestSuite()
+    suite.addTest(makeSuite(SesameBulkLoaderTest))
+    suite.addTest(makeSuite(BatchLoaderTest))
+    return suite
+
+if __name__ == '__main__':
+    main(defaultTest='test_suite')
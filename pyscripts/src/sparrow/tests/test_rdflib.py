@@ -1,7 +1,10 @@
 from unittest import TestCase, TestSuite, makeSuite, main
+from StringIO import StringIO
 
 import sparrow
-from sparrow.error import ConnectionError
+from sparrow.rdflib_backend import rdflib
+from sparrow.error import ConnectionError, QueryError
+from sparrow.utils import parse_sparql_result
 from sparrow.tests.base_tests import (TripleStoreTest,
                                       TripleStoreQueryTest,
                                       open_test_file)
@@ -25,6 +28,98 @@ class RDFLibQueryTest(TripleStoreQueryTest):
         self.db.disconnect()
         del self.db
 
+EXTRA_NTRIPLES = u'''<uri:a> <uri:label> "" .
+<uri:a> <uri:label> "plain" .
+<uri:a> <uri:label> "chat"@fr .
+<uri:a> <uri:label> "42"^^<http://www.w3.org/2001/XMLSchema#integer> .
+<uri:a> <uri:label> "two\\r\\nlines\\rhere" .
+<uri:a> <uri:label> "caf\\u00E9 <&> \\"quoted\\"" .
+<uri:a> <uri:link> _:b1 .
+_:b1 <uri:label> "bnode" .
+<uri:c> <uri:link> <uri:a> .
+'''
+
+class RDFLibResultConformanceTest(TestCase):
+    """ The native result conversion must give the same results as the
+    SPARQL XML results format read by parse_sparql_result, which the other
+    backends use.
+    """
+    queries = [
+        """
+        prefix vin: <http://www.w3.org/TR/2003/PR-owl-guide-20031209/wine#>
+        select ?grape where { ?grape a vin:WineGrape .}
+        """,
+        """
+        prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+        select ?x ?label where { ?x rdfs:label ?label .}
+        """,
+        """
+        select ?s ?p ?o where { ?s ?p ?o .}
+        """,
+        """
+        select ?s ?o ?label where { ?s <uri:link> ?o . optional { ?o <uri:label> ?label } }
+        """,
+        """
+        select ?label where { optional { <uri:nothing> <uri:label> ?label } }
+        """,
+        """
+        select ?s where { ?s <uri:nothing> ?o .}
+        """,
+        ]
+
+    def setUp(self):
+        self.db = sparrow.database('rdflib', 'memory')
+        fp = open_test_file('ntriples')
+        self.db.add_ntriples(fp, 'test')
+        fp.close()
+        self.db.add_ntriples(StringIO(EXTRA_NTRIPLES.encode('utf-8')), 'extra')
+
+    def tearDown(self):
+        self.db.disconnect()
+        del self.db
+
+    def assertSameResults(self, result, expected):
+        self.assertEquals(len(result), len(expected))
+        self.assertEquals(sorted(result), sorted(expected))
+
+    def test_select(self):
+        for q in self.queries:
+            expected = parse_sparql_result(self.db._query(q).serialize())
+            self.assertSameResults(self.db.select(q), expected)
+
+    def test_ask(self):
+        q = 'ASK { <uri:a> <uri:label> "plain" }'
+        self.assertEquals(self.db.select(q), True)
+        self.assertEquals(parse_sparql_result(self.db._query(q).serialize()), True)
+
+    def test_pselect(self):
+        for i, q in enumerate(self.queries):
+            qid = 'q%d' % (i)
+            self.db.add_pquery(qid, q)
+            expected = parse_sparql_result(self.db._query(q).serialize())
+            self.assertSameResults(self.db.pselect(qid), expected)
+            self.assertSameResults(list(self.db.pselect_iter(qid)), expected)
+
+    def test_pselect_bindings(self):
+        self.db.add_pquery('labels', 'select ?label where { ?x <uri:label> ?label .}')
+        bindings = {'x': rdflib.URIRef('uri:a')}
+        result = self.db.pselect('labels', bindings)
+        self.assertEquals(len(result), 6)
+        self.assertSameResults(list(self.db.pselect_iter('labels', bindings)), result)
+        self.assertTrue({u'label': {'type': u'literal', 'value': None}} in result)
+        self.assertTrue({u'label': {'type': u'literal',
+                                    'value': u'two\nlines\nhere'}} in result)
+        self.assertTrue({u'label': {'type': u'literal', 'value': u'chat',
+                                    'lang': u'fr'}} in result)
+
+    def test_construct(self):
+        # CONSTRUCT results have no bindings
+        q = 'CONSTRUCT { ?s <uri:copy> ?o } WHERE { ?s <uri:label> ?o }'
+        self.assertRaises(QueryError, self.db.select, q)
+        self.db.add_pquery('copy', q)
+        self.assertRaises(QueryError, self.db.pselect, 'copy')
+        self.assertRaises(QueryError, self.db.pselect_iter, 'copy')
+
 def test_suite():
     try:
         sparrow.database('rdflib', 'memory')
@@ -34,6 +129,7 @@ def test_suite():
     suite = TestSuite()
     suite.addTest(makeSuite(RDFLibTest))
     suite.addTest(makeSuite(RDFLibQueryTest))
+    suite.addTest(makeSuite(RDFLibResultConformanceTest))
     return suite
 
 if __name__ == '__main__':
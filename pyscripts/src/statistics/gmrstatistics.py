@@ -107,12 +107,14 @@ class Statistics():
         self.logger.info('generating counts for %s',lang) 
         
         tconcount = 0
+        # counts for all target concepts at once
+        cmcounts = gdb.getCMSourceCounts(lang,None)
+        lmcounts = gdb.getLMCountsByTargetSource(lang,None)
         for tcon in gdb.getTargetConcepts():
-            cmsources = gdb.getCMSourcesFromTarget(lang,tcon,None) 
+            tconlmcounts = lmcounts.get(tcon.id,{})
             cmrows = []
-            for scon in cmsources:
-                lmcount = gdb.getCountLMsFromTargetSource(lang,tcon,scon,None)
-                cmrows.append(lmcount)
+            for scon, ncms in cmcounts.get(tcon.id,{}).iteritems():
+                cmrows.extend([tconlmcounts.get(scon,0)] * ncms)
             tconcount += 1
             totallmcount = sum(lmcount for lmcount in cmrows)
             if not tcon.target_concept in self.concepts: